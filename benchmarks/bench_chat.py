@@ -0,0 +1,163 @@
+# チャット補完のストリーミング・共有・取消の確認とベンチマーク[ローカルの疑似OpenAIサーバー使用]
+# (Checks and benchmark for chat streaming, sharing and cancellation [against a local fake OpenAI server])
+# 実行方法(usage): python benchmarks/bench_chat.py
+import os
+import sys
+import json
+import time
+import asyncio
+import logging
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+FAKE_PORT = 18081
+APP_PORT = 18082
+os.environ["OPENAI_API_KEY"] = "sk-local"
+os.environ["OPENAI_BASE_URL"] = f"http://127.0.0.1:{FAKE_PORT}/v1"
+
+import httpx
+import openai
+import uvicorn
+
+from fastapi import FastAPI, Request
+from fastapi.responses import StreamingResponse
+
+from functions import chat_fnc
+from routers import chat
+
+# 疑似サーバーの1トークンごとの待ち秒数とトークン数(fake server delay per token and token count)
+TOKEN_DELAY = 0.02
+TOKEN_COUNT = 40
+
+objFakeStats = {"requests": 0, "completed": 0, "cancelled": 0}
+objFake = FastAPI()
+
+@objFake.post("/v1/chat/completions")
+async def post_fake_completions(request: Request):
+    objBody = await request.json()
+    objFakeStats["requests"] += 1
+    strPrompt = objBody["messages"][-1]["content"]
+
+    def getChunk(objDelta, strFinish=None):
+        return "data: " + json.dumps({
+            "id": "chatcmpl-local", "object": "chat.completion.chunk", "created": 0, "model": objBody["model"],
+            "choices": [{"index": 0, "delta": objDelta, "finish_reason": strFinish}],
+        }) + "\n\n"
+
+    async def getStream():
+        try:
+            yield getChunk({"role": "assistant", "content": ""})
+            for i in range(TOKEN_COUNT):
+                await asyncio.sleep(TOKEN_DELAY)
+                yield getChunk({"content": f"{strPrompt}-{i} "})
+            yield getChunk({}, "stop")
+            yield "data: [DONE]\n\n"
+            objFakeStats["completed"] += 1
+        except BaseException:
+            objFakeStats["cancelled"] += 1
+            raise
+
+    if not objBody.get("stream"):
+        await asyncio.sleep(TOKEN_DELAY * TOKEN_COUNT)
+        strText = "".join(f"{strPrompt}-{i} " for i in range(TOKEN_COUNT))
+        return {
+            "id": "chatcmpl-local", "object": "chat.completion", "created": 0, "model": objBody["model"],
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": strText}, "finish_reason": "stop"}],
+        }
+
+    return StreamingResponse(getStream(), media_type="text/event-stream")
+
+objApp = FastAPI()
+objApp.include_router(chat.router)
+
+def getExpect(strPrompt: str):
+    return "".join(f"{strPrompt}-{i} " for i in range(TOKEN_COUNT))
+
+async def getSse(objClient, strPrompt: str, intStopAfter: int=None):
+    """
+    SSEの受信[intStopAfter件で切断](Read SSE [disconnect after intStopAfter events])
+
+    Returns:
+
+        tuple:(テキスト, 最初のトークンまでの秒数)(text, seconds to first token)
+    """
+
+    fltStart = time.perf_counter()
+    fltFirst = None
+    aryText = []
+    async with objClient.stream("POST", f"http://127.0.0.1:{APP_PORT}/v1/chat/completions", json={"messages": [{"role": "user", "content": strPrompt}]}) as objResponse:
+        async for strLine in objResponse.aiter_lines():
+            if not strLine.startswith("data: ") or strLine == "data: [DONE]":
+                continue
+            objEvent = json.loads(strLine[6:])
+            if "delta" in objEvent:
+                fltFirst = fltFirst or time.perf_counter() - fltStart
+                aryText.append(objEvent["delta"])
+                if intStopAfter is not None and len(aryText) >= intStopAfter:
+                    break
+
+    return "".join(aryText), fltFirst
+
+async def main():
+    objServers = [
+        uvicorn.Server(uvicorn.Config(objFake, port=FAKE_PORT, log_level="warning")),
+        uvicorn.Server(uvicorn.Config(objApp, port=APP_PORT, log_level="warning")),
+    ]
+    aryTasks = [asyncio.create_task(objServer.serve()) for objServer in objServers]
+    while not all(objServer.started for objServer in objServers):
+        await asyncio.sleep(0.05)
+    chat_fnc.setupChatClient()
+    for strLogger in ("httpx", "httpx2", "openai"):
+        logging.getLogger(strLogger).setLevel(logging.WARNING)
+
+    async with httpx.AsyncClient(timeout=30) as objClient:
+        # ストリーミング:最初のトークンは全体より早く届く(Streaming: the first token arrives long before the end)
+        fltStart = time.perf_counter()
+        strText, fltFirst = await getSse(objClient, "solo")
+        assert strText == getExpect("solo")
+        print(f"stream: first token {fltFirst * 1000:.0f} ms, complete {(time.perf_counter() - fltStart) * 1000:.0f} ms")
+
+        # 同一プロンプトの同時リクエストは上流1回(Concurrent identical prompts make one upstream call)
+        objFakeStats["requests"] = 0
+        aryResults = await asyncio.gather(*[getSse(objClient, "same") for _ in range(20)])
+        assert all(strText == getExpect("same") for strText, _ in aryResults)
+        assert objFakeStats["requests"] == 1, objFakeStats
+        print(f"20 identical concurrent prompts -> {objFakeStats['requests']} upstream call")
+
+        # 1人が切断しても他の呼び出し元がいれば続ける(One caller leaving does not stop the stream for others)
+        objFakeStats.update(requests=0, cancelled=0)
+        aryResults = await asyncio.gather(getSse(objClient, "shared", 3), getSse(objClient, "shared"))
+        assert aryResults[1][0] == getExpect("shared") and objFakeStats["cancelled"] == 0
+
+        # 全員が切断すると上流を取り消す(Upstream is cancelled once every caller has left)
+        objFakeStats.update(requests=0, cancelled=0, completed=0)
+        await getSse(objClient, "leave", 3)
+        fltStart = time.perf_counter()
+        while objFakeStats["cancelled"] == 0 and time.perf_counter() - fltStart < 5:
+            await asyncio.sleep(0.01)
+        assert objFakeStats["cancelled"] == 1 and objFakeStats["completed"] == 0, objFakeStats
+        assert not chat_fnc._aryInflight
+        print(f"disconnect -> upstream cancelled after {(time.perf_counter() - fltStart) * 1000:.0f} ms")
+
+        # 従来:呼び出しごとにクライアントを作成し、全体を待つ(Previously: a client per call, waiting for the whole completion)
+        intCalls = 20
+        fltStart = time.perf_counter()
+        for i in range(intCalls):
+            async with openai.AsyncOpenAI() as objOpenAI:
+                await objOpenAI.chat.completions.create(model="m", messages=[{"role": "user", "content": f"legacy{i}"}])
+        fltLegacy = (time.perf_counter() - fltStart) / intCalls
+        fltStart = time.perf_counter()
+        aryFirst = []
+        for i in range(intCalls):
+            aryFirst.append((await getSse(objClient, f"new{i}"))[1])
+        fltNew = (time.perf_counter() - fltStart) / intCalls
+        print(f"per call: legacy full response {fltLegacy * 1000:.0f} ms, shared client stream {fltNew * 1000:.0f} ms (first token {sum(aryFirst) / intCalls * 1000:.0f} ms)")
+
+    await chat_fnc.shutdownChatClient()
+    for objServer in objServers:
+        objServer.should_exit = True
+    await asyncio.gather(*aryTasks)
+
+if __name__ == "__main__":
+    asyncio.run(main())
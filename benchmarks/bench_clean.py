@@ -0,0 +1,46 @@
+# テキスト整形のベンチマーク(Benchmark for text cleaning)
+# 実行方法(usage): python benchmarks/bench_clean.py
+# 従来処理との同等性は tests/test_clean.py で確認する(equivalence with the previous implementation is checked in tests/test_clean.py)
+import os
+import sys
+import time
+import random
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import pandas as pd
+
+from util import util_cmn
+from tests.test_clean import getLegacyCleanText, getHtmlTexts
+
+async def main():
+    objRandom = random.Random(0)
+
+    aryHtml = getHtmlTexts(20000, objRandom)
+
+    # 速度(speed)
+    intBytes = sum(len(strText.encode('utf-8')) for strText in aryHtml)
+
+    def setReport(strName: str, objFunc):
+        fltStart = time.perf_counter()
+        objFunc()
+        fltElapsed = time.perf_counter() - fltStart
+        print(f"{strName:<26} {len(aryHtml) / fltElapsed:>10,.0f} docs/s {intBytes / fltElapsed / 1e6:>7.1f} MB/s")
+
+    setReport("legacy getCleanText", lambda: [getLegacyCleanText(strText) for strText in aryHtml])
+    setReport("getCleanText", lambda: [util_cmn.getCleanText(strText) for strText in aryHtml])
+    objHtml = pd.Series(aryHtml)
+    setReport("getCleanTextSeries", lambda: util_cmn.getCleanTextSeries(objHtml))
+
+    fltStart = time.perf_counter()
+    await util_cmn.getCleanTextBatch(aryHtml, 0)
+    fltElapsed = time.perf_counter() - fltStart
+    strMode = f"{util_cmn.CLEAN_PROCESSES} processes" if util_cmn.CLEAN_PROCESSES > 1 else "inline"
+    print(f"{'getCleanTextBatch (' + strMode + ')':<26} {len(aryHtml) / fltElapsed:>10,.0f} docs/s {intBytes / fltElapsed / 1e6:>7.1f} MB/s")
+
+    util_cmn.shutdownCleanPool()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,103 @@
+# 埋め込みキャッシュと一括呼び出しのベンチマーク(Benchmark for the embedding cache and batched provider calls)
+# 実行方法(usage): python benchmarks/bench_embed.py [件数]
+import os
+import sys
+import time
+import random
+import asyncio
+import tempfile
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault("EMBED_BACKOFF", "0.01")
+
+import numpy as np
+
+from functions import embed_fnc
+
+class LatencyProvider(embed_fnc.LocalEmbeddingProvider):
+    """
+    呼び出しごとに待ち時間があり、最初の数回は失敗する提供元(Provider with per-call latency that fails the first few calls)
+    """
+
+    strName = "latency"
+
+    def __init__(self, fltLatency: float, intFailures: int=0):
+        super().__init__()
+        self.fltLatency = fltLatency
+        self.intFailures = intFailures
+        self.intCalls = 0
+        self.intTexts = 0
+
+    async def getEmbeddings(self, aryTexts: list, strModel: str):
+        self.intCalls += 1
+        await asyncio.sleep(self.fltLatency)
+        if self.intFailures > 0:
+            self.intFailures -= 1
+            raise ConnectionError("temporary failure")
+        self.intTexts += len(aryTexts)
+        return await super().getEmbeddings(aryTexts, strModel)
+
+def getChunks(intCount: int, objRandom):
+    """
+    取込みのたびに同じものが多く含まれるチャンク(Chunks where most repeat across ingestion runs)
+    """
+
+    aryWords = "送料 無料 在庫 あり vector search cache batch 日本語 text chunk embedding".split()
+    aryUnique = [" ".join(objRandom.choice(aryWords) for _ in range(40)) for _ in range(intCount // 2)]
+
+    return [objRandom.choice(aryUnique) for _ in range(intCount)]
+
+async def main():
+    intCount = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    objRandom = random.Random(0)
+    aryChunks = getChunks(intCount, objRandom)
+    fltLatency = 0.05
+
+    # 従来:チャンクごとに1回呼び出す(Previously: one provider call per chunk)
+    objProvider = LatencyProvider(fltLatency)
+    fltStart = time.perf_counter()
+    aryLegacy = [np.asarray((await objProvider.getEmbeddings([strChunk], "m"))[0], dtype=np.float32) for strChunk in aryChunks[:100]]
+    fltLegacy = (time.perf_counter() - fltStart) / 100 * intCount
+    print(f"per-chunk calls      {intCount / fltLegacy:>9,.0f} chunks/s  calls:{intCount:,} (extrapolated from 100)")
+
+    with tempfile.TemporaryDirectory() as strDir:
+        # 取込みワーカーが1件ずつ要求しても一括呼び出しになる(Single-chunk requests from many workers become batch calls)
+        objProvider = LatencyProvider(fltLatency, intFailures=2)
+        objService = embed_fnc.EmbeddingService(objProvider, embed_fnc.EmbeddingCache(os.path.join(strDir, "cache.sqlite3")))
+
+        async def execWorker(aryPart):
+            return [(await objService.getEmbeddings([strChunk], "m"))[0] for strChunk in aryPart]
+
+        for strRun in ("cold", "warm"):
+            fltStart = time.perf_counter()
+            aryParts = await asyncio.gather(*[execWorker(aryChunks[i::50]) for i in range(50)])
+            fltElapsed = time.perf_counter() - fltStart
+            print(f"service, {strRun:<11} {intCount / fltElapsed:>9,.0f} chunks/s  calls:{objProvider.intCalls:,} texts:{objProvider.intTexts:,} {objService.getStats()}")
+
+        aryVectors = [None] * intCount
+        for i, aryPart in enumerate(aryParts):
+            aryVectors[i::50] = aryPart
+        assert all(np.array_equal(aryVector, aryExpect) for aryVector, aryExpect in zip(aryVectors, aryLegacy))
+        assert objService.getStats()["retries"] == 2
+
+        # 別プロセス相当:新しいサービスでもディスクキャッシュから返す(A fresh service [like another worker] is served from disk)
+        objProvider2 = LatencyProvider(fltLatency)
+        objService2 = embed_fnc.EmbeddingService(objProvider2, embed_fnc.EmbeddingCache(os.path.join(strDir, "cache.sqlite3")))
+        objService2.objProvider.strName = objProvider.strName
+        assert np.array_equal(await objService2.getEmbeddings(aryChunks[:100], "m"), np.vstack(aryLegacy))
+        assert objProvider2.intCalls == 0
+        await objService2.close()
+        await objService.close()
+
+        # 上限を超えると古い順に削除(Least recently read rows are evicted over the limit)
+        objCache = embed_fnc.EmbeddingCache(os.path.join(strDir, "small.sqlite3"), intMaxBytes=600 * 1024)
+        objService = embed_fnc.EmbeddingService(LatencyProvider(0), objCache)
+        await objService.getEmbeddings(aryChunks, "m")
+        objStats = await asyncio.get_running_loop().run_in_executor(objCache.objExecutor, objCache.getStatsSync)
+        assert objStats["bytes"] <= 600 * 1024, objStats
+        print(f"eviction: {objStats['rows']} rows / {objStats['bytes']:,} bytes kept under 600 KiB")
+        await objService.close()
+
+if __name__ == "__main__":
+    asyncio.run(main())
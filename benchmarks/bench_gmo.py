@@ -0,0 +1,100 @@
+# GMOエラーメッセージ取得のマイクロベンチマーク(Microbenchmark for GMO error message lookup)
+# 実行方法(usage): python benchmarks/bench_gmo.py
+import os
+import sys
+import time
+import asyncio
+
+from bs4 import BeautifulSoup
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from functions import gmo_fnc
+
+async def getLegacyGmoErrorMsg(strErrorCode :str, strErrorInfo :str):
+    """
+    従来のHTML逐次解析による取得(Previous lookup that parses the HTML on every call)
+    """
+
+    aryGmoErrorFile = []
+
+    if strErrorCode.upper()[0] == "E":
+        aryGmoErrorFile.append("gmo_e")
+        aryGmoErrorFile.append("gmo_e_m")
+    elif strErrorCode.upper()[0] == "C":
+        aryGmoErrorFile.append("gmo_c")
+    elif strErrorCode.upper()[0] == "G":
+        aryGmoErrorFile.append("gmo_g")
+    elif strErrorCode.upper()[0] == "M":
+        aryGmoErrorFile.append("gmo_m")
+        aryGmoErrorFile.append("gmo_e_m")
+        aryGmoErrorFile.append("gmo_carrier")
+        aryGmoErrorFile.append("gom_linepay")
+    else:
+        return ""
+
+    strGmoErrorMsg = ""
+    for strFileName in aryGmoErrorFile:
+        with open(f'./files/gmo/{strFileName}.html', 'r') as file:
+            html = file.read()
+        soup = BeautifulSoup(html, 'html.parser')
+        table = soup.find_all('table')[1]
+        for row in table.find_all('tr'):
+            cells = row.find_all('td')
+            if cells:
+                if strErrorInfo in cells[1].text:
+                    if strFileName == "gmo_m" or strFileName == "gmo_carrier" or strFileName == "gom_linepay" or strFileName == "gmo_paysle":
+                        strGmoErrorMsg = cells[2].text
+                    else:
+                        strGmoErrorMsg = cells[3].text
+                    break
+        if strGmoErrorMsg != "":
+            break
+
+    if strGmoErrorMsg == "－":
+        return ""
+
+    return strGmoErrorMsg
+
+async def main():
+    # 検索対象を全詳細コードから作成(Build lookups from every detail code)
+    fltStart = time.perf_counter()
+    objIndex = gmo_fnc.getGmoErrorIndex(blnReload=True)
+    print(f"index load: {(time.perf_counter() - fltStart) * 1000:.2f} ms")
+
+    aryErrors = []
+    for strPrefix, (aryExact, _) in objIndex.items():
+        for strDetail in aryExact:
+            aryErrors.append((strPrefix + "01", strDetail))
+    aryErrors.append(("E01", "NOTFOUND"))
+    aryErrors.append(("X01", "E00000001"))
+
+    # 従来の結果と一致することを確認(Check that results match the previous implementation)
+    intLegacyCount = 0
+    fltStart = time.perf_counter()
+    for strErrorCode, strErrorInfo in aryErrors[::10]:
+        strExpected = await getLegacyGmoErrorMsg(strErrorCode, strErrorInfo)
+        assert gmo_fnc.getGmoErrorMsg(strErrorCode, strErrorInfo) == strExpected, (strErrorCode, strErrorInfo)
+        intLegacyCount += 1
+    fltLegacy = (time.perf_counter() - fltStart) / intLegacyCount
+
+    intLoop = 100
+    fltStart = time.perf_counter()
+    for _ in range(intLoop):
+        for strErrorCode, strErrorInfo in aryErrors:
+            gmo_fnc.getGmoErrorMsg(strErrorCode, strErrorInfo)
+    fltIndex = (time.perf_counter() - fltStart) / (intLoop * len(aryErrors))
+
+    fltStart = time.perf_counter()
+    for _ in range(intLoop):
+        gmo_fnc.getGmoErrorMsgList(aryErrors)
+    fltBatch = (time.perf_counter() - fltStart) / (intLoop * len(aryErrors))
+
+    print(f"legacy : {fltLegacy * 1e6:12.1f} us/lookup ({intLegacyCount} lookups)")
+    print(f"index  : {fltIndex * 1e6:12.3f} us/lookup")
+    print(f"batch  : {fltBatch * 1e6:12.3f} us/lookup")
+    print(f"speedup: {fltLegacy / fltIndex:12.0f}x")
+
+if __name__ == "__main__":
+    asyncio.run(main())
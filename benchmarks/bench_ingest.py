@@ -0,0 +1,111 @@
+# アップロード取込みと重複結合のベンチマーク(Benchmark for upload ingestion and overlap joining)
+# 実行方法(usage): python benchmarks/bench_ingest.py [MB]
+import os
+import sys
+import time
+import random
+import asyncio
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from functions import ingest_fnc
+from util import util_cmn
+
+def getLegacyJoinStrings(strS1, strS2):
+    """
+    従来の全接頭辞をendswithで確認する結合(Previous join checking every prefix with endswith)
+    """
+
+    for i in range(min(len(strS1), len(strS2)), -1, -1):
+        if strS1.endswith(strS2[:i]):
+            return strS1 + strS2[i:]
+
+    return strS1 + strS2
+
+def getSegments(intCount: int, objRandom):
+    """
+    前の行の末尾を先頭に含む行[分割した書き起こし等](Lines that start with the end of the previous one [e.g. split transcripts])
+    """
+
+    aryWords = "<p>取込み</p> ストリーミング 文書 chunk overlap text&amp;data 日本語 line".split()
+    strPrev = ""
+    aryLines = []
+    for _ in range(intCount):
+        strLine = strPrev[-objRandom.randrange(0, 30):] if strPrev else ""
+        strLine += "".join(objRandom.choice(aryWords) for _ in range(20))
+        aryLines.append(strLine)
+        strPrev = util_cmn.getCleanText(strLine)
+
+    return aryLines
+
+async def getBody(aryLines, intRepeat: int, intPiece: int):
+    """
+    受信データ[任意の位置で区切られたバイト列](received data [bytes split at arbitrary positions])
+    """
+
+    bytBody = ("\r\n".join(aryLines) + "\r\n").encode('utf-8')
+    for _ in range(intRepeat):
+        for i in range(0, len(bytBody), intPiece):
+            yield bytBody[i:i + intPiece]
+
+async def getRecords(objStream, **aryArgs):
+    aryRecords = []
+    async for aryChunk in ingest_fnc.getIngestRecords(objStream, **aryArgs):
+        aryRecords.extend(aryChunk)
+    return aryRecords
+
+async def main():
+    intMegabytes = int(sys.argv[1]) if len(sys.argv) > 1 else 50
+    objRandom = random.Random(0)
+
+    # 重複結合:従来の処理と同じ結果で、長い文字列ほど差が出る(Joining: same result as before, the gap grows with length)
+    for _ in range(2000):
+        strS1 = "".join(objRandom.choice("ab") for _ in range(objRandom.randrange(12)))
+        strS2 = "".join(objRandom.choice("ab") for _ in range(objRandom.randrange(12)))
+        assert await util_cmn.getJoinStrings(strS1, strS2) == getLegacyJoinStrings(strS1, strS2)
+    # 中央だけ異なるため従来の処理は全接頭辞をほぼ最後まで比較する(Only the middle differs, so the previous join compares almost every prefix in full)
+    for intLength in (10000, 100000, 200000):
+        strS1 = "a" * intLength
+        strS2 = "a" * (intLength // 2) + "b" + "a" * (intLength // 2)
+        fltStart = time.perf_counter()
+        getLegacyJoinStrings(strS1, strS2)
+        fltLegacy = time.perf_counter() - fltStart
+        fltStart = time.perf_counter()
+        await util_cmn.getJoinStrings(strS1, strS2)
+        fltKmp = time.perf_counter() - fltStart
+        print(f"getJoinStrings {intLength:>6} chars: legacy {fltLegacy * 1000:9.2f} ms  new {fltKmp * 1000:7.2f} ms")
+
+    # 取込み結果が従来の結合と同じこと[任意の区切りで](Ingestion matches the previous join [for any split])
+    aryLines = getSegments(300, objRandom)
+    strExpect = ""
+    for strLine in aryLines:
+        strLine = util_cmn.getCleanText(strLine)
+        if strLine:
+            strExpect = getLegacyJoinStrings(strExpect, strLine)
+    for intPiece in (1, 7, 4096):
+        aryRecords = await getRecords(getBody(aryLines, 1, intPiece), intChunkSize=500, intOverlap=50, intMaxOverlap=1000)
+        strJoined = aryRecords[0]["text"] + "".join(objRecord["text"][50:] for objRecord in aryRecords[1:])
+        assert strJoined == strExpect, intPiece
+    print("stitching matches getJoinStrings")
+
+    # 大きな入力でのスループットとメモリ(Throughput and memory on a large input)
+    aryLines = getSegments(2000, objRandom)
+    intBodyBytes = len(("\r\n".join(aryLines) + "\r\n").encode('utf-8'))
+    intRepeat = max(1, intMegabytes * 1024 * 1024 // intBodyBytes)
+
+    tracemalloc.start()
+    fltStart = time.perf_counter()
+    intRecords = 0
+    async for aryChunk in ingest_fnc.getIngestRecords(getBody(aryLines, intRepeat, 65536), intChunkSize=2000, intOverlap=200, intMaxOverlap=1000):
+        intRecords += len(aryChunk)
+    fltElapsed = time.perf_counter() - fltStart
+    _, intPeak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    fltMegabytes = intBodyBytes * intRepeat / 1024 / 1024
+    print(f"ingest {fltMegabytes:.0f} MB: {fltMegabytes / fltElapsed:.1f} MB/s, {intRecords:,} chunks, peak traced memory {intPeak / 1024 / 1024:.1f} MB")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,118 @@
+# JSONレスポンスのベンチマーク[DB行10,000件](Benchmark for JSON responses [10,000 DB rows])
+# 実行方法(usage): python benchmarks/bench_json.py [件数]
+import os
+import sys
+import json
+import time
+import base64
+import random
+import asyncio
+import datetime
+from decimal import Decimal
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import httpx
+
+from fastapi import FastAPI, APIRouter
+from fastapi.responses import JSONResponse
+from fastapi.encoders import jsonable_encoder
+
+from functions import response_fnc
+from util import util_cmn
+
+def getRows(intCount: int, objRandom):
+    """
+    DictCursorの行と同じ型の値(Values of the same types as DictCursor rows)
+    """
+
+    objBase = datetime.datetime(2024, 1, 1, 9, 0, 0)
+
+    return [{
+        "id": i,
+        "order_no": f"A{i:08d}",
+        "name": objRandom.choice(["送料無料 セール商品", "在庫あり", "limited edition", "日本語の商品名"]),
+        "price": Decimal(objRandom.randrange(100, 100000)) / 100,
+        "quantity": Decimal(objRandom.randrange(1, 10)),
+        "rate": objRandom.random(),
+        "created_at": objBase + datetime.timedelta(seconds=objRandom.randrange(10 ** 7), microseconds=objRandom.randrange(10 ** 6)),
+        "ship_date": datetime.date(2024, 1, 1) + datetime.timedelta(days=objRandom.randrange(365)),
+        "token": objRandom.randbytes(12).hex().encode(),
+        "note": None if i % 3 else "備考",
+        "tags": ["a", "b"],
+    } for i in range(intCount)]
+
+def getLegacyBody(aryRows):
+    """
+    従来の処理[getEncodeDictToUtf8→jsonable_encoder→json.dumps](Previous path [getEncodeDictToUtf8, jsonable_encoder, json.dumps])
+    """
+
+    return JSONResponse(jsonable_encoder(util_cmn.getEncodeDictToUtf8({"rows": aryRows}))).body
+
+def getExpected(aryRows):
+    """
+    期待するJSON[従来の処理と同じ、バイト列のみBase64](Expected JSON [same as the previous path except bytes become Base64])
+    """
+
+    objExpected = json.loads(getLegacyBody(aryRows))
+    for aryRow, aryExpected in zip(aryRows, objExpected["rows"]):
+        aryExpected["token"] = base64.b64encode(aryRow["token"]).decode('ascii')
+
+    return objExpected
+
+def getApp(blnOrjson: bool, aryRows):
+    objRouter = APIRouter(route_class=response_fnc.OrjsonRoute) if blnOrjson else APIRouter()
+
+    if blnOrjson:
+        @objRouter.get("/rows")
+        async def get_rows():
+            return {"rows": aryRows}
+    else:
+        @objRouter.get("/rows")
+        async def get_rows():
+            return util_cmn.getEncodeDictToUtf8({"rows": aryRows})
+
+    objApp = FastAPI(default_response_class=response_fnc.OrjsonResponse) if blnOrjson else FastAPI()
+    objApp.include_router(objRouter)
+
+    return objApp
+
+async def main():
+    intCount = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    aryRows = getRows(intCount, random.Random(0))
+
+    # 同じJSONになること(Same JSON)
+    objLegacy = json.loads(getLegacyBody(aryRows))
+    objExpected = getExpected(aryRows)
+    assert json.loads(response_fnc.OrjsonResponse({"rows": aryRows}).body) == objExpected
+    assert json.loads(response_fnc.getJsonBytes({1: datetime.timedelta(seconds=1.5), "s": {3}})) == json.loads(JSONResponse(jsonable_encoder({1: datetime.timedelta(seconds=1.5), "s": {3}})).body)
+
+    def setReport(strName: str, objFunc, intRepeat: int=5):
+        fltBest = float("inf")
+        for _ in range(intRepeat):
+            fltStart = time.perf_counter()
+            objFunc()
+            fltBest = min(fltBest, time.perf_counter() - fltStart)
+        print(f"{strName:<36} {fltBest * 1000:8.1f} ms  {intCount / fltBest:>11,.0f} rows/s")
+
+    print(f"{intCount:,} rows, {len(getLegacyBody(aryRows)) / 1024 / 1024:.1f} MB JSON")
+    setReport("legacy: getEncodeDictToUtf8", lambda: util_cmn.getEncodeDictToUtf8({"rows": aryRows}))
+    setReport("legacy: jsonable_encoder", lambda: jsonable_encoder({"rows": aryRows}))
+    setReport("legacy: total render", lambda: getLegacyBody(aryRows))
+    setReport("OrjsonResponse render", lambda: response_fnc.OrjsonResponse({"rows": aryRows}).body)
+
+    # ASGI経由のリクエスト全体(Whole request through ASGI)
+    for strName, blnOrjson in (("legacy app", False), ("OrjsonRoute app", True)):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=getApp(blnOrjson, aryRows)), base_url="http://test") as objClient:
+            objResponse = await objClient.get("/rows")
+            assert objResponse.json() == (objExpected if blnOrjson else objLegacy)
+            fltBest = float("inf")
+            for _ in range(5):
+                fltStart = time.perf_counter()
+                await objClient.get("/rows")
+                fltBest = min(fltBest, time.perf_counter() - fltStart)
+            print(f"{'request: ' + strName:<36} {fltBest * 1000:8.1f} ms  {intCount / fltBest:>11,.0f} rows/s")
+
+if __name__ == "__main__":
+    asyncio.run(main())
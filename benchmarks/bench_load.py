@@ -0,0 +1,332 @@
+# main:appの負荷・レイテンシのベンチマーク[疑似MySQLプール使用、MySQL不要](Load and latency benchmark for main:app [fake MySQL pool, no MySQL needed])
+# 実行方法(usage): python benchmarks/bench_load.py [--mode asgi|socket|both] [--concurrency 16] [--duration 3] [--latency-ms 1]
+#                 基準値の保存(save baseline): python benchmarks/bench_load.py --save-baseline
+# 出力先(output): --output または BENCH_LOAD_OUTPUT[既定は一時ディレクトリ](--output or BENCH_LOAD_OUTPUT [a temp directory by default])
+# 結果はJSONで保存し、基準値からの悪化が閾値を超えた場合は終了コード1(Results are saved as JSON, exits with 1 when worse than the baseline by more than the threshold)
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import logging
+import argparse
+import datetime
+import platform
+import tempfile
+import multiprocessing
+from decimal import Decimal
+
+strRoot = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, strRoot)
+os.chdir(strRoot)
+
+BENCH_API_KEY = "bench-key"
+BENCH_PORT = 18090
+BENCH_BASELINE = os.path.join(strRoot, "benchmarks", "bench_load_baseline.json")
+
+# main読込前の設定[レート制限なし・認証キーは環境変数のみ](Settings before importing main [no rate limit, keys only from the environment])
+os.environ.setdefault("APP_ROUTERS", "test")
+os.environ["getApikey"] = BENCH_API_KEY
+os.environ["APIKEY_REFRESH_INTERVAL"] = "0"
+os.environ["RATELIMIT_RATE"] = "1000000000"
+os.environ["RATELIMIT_BURST"] = "1000000000"
+BENCH_TMP_DIR = tempfile.mkdtemp(prefix="bench_load_")
+os.environ["RATELIMIT_FILE"] = os.path.join(BENCH_TMP_DIR, "ratelimit")
+
+# アプリのログ・プロファイルもリポジトリの外へ(App logs and profiles also go outside the repository)
+os.environ.setdefault("LOG_DIR", BENCH_TMP_DIR)
+os.environ.setdefault("PROFILE_DIR", os.path.join(BENCH_TMP_DIR, "profile"))
+
+import httpx
+import uvicorn
+
+from fastapi import APIRouter, Depends
+
+import main
+from functions import dbpool_fnc
+from functions import mysqlaio_fnc
+from functions import response_fnc
+from functions import unitofwork_fnc
+
+from benchmarks import fakedb
+
+def getBenchRows(strSql: str, aryParam):
+    """
+    疑似プールの応答[DictCursorの行と同じ型](Fake pool answer [same types as DictCursor rows])
+    """
+
+    if "FROM bench_rows" in strSql:
+        objBase = datetime.datetime(2024, 1, 1, 9, 0, 0)
+        return [{
+            "id": i,
+            "order_no": f"A{i:08d}",
+            "name": "送料無料 セール商品",
+            "price": Decimal(i * 37 % 100000) / 100,
+            "created_at": objBase + datetime.timedelta(seconds=i * 61),
+            "token": b"0123456789abcdef",
+            "note": None,
+        } for i in range(int(aryParam[0]) if aryParam else 1)]
+
+    return fakedb.getDefaultRows(strSql, aryParam)
+
+# mysqlaio_fncの処理とレスポンス変換を通すベンチマーク用のルート(Benchmark routes going through the mysqlaio_fnc helpers and response rendering)
+objBenchRouter = APIRouter(route_class=response_fnc.OrjsonRoute)
+
+@objBenchRouter.get("/bench/rows")
+async def get_bench_rows(count: int=100, db_pool=Depends(main.get_db_pool)):
+    return {"rows": await mysqlaio_fnc.getQuery(db_pool, "get_bench_rows", "SELECT * FROM bench_rows LIMIT %s", (count,))}
+
+@objBenchRouter.get("/bench/row")
+async def get_bench_row(db_pool=Depends(main.get_db_pool)):
+    return await mysqlaio_fnc.getFetchOneQuery(db_pool, "get_bench_row", "SELECT * FROM bench_rows WHERE id = %s", (1,))
+
+@objBenchRouter.post("/bench/write")
+async def post_bench_write(db_pool=Depends(main.get_db_pool)):
+    return {"ok": await mysqlaio_fnc.execQuery(db_pool, "post_bench_write", "UPDATE bench_rows SET note = %s WHERE id = %s", ("bench", 1))}
+
+# 負荷側のリクエストごとのログを出さない(No per-request logs from the load generator)
+logging.getLogger("httpx").setLevel(logging.WARNING)
+
+# 1リクエストで5クエリ[クエリごとに接続を取得/ユニットオブワークで1接続を共有](five queries per request [a checkout per query / one shared connection in a unit of work])
+async def getMultiRows(db_pool):
+    return {"rows": [
+        await mysqlaio_fnc.getFetchOneQuery(db_pool, "get_bench_multi", "SELECT * FROM bench_rows WHERE id = %s", (i,)) for i in range(5)
+    ]}
+
+@objBenchRouter.get("/bench/multi")
+async def get_bench_multi(db_pool=Depends(main.get_db_pool)):
+    return await getMultiRows(db_pool)
+
+@objBenchRouter.get("/bench/multi_uow")
+async def get_bench_multi_uow(objUnitOfWork=Depends(unitofwork_fnc.getRequestUnitOfWork, scope="function"), db_pool=Depends(main.get_db_pool)):
+    return await getMultiRows(db_pool)
+
+main.app.include_router(objBenchRouter, dependencies=[Depends(main.check_rate_limit)])
+
+# 計測するルート[名前, メソッド, パス, 認証キー, 期待するステータス](routes measured [name, method, path, API key, expected status])
+BENCH_ROUTES = [
+    ("test", "POST", "/v1/test", BENCH_API_KEY, 200),
+    ("auth_denied", "POST", "/v1/test", "invalid-key", 403),
+    ("rows_100", "GET", "/bench/rows?count=100", BENCH_API_KEY, 200),
+    ("rows_1000", "GET", "/bench/rows?count=1000", BENCH_API_KEY, 200),
+    ("row", "GET", "/bench/row", BENCH_API_KEY, 200),
+    ("write", "POST", "/bench/write", BENCH_API_KEY, 200),
+    ("multi", "GET", "/bench/multi", BENCH_API_KEY, 200),
+    ("multi_uow", "GET", "/bench/multi_uow", BENCH_API_KEY, 200),
+    ("metrics", "GET", "/metrics", None, 200),
+]
+
+def getPercentile(aryValues: list, fltPercent: float):
+    # 最近傍順位法[aryValuesは昇順](nearest-rank method [aryValues sorted ascending])
+    return aryValues[max(0, min(len(aryValues) - 1, int(len(aryValues) * fltPercent / 100 + 0.5) - 1))]
+
+async def getRouteResult(objClient, aryRoute, intConcurrency: int, fltDuration: float, objAcquires=None):
+    """
+    1ルートの計測[intConcurrency件を同時に送り続ける](Measure one route [keeps intConcurrency requests in flight])
+
+    Args:
+
+        objAcquires (function): 疑似プールの接続取得回数を返す関数[プロセス内のみ](function returning the fake pool's checkouts [in process only])
+
+    Returns:
+
+        dict:RPS・レイテンシ[ミリ秒]・エラー数・1リクエストあたりの接続取得回数(RPS, latency [ms], errors and checkouts per request)
+    """
+
+    strName, strMethod, strPath, strKey, intStatus = aryRoute
+    aryHeaders = {"Authorization": strKey} if strKey else {}
+    aryLatencies = []
+    aryErrors = []
+
+    async def execWorker(fltEnd: float, blnRecord: bool):
+        while time.perf_counter() < fltEnd:
+            fltStart = time.perf_counter()
+            try:
+                objResponse = await objClient.request(strMethod, strPath, headers=aryHeaders)
+                await objResponse.aread()
+                blnOk = objResponse.status_code == intStatus
+            except httpx.HTTPError as e:
+                blnOk = False
+                objResponse = e
+            if blnRecord:
+                aryLatencies.append(time.perf_counter() - fltStart)
+                if not blnOk:
+                    aryErrors.append(getattr(objResponse, "status_code", repr(objResponse)))
+
+    # 準備運転[接続・キャッシュ](warm-up [connections and caches])
+    await asyncio.gather(*[execWorker(time.perf_counter() + min(0.5, fltDuration / 4), False) for _ in range(intConcurrency)])
+
+    intAcquires = objAcquires() if objAcquires else 0
+    fltStart = time.perf_counter()
+    await asyncio.gather(*[execWorker(fltStart + fltDuration, True) for _ in range(intConcurrency)])
+    fltElapsed = time.perf_counter() - fltStart
+
+    aryLatencies.sort()
+    if aryErrors:
+        print(f"  {strName}: {len(aryErrors)} unexpected responses, first: {aryErrors[0]}")
+
+    objResult = {
+        "requests": len(aryLatencies),
+        "errors": len(aryErrors),
+        "rps": len(aryLatencies) / fltElapsed,
+        "p50_ms": getPercentile(aryLatencies, 50) * 1000,
+        "p95_ms": getPercentile(aryLatencies, 95) * 1000,
+        "p99_ms": getPercentile(aryLatencies, 99) * 1000,
+    }
+    if objAcquires:
+        objResult["acquires_per_request"] = (objAcquires() - intAcquires) / max(1, len(aryLatencies))
+
+    return objResult
+
+async def getModeResults(objClient, aryRoutes, intConcurrency: int, fltDuration: float, strMode: str, objAcquires=None):
+    aryResults = {}
+    for aryRoute in aryRoutes:
+        aryResults[aryRoute[0]] = objResult = await getRouteResult(objClient, aryRoute, intConcurrency, fltDuration, objAcquires)
+        print(
+            f"{strMode:<7}{aryRoute[0]:<12} {objResult['rps']:>9,.0f} req/s  p50 {objResult['p50_ms']:7.2f}  "
+            f"p95 {objResult['p95_ms']:7.2f}  p99 {objResult['p99_ms']:7.2f} ms  errors {objResult['errors']}"
+            + (f"  acquires/req {objResult['acquires_per_request']:.2f}" if "acquires_per_request" in objResult else "")
+        )
+
+    return aryResults
+
+async def getAsgiResults(aryRoutes, intConcurrency: int, fltDuration: float):
+    """
+    プロセス内[ASGI]での計測(Measure in process [ASGI])
+    """
+
+    async with main.app.router.lifespan_context(main.app):
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=main.app), base_url="http://bench") as objClient:
+            return await getModeResults(
+                objClient, aryRoutes, intConcurrency, fltDuration, "asgi", lambda: main.app.state.db_pool.objPool.intAcquires
+            )
+
+def setServe(intPort: int):
+    # 子プロセスでuvicornを起動[疑似プールの設定はforkで引き継ぐ](uvicorn in a child process [the fake pool setting is inherited through fork])
+    uvicorn.run(main.app, host="127.0.0.1", port=intPort, log_level="warning")
+
+async def getSocketResults(aryRoutes, intConcurrency: int, fltDuration: float):
+    """
+    実ソケット[別プロセスのuvicorn]での計測(Measure over a real socket [uvicorn in another process])
+    """
+
+    objProcess = multiprocessing.get_context("fork").Process(target=setServe, args=(BENCH_PORT,), daemon=True)
+    objProcess.start()
+    try:
+        fltDeadline = time.monotonic() + 30
+        while True:
+            try:
+                socket.create_connection(("127.0.0.1", BENCH_PORT), timeout=1).close()
+                break
+            except OSError:
+                if time.monotonic() > fltDeadline or not objProcess.is_alive():
+                    raise RuntimeError("benchmark server did not start")
+                await asyncio.sleep(0.1)
+
+        objLimits = httpx.Limits(max_connections=intConcurrency, max_keepalive_connections=intConcurrency)
+        async with httpx.AsyncClient(base_url=f"http://127.0.0.1:{BENCH_PORT}", limits=objLimits, timeout=30) as objClient:
+            return await getModeResults(objClient, aryRoutes, intConcurrency, fltDuration, "socket")
+    finally:
+        objProcess.terminate()
+        objProcess.join(10)
+
+def getRegressions(objResult: dict, objBaseline: dict, fltThreshold: float, fltMinDeltaMs: float):
+    """
+    基準値との比較(Compare with the baseline)
+
+    RPSの低下またはp99の増加が閾値を超えたルート[p99はfltMinDeltaMs未満の差は無視]
+    (Routes whose RPS dropped or p99 grew by more than the threshold [p99 differences under fltMinDeltaMs are ignored])
+
+    Returns:
+
+        list:悪化した項目の説明(descriptions of regressions)
+    """
+
+    aryRegressions = []
+    for strMode, aryRoutes in objResult["results"].items():
+        for strRoute, objNow in aryRoutes.items():
+            objBase = objBaseline.get("results", {}).get(strMode, {}).get(strRoute)
+            if objBase is None:
+                continue
+            if objNow["rps"] < objBase["rps"] * (1 - fltThreshold):
+                aryRegressions.append(f"{strMode}/{strRoute}: {objNow['rps']:,.0f} req/s < baseline {objBase['rps']:,.0f}")
+            if objNow["p99_ms"] > objBase["p99_ms"] * (1 + fltThreshold) and objNow["p99_ms"] - objBase["p99_ms"] > fltMinDeltaMs:
+                aryRegressions.append(f"{strMode}/{strRoute}: p99 {objNow['p99_ms']:.2f} ms > baseline {objBase['p99_ms']:.2f} ms")
+            if objNow["errors"] > objBase["errors"]:
+                aryRegressions.append(f"{strMode}/{strRoute}: {objNow['errors']} errors > baseline {objBase['errors']}")
+
+    return aryRegressions
+
+async def main_bench():
+    objParser = argparse.ArgumentParser(description="Load and latency benchmark for main:app with a fake MySQL pool")
+    objParser.add_argument("--mode", choices=["asgi", "socket", "both"], default="both")
+    objParser.add_argument("--concurrency", type=int, default=16)
+    objParser.add_argument("--duration", type=float, default=3.0, help="seconds per route")
+    objParser.add_argument("--latency-ms", type=float, default=1.0, help="simulated MySQL round trip")
+    objParser.add_argument("--pool", type=int, default=10, help="pool maxsize")
+    objParser.add_argument("--routes", default="", help="comma separated route names (default: all)")
+    objParser.add_argument("--output", default=os.getenv("BENCH_LOAD_OUTPUT", os.path.join(BENCH_TMP_DIR, "bench_load.json")))
+    objParser.add_argument("--baseline", default=BENCH_BASELINE)
+    objParser.add_argument("--save-baseline", action="store_true")
+    objParser.add_argument("--threshold", type=float, default=float(os.getenv("BENCH_LOAD_THRESHOLD", "0.25")), help="allowed relative regression")
+    objParser.add_argument("--min-delta-ms", type=float, default=1.0, help="ignore p99 increases smaller than this")
+    objArgs = objParser.parse_args()
+
+    aryNames = [strName.strip() for strName in objArgs.routes.split(",") if strName.strip()]
+    aryRoutes = [aryRoute for aryRoute in BENCH_ROUTES if not aryNames or aryRoute[0] in aryNames]
+
+    os.environ["MYSQL_POOL_MAXSIZE"] = str(objArgs.pool)
+    dbpool_fnc.setCreatePool(fakedb.getCreatePool(objArgs.latency_ms / 1000, objRows=getBenchRows))
+
+    objResult = {
+        "meta": {
+            "date": datetime.datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "cpus": os.cpu_count(),
+            "concurrency": objArgs.concurrency,
+            "duration": objArgs.duration,
+            "latency_ms": objArgs.latency_ms,
+            "pool": objArgs.pool,
+            "routers": os.environ["APP_ROUTERS"],
+        },
+        "results": {},
+    }
+
+    print(f"concurrency {objArgs.concurrency}, {objArgs.duration:g} s per route, fake MySQL round trip {objArgs.latency_ms:g} ms, pool {objArgs.pool}")
+    if objArgs.mode in ("asgi", "both"):
+        objResult["results"]["asgi"] = await getAsgiResults(aryRoutes, objArgs.concurrency, objArgs.duration)
+    if objArgs.mode in ("socket", "both"):
+        objResult["results"]["socket"] = await getSocketResults(aryRoutes, objArgs.concurrency, objArgs.duration)
+
+    os.makedirs(os.path.dirname(objArgs.output), exist_ok=True)
+    with open(objArgs.output, "w") as f:
+        json.dump(objResult, f, indent=2)
+    print(f"results written to {objArgs.output}")
+
+    if objArgs.save_baseline:
+        with open(objArgs.baseline, "w") as f:
+            json.dump(objResult, f, indent=2)
+        print(f"baseline saved to {objArgs.baseline}")
+        return
+
+    if not os.path.exists(objArgs.baseline):
+        print(f"no baseline at {objArgs.baseline} (create it with --save-baseline)")
+        return
+
+    with open(objArgs.baseline) as f:
+        objBaseline = json.load(f)
+    if objBaseline["meta"]["latency_ms"] != objArgs.latency_ms or objBaseline["meta"]["concurrency"] != objArgs.concurrency:
+        print("warning: baseline was recorded with different --latency-ms or --concurrency")
+
+    aryRegressions = getRegressions(objResult, objBaseline, objArgs.threshold, objArgs.min_delta_ms)
+    if aryRegressions:
+        print(f"REGRESSION (threshold {objArgs.threshold:.0%}):")
+        for strRegression in aryRegressions:
+            print(f"  {strRegression}")
+        sys.exit(1)
+
+    print(f"no regression against baseline (threshold {objArgs.threshold:.0%})")
+
+if __name__ == "__main__":
+    asyncio.run(main_bench())
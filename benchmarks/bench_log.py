@@ -0,0 +1,85 @@
+# クエリ毎のログ準備オーバーヘッドのベンチマーク(Benchmark for per-query logging overhead)
+# 実行方法(usage): python benchmarks/bench_log.py
+import os
+import sys
+import json
+import time
+import logging
+import tempfile
+from logging import getLogger, config
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from functions import log_fnc
+
+def setLegacyOutputLog(strLogDir: str):
+    """
+    従来の呼び出し毎のログ設定(Previous per-call logging setup)
+    """
+
+    with open(os.getcwd() + '/log_config.json', 'r') as f:
+        objLogConf = json.load(f)
+
+    if not os.path.isdir(strLogDir):
+        os.makedirs(strLogDir)
+
+    strDatetimeDat = datetime.now()
+    objLogConf["handlers"]["fileHandler"] = {
+        "class": "logging.FileHandler",
+        "level": "INFO",
+        "formatter": "simple",
+        "filename": strLogDir + 'python-{}.logs'.format(strDatetimeDat.strftime("%Y%m%d")),
+    }
+
+    for handler in objLogConf["handlers"].values():
+        handler["formatter"] = "custom"
+
+    objLogConf["formatters"]["custom"] = {
+        "()": log_fnc.CustomFormatter,
+        "format": "[%(asctime)s][%(clientip)s][%(name)s:%(lineno)s][%(funcName)s][%(levelname)s]: %(message)s"
+    }
+
+    config.dictConfig(objLogConf)
+
+    return getLogger()
+
+def getTime(objFunc, intLoop: int):
+    fltStart = time.perf_counter()
+    for _ in range(intLoop):
+        objFunc()
+    return (time.perf_counter() - fltStart) / intLoop * 1e6
+
+def main():
+    intLoop = 2000
+    strLogDir = tempfile.mkdtemp() + '/'
+    aryLogExtra = {'clientip': '127.0.0.1'}
+
+    # 標準出力は捨てる(Discard console output)
+    objStdout = sys.stdout
+    sys.stdout = open(os.devnull, 'w')
+    try:
+        fltLegacySetup = getTime(lambda: setLegacyOutputLog(strLogDir), intLoop)
+        fltLegacyLog = getTime(lambda: setLegacyOutputLog(strLogDir).info("query", extra=aryLogExtra), intLoop)
+
+        # 従来設定のハンドラを閉じてから新方式を設定(Close the legacy handlers before the new setup)
+        for objHandler in getLogger().handlers:
+            objHandler.close()
+        os.environ["LOG_DIR"] = strLogDir
+        log_fnc.setupLogging()
+
+        fltSetup = getTime(lambda: log_fnc.getOutputLog(), intLoop * 100)
+        fltLog = getTime(lambda: log_fnc.getOutputLog().info("query", extra=aryLogExtra), intLoop)
+        log_fnc.shutdownLogging()
+    finally:
+        sys.stdout.close()
+        sys.stdout = objStdout
+
+    print(f"legacy setOutputLog      : {fltLegacySetup:10.2f} us/query")
+    print(f"legacy setOutputLog + log: {fltLegacyLog:10.2f} us/query")
+    print(f"getOutputLog             : {fltSetup:10.3f} us/query")
+    print(f"getOutputLog + log       : {fltLog:10.2f} us/query")
+
+if __name__ == "__main__":
+    main()
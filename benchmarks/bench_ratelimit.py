@@ -0,0 +1,73 @@
+# レート制限のオーバーヘッドとワーカー間の整合性のベンチマーク(Benchmark for rate limiter overhead and consistency across workers)
+# 実行方法(usage): python benchmarks/bench_ratelimit.py
+import os
+import sys
+import time
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from functions import ratelimit_fnc
+
+def execWorker(strPath: str, fltRate: float, fltBurst: float, fltSeconds: float, objQueue):
+    """
+    同じキーへ一定時間リクエストし続けるワーカー(Worker hammering the same key for a while)
+    """
+
+    objRateLimiter = ratelimit_fnc.RateLimiter(strPath, 1024)
+    intAllowed = 0
+    intCalls = 0
+    fltEnd = time.monotonic() + fltSeconds
+    while time.monotonic() < fltEnd:
+        blnAllowed, _ = objRateLimiter.take("shared-key|/v1/test", fltRate, fltBurst)
+        intAllowed += blnAllowed
+        intCalls += 1
+    objRateLimiter.close()
+    objQueue.put((intAllowed, intCalls))
+
+def main():
+    strPath = os.path.join(tempfile.mkdtemp(), "ratelimit.bin")
+
+    # 1プロセスでの1回あたりの時間(per call time in one process)
+    objRateLimiter = ratelimit_fnc.RateLimiter(strPath, 65536)
+    intLoop = 200000
+    fltStart = time.perf_counter()
+    for i in range(intLoop):
+        objRateLimiter.take(f"key{i % 1000}|/v1/test", 1e9, 1e9)
+    fltElapsed = time.perf_counter() - fltStart
+    print(f"take(): {fltElapsed / intLoop * 1e6:.2f} us/call ({intLoop / fltElapsed:,.0f} calls/s)")
+    objRateLimiter.close()
+
+    # 複数プロセスで同じキーを消費し、許可数が上限[バースト + 補充量]を超えないこと
+    # (Several processes drain one key, the allowed count must not exceed burst + refill)
+    intWorkers = max(2, min(8, os.cpu_count() or 2))
+    fltRate = 100.0
+    fltBurst = 50.0
+    fltSeconds = 2.0
+    objQueue = multiprocessing.Queue()
+    aryProcess = [
+        multiprocessing.Process(target=execWorker, args=(strPath, fltRate, fltBurst, fltSeconds, objQueue))
+        for _ in range(intWorkers)
+    ]
+    fltStart = time.monotonic()
+    for objProcess in aryProcess:
+        objProcess.start()
+    aryResult = [objQueue.get() for _ in aryProcess]
+    for objProcess in aryProcess:
+        objProcess.join()
+    fltElapsed = time.monotonic() - fltStart
+
+    intAllowed = sum(intAllowed for intAllowed, _ in aryResult)
+    intCalls = sum(intCalls for _, intCalls in aryResult)
+    intLimit = int(fltBurst + fltRate * fltElapsed)
+    print(f"{intWorkers} workers: {intCalls:,} calls, {intAllowed} allowed, limit {intLimit} (burst {fltBurst:.0f} + {fltRate:.0f}/s x {fltElapsed:.2f}s)")
+
+    if intAllowed > intLimit:
+        print("NG: allowed requests exceeded the shared limit")
+        sys.exit(1)
+    print("OK")
+
+if __name__ == "__main__":
+    main()
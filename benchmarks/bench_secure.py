@@ -0,0 +1,75 @@
+# 復号化のスループットのベンチマーク(Benchmark for decryption throughput)
+# 実行方法(usage): python benchmarks/bench_secure.py
+import os
+import sys
+import time
+import base64
+import asyncio
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+os.environ.setdefault("APP_ENCRYPT_KEY", "0123456789abcdef0123456789abcdef")
+
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import padding
+
+from functions import secure_fnc
+
+def getLegacyDecrypt(strText: str):
+    """
+    従来の呼び出し毎に鍵を読込む復号化(Previous decryption reading the key per call)
+    """
+
+    strKey = os.getenv("APP_ENCRYPT_KEY")
+    strData = base64.b64decode(strText)
+    intIvLength = algorithms.AES(strKey.encode()).block_size // 8
+    objCipher = Cipher(algorithms.AES(strKey.encode()), modes.CBC(strData[:intIvLength]), backend=default_backend())
+    objDecryptor = objCipher.decryptor()
+    strDecrypted = objDecryptor.update(strData[intIvLength:]) + objDecryptor.finalize()
+    objPadder = padding.PKCS7(128).unpadder()
+    strDecrypted = (objPadder.update(strDecrypted) + objPadder.finalize()).decode('utf-8')
+
+    return strDecrypted[:-ord(strDecrypted[-1])]
+
+def setReport(strName: str, fltElapsed: float, intRows: int, intBytes: int):
+    print(f"{strName:<28} {intRows / fltElapsed:>12,.0f} rows/s {intBytes / fltElapsed / 1e6:>8.2f} MB/s")
+
+async def main():
+    for intLength in (32, 4096):
+        intRows = 20000
+        aryPlain = [f"{i:08d}-" + "x" * intLength for i in range(intRows)]
+        aryTexts = [secure_fnc.getEncrypt(strText) for strText in aryPlain]
+        intBytes = sum(len(strText) for strText in aryTexts)
+
+        # 暗号化結果が従来の復号化で戻せること(Encrypted rows must round-trip through the previous decryption)
+        assert [getLegacyDecrypt(strText) for strText in aryTexts[:100]] == aryPlain[:100]
+
+        print(f"--- {intRows:,} rows x {intLength + 9} chars ---")
+
+        fltStart = time.perf_counter()
+        aryLegacy = [getLegacyDecrypt(strText) for strText in aryTexts]
+        setReport("legacy per row", time.perf_counter() - fltStart, intRows, intBytes)
+
+        fltStart = time.perf_counter()
+        aryResult = [await secure_fnc.getOpensslDecrypt(strText) for strText in aryTexts]
+        setReport("getOpensslDecrypt per row", time.perf_counter() - fltStart, intRows, intBytes)
+
+        fltStart = time.perf_counter()
+        aryBatch = await secure_fnc.getOpensslDecryptBatch(aryTexts, intRows + 1)
+        setReport("batch inline", time.perf_counter() - fltStart, intRows, intBytes)
+
+        fltStart = time.perf_counter()
+        aryOffload = await secure_fnc.getOpensslDecryptBatch(aryTexts, 0)
+        setReport("batch thread pool", time.perf_counter() - fltStart, intRows, intBytes)
+
+        assert aryLegacy == aryResult == aryBatch["result"] == aryOffload["result"] == aryPlain
+
+    aryBad = await secure_fnc.getOpensslDecryptBatch(["", "not base64!", aryTexts[0]])
+    print("errors:", aryBad["error"])
+
+    secure_fnc.shutdownSecureExecutor()
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,102 @@
+# main:appの起動時間とメモリの計測[予算を超えた場合は終了コード1](Boot time and memory of main:app [exits with 1 over budget])
+# 実行方法(usage): python benchmarks/bench_startup.py [回数]
+# 予算(budgets): STARTUP_IMPORT_BUDGET_MS, STARTUP_RSS_BUDGET_MB / 対象のルーター(routers measured): APP_ROUTERS
+import os
+import sys
+import json
+import statistics
+import subprocess
+
+strRoot = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+os.chdir(strRoot)
+
+# 取込み時間[ミリ秒]と常駐メモリ[MB]の上限(limits for import time [ms] and resident memory [MB])
+STARTUP_IMPORT_BUDGET_MS = float(os.getenv("STARTUP_IMPORT_BUDGET_MS", "1500"))
+STARTUP_RSS_BUDGET_MB = float(os.getenv("STARTUP_RSS_BUDGET_MB", "150"))
+
+# 新しいプロセスでmainを読込み、時間と常駐メモリを返す(Import main in a fresh process and report time and resident memory)
+_strProbe = """
+import json, time
+fltStart = time.perf_counter()
+{imports}
+fltElapsed = time.perf_counter() - fltStart
+intRss = 0
+with open("/proc/self/status") as f:
+    for strLine in f:
+        if strLine.startswith("VmRSS:"):
+            intRss = int(strLine.split()[1]) * 1024
+print(json.dumps({{"ms": fltElapsed * 1000, "rss": intRss}}))
+"""
+
+def getProbe(strImports: str, blnImportTime: bool=False):
+    """
+    計測用プロセスの実行(Run one measuring process)
+
+    Returns:
+
+        tuple:(結果, importtimeの出力)(result, importtime output)
+    """
+
+    aryCommand = [sys.executable] + (["-X", "importtime"] if blnImportTime else []) + ["-c", _strProbe.format(imports=strImports)]
+    objResult = subprocess.run(aryCommand, cwd=strRoot, capture_output=True, text=True, env=dict(os.environ, PYTHONDONTWRITEBYTECODE="0"))
+    if objResult.returncode != 0:
+        print(objResult.stderr[-3000:])
+        sys.exit(2)
+
+    return json.loads(objResult.stdout.strip().splitlines()[-1]), objResult.stderr
+
+def getImportTimes(strOutput: str):
+    """
+    importtimeの出力から累積時間を取得(Cumulative times from -X importtime output)
+
+    Returns:
+
+        list:[(累積マイクロ秒, 階層, モジュール名)]([(cumulative us, depth, module)])
+    """
+
+    aryTimes = []
+    for strLine in strOutput.splitlines():
+        if not strLine.startswith("import time:") or "cumulative" in strLine:
+            continue
+        _, strCumulative, strName = strLine[len("import time:"):].split("|")
+        aryTimes.append((int(strCumulative), (len(strName) - len(strName.lstrip())) // 2, strName.strip()))
+
+    return aryTimes
+
+def setReport(strName: str, strImports: str, intRuns: int):
+    aryResults = [getProbe(strImports)[0] for _ in range(intRuns)]
+    fltMs = statistics.median(objResult["ms"] for objResult in aryResults)
+    fltRss = statistics.median(objResult["rss"] for objResult in aryResults) / 1024 / 1024
+    print(f"{strName:<44} import {fltMs:7.0f} ms  RSS {fltRss:6.1f} MB")
+
+    return fltMs, fltRss
+
+def main():
+    intRuns = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+
+    # 時間のかかるモジュール(slowest modules)
+    _, strOutput = getProbe("import main", True)
+    aryTimes = getImportTimes(strOutput)
+    print("slowest top-level imports of main:")
+    for intCumulative, _, strModule in sorted([objTime for objTime in aryTimes if objTime[1] == 1], reverse=True)[:10]:
+        print(f"  {intCumulative / 1000:7.1f} ms  {strModule}")
+    aryHeavy = {strModule for _, _, strModule in aryTimes} & {"pandas", "numpy", "tiktoken", "openai", "langchain", "bs4"}
+    print(f"heavy libraries loaded by main: {sorted(aryHeavy) or 'none'}")
+
+    fltMs, fltRss = setReport(f"main (APP_ROUTERS={os.getenv('APP_ROUTERS', 'default')})", "import main", intRuns)
+    setReport("main + eager pandas/tiktoken/openai", "import main, pandas, tiktoken, openai", intRuns)
+    setReport("fastapi only", "import fastapi", intRuns)
+
+    aryOver = []
+    if fltMs > STARTUP_IMPORT_BUDGET_MS:
+        aryOver.append(f"import {fltMs:.0f} ms > {STARTUP_IMPORT_BUDGET_MS:.0f} ms")
+    if fltRss > STARTUP_RSS_BUDGET_MB:
+        aryOver.append(f"RSS {fltRss:.1f} MB > {STARTUP_RSS_BUDGET_MB:.0f} MB")
+    if aryOver:
+        print("OVER BUDGET: " + ", ".join(aryOver))
+        sys.exit(1)
+
+    print(f"within budget (import {STARTUP_IMPORT_BUDGET_MS:.0f} ms, RSS {STARTUP_RSS_BUDGET_MB:.0f} MB)")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+# トークン数計測・チャンク分割のベンチマーク(Benchmark for token counting and chunking)
+# 実行方法(usage): python benchmarks/bench_token.py
+# エンコーディングを取得できない環境ではバイト単位の代替エンコーディングで計測する
+# (Falls back to a byte-level stand-in encoding when the encoding files cannot be downloaded)
+import os
+import sys
+import time
+import random
+import asyncio
+from functools import lru_cache
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import tiktoken
+
+from functions import token_fnc
+
+def setOfflineEncoder():
+    """
+    取得できない場合にバイト単位の代替エンコーディングを使う(Use a byte-level stand-in when the encoding cannot be fetched)
+    """
+
+    try:
+        token_fnc.getEncoder()
+        return
+    except Exception as e:
+        print(f"encoding unavailable ({e.__class__.__name__}), using a byte-level stand-in")
+
+    # 英字2文字の組を結合トークンとして加える(Add two-letter pairs as merged tokens)
+    aryRanks = {bytes([i]): i for i in range(256)}
+    aryLetters = b"abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ "
+    for a in aryLetters:
+        for b in aryLetters:
+            aryRanks[bytes([a, b])] = len(aryRanks)
+
+    objEncoder = tiktoken.Encoding(
+        name="bench_bytes",
+        pat_str=r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}+|\p{N}{1,3}| ?[^\s\p{L}\p{N}]++[\r\n]*|\s*[\r\n]|\s+(?!\S)|\s+""",
+        mergeable_ranks=aryRanks,
+        special_tokens={},
+    )
+    token_fnc.getEncoder = lru_cache(maxsize=None)(lambda strModel=None: objEncoder)
+
+async def main():
+    setOfflineEncoder()
+    objEncoder = token_fnc.getEncoder()
+
+    # 繰り返しのない文書を生成(Generate documents without repeated passages)
+    objRandom = random.Random(0)
+    aryWords = "token budget context window LLM 日本語 テキスト 文書 チャンク 分割 overlap model embedding".split()
+    aryTexts = [" ".join(objRandom.choice(aryWords) + str(objRandom.randrange(1000)) for _ in range(150)) for _ in range(20000)]
+
+    # 1件ずつ数える(Count one text per call)
+    fltStart = time.perf_counter()
+    aryCounts = [token_fnc.getTokenCount(strText) for strText in aryTexts]
+    fltElapsed = time.perf_counter() - fltStart
+    print(f"getTokenCount loop    {len(aryTexts) / fltElapsed:>12,.0f} docs/s")
+
+    fltStart = time.perf_counter()
+    aryAsync = await token_fnc.getTokenCounts(aryTexts)
+    fltElapsed = time.perf_counter() - fltStart
+    strPool = f"{token_fnc.TOKEN_PROCESSES} processes" if token_fnc.getProcessPool() else "thread"
+    print(f"getTokenCounts ({strPool}) {len(aryTexts) / fltElapsed:>12,.0f} docs/s")
+    assert aryAsync == aryCounts
+
+    # チャンクは元のテキストの連続した部分で、先頭から末尾まで隙間なく覆うこと
+    # (Chunks are slices of the original text that cover it from start to end without gaps)
+    intMaxTokens = 128
+    intOverlap = 16
+    fltStart = time.perf_counter()
+    aryChunkList = await token_fnc.getTokenChunkBatch(aryTexts[:5000], intMaxTokens, intOverlap)
+    fltElapsed = time.perf_counter() - fltStart
+    print(f"getTokenChunkBatch    {5000 / fltElapsed:>12,.0f} docs/s")
+
+    for strText, aryChunks in zip(aryTexts[:50], aryChunkList[:50]):
+        intEnd = 0
+        for objChunk in aryChunks:
+            # チャンクのテキストを数え直して確認(Check by encoding the chunk text again)
+            intTokens = len(objEncoder.encode_ordinary(objChunk["text"]))
+            assert intTokens <= intMaxTokens, (intTokens, objChunk["tokens"])
+            intStart = strText.find(objChunk["text"], max(0, intEnd - len(objChunk["text"])))
+            assert 0 <= intStart <= intEnd
+            intEnd = intStart + len(objChunk["text"])
+        assert intEnd == len(strText)
+
+    token_fnc.shutdownTokenPool()
+    print("OK")
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,88 @@
+# ベクトル検索のQPSと再現率のベンチマーク(QPS and recall benchmark for vector search)
+# 実行方法(usage): python benchmarks/bench_vector.py [件数,...] [次元数]
+import os
+import sys
+import time
+import shutil
+import tempfile
+
+import numpy as np
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.chdir(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from functions import vector_fnc
+
+def getClusteredVectors(intRows: int, intDim: int, objRandom, aryCenters):
+    """
+    いくつかの話題に集まった埋め込みに近いベクトル(Vectors grouped around topics, like real embeddings)
+    """
+
+    aryLabels = objRandom.integers(0, len(aryCenters), size=intRows)
+
+    return (aryCenters[aryLabels] + objRandom.standard_normal((intRows, intDim), dtype=np.float32) * 1.5).astype(np.float32)
+
+def getBruteTopK(objStore, aryQueries, intTopK: int):
+    """
+    確認用の全件ソート[argpartitionを使わない](Reference full sort [no argpartition])
+    """
+
+    aryQueries = objStore.getNormalized(aryQueries)
+    aryScores = np.concatenate([aryQueries @ np.asarray(objStore.objMatrix[i:i + 65536]).T for i in range(0, objStore.intRows, 65536)], axis=1)
+    aryScores[:, ~objStore.aryAlive[:objStore.intRows]] = -np.inf
+
+    return [{objStore.aryIds[intRow] for intRow in aryRow} for aryRow in np.argsort(-aryScores, axis=1)[:, :intTopK]]
+
+def getRecall(aryResults, aryExpect):
+    return float(np.mean([len({objHit["id"] for objHit in aryHits} & setIds) / len(setIds) for aryHits, setIds in zip(aryResults, aryExpect)]))
+
+def setReport(strName: str, objStore, aryQueries, aryExpect, intBatch: int, **aryArgs):
+    fltStart = time.perf_counter()
+    aryResults = []
+    for i in range(0, len(aryQueries), intBatch):
+        aryResults.extend(objStore.search(aryQueries[i:i + intBatch], 10, **aryArgs))
+    fltElapsed = time.perf_counter() - fltStart
+    print(f"  {strName:<28} {len(aryQueries) / fltElapsed:>9,.1f} QPS  recall@10 {getRecall(aryResults, aryExpect):.3f}")
+
+def main():
+    aryCounts = [int(strCount) for strCount in sys.argv[1].split(",")] if len(sys.argv) > 1 else [100000, 1000000]
+    intDim = int(sys.argv[2]) if len(sys.argv) > 2 else 128
+    objRandom = np.random.default_rng(0)
+    aryCenters = objRandom.standard_normal((1000, intDim), dtype=np.float32)
+
+    for intRows in aryCounts:
+        strDir = tempfile.mkdtemp(prefix="bench_vector_")
+        try:
+            objStore = vector_fnc.VectorStore(strDir, intDim)
+            fltStart = time.perf_counter()
+            for intStart in range(0, intRows, 100000):
+                intEnd = min(intStart + 100000, intRows)
+                objStore.upsert([str(i) for i in range(intStart, intEnd)], getClusteredVectors(intEnd - intStart, intDim, objRandom, aryCenters))
+            fltUpsert = time.perf_counter() - fltStart
+            print(f"{intRows:,} x {intDim}: upsert {intRows / fltUpsert:,.0f} rows/s")
+
+            # 起動時は行列を読込まない(Opening does not read the matrix)
+            fltStart = time.perf_counter()
+            objReopened = vector_fnc.VectorStore(strDir)
+            print(f"  reopen {(time.perf_counter() - fltStart) * 1000:.0f} ms, matrix is {type(objReopened.objMatrix).__name__}")
+            objReopened.close()
+
+            # 削除済みの行が結果に出ないこと(Deleted rows never appear)
+            objStore.delete([str(i) for i in range(0, intRows, 50)])
+            aryQueries = getClusteredVectors(200, intDim, objRandom, aryCenters)
+            aryExpect = getBruteTopK(objStore, aryQueries, 10)
+            assert getRecall(objStore.search(aryQueries, 10, blnExact=True), aryExpect) > 0.999
+
+            setReport("exact, 1 query per call", objStore, aryQueries, aryExpect, 1, blnExact=True)
+            setReport("exact, 32 queries per call", objStore, aryQueries, aryExpect, 32, blnExact=True)
+
+            fltStart = time.perf_counter()
+            objIvf = objStore.buildIvf()
+            print(f"  IVF build {objIvf['lists']} lists: {time.perf_counter() - fltStart:.1f} s")
+            for intProbe in (8, 16, 32, 64):
+                setReport(f"IVF probe {intProbe}", objStore, aryQueries, aryExpect, 1, intProbe=intProbe)
+        finally:
+            shutil.rmtree(strDir)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,285 @@
+import asyncio
+import itertools
+from collections import deque
+
+# MySQLを使わずに動かすための疑似接続プール[ベンチマーク・開発用](Fake connection pool to run without MySQL [benchmarks and development])
+# 使い方(usage): dbpool_fnc.setCreatePool(fakedb.getCreatePool(fltQueryLatency=0.002))
+
+def getDefaultRows(strSql: str, aryParam):
+    """
+    既定の応答[SELECTは0件、それ以外は1件更新](Default answer [SELECT returns no rows, anything else updates one row])
+
+    Args:
+
+        strSql (str): sql
+
+        aryParam (list): params
+
+    Returns:
+
+        list|int:行のリストまたは更新件数(list of rows or affected row count)
+    """
+
+    if strSql.lstrip()[:6].upper() in ("SELECT", "SHOW", "WITH"):
+        return []
+
+    return 1
+
+class FakeCursor:
+    """
+    aiomysqlのカーソルの代わり(Stand-in for an aiomysql cursor)
+
+    executeごとに1往復分待ち、結果は疑似プールの応答関数から取得する
+    (Every execute waits one round trip and takes its result from the fake pool's answer function)
+    """
+
+    def __init__(self, conn, objCursorClass=None):
+        self.connection = conn
+        self.blnDict = objCursorClass is not None and "Dict" in objCursorClass.__name__
+        self.aryRows = deque()
+        self.rowcount = -1
+        self.lastrowid = None
+
+    async def execute(self, query: str, args=None):
+        objPool = self.connection.objPool
+        objPool.intQueries += 1
+        await asyncio.sleep(objPool.fltQueryLatency)
+
+        objResult = objPool.objRows(query, args)
+        if isinstance(objResult, int):
+            self.aryRows = deque()
+            self.rowcount = objResult
+            if query.lstrip()[:6].upper() == "INSERT":
+                self.lastrowid = next(objPool.objLastId)
+        else:
+            self.aryRows = deque(objResult if self.blnDict else (tuple(aryRow.values()) for aryRow in objResult))
+            self.rowcount = len(self.aryRows)
+
+        return self.rowcount
+
+    async def executemany(self, query: str, args):
+        # 1往復で送る(sent in one round trip)
+        aryArgs = list(args)
+        objPool = self.connection.objPool
+        objPool.intQueries += 1
+        await asyncio.sleep(objPool.fltQueryLatency)
+        self.aryRows = deque()
+        self.rowcount = len(aryArgs)
+
+        return self.rowcount
+
+    async def fetchone(self):
+        return self.aryRows.popleft() if self.aryRows else None
+
+    async def fetchmany(self, size: int=None):
+        return [self.aryRows.popleft() for _ in range(min(size or 1, len(self.aryRows)))]
+
+    async def fetchall(self):
+        aryRows = list(self.aryRows)
+        self.aryRows.clear()
+        return aryRows
+
+    async def close(self):
+        self.aryRows.clear()
+
+class CursorContext:
+    """
+    conn.cursor()の戻り値[awaitとasync withの両方に対応](Return value of conn.cursor() [supports both await and async with])
+    """
+
+    def __init__(self, cur):
+        self.cur = cur
+
+    def __await__(self):
+        async def getCursor():
+            return self.cur
+        return getCursor().__await__()
+
+    async def __aenter__(self):
+        return self.cur
+
+    async def __aexit__(self, exc_type, exc, tb):
+        await self.cur.close()
+
+class FakeConnection:
+    """
+    aiomysqlの接続の代わり(Stand-in for an aiomysql connection)
+    """
+
+    def __init__(self, objPool):
+        self.objPool = objPool
+        self.closed = False
+        self.blnAutocommit = objPool.blnAutocommit
+
+    def cursor(self, objCursorClass=None):
+        return CursorContext(FakeCursor(self, objCursorClass))
+
+    async def _execRoundTrip(self):
+        self.objPool.intQueries += 1
+        await asyncio.sleep(self.objPool.fltQueryLatency)
+
+    async def ping(self, reconnect: bool=True):
+        await self._execRoundTrip()
+
+    async def begin(self):
+        await self._execRoundTrip()
+
+    async def commit(self):
+        await self._execRoundTrip()
+
+    async def rollback(self):
+        await self._execRoundTrip()
+
+    async def autocommit(self, blnValue: bool):
+        await self._execRoundTrip()
+        self.blnAutocommit = bool(blnValue)
+
+    def get_autocommit(self):
+        return self.blnAutocommit
+
+    def close(self):
+        self.closed = True
+
+    async def ensure_closed(self):
+        self.closed = True
+
+class FakePool:
+    """
+    aiomysqlのプールの代わり[maxsizeを超える取得は解放まで待つ](Stand-in for an aiomysql pool [acquires beyond maxsize wait for a release])
+
+    Attributes:
+
+        intQueries (int): DBへの往復回数(round trips to the DB)
+
+        intAcquires (int): 接続の取得回数(connection checkouts)
+
+        intConnects (int): 接続回数(connections opened)
+    """
+
+    def __init__(self, intMinsize: int, intMaxsize: int, fltQueryLatency: float, fltConnectLatency: float, objRows, blnAutocommit: bool):
+        self.intMinsize = intMinsize
+        self.intMaxsize = intMaxsize
+        self.fltQueryLatency = fltQueryLatency
+        self.fltConnectLatency = fltConnectLatency
+        self.objRows = objRows
+        self.blnAutocommit = blnAutocommit
+        self.aryFree = deque()
+        self.aryUsed = set()
+        self.aryWaiters = deque()
+        self.intOpening = 0
+        self.intQueries = 0
+        self.intAcquires = 0
+        self.intConnects = 0
+        self.objLastId = itertools.count(1)
+        self.closed = False
+
+    @property
+    def minsize(self):
+        return self.intMinsize
+
+    @property
+    def maxsize(self):
+        return self.intMaxsize
+
+    @property
+    def size(self):
+        return len(self.aryFree) + len(self.aryUsed) + self.intOpening
+
+    @property
+    def freesize(self):
+        return len(self.aryFree)
+
+    async def _getNewConnection(self):
+        self.intOpening += 1
+        try:
+            await asyncio.sleep(self.fltConnectLatency)
+            self.intConnects += 1
+            return FakeConnection(self)
+        finally:
+            self.intOpening -= 1
+
+    async def fill(self):
+        while self.size < self.intMinsize:
+            self.aryFree.append(await self._getNewConnection())
+
+    async def acquire(self):
+        self.intAcquires += 1
+        while True:
+            if self.closed:
+                raise RuntimeError("Cannot acquire connection after closing pool")
+
+            while self.aryFree:
+                conn = self.aryFree.popleft()
+                if not conn.closed:
+                    self.aryUsed.add(conn)
+                    return conn
+
+            if self.size < self.intMaxsize:
+                conn = await self._getNewConnection()
+                self.aryUsed.add(conn)
+                return conn
+
+            objFuture = asyncio.get_running_loop().create_future()
+            self.aryWaiters.append(objFuture)
+            try:
+                await objFuture
+            except asyncio.CancelledError:
+                # 起こされた後に取消された場合は次の待ちへ譲る(Pass the wakeup on if cancelled after being woken)
+                if objFuture.done() and not objFuture.cancelled():
+                    self._setWakeup()
+                raise
+            finally:
+                if objFuture in self.aryWaiters:
+                    self.aryWaiters.remove(objFuture)
+
+    def _setWakeup(self):
+        while self.aryWaiters:
+            objFuture = self.aryWaiters.popleft()
+            if not objFuture.done():
+                objFuture.set_result(None)
+                return
+
+    def release(self, conn):
+        self.aryUsed.discard(conn)
+        if not conn.closed and not self.closed:
+            self.aryFree.append(conn)
+        self._setWakeup()
+
+        # aiomysqlと同じく完了済みのFutureを返す(Returns a completed future like aiomysql)
+        objFuture = asyncio.get_running_loop().create_future()
+        objFuture.set_result(None)
+        return objFuture
+
+    def close(self):
+        self.closed = True
+        for conn in self.aryFree:
+            conn.close()
+        self.aryFree.clear()
+
+    async def wait_closed(self):
+        while self.aryUsed:
+            await asyncio.sleep(0.01)
+
+def getCreatePool(fltQueryLatency: float=0.001, fltConnectLatency: float=0.005, objRows=getDefaultRows):
+    """
+    疑似プールの作成関数[dbpool_fnc.setCreatePoolに渡す](Fake pool factory [passed to dbpool_fnc.setCreatePool])
+
+    Args:
+
+        fltQueryLatency (float): 1往復の秒数(seconds per round trip)
+
+        fltConnectLatency (float): 接続の秒数(seconds per connect)
+
+        objRows (function): (sql, params)から行のリストまたは更新件数を返す関数(function returning a list of rows or an affected row count for (sql, params))
+
+    Returns:
+
+        function:aiomysql.create_poolと同じ引数のコルーチン関数(coroutine function taking aiomysql.create_pool's arguments)
+    """
+
+    async def create_pool(minsize: int=1, maxsize: int=10, autocommit: bool=False, **aryArgs):
+        objPool = FakePool(minsize, maxsize, fltQueryLatency, fltConnectLatency, objRows, autocommit)
+        await objPool.fill()
+        return objPool
+
+    return create_pool
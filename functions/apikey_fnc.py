@@ -0,0 +1,121 @@
+import os
+import asyncio
+import hashlib
+import contextvars
+
+# 共通ファンクションの読込(Reading common functions)
+from functions import mysqlaio_fnc
+from functions import log_fnc
+
+# 認証キーの再読込間隔[秒](authentication key refresh interval in seconds)
+APIKEY_REFRESH_INTERVAL = float(os.getenv("APIKEY_REFRESH_INTERVAL", "60"))
+
+def getKeyDigest(strKey: str):
+    """
+    認証キーのハッシュ値(Hash of an authentication key)
+
+    Args:
+
+        strKey (str): 認証キー(authentication key)
+
+    Returns:
+
+        bytes:SHA-256ダイジェスト(SHA-256 digest)
+    """
+
+    return hashlib.sha256(strKey.encode('utf-8')).digest()
+
+class ApiKeyRegistry:
+    """
+    メモリ上の認証キー一覧(In-memory authentication key registry)
+
+    キーはハッシュ値のみ保持し、判定はsetの検索で行う(Keys are held only as hashes and checked by set membership)
+    """
+
+    def __init__(self):
+        self.aryDigests = frozenset()
+        self.aryDbDigests = frozenset()
+        self.objDbPool = None
+        self.objTask = None
+
+    async def refresh(self):
+        """
+        認証キーの再読込[DBと環境変数getApikey](Reload authentication keys [DB and the getApikey environment variable])
+
+        Returns:
+
+            bool:成功:True 失敗:False[環境変数のキーは反映し、DBのキーは前回読込分を維持](Success:True Failure:False [environment keys still apply, DB keys from the last good load are kept])
+        """
+
+        aryEnvDigests = frozenset(getKeyDigest(strKey.strip()) for strKey in os.getenv("getApikey", "").split(",") if strKey.strip())
+
+        blnResult = True
+        if self.objDbPool is not None:
+            aryDbKeys = await mysqlaio_fnc.getPythonAuthorizationKey(self.objDbPool)
+            if aryDbKeys is False:
+                blnResult = False
+            else:
+                self.aryDbDigests = frozenset(getKeyDigest(strKey) for strKey in aryDbKeys)
+
+        # 入れ替えのみで失効を反映する(Revocations apply by swapping the set)
+        self.aryDigests = aryEnvDigests | self.aryDbDigests
+
+        return blnResult
+
+    async def verify(self, strKey: str):
+        """
+        認証キーの判定(Verify an authentication key)
+
+        メモリ上のキーのみで判定しDBへは問い合わせない。新しいキーは定期的な再読込で反映する
+        (Checked against the keys in memory only, never the DB. New keys apply with the periodic refresh)
+
+        Args:
+
+            strKey (str): 認証キー(authentication key)
+
+        Returns:
+
+            bool:正しい:True 不正:False(valid:True invalid:False)
+        """
+
+        if not strKey:
+            return False
+
+        return getKeyDigest(strKey) in self.aryDigests
+
+    async def start(self, objDbPool):
+        """
+        読込と定期的な再読込の開始(Load and start periodic refresh)
+
+        Args:
+
+            objDbPool (object): コネクションプーリング
+        """
+
+        self.objDbPool = objDbPool
+        if not await self.refresh():
+            log_fnc.getOutputLog().critical("認証キー読込失敗(failed to load authentication keys)")
+
+        if APIKEY_REFRESH_INTERVAL > 0 and self.objTask is None:
+            self.objTask = asyncio.get_running_loop().create_task(self._execRefreshLoop(), context=contextvars.Context())
+
+    async def stop(self):
+        """
+        定期的な再読込の停止(Stop periodic refresh)
+        """
+
+        if self.objTask is not None:
+            self.objTask.cancel()
+            await asyncio.gather(self.objTask, return_exceptions=True)
+            self.objTask = None
+
+    async def _execRefreshLoop(self):
+        while True:
+            await asyncio.sleep(APIKEY_REFRESH_INTERVAL)
+            try:
+                if not await self.refresh():
+                    log_fnc.getOutputLog().critical("認証キー再読込失敗(failed to refresh authentication keys)")
+            except Exception as e:
+                log_fnc.getOutputLog().critical(f"認証キー再読込失敗(failed to refresh authentication keys) Exception:{e}")
+
+objApiKeyRegistry = ApiKeyRegistry()
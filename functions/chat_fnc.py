@@ -0,0 +1,288 @@
+import os
+import json
+import asyncio
+import hashlib
+import contextvars
+
+# 共通ファンクションの読込(Reading common functions)
+from functions import log_fnc
+
+# 既定のモデル(default model)
+CHAT_DEFAULT_MODEL = os.getenv("CHAT_DEFAULT_MODEL", "gpt-4o-mini")
+
+# 接続プール[最大接続数・維持する接続数・維持秒数](connection pool [max connections, kept-alive connections, keep-alive seconds])
+CHAT_MAX_CONNECTIONS = int(os.getenv("CHAT_MAX_CONNECTIONS", "100"))
+CHAT_MAX_KEEPALIVE = int(os.getenv("CHAT_MAX_KEEPALIVE", "20"))
+CHAT_KEEPALIVE_EXPIRY = float(os.getenv("CHAT_KEEPALIVE_EXPIRY", "60"))
+
+# 接続・読込のタイムアウト秒数[読込はトークン間の待ち時間](connect and read timeouts in seconds [read is the wait between tokens])
+CHAT_CONNECT_TIMEOUT = float(os.getenv("CHAT_CONNECT_TIMEOUT", "5"))
+CHAT_READ_TIMEOUT = float(os.getenv("CHAT_READ_TIMEOUT", "60"))
+
+# 提供元のSDKによる再試行回数[ストリームの開始前のみ](SDK retries [only before the stream starts])
+CHAT_MAX_RETRIES = int(os.getenv("CHAT_MAX_RETRIES", "2"))
+
+_objClient = None
+
+# 実行中の上流ストリーム(upstream streams in flight)
+_aryInflight = {}
+
+class ChatError(Exception):
+    """
+    チャット補完のエラー(Chat completion error)
+    """
+
+def setupChatClient():
+    """
+    共有のOpenAIクライアント作成[起動時に1回](Create the shared OpenAI client [once at startup])
+
+    OPENAI_API_KEYが未設定の場合は作成しない。OPENAI_BASE_URLで互換サーバーを指定できる
+    (Not created without OPENAI_API_KEY. OPENAI_BASE_URL points it at a compatible server)
+
+    Returns:
+
+        object:AsyncOpenAI または None(AsyncOpenAI or None)
+    """
+
+    global _objClient
+
+    if _objClient is not None:
+        return _objClient
+
+    if not os.getenv("OPENAI_API_KEY"):
+        log_fnc.getOutputLog().info("OPENAI_API_KEYが未設定のためチャット補完は無効(chat completion disabled, OPENAI_API_KEY is not set)")
+        return None
+
+    import httpx
+    import openai
+
+    objHttpClient = openai.DefaultAsyncHttpxClient(
+        limits=httpx.Limits(max_connections=CHAT_MAX_CONNECTIONS, max_keepalive_connections=CHAT_MAX_KEEPALIVE, keepalive_expiry=CHAT_KEEPALIVE_EXPIRY),
+    )
+    # タイムアウトはクライアント側の設定がリクエストごとに使われる(The client's timeout is the one applied per request)
+    _objClient = openai.AsyncOpenAI(
+        http_client=objHttpClient, max_retries=CHAT_MAX_RETRIES, timeout=httpx.Timeout(CHAT_READ_TIMEOUT, connect=CHAT_CONNECT_TIMEOUT)
+    )
+
+    return _objClient
+
+def getChatClient():
+    """
+    共有のOpenAIクライアント取得(Get the shared OpenAI client)
+
+    Raises:
+
+        ChatError: クライアント未作成(client not created)
+    """
+
+    if _objClient is None:
+        raise ChatError("chat completion is not configured")
+
+    return _objClient
+
+async def shutdownChatClient():
+    """
+    実行中のストリームを止めてクライアントを閉じる(Stop running streams and close the client)
+    """
+
+    global _objClient
+
+    for objStream in list(_aryInflight.values()):
+        objStream.cancel()
+
+    if _objClient is not None:
+        await _objClient.close()
+        _objClient = None
+
+def getPromptKey(strModel: str, aryMessages: list, aryParams: dict):
+    """
+    同一プロンプトの判定キー(Key identifying identical prompts)
+
+    Returns:
+
+        str:モデル・メッセージ・パラメータのハッシュ(hash of model, messages and parameters)
+    """
+
+    strJson = json.dumps([strModel, aryMessages, aryParams], ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+
+    return hashlib.blake2b(strJson.encode('utf-8'), digest_size=16).hexdigest()
+
+class SharedChatStream:
+    """
+    複数の呼び出し元で共有する上流ストリーム(Upstream stream shared by several callers)
+
+    受信したトークンを保持し、途中から参加した呼び出し元にも先頭から返す。
+    全員が切断した場合は上流の呼び出しを取り消す
+    (Received tokens are kept so late joiners get the stream from the start. When every caller has disconnected the upstream call is cancelled)
+    """
+
+    def __init__(self, strKey: str, strModel: str, aryMessages: list, aryParams: dict):
+        self.strKey = strKey
+        self.aryEvents = []
+        self.objChanged = asyncio.Event()
+        self.blnDone = False
+        self.intSubscribers = 0
+        # 上流の呼び出しはリクエストのコンテキストを引き継がない(The upstream call does not inherit the request context)
+        self.objTask = asyncio.get_running_loop().create_task(self.execUpstream(strModel, aryMessages, aryParams), context=contextvars.Context())
+
+    def setEvent(self, objEvent: dict):
+        self.aryEvents.append(objEvent)
+        self.objChanged.set()
+        self.objChanged = asyncio.Event()
+
+    async def execUpstream(self, strModel: str, aryMessages: list, aryParams: dict):
+        objStream = None
+        try:
+            objStream = await getChatClient().chat.completions.create(model=strModel, messages=aryMessages, stream=True, **aryParams)
+            async for objChunk in objStream:
+                for objChoice in objChunk.choices:
+                    if objChoice.delta.content:
+                        self.setEvent({"delta": objChoice.delta.content})
+                    if objChoice.finish_reason:
+                        self.setEvent({"finish_reason": objChoice.finish_reason})
+        except asyncio.CancelledError:
+            log_fnc.getOutputLog().info(f"チャット補完の取消(chat completion cancelled) key:{self.strKey}")
+            # 残っている購読者には途中で終わったことを伝える(Tell remaining subscribers the stream ended early)
+            self.setEvent({"error": "chat completion cancelled"})
+            raise
+        except Exception as e:
+            log_fnc.getOutputLog().error(f"チャット補完エラー(chat completion error) key:{self.strKey} error:{e}")
+            self.setEvent({"error": str(e)})
+        finally:
+            # 上流の接続を閉じる[取消時は応答の途中で切断](Close the upstream connection [dropped mid-response when cancelled])
+            if objStream is not None:
+                await asyncio.shield(objStream.close())
+            self.blnDone = True
+            self.objChanged.set()
+            if _aryInflight.get(self.strKey) is self:
+                del _aryInflight[self.strKey]
+
+    def getEvents(self):
+        """
+        イベントの取得[先頭から](Events from the start)
+
+        呼び出した時点で購読者として数える[反復を始める前に他の購読者が切断しても取り消されない]
+        (The caller counts as a subscriber as soon as this is called [so it is not cancelled by others leaving before it starts iterating])
+
+        Returns:
+
+            object:{"delta"} / {"finish_reason"} / {"error"}の非同期イテレータ(async iterator of {"delta"} / {"finish_reason"} / {"error"})
+        """
+
+        return ChatSubscription(self)
+
+    def cancel(self):
+        if _aryInflight.get(self.strKey) is self:
+            del _aryInflight[self.strKey]
+        self.objTask.cancel()
+
+class ChatSubscription:
+    """
+    共有ストリームの購読[作成時に登録し、acloseまたは終端で解除](Subscription to a shared stream [registered on creation, released by aclose or at the end])
+    """
+
+    def __init__(self, objStream: SharedChatStream):
+        self.objStream = objStream
+        self.intIndex = 0
+        self.blnClosed = False
+        objStream.intSubscribers += 1
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        objStream = self.objStream
+        while not self.blnClosed:
+            if self.intIndex < len(objStream.aryEvents):
+                self.intIndex += 1
+                return objStream.aryEvents[self.intIndex - 1]
+            if objStream.blnDone:
+                await self.aclose()
+                break
+            await objStream.objChanged.wait()
+
+        raise StopAsyncIteration
+
+    async def aclose(self):
+        if self.blnClosed:
+            return
+        self.blnClosed = True
+        self.objStream.intSubscribers -= 1
+        if self.objStream.intSubscribers == 0 and not self.objStream.blnDone:
+            self.objStream.cancel()
+
+def getChatEvents(aryMessages: list, strModel: str=None, aryParams: dict=None):
+    """
+    チャット補完のイベント取得[同一プロンプトの同時呼び出しは上流を共有](Chat completion events [concurrent identical prompts share the upstream call])
+
+    Args:
+
+        aryMessages (list): [{"role", "content"}]
+
+        strModel (str): モデル名[省略時はCHAT_DEFAULT_MODEL](model name [CHAT_DEFAULT_MODEL if omitted])
+
+        aryParams (dict): temperature・max_tokens等(temperature, max_tokens etc.)
+
+    Returns:
+
+        object:イベントの非同期イテレータ(async iterator of events)
+    """
+
+    getChatClient()
+    strModel = strModel or CHAT_DEFAULT_MODEL
+    aryParams = {strName: objValue for strName, objValue in (aryParams or {}).items() if objValue is not None}
+    strKey = getPromptKey(strModel, aryMessages, aryParams)
+
+    objStream = _aryInflight.get(strKey)
+    if objStream is None:
+        objStream = _aryInflight[strKey] = SharedChatStream(strKey, strModel, aryMessages, aryParams)
+
+    return objStream.getEvents()
+
+async def getSseStream(aryEvents):
+    """
+    イベントをServer-Sent Eventsのバイト列に変換(Convert events to Server-Sent Events bytes)
+
+    Yields:
+
+        bytes:SSE
+    """
+
+    try:
+        async for objEvent in aryEvents:
+            if "error" in objEvent:
+                yield ("event: error\ndata: " + json.dumps(objEvent, ensure_ascii=False) + "\n\n").encode('utf-8')
+            else:
+                yield ("data: " + json.dumps(objEvent, ensure_ascii=False) + "\n\n").encode('utf-8')
+        yield b"data: [DONE]\n\n"
+    finally:
+        # 切断時に購読を終えて上流の取消を判定させる(Leave the shared stream on disconnect so it can cancel upstream)
+        await aryEvents.aclose()
+
+async def getChatText(aryEvents):
+    """
+    イベントを結合したテキスト[ストリーミングしない場合](Text joined from events [when not streaming])
+
+    Returns:
+
+        dict:{"text", "finish_reason"}
+
+    Raises:
+
+        ChatError: 上流のエラー(upstream error)
+    """
+
+    aryText = []
+    strFinishReason = None
+    try:
+        async for objEvent in aryEvents:
+            if "error" in objEvent:
+                raise ChatError(objEvent["error"])
+            if "delta" in objEvent:
+                aryText.append(objEvent["delta"])
+            if "finish_reason" in objEvent:
+                strFinishReason = objEvent["finish_reason"]
+    finally:
+        await aryEvents.aclose()
+
+    return {"text": "".join(aryText), "finish_reason": strFinishReason}
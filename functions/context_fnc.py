@@ -0,0 +1,188 @@
+import os
+import socket
+import ipaddress
+from contextvars import ContextVar
+
+# リクエスト単位のクライアントIP(Request-scoped client IP)
+_objClientIp = ContextVar("clientip", default=None)
+
+_strHostIp = None
+
+def getHostIp():
+    """
+    サーバ自身のIPアドレス取得(Get this server's own IP address)
+
+    リクエスト外[起動時・バックグラウンド処理]で利用し、名前解決は初回のみ行う(Used outside requests [startup, background tasks], resolving only once)
+
+    Returns:
+
+        str:IPアドレス(IP address)
+    """
+
+    global _strHostIp
+
+    if _strHostIp is None:
+        strHost = socket.gethostname()
+        try:
+            _strHostIp = socket.gethostbyname(strHost)
+        except OSError:
+            _strHostIp = strHost
+
+    return _strHostIp
+
+def getClientIp():
+    """
+    アクセスしている人のIPアドレスの取得(Obtaining the IP address of the person accessing the site)
+
+    リクエスト外の場合はサーバ自身のIPアドレスを返す(Returns this server's IP address outside a request)
+
+    Returns:
+
+        str:IPアドレス(IP address)
+    """
+
+    strIp = _objClientIp.get()
+    if strIp is None:
+        return getHostIp()
+
+    return strIp
+
+def setClientIp(strIp: str):
+    """
+    クライアントIPの設定(Set the client IP)
+
+    Args:
+
+        strIp (str): IPアドレス(IP address)
+
+    Returns:
+
+        object:resetClientIpに渡すトークン(token to pass to resetClientIp)
+    """
+
+    return _objClientIp.set(strIp)
+
+def resetClientIp(objToken):
+    """
+    クライアントIPを設定前に戻す(Restore the client IP to before it was set)
+
+    Args:
+
+        objToken (object): setClientIpのトークン(token from setClientIp)
+    """
+
+    _objClientIp.reset(objToken)
+
+def getTrustedProxies(strTrustedProxies: str=None):
+    """
+    信頼するプロキシの取得(Get trusted proxies)
+
+    環境変数TRUSTED_PROXIESにIPまたはCIDRをカンマ区切りで指定(Set IPs or CIDRs comma separated in the TRUSTED_PROXIES environment variable)
+
+    Args:
+
+        strTrustedProxies (str): カンマ区切りのIP/CIDR[省略時は環境変数](comma separated IP/CIDR [environment variable if omitted])
+
+    Returns:
+
+        tuple:ネットワークのタプル(tuple of networks)
+    """
+
+    if strTrustedProxies is None:
+        strTrustedProxies = os.getenv("TRUSTED_PROXIES", "")
+
+    aryNetworks = []
+    for strProxy in strTrustedProxies.split(","):
+        strProxy = strProxy.strip()
+        if strProxy:
+            aryNetworks.append(ipaddress.ip_network(strProxy, strict=False))
+
+    return tuple(aryNetworks)
+
+def isTrustedProxy(strIp: str, aryTrustedProxies: tuple):
+    """
+    信頼するプロキシか判定(Check whether the address is a trusted proxy)
+
+    Args:
+
+        strIp (str): IPアドレス(IP address)
+
+        aryTrustedProxies (tuple): 信頼するネットワーク(trusted networks)
+
+    Returns:
+
+        bool:信頼する:True 信頼しない:False(trusted:True untrusted:False)
+    """
+
+    try:
+        objIp = ipaddress.ip_address(strIp)
+    except ValueError:
+        return False
+
+    for objNetwork in aryTrustedProxies:
+        if objIp in objNetwork:
+            return True
+
+    return False
+
+def getForwardedClientIp(strPeerIp: str, strForwardedFor: str, aryTrustedProxies: tuple):
+    """
+    X-Forwarded-Forから実際のクライアントIPを取得(Get the real client IP from X-Forwarded-For)
+
+    接続元が信頼するプロキシの場合のみ、右から信頼するプロキシを除いた最初のIPを採用(Only when the peer is a trusted proxy, take the first untrusted hop from the right)
+
+    Args:
+
+        strPeerIp (str): 接続元IP(peer IP)
+
+        strForwardedFor (str): X-Forwarded-Forヘッダ(X-Forwarded-For header)
+
+        aryTrustedProxies (tuple): 信頼するネットワーク(trusted networks)
+
+    Returns:
+
+        str:IPアドレス(IP address)
+    """
+
+    if not strForwardedFor or not aryTrustedProxies or not isTrustedProxy(strPeerIp, aryTrustedProxies):
+        return strPeerIp
+
+    strIp = strPeerIp
+    for strHop in reversed(strForwardedFor.split(",")):
+        strHop = strHop.strip()
+        if not strHop:
+            continue
+        strIp = strHop
+        if not isTrustedProxy(strHop, aryTrustedProxies):
+            break
+
+    return strIp
+
+class ClientIpMiddleware:
+    """
+    リクエストごとにクライアントIPをコンテキストへ設定するASGIミドルウェア(ASGI middleware that stores the client IP in the context per request)
+    """
+
+    def __init__(self, app, strTrustedProxies: str=None):
+        self.app = app
+        self.aryTrustedProxies = getTrustedProxies(strTrustedProxies)
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] not in ("http", "websocket"):
+            await self.app(scope, receive, send)
+            return
+
+        objClient = scope.get("client")
+        strPeerIp = objClient[0] if objClient else getHostIp()
+
+        strForwardedFor = ""
+        if self.aryTrustedProxies:
+            strForwardedFor = ",".join(
+                value.decode("latin-1") for key, value in scope["headers"] if key == b"x-forwarded-for"
+            )
+
+        objToken = _objClientIp.set(getForwardedClientIp(strPeerIp, strForwardedFor, self.aryTrustedProxies))
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            _objClientIp.reset(objToken)
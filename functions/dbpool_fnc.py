@@ -0,0 +1,319 @@
+import os
+import asyncio
+import contextvars
+
+import aiomysql
+
+# 共通ファンクションの読込(Reading common functions)
+from functions import log_fnc
+from functions import metrics_fnc
+from functions import unitofwork_fnc
+
+# 作成したプール[メトリクス用](created pools [for metrics])
+_aryPools = []
+
+# プールの作成関数[aiomysql.create_poolと同じ引数](pool factory [same arguments as aiomysql.create_pool])
+_objCreatePool = aiomysql.create_pool
+
+def setCreatePool(objCreatePool=None):
+    """
+    プールの作成関数の差替え[MySQLを使わないベンチマーク等](Swap the pool factory [benchmarks without MySQL etc.])
+
+    Args:
+
+        objCreatePool (function): aiomysql.create_poolと同じ引数のコルーチン関数[Noneで元に戻す]
+            (coroutine function taking aiomysql.create_pool's arguments [None restores it])
+    """
+
+    global _objCreatePool
+
+    _objCreatePool = objCreatePool or aiomysql.create_pool
+
+def getPoolSetting(strPrefix: str="MYSQL"):
+    """
+    接続プール設定の取得(Get connection pool settings)
+
+    レプリカ[MYSQL_REPLICA_*]は未指定の項目をプライマリの値で補う(The replica [MYSQL_REPLICA_*] falls back to the primary values)
+
+    Args:
+
+        strPrefix (str): 環境変数の接頭辞["MYSQL" または "MYSQL_REPLICA"](environment variable prefix ["MYSQL" or "MYSQL_REPLICA"])
+
+    Returns:
+
+        dict:接続プール設定[レプリカのホストが未指定の場合はNone](pool settings [None if no replica host])
+    """
+
+    def getEnv(strName: str, strDefault: str=None):
+        strValue = os.getenv(f"{strPrefix}_{strName}")
+        if strValue is None and strPrefix != "MYSQL":
+            strValue = os.getenv(f"MYSQL_{strName}")
+        return strDefault if strValue is None else strValue
+
+    strHost = os.getenv("MYSQL_LOCALHOST") if strPrefix == "MYSQL" else os.getenv(f"{strPrefix}_HOST")
+    if strHost is None and strPrefix != "MYSQL":
+        return None
+
+    strAcquireTimeout = getEnv("ACQUIRE_TIMEOUT", "")
+
+    return {
+        "host": strHost,
+        "port": int(getEnv("PORT", "3306")),
+        "user": getEnv("USER"),
+        "password": getEnv("PASSWORD"),
+        "db": getEnv("DB"),
+        "minsize": int(getEnv("POOL_MINSIZE", "1")),
+        "maxsize": int(getEnv("POOL_MAXSIZE", "10")),
+        "pool_recycle": int(getEnv("POOL_RECYCLE", "-1")),
+        "acquire_timeout": float(strAcquireTimeout) if strAcquireTimeout != "" else None,
+        "ping_interval": float(getEnv("PING_INTERVAL", "30")),
+    }
+
+class AcquireContext:
+    """
+    DbPool.acquire()の戻り値(Return value of DbPool.acquire())
+
+    awaitとasync withの両方に対応する。ユニットオブワーク中はその共有接続を返す
+    (Supports both await and async with. Inside a unit of work its shared connection is returned)
+    """
+
+    def __init__(self, objDbPool):
+        self.objDbPool = objDbPool
+        self.conn = None
+
+    def __await__(self):
+        objUnitOfWork = unitofwork_fnc.getUnitOfWork(self.objDbPool)
+        if objUnitOfWork is not None:
+            return objUnitOfWork.getLockedConnection().__await__()
+        return self.objDbPool.getConnection().__await__()
+
+    async def __aenter__(self):
+        self.conn = await self
+        return self.conn
+
+    async def __aexit__(self, exc_type, exc, tb):
+        conn = self.conn
+        self.conn = None
+        await self.objDbPool.release(conn)
+
+class DbPool:
+    """
+    aiomysqlプールのラッパー(Wrapper of an aiomysql pool)
+
+    acquireのタイムアウト・待ち数の計測・定期的な死活確認を行い、読込用のレプリカプールを保持する
+    (Adds acquire timeouts, waiter counting and periodic health pings, and holds the replica pool used for reads)
+    """
+
+    def __init__(self, objPool, strName: str, fltAcquireTimeout: float=None, fltPingInterval: float=0):
+        self.objPool = objPool
+        self.strName = strName
+        self.fltAcquireTimeout = fltAcquireTimeout
+        self.fltPingInterval = fltPingInterval
+        self.intWaiting = 0
+        self.objReadPool = self
+        self.objPingTask = None
+
+    @property
+    def minsize(self):
+        return self.objPool.minsize
+
+    @property
+    def maxsize(self):
+        return self.objPool.maxsize
+
+    @property
+    def size(self):
+        return self.objPool.size
+
+    @property
+    def freesize(self):
+        return self.objPool.freesize
+
+    def acquire(self):
+        return AcquireContext(self)
+
+    async def getConnection(self):
+        """
+        接続の取得(Acquire a connection)
+
+        Returns:
+
+            object:接続(connection)
+        """
+
+        self.intWaiting += 1
+        try:
+            if self.fltAcquireTimeout is None:
+                return await self.objPool.acquire()
+            return await asyncio.wait_for(self.objPool.acquire(), self.fltAcquireTimeout)
+        except asyncio.TimeoutError:
+            raise aiomysql.OperationalError(2003, f"pool acquire timeout [{self.strName}] {self.fltAcquireTimeout}s")
+        finally:
+            self.intWaiting -= 1
+
+    def release(self, conn):
+        # 共有接続はプールへ戻さず排他のみ解除(A shared connection stays out of the pool, only its lock is released)
+        if isinstance(conn, unitofwork_fnc.UnitOfWorkConnection):
+            conn.objUnitOfWork.setUnlock()
+            objFuture = asyncio.get_running_loop().create_future()
+            objFuture.set_result(None)
+            return objFuture
+
+        return self.objPool.release(conn)
+
+    async def warmup(self):
+        """
+        minsizeまでの接続を確立して疎通確認(Open connections up to minsize and ping them)
+        """
+
+        aryConn = await asyncio.gather(*[self.getConnection() for _ in range(self.minsize)])
+        try:
+            await asyncio.gather(*[conn.ping(reconnect=True) for conn in aryConn])
+        finally:
+            for conn in aryConn:
+                await self.release(conn)
+
+    async def ping(self):
+        """
+        空き接続の死活確認[失敗した接続は破棄](Health ping of idle connections [failed ones are discarded])
+        """
+
+        # acquire/releaseで空き接続を先頭から順に一巡する(acquire/release cycles through the idle connections in order)
+        for _ in range(self.freesize):
+            if self.freesize == 0:
+                break
+            conn = await self.getConnection()
+            try:
+                await conn.ping(reconnect=False)
+            except Exception:
+                conn.close()
+            finally:
+                await self.release(conn)
+
+    def startPing(self):
+        """
+        定期的な死活確認の開始(Start periodic health pings)
+
+        タスクはリクエストのコンテキストを引き継がない(The task does not inherit the request context)
+        """
+
+        if self.fltPingInterval > 0 and self.objPingTask is None:
+            self.objPingTask = asyncio.get_running_loop().create_task(self._execPingLoop(), context=contextvars.Context())
+
+    async def _execPingLoop(self):
+        while True:
+            await asyncio.sleep(self.fltPingInterval)
+            try:
+                await self.ping()
+            except Exception as e:
+                log_fnc.getOutputLog().critical(f"MySQL ping error [pool:{self.strName}] Exception:{e}")
+
+    def close(self):
+        if self.objPingTask is not None:
+            self.objPingTask.cancel()
+            self.objPingTask = None
+        self.objPool.close()
+        if self.objReadPool is not self:
+            self.objReadPool.close()
+
+    async def wait_closed(self):
+        await self.objPool.wait_closed()
+        if self.objReadPool is not self:
+            await self.objReadPool.wait_closed()
+        if self in _aryPools:
+            _aryPools.remove(self)
+        if self.objReadPool in _aryPools:
+            _aryPools.remove(self.objReadPool)
+
+async def createPool(objSetting: dict, strName: str):
+    """
+    接続プールの作成と事前接続(Create a connection pool and warm it up)
+
+    Args:
+
+        objSetting (dict): 接続プール設定(pool settings)
+
+        strName (str): プール名(pool name)
+
+    Returns:
+
+        object:DbPool
+    """
+
+    objPool = await _objCreatePool(
+        host=objSetting["host"],
+        port=objSetting["port"],
+        user=objSetting["user"],
+        password=objSetting["password"],
+        db=objSetting["db"],
+        autocommit=True,
+        minsize=objSetting["minsize"],
+        maxsize=objSetting["maxsize"],
+        pool_recycle=objSetting["pool_recycle"]
+    )
+
+    objDbPool = DbPool(objPool, strName, objSetting["acquire_timeout"], objSetting["ping_interval"])
+    await objDbPool.warmup()
+    objDbPool.startPing()
+    _aryPools.append(objDbPool)
+
+    return objDbPool
+
+async def createDbPool():
+    """
+    プライマリと任意のレプリカの接続プール作成(Create the primary and optional replica pools)
+
+    Returns:
+
+        object:プライマリのDbPool[objReadPoolがレプリカ](primary DbPool [objReadPool is the replica])
+    """
+
+    objDbPool = await createPool(getPoolSetting("MYSQL"), "primary")
+
+    objReplicaSetting = getPoolSetting("MYSQL_REPLICA")
+    if objReplicaSetting is not None:
+        objDbPool.objReadPool = await createPool(objReplicaSetting, "replica")
+
+    return objDbPool
+
+def getReadPool(objDbPool, blnPrimary: bool=False):
+    """
+    読込用プールの取得(Get the pool used for reads)
+
+    Args:
+
+        objDbPool (object): コネクションプーリング
+
+        blnPrimary (bool): プライマリから読む[書込み直後の読込等、ユニットオブワーク中は常にプライマリ](read from the primary [e.g. read-your-writes, always inside a unit of work])
+
+    Returns:
+
+        object:読込用のプール(pool for reads)
+    """
+
+    # ユニットオブワーク中は書込みと同じ接続で読む(Inside a unit of work reads use the same connection as writes)
+    if blnPrimary or unitofwork_fnc.getUnitOfWork(objDbPool) is not None:
+        return objDbPool
+
+    return getattr(objDbPool, "objReadPool", objDbPool)
+
+def getPoolGauges():
+    """
+    接続プールの使用状況[メトリクス用](Pool usage [for metrics])
+
+    Returns:
+
+        dict:{(ラベル): 値}({(labels): value})
+    """
+
+    aryGauges = {}
+    for objDbPool in _aryPools:
+        aryGauges[(("pool", objDbPool.strName), ("state", "size"))] = objDbPool.size
+        aryGauges[(("pool", objDbPool.strName), ("state", "free"))] = objDbPool.freesize
+        aryGauges[(("pool", objDbPool.strName), ("state", "used"))] = objDbPool.size - objDbPool.freesize
+        aryGauges[(("pool", objDbPool.strName), ("state", "max"))] = objDbPool.maxsize
+        aryGauges[(("pool", objDbPool.strName), ("state", "waiting"))] = objDbPool.intWaiting
+
+    return aryGauges
+
+metrics_fnc.setGauge("mysql_pool_connections", "MySQL pool connections by state", getPoolGauges)
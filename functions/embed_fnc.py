@@ -0,0 +1,541 @@
+import os
+import re
+import time
+import random
+import sqlite3
+import asyncio
+import hashlib
+
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# 共通ファンクションの読込(Reading common functions)
+from functions import log_fnc
+
+# 埋め込みの提供元["openai"/"local"](embedding provider ["openai"/"local"])
+EMBED_PROVIDER = os.getenv("EMBED_PROVIDER", "openai")
+
+# 既定のモデル(default model)
+EMBED_DEFAULT_MODEL = os.getenv("EMBED_DEFAULT_MODEL", "text-embedding-3-small")
+
+# キャッシュファイル(cache file)
+EMBED_CACHE_FILE = os.getenv("EMBED_CACHE_FILE", os.path.join(os.getcwd(), "files", "embed_cache.sqlite3"))
+
+# キャッシュの最大バイト数[超えた場合は古い順に削除](maximum cache bytes [least recently used rows are evicted])
+EMBED_CACHE_MAX_BYTES = int(os.getenv("EMBED_CACHE_MAX_BYTES", str(1024 * 1024 * 1024)))
+
+# 1回の提供元呼び出しの最大件数(maximum texts per provider call)
+EMBED_BATCH_ROWS = int(os.getenv("EMBED_BATCH_ROWS", "512"))
+
+# ミスをまとめるために待つ秒数(seconds to wait for more misses before calling the provider)
+EMBED_BATCH_WAIT = float(os.getenv("EMBED_BATCH_WAIT", "0.01"))
+
+# 提供元の同時呼び出し数(concurrent provider calls)
+EMBED_CONCURRENCY = int(os.getenv("EMBED_CONCURRENCY", "4"))
+
+# 再試行回数と初回の待ち秒数[倍々に増やす](retries and first backoff in seconds [doubled each time])
+EMBED_RETRIES = int(os.getenv("EMBED_RETRIES", "5"))
+EMBED_BACKOFF = float(os.getenv("EMBED_BACKOFF", "0.5"))
+
+_objService = None
+
+class EmbeddingProvider:
+    """
+    埋め込みの提供元[継承して差し替える](Embedding provider [subclass to plug in another one])
+    """
+
+    # キャッシュキーに含める名前(name included in the cache key)
+    strName = "base"
+
+    # 1回の呼び出しの最大件数(maximum texts per call)
+    intMaxBatch = EMBED_BATCH_ROWS
+
+    async def getEmbeddings(self, aryTexts: list, strModel: str):
+        """
+        埋め込みの取得(Get embeddings)
+
+        Args:
+
+            aryTexts (list): テキスト(texts)
+
+            strModel (str): モデル名(model name)
+
+        Returns:
+
+            list:テキストごとの埋め込み(embedding per text)
+        """
+
+        raise NotImplementedError
+
+    def isRetryable(self, e: Exception):
+        """
+        再試行する例外か(Whether the exception is worth retrying)
+        """
+
+        return not isinstance(e, (ValueError, TypeError, NotImplementedError))
+
+class OpenAIEmbeddingProvider(EmbeddingProvider):
+    """
+    OpenAIの埋め込みAPI[pip3 install openai](OpenAI embeddings API [pip3 install openai])
+    """
+
+    strName = "openai"
+
+    def __init__(self):
+        self.objClient = None
+
+    def getClient(self):
+        if self.objClient is None:
+            import openai
+
+            # 再試行はこちらで行う(Retries are handled here)
+            self.objClient = openai.AsyncOpenAI(max_retries=0)
+
+        return self.objClient
+
+    async def getEmbeddings(self, aryTexts: list, strModel: str):
+        objResponse = await self.getClient().embeddings.create(model=strModel, input=aryTexts)
+
+        return [objData.embedding for objData in sorted(objResponse.data, key=lambda objData: objData.index)]
+
+    def isRetryable(self, e: Exception):
+        import openai
+
+        if isinstance(e, (openai.APIConnectionError, openai.RateLimitError, openai.InternalServerError)):
+            return True
+        if isinstance(e, openai.APIStatusError):
+            return e.status_code == 409 or e.status_code >= 500
+
+        return False
+
+class LocalEmbeddingProvider(EmbeddingProvider):
+    """
+    ネットワークを使わない決定的な埋め込み[単語・文字3-gramの特徴ハッシュ](Deterministic embedding without network [feature hashing of words and character trigrams])
+
+    同じテキストは常に同じベクトルになり、語句を共有するテキストほど近くなる。テスト・開発用
+    (The same text always gives the same vector and texts sharing words are closer. For tests and development)
+    """
+
+    strName = "local"
+
+    def __init__(self, intDim: int=256):
+        self.intDim = intDim
+
+    def getEmbedding(self, strText: str):
+        strText = strText.lower()
+        aryFeatures = re.findall(r'\w+', strText)
+        aryFeatures += [strText[i:i + 3] for i in range(max(len(strText) - 2, 0))]
+
+        aryVector = np.zeros(self.intDim, dtype=np.float32)
+        for strFeature in aryFeatures:
+            intHash = int.from_bytes(hashlib.blake2b(strFeature.encode('utf-8'), digest_size=8).digest(), "little")
+            aryVector[intHash % self.intDim] += 1.0 if intHash >> 63 else -1.0
+
+        fltNorm = float(np.linalg.norm(aryVector))
+
+        return (aryVector / fltNorm if fltNorm else aryVector).tolist()
+
+    async def getEmbeddings(self, aryTexts: list, strModel: str):
+        return [self.getEmbedding(strText) for strText in aryTexts]
+
+def getCacheKey(strModel: str, strText: str):
+    """
+    キャッシュキー[モデル名とテキストのハッシュ](Cache key [hash of model name and text])
+
+    Returns:
+
+        bytes:16バイトのハッシュ(16-byte hash)
+    """
+
+    return hashlib.blake2b(f"{strModel}\0{strText}".encode('utf-8', 'surrogatepass'), digest_size=16).digest()
+
+class EmbeddingCache:
+    """
+    SQLiteによる埋め込みのディスクキャッシュ(On-disk embedding cache on SQLite)
+
+    合計バイト数はトリガーで管理し、上限を超えると最終参照が古い順に削除する。プロセス間で共有できる
+    (Total bytes are kept by triggers and the least recently read rows are evicted over the limit. Shared between processes)
+
+    SQLiteの操作は専用の1スレッドで行う(SQLite is only touched from one dedicated thread)
+    """
+
+    # 参照時刻をこの秒数より古い場合だけ更新(Access time is only rewritten when older than this)
+    TOUCH_SECONDS = 60
+
+    def __init__(self, strPath: str=EMBED_CACHE_FILE, intMaxBytes: int=EMBED_CACHE_MAX_BYTES):
+        self.strPath = strPath
+        self.intMaxBytes = intMaxBytes
+        self.objExecutor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="embed-cache")
+        self.objConnection = None
+
+    def getConnection(self):
+        if self.objConnection is None:
+            if os.path.dirname(self.strPath):
+                os.makedirs(os.path.dirname(self.strPath), exist_ok=True)
+
+            objConnection = sqlite3.connect(self.strPath, timeout=30, isolation_level=None, check_same_thread=False)
+            objConnection.execute("PRAGMA journal_mode=WAL")
+            objConnection.execute("PRAGMA synchronous=NORMAL")
+            objConnection.executescript("""
+                CREATE TABLE IF NOT EXISTS embeddings (key BLOB PRIMARY KEY, vector BLOB NOT NULL, accessed REAL NOT NULL) WITHOUT ROWID;
+                CREATE INDEX IF NOT EXISTS embeddings_accessed ON embeddings (accessed);
+                CREATE TABLE IF NOT EXISTS embeddings_size (id INTEGER PRIMARY KEY CHECK (id = 0), bytes INTEGER NOT NULL);
+                INSERT OR IGNORE INTO embeddings_size VALUES (0, 0);
+                CREATE TRIGGER IF NOT EXISTS embeddings_insert AFTER INSERT ON embeddings BEGIN
+                    UPDATE embeddings_size SET bytes = bytes + length(NEW.key) + length(NEW.vector) + 8 WHERE id = 0;
+                END;
+                CREATE TRIGGER IF NOT EXISTS embeddings_delete AFTER DELETE ON embeddings BEGIN
+                    UPDATE embeddings_size SET bytes = bytes - length(OLD.key) - length(OLD.vector) - 8 WHERE id = 0;
+                END;
+            """)
+            self.objConnection = objConnection
+
+        return self.objConnection
+
+    def getSync(self, aryKeys: list):
+        """
+        キャッシュの取得[同期処理](Get from the cache [synchronous])
+
+        Returns:
+
+            dict:キー→float32配列(key to float32 array)
+        """
+
+        objConnection = self.getConnection()
+        aryFound = {}
+        for intStart in range(0, len(aryKeys), 500):
+            aryChunk = aryKeys[intStart:intStart + 500]
+            objCursor = objConnection.execute(
+                f"SELECT key, vector, accessed FROM embeddings WHERE key IN ({','.join('?' * len(aryChunk))})", aryChunk
+            )
+            aryStale = []
+            fltNow = time.time()
+            for bytKey, bytVector, fltAccessed in objCursor:
+                aryFound[bytKey] = np.frombuffer(bytVector, dtype=np.float32)
+                if fltAccessed < fltNow - self.TOUCH_SECONDS:
+                    aryStale.append((fltNow, bytKey))
+            if aryStale:
+                objConnection.executemany("UPDATE embeddings SET accessed = ? WHERE key = ?", aryStale)
+
+        return aryFound
+
+    def setSync(self, aryItems: list):
+        """
+        キャッシュへの登録と上限超過分の削除[同期処理](Store in the cache and evict over the limit [synchronous])
+
+        Args:
+
+            aryItems (list): [(キー, float32配列)]([(key, float32 array)])
+        """
+
+        objConnection = self.getConnection()
+        fltNow = time.time()
+        with objConnection:
+            objConnection.execute("BEGIN IMMEDIATE")
+            objConnection.executemany(
+                "INSERT OR IGNORE INTO embeddings VALUES (?, ?, ?)",
+                [(bytKey, np.asarray(aryVector, dtype=np.float32).tobytes(), fltNow) for bytKey, aryVector in aryItems]
+            )
+
+            # 上限を超えた場合は9割まで古い順に削除(Over the limit, evict least recently read rows down to 90%)
+            intEvicted = 0
+            intBytes = objConnection.execute("SELECT bytes FROM embeddings_size WHERE id = 0").fetchone()[0]
+            if intBytes > self.intMaxBytes and aryItems:
+                intRowBytes = len(aryItems[0][0]) + np.asarray(aryItems[0][1]).size * 4 + 8
+                while intBytes > self.intMaxBytes * 0.9:
+                    intEvicted += objConnection.execute(
+                        "DELETE FROM embeddings WHERE key IN (SELECT key FROM embeddings ORDER BY accessed LIMIT ?)",
+                        (int((intBytes - self.intMaxBytes * 0.9) // intRowBytes) + 1,)
+                    ).rowcount
+                    intBytes = objConnection.execute("SELECT bytes FROM embeddings_size WHERE id = 0").fetchone()[0]
+
+        if intEvicted:
+            log_fnc.getOutputLog().info(f"埋め込みキャッシュ削除(embedding cache eviction) rows:{intEvicted}")
+
+    def getStatsSync(self):
+        objConnection = self.getConnection()
+
+        return {
+            "rows": objConnection.execute("SELECT count(*) FROM embeddings").fetchone()[0],
+            "bytes": objConnection.execute("SELECT bytes FROM embeddings_size WHERE id = 0").fetchone()[0],
+        }
+
+    async def get(self, aryKeys: list):
+        return await asyncio.get_running_loop().run_in_executor(self.objExecutor, self.getSync, aryKeys)
+
+    async def set(self, aryItems: list):
+        await asyncio.get_running_loop().run_in_executor(self.objExecutor, self.setSync, aryItems)
+
+    def close(self):
+        self.objExecutor.shutdown(wait=True)
+        if self.objConnection is not None:
+            self.objConnection.close()
+            self.objConnection = None
+
+class EmbeddingService:
+    """
+    埋め込み取得のキャッシュと一括呼び出し(Cache and batching in front of an embedding provider)
+
+    テキストとモデルのハッシュで重複を除き、キャッシュにないものは少し待ってまとめ、
+    同時実行数を制限して提供元を呼び出す[失敗時は指数バックオフで再試行]
+    (Texts are deduplicated by hash of text and model, misses are gathered for a moment into large batches and
+    sent to the provider under a concurrency limit [retried with exponential backoff on failure])
+    """
+
+    def __init__(self, objProvider: EmbeddingProvider, objCache: EmbeddingCache=None, intConcurrency: int=EMBED_CONCURRENCY, fltBatchWait: float=EMBED_BATCH_WAIT):
+        self.objProvider = objProvider
+        self.objCache = objCache
+        self.intConcurrency = intConcurrency
+        self.fltBatchWait = fltBatchWait
+        self.objSemaphore = None
+        self.aryInflight = {}
+        self.aryPending = {}
+        self.objFlushTask = None
+        self.aryTasks = set()
+        self.aryStats = {"requested": 0, "hits": 0, "misses": 0, "coalesced": 0, "provider_calls": 0, "retries": 0}
+
+    async def getEmbeddings(self, aryTexts: list, strModel: str=None):
+        """
+        埋め込みの取得(Get embeddings)
+
+        Args:
+
+            aryTexts (list): テキスト(texts)
+
+            strModel (str): モデル名[省略時はEMBED_DEFAULT_MODEL](model name [EMBED_DEFAULT_MODEL if omitted])
+
+        Returns:
+
+            ndarray:float32の配列[件数×次元](float32 array [count x dim])
+        """
+
+        strModel = strModel or EMBED_DEFAULT_MODEL
+        strModelKey = f"{self.objProvider.strName}:{strModel}"
+        aryKeys = [getCacheKey(strModelKey, strText) for strText in aryTexts]
+        aryUnique = dict(zip(aryKeys, aryTexts))
+        self.aryStats["requested"] += len(aryTexts)
+
+        aryFound = {}
+        if self.objCache is not None:
+            try:
+                aryFound = await self.objCache.get(list(aryUnique))
+            except Exception as e:
+                log_fnc.getOutputLog().error(f"埋め込みキャッシュ取得エラー(embedding cache read error) error:{e}")
+        self.aryStats["hits"] += len(aryFound)
+
+        # 取得中のものは待ち、それ以外は次の一括呼び出しへ追加(Wait for keys already in flight, queue the rest for the next batch)
+        aryFutures = {}
+        for bytKey, strText in aryUnique.items():
+            if bytKey in aryFound:
+                continue
+            objFuture = self.aryInflight.get((strModel, bytKey))
+            if objFuture is not None:
+                self.aryStats["coalesced"] += 1
+            else:
+                objFuture = asyncio.get_running_loop().create_future()
+                self.aryInflight[(strModel, bytKey)] = objFuture
+                self.aryPending.setdefault(strModel, {})[bytKey] = strText
+                self.aryStats["misses"] += 1
+            aryFutures[bytKey] = objFuture
+
+        if aryFutures:
+            self.setScheduleFlush(strModel)
+            for bytKey, objFuture in aryFutures.items():
+                aryFound[bytKey] = await asyncio.shield(objFuture)
+
+        if not aryKeys:
+            return np.empty((0, 0), dtype=np.float32)
+
+        return np.vstack([aryFound[bytKey] for bytKey in aryKeys])
+
+    def setScheduleFlush(self, strModel: str):
+        """
+        一括呼び出しの予約[件数に達した分はすぐに送る](Schedule a batch call [full batches are sent at once])
+        """
+
+        aryPending = self.aryPending[strModel]
+        while len(aryPending) >= self.objProvider.intMaxBatch:
+            aryBatch = dict(list(aryPending.items())[:self.objProvider.intMaxBatch])
+            for bytKey in aryBatch:
+                del aryPending[bytKey]
+            self.setStartTask(self.execBatch(strModel, aryBatch))
+
+        if self.objFlushTask is None and any(self.aryPending.values()):
+            self.objFlushTask = self.setStartTask(self.execFlushLater())
+
+    def setStartTask(self, objCoroutine):
+        objTask = asyncio.get_running_loop().create_task(objCoroutine)
+        self.aryTasks.add(objTask)
+        objTask.add_done_callback(self.aryTasks.discard)
+
+        return objTask
+
+    async def execFlushLater(self):
+        try:
+            await asyncio.sleep(self.fltBatchWait)
+        finally:
+            self.objFlushTask = None
+
+        for strModel in list(self.aryPending):
+            aryPending = self.aryPending.pop(strModel)
+            aryItems = list(aryPending.items())
+            for intStart in range(0, len(aryItems), self.objProvider.intMaxBatch):
+                self.setStartTask(self.execBatch(strModel, dict(aryItems[intStart:intStart + self.objProvider.intMaxBatch])))
+
+    async def execBatch(self, strModel: str, aryBatch: dict):
+        """
+        提供元の一括呼び出しとキャッシュへの登録(Call the provider for one batch and store the results)
+
+        Args:
+
+            strModel (str): モデル名(model name)
+
+            aryBatch (dict): キー→テキスト(key to text)
+        """
+
+        if self.objSemaphore is None:
+            self.objSemaphore = asyncio.Semaphore(self.intConcurrency)
+
+        aryKeys = list(aryBatch)
+        try:
+            async with self.objSemaphore:
+                aryVectors = await self.getEmbeddingsWithRetry(list(aryBatch.values()), strModel)
+            aryVectors = [np.asarray(aryVector, dtype=np.float32) for aryVector in aryVectors]
+            if len(aryVectors) != len(aryKeys):
+                raise ValueError(f"provider returned {len(aryVectors)} embeddings for {len(aryKeys)} texts")
+
+            if self.objCache is not None:
+                try:
+                    await self.objCache.set(list(zip(aryKeys, aryVectors)))
+                except Exception as e:
+                    log_fnc.getOutputLog().error(f"埋め込みキャッシュ登録エラー(embedding cache write error) error:{e}")
+        except BaseException as e:
+            for bytKey in aryKeys:
+                objFuture = self.aryInflight.pop((strModel, bytKey))
+                if objFuture.done():
+                    continue
+                if isinstance(e, Exception):
+                    objFuture.set_exception(e)
+                    # 待っている呼び出し元がいない場合に警告を出さない(No warning when nobody is waiting)
+                    objFuture.exception()
+                else:
+                    objFuture.cancel()
+            if not isinstance(e, Exception):
+                raise
+            return
+
+        for bytKey, aryVector in zip(aryKeys, aryVectors):
+            self.aryInflight.pop((strModel, bytKey)).set_result(aryVector)
+
+    async def getEmbeddingsWithRetry(self, aryTexts: list, strModel: str):
+        """
+        再試行付きの提供元呼び出し[指数バックオフ+ジッター](Provider call with retries [exponential backoff with jitter])
+        """
+
+        self.aryStats["provider_calls"] += 1
+        for intTry in range(EMBED_RETRIES + 1):
+            try:
+                return await self.objProvider.getEmbeddings(aryTexts, strModel)
+            except Exception as e:
+                if intTry >= EMBED_RETRIES or not self.objProvider.isRetryable(e):
+                    log_fnc.getOutputLog().error(f"埋め込み取得エラー(embedding error) provider:{self.objProvider.strName} rows:{len(aryTexts)} error:{e}")
+                    raise
+                fltWait = EMBED_BACKOFF * (2 ** intTry) * random.uniform(0.5, 1.5)
+                self.aryStats["retries"] += 1
+                log_fnc.getOutputLog().warning(f"埋め込み取得の再試行(embedding retry) try:{intTry + 1} wait:{fltWait:.2f} error:{e}")
+                await asyncio.sleep(fltWait)
+
+    def getStats(self):
+        """
+        ヒット・ミス等の件数取得(Get hit/miss counters)
+
+        Returns:
+
+            dict:requested/hits/misses/coalesced/provider_calls/retries
+        """
+
+        return dict(self.aryStats)
+
+    async def close(self):
+        """
+        実行中の呼び出しを待ってキャッシュを閉じる(Wait for running calls and close the cache)
+        """
+
+        while self.aryTasks:
+            await asyncio.gather(*list(self.aryTasks), return_exceptions=True)
+        if self.objCache is not None:
+            self.objCache.close()
+
+def getEmbeddingProvider(strName: str=EMBED_PROVIDER):
+    """
+    名前による提供元の作成(Create a provider by name)
+
+    Args:
+
+        strName (str): "openai" または "local"("openai" or "local")
+
+    Returns:
+
+        object:EmbeddingProvider
+    """
+
+    if strName == "openai":
+        return OpenAIEmbeddingProvider()
+    if strName == "local":
+        return LocalEmbeddingProvider()
+
+    raise ValueError(f"unknown embedding provider {strName}")
+
+def getEmbeddingService():
+    """
+    プロセス共通の埋め込みサービス取得(Get the process-wide embedding service)
+
+    Returns:
+
+        object:EmbeddingService
+    """
+
+    global _objService
+
+    if _objService is None:
+        _objService = EmbeddingService(getEmbeddingProvider(), EmbeddingCache())
+
+    return _objService
+
+def setEmbeddingService(objService: EmbeddingService):
+    """
+    埋め込みサービスの差し替え[テスト等でLocalEmbeddingProviderを使う場合](Replace the embedding service [e.g. LocalEmbeddingProvider in tests])
+    """
+
+    global _objService
+
+    _objService = objService
+
+async def getEmbeddings(aryTexts: list, strModel: str=None):
+    """
+    埋め込みの取得[キャッシュ・一括呼び出し付き](Get embeddings [cached and batched])
+
+    Args:
+
+        aryTexts (list): テキスト(texts)
+
+        strModel (str): モデル名(model name)
+
+    Returns:
+
+        ndarray:float32の配列[件数×次元](float32 array [count x dim])
+    """
+
+    return await getEmbeddingService().getEmbeddings(aryTexts, strModel)
+
+async def shutdownEmbeddingService():
+    """
+    埋め込みサービスの停止(Stop the embedding service)
+    """
+
+    global _objService
+
+    if _objService is not None:
+        await _objService.close()
+        _objService = None
@@ -0,0 +1,258 @@
+import os
+import json
+import glob
+import time
+import threading
+
+# GMOエラーコードHTMLの格納先(Location of GMO error code HTML)
+GMO_ERROR_DIR = os.getcwd() + '/files/gmo/'
+
+# 事前構築したインデックスのキャッシュファイル(Cache file for the prebuilt index)
+GMO_INDEX_CACHE_FILE = GMO_ERROR_DIR + 'gmo_index.json'
+
+# キャッシュフォーマットのバージョン(Cache format version)
+GMO_INDEX_VERSION = 1
+
+# HTMLの更新チェック間隔[秒](Interval in seconds between HTML mtime checks)
+GMO_INDEX_CHECK_INTERVAL = 60
+
+# エラーコード先頭文字ごとの検索ファイル[検索順](Files searched per error code prefix, in search order)
+GMO_ERROR_FILES = {
+    "E": ("gmo_e", "gmo_e_m"),
+    "C": ("gmo_c",),
+    "G": ("gmo_g",),
+    "M": ("gmo_m", "gmo_e_m", "gmo_carrier", "gom_linepay"),
+}
+
+# メッセージがcells[2]にあるファイル[それ以外はcells[3]](Files whose message is in cells[2], otherwise cells[3])
+GMO_MSG_CELL2_FILES = ("gmo_m", "gmo_carrier", "gom_linepay", "gmo_paysle")
+
+_objIndexLock = threading.Lock()
+_objIndex = None
+_arySignature = None
+_fltCheckedAt = 0.0
+
+def _getSignature():
+    """
+    HTMLファイルの更新シグネチャ取得(Get the modification signature of the HTML files)
+
+    Returns:
+
+        dict:ファイル名ごとの[mtime_ns, size](per file name [mtime_ns, size])
+    """
+
+    arySignature = {}
+    for strPath in sorted(glob.glob(GMO_ERROR_DIR + '*.html')):
+        objStat = os.stat(strPath)
+        arySignature[os.path.basename(strPath)[:-5]] = [objStat.st_mtime_ns, objStat.st_size]
+
+    return arySignature
+
+def _getFileRows(strFileName: str):
+    """
+    HTMLファイルから[詳細コード, メッセージ]の行を抽出(Extract [detail code, message] rows from an HTML file)
+
+    Args:
+
+        strFileName (str): 拡張子なしのファイル名(File name without extension)
+
+    Returns:
+
+        list:[詳細コード, メッセージ]のリスト(list of [detail code, message])
+    """
+
+    # 構築時のみ必要なため遅延読込(Imported lazily as it is only needed when building)
+    from bs4 import BeautifulSoup
+
+    with open(GMO_ERROR_DIR + f'{strFileName}.html', 'r') as file:
+        html = file.read()
+
+    soup = BeautifulSoup(html, 'html.parser')
+
+    # 二番目のテーブルを選択(Select the second table)
+    tables = soup.find_all('table')
+    if len(tables) < 2:
+        return []
+
+    intMsgCell = 2 if strFileName in GMO_MSG_CELL2_FILES else 3
+
+    aryRows = []
+    for row in tables[1].find_all('tr'):
+        cells = row.find_all('td')
+        if len(cells) > intMsgCell:
+            aryRows.append([cells[1].text, cells[intMsgCell].text])
+
+    return aryRows
+
+def _getScanMsg(aryScan: tuple, strErrorInfo: str):
+    """
+    行を順に部分一致で検索(Sequential substring search over the rows)
+
+    Args:
+
+        aryScan (tuple): (ファイル名, 詳細コード, メッセージ)の行(rows of (file name, detail code, message))
+
+        strErrorInfo (str): 詳細コード(detail code)
+
+    Returns:
+
+        str:GMOエラーメッセージ[取得できない場合は空](GMO error message [empty if not obtained])
+    """
+
+    # ファイル内では最初に一致した行で打ち切り、空なら次のファイルを検索(Stop at the first match in a file, trying the next file if it is empty)
+    strMatchedFile = ""
+    for strFileName, strDetail, strMsg in aryScan:
+        if strFileName == strMatchedFile or strErrorInfo not in strDetail:
+            continue
+        if strMsg != "":
+            return "" if strMsg == "－" else strMsg
+        strMatchedFile = strFileName
+
+    return ""
+
+def _buildIndex(aryFiles: dict):
+    """
+    ファイル単位の行からエラーコード先頭文字単位のインデックスを作成(Build the per-prefix index from per-file rows)
+
+    Args:
+
+        aryFiles (dict): ファイル名ごとの行(rows per file name)
+
+    Returns:
+
+        dict:先頭文字ごとの(詳細コード辞書, 部分一致用の行)(per prefix (detail code dict, rows for substring matching))
+    """
+
+    objIndex = {}
+    for strPrefix, aryFileNames in GMO_ERROR_FILES.items():
+        aryScan = tuple(
+            (strFileName, strDetail, strMsg)
+            for strFileName in aryFileNames
+            for strDetail, strMsg in aryFiles.get(strFileName, [])
+        )
+
+        # 詳細コードごとに従来の検索結果を事前計算(Precompute the previous search result per detail code)
+        aryExact = {}
+        for _, strDetail, _ in aryScan:
+            strKey = strDetail.strip()
+            if strKey not in aryExact:
+                aryExact[strKey] = _getScanMsg(aryScan, strKey)
+
+        objIndex[strPrefix] = (aryExact, aryScan)
+
+    return objIndex
+
+def _loadIndex(arySignature: dict):
+    """
+    キャッシュファイルの読込、無効ならHTMLから再構築(Load the cache file, rebuilding from HTML when stale)
+
+    Args:
+
+        arySignature (dict): 現在のHTMLシグネチャ(current HTML signature)
+
+    Returns:
+
+        dict:先頭文字ごとのインデックス(per prefix index)
+    """
+
+    try:
+        with open(GMO_INDEX_CACHE_FILE, 'r') as f:
+            objCache = json.load(f)
+        if objCache.get("version") == GMO_INDEX_VERSION and objCache.get("signature") == arySignature:
+            return _buildIndex(objCache["files"])
+    except (OSError, ValueError, KeyError):
+        pass
+
+    aryFiles = {strFileName: _getFileRows(strFileName) for strFileName in arySignature}
+
+    # 一時ファイルへ書いてから置き換える(Write to a temporary file and then replace)
+    strTmpFile = f'{GMO_INDEX_CACHE_FILE}.{os.getpid()}.tmp'
+    try:
+        with open(strTmpFile, 'w') as f:
+            json.dump({"version": GMO_INDEX_VERSION, "signature": arySignature, "files": aryFiles}, f, ensure_ascii=False)
+        os.replace(strTmpFile, GMO_INDEX_CACHE_FILE)
+    except OSError:
+        # キャッシュが書けなくてもメモリ上のインデックスは利用する(Keep the in-memory index even if the cache cannot be written)
+        if os.path.exists(strTmpFile):
+            os.remove(strTmpFile)
+
+    return _buildIndex(aryFiles)
+
+def getGmoErrorIndex(blnReload: bool=False):
+    """
+    GMOエラーコードインデックスの取得(Get the GMO error code index)
+
+    初回呼び出し時に構築し、以降はHTMLが更新された場合のみ再構築する(Built on first call and rebuilt only when the HTML changes)
+
+    Args:
+
+        blnReload (bool): 更新チェックを強制する(force a modification check)
+
+    Returns:
+
+        dict:先頭文字ごとのインデックス(per prefix index)
+    """
+
+    global _objIndex, _arySignature, _fltCheckedAt
+
+    fltNow = time.monotonic()
+    if _objIndex is not None and not blnReload and fltNow - _fltCheckedAt < GMO_INDEX_CHECK_INTERVAL:
+        return _objIndex
+
+    with _objIndexLock:
+        if _objIndex is not None and not blnReload and fltNow - _fltCheckedAt < GMO_INDEX_CHECK_INTERVAL:
+            return _objIndex
+
+        arySignature = _getSignature()
+        if _objIndex is None or arySignature != _arySignature:
+            _objIndex = _loadIndex(arySignature)
+            _arySignature = arySignature
+        _fltCheckedAt = fltNow
+
+    return _objIndex
+
+def getGmoErrorMsg(strErrorCode: str, strErrorInfo: str):
+    """
+    GMOペイメントのエラーコードからメッセージを取得(Get message from GMO Payments error code)
+
+    Args:
+
+        strErrorCode (str): エラーコード(error code)
+
+        strErrorInfo (str): 詳細コード(detail code)
+
+    Returns:
+
+        str:GMOエラーメッセージ[取得できない場合は空](GMO error message [empty if not obtained])
+    """
+
+    if not strErrorCode:
+        return ""
+
+    objEntry = getGmoErrorIndex().get(strErrorCode[0].upper())
+    if objEntry is None:
+        return ""
+
+    aryExact, aryScan = objEntry
+
+    strGmoErrorMsg = aryExact.get(strErrorInfo)
+    if strGmoErrorMsg is not None:
+        return strGmoErrorMsg
+
+    # 未登録の詳細コードは従来通り部分一致で検索(Unknown detail codes fall back to the previous substring match)
+    return _getScanMsg(aryScan, strErrorInfo)
+
+def getGmoErrorMsgList(aryErrors: list):
+    """
+    GMOペイメントのエラーコードからメッセージを一括取得(Batch get messages from GMO Payments error codes)
+
+    Args:
+
+        aryErrors (list): (エラーコード, 詳細コード)のリスト(list of (error code, detail code))
+
+    Returns:
+
+        list:GMOエラーメッセージのリスト[取得できない場合は空](list of GMO error messages [empty if not obtained])
+    """
+
+    return [getGmoErrorMsg(strErrorCode, strErrorInfo) for strErrorCode, strErrorInfo in aryErrors]
@@ -0,0 +1,252 @@
+import os
+import codecs
+
+from fastapi.responses import StreamingResponse
+
+# 共通ファンクションの読込(Reading common functions)
+from functions import stream_fnc
+
+# 共通ユーティリティの読込(Reading common utilities)
+from util import util_cmn
+
+# 受信データを読込む単位[バイト](bytes read per receive)
+INGEST_READ_BYTES = int(os.getenv("INGEST_READ_BYTES", str(64 * 1024)))
+
+# 前の行と重複を確認する最大文字数(maximum characters checked for overlap with the previous line)
+INGEST_MAX_OVERLAP = int(os.getenv("INGEST_MAX_OVERLAP", "1000"))
+
+# 1行の最大文字数[超えた場合はその位置で区切る](maximum characters per line [longer lines are broken there])
+INGEST_MAX_LINE = int(os.getenv("INGEST_MAX_LINE", str(1024 * 1024)))
+
+# NDJSONで1回に送る件数(records per NDJSON write)
+INGEST_FLUSH_ROWS = int(os.getenv("INGEST_FLUSH_ROWS", "100"))
+
+class RequestStreamingResponse(StreamingResponse):
+    """
+    リクエストボディを読みながら返すストリーミングレスポンス(Streaming response produced while the request body is still being read)
+
+    StreamingResponseの切断監視はreceiveを読むためボディを奪い合う。切断はrequest.stream()側で検知する
+    (StreamingResponse's disconnect listener also reads receive and would steal body messages, the disconnect is seen by request.stream() instead)
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+        if self.background is not None:
+            await self.background()
+
+async def getReadChunks(objStream, intReadBytes: int=INGEST_READ_BYTES):
+    """
+    受信データを一定サイズのバイト列に区切る(Re-slice received data into fixed-size byte chunks)
+
+    Args:
+
+        objStream (object): バイト列の非同期イテレータ[request.stream()等](async iterator of bytes [request.stream() etc.])
+
+        intReadBytes (int): 区切るバイト数(bytes per chunk)
+
+    Yields:
+
+        bytes:受信データ(received data)
+    """
+
+    bytBuffer = bytearray()
+    async for bytChunk in objStream:
+        bytBuffer += bytChunk
+        while len(bytBuffer) >= intReadBytes:
+            yield bytes(bytBuffer[:intReadBytes])
+            del bytBuffer[:intReadBytes]
+
+    if bytBuffer:
+        yield bytes(bytBuffer)
+
+async def getDecodedText(aryChunks, strEncoding: str="utf-8"):
+    """
+    逐次デコード[文字の途中で区切られたバイト列も正しく扱う](Incremental decode [bytes split mid-character are handled])
+
+    Args:
+
+        aryChunks (object): バイト列の非同期イテレータ(async iterator of bytes)
+
+        strEncoding (str): 文字コード(character encoding)
+
+    Yields:
+
+        str:テキスト(text)
+    """
+
+    objDecoder = codecs.getincrementaldecoder(strEncoding)(errors="replace")
+
+    async for bytChunk in aryChunks:
+        strText = objDecoder.decode(bytChunk)
+        if strText:
+            yield strText
+
+    strText = objDecoder.decode(b"", final=True)
+    if strText:
+        yield strText
+
+async def getLines(aryTexts):
+    """
+    テキストを行に分割[行末の改行は含まない](Split text into lines [without line endings])
+
+    改行のない長いデータでもメモリを使い続けないよう、INGEST_MAX_LINE文字で区切る
+    (Lines are broken at INGEST_MAX_LINE characters so data without line breaks does not grow memory)
+
+    Args:
+
+        aryTexts (object): テキストの非同期イテレータ(async iterator of text)
+
+    Yields:
+
+        str:行(line)
+    """
+
+    strRest = ""
+    async for strText in aryTexts:
+        aryLines = (strRest + strText).split("\n")
+        # 最後の行は続きが来る可能性があるため保持(Keep the last line, more may follow)
+        strRest = aryLines.pop()
+        for strLine in aryLines:
+            yield strLine.rstrip("\r")
+        while len(strRest) > INGEST_MAX_LINE:
+            yield strRest[:INGEST_MAX_LINE]
+            strRest = strRest[INGEST_MAX_LINE:]
+
+    if strRest:
+        yield strRest.rstrip("\r")
+
+async def getCleanLines(aryLines):
+    """
+    行ごとのHTMLタグ・改行・空白の削除[空行は除く](Clean each line [empty lines are dropped])
+
+    Args:
+
+        aryLines (object): 行の非同期イテレータ(async iterator of lines)
+
+    Yields:
+
+        str:除去された行(cleaned line)
+    """
+
+    async for strLine in aryLines:
+        strLine = util_cmn.getCleanText(strLine)
+        if strLine:
+            yield strLine
+
+async def getStitchedText(aryLines, intMaxOverlap: int=INGEST_MAX_OVERLAP):
+    """
+    前の行の末尾と重複する先頭を除いて結合[getJoinStringsの逐次版](Join lines dropping the start that repeats the previous end [streaming getJoinStrings])
+
+    重複の確認は直前のintMaxOverlap文字までに限るため、メモリ使用量は一定
+    (The overlap check only looks at the last intMaxOverlap characters, so memory use stays constant)
+
+    Args:
+
+        aryLines (object): 行の非同期イテレータ(async iterator of lines)
+
+        intMaxOverlap (int): 重複を確認する最大文字数[0は重複除去なし](maximum overlap checked [0 disables])
+
+    Yields:
+
+        str:重複を除いたテキスト(text with the overlap removed)
+    """
+
+    strTail = ""
+    async for strLine in aryLines:
+        if intMaxOverlap > 0:
+            strLine = strLine[util_cmn.getOverlapLength(strTail, strLine[:intMaxOverlap]):]
+            strTail = (strTail + strLine)[-intMaxOverlap:]
+        if strLine:
+            yield strLine
+
+async def getTextChunks(aryTexts, intChunkSize: int, intOverlap: int=0):
+    """
+    一定文字数のチャンクへ分割[前のチャンクとintOverlap文字重ねる](Split into fixed-size chunks [sharing intOverlap characters with the previous one])
+
+    Args:
+
+        aryTexts (object): テキストの非同期イテレータ(async iterator of text)
+
+        intChunkSize (int): チャンクの文字数(characters per chunk)
+
+        intOverlap (int): 重ねる文字数(overlapping characters)
+
+    Yields:
+
+        str:チャンク(chunk)
+    """
+
+    if intChunkSize <= 0 or not 0 <= intOverlap < intChunkSize:
+        raise ValueError(f"invalid chunk size chunk_size:{intChunkSize} overlap:{intOverlap}")
+
+    intStep = intChunkSize - intOverlap
+    strBuffer = ""
+    blnEmitted = False
+    async for strText in aryTexts:
+        strBuffer += strText
+        intPos = 0
+        while len(strBuffer) - intPos >= intChunkSize:
+            yield strBuffer[intPos:intPos + intChunkSize]
+            intPos += intStep
+            blnEmitted = True
+        if intPos:
+            strBuffer = strBuffer[intPos:]
+
+    # 残りが前のチャンクの重複部分のみの場合は出力しない(Skip a remainder that is only the previous chunk's overlap)
+    if strBuffer and not (blnEmitted and len(strBuffer) <= intOverlap):
+        yield strBuffer
+
+async def getIngestRecords(objStream, strEncoding: str="utf-8", intChunkSize: int=2000, intOverlap: int=0, intMaxOverlap: int=0, blnClean: bool=True):
+    """
+    アップロードの取込み[読込→デコード→行分割→整形→重複除去→チャンク分割](Ingest an upload [read, decode, split lines, clean, stitch, chunk])
+
+    Args:
+
+        objStream (object): バイト列の非同期イテレータ(async iterator of bytes)
+
+        strEncoding (str): 文字コード(character encoding)
+
+        intChunkSize (int): チャンクの文字数(characters per chunk)
+
+        intOverlap (int): チャンク間で重ねる文字数(characters shared between chunks)
+
+        intMaxOverlap (int): 行間の重複を確認する最大文字数[0は重複除去なし](maximum overlap checked between lines [0 disables])
+
+        blnClean (bool): getCleanTextで整形する(clean with getCleanText)
+
+    Yields:
+
+        list:[{index, offset, text}]
+    """
+
+    aryLines = getLines(getDecodedText(getReadChunks(objStream), strEncoding))
+    if blnClean:
+        aryLines = getCleanLines(aryLines)
+
+    intIndex = 0
+    intOffset = 0
+    aryRecords = []
+    async for strChunk in getTextChunks(getStitchedText(aryLines, intMaxOverlap), intChunkSize, intOverlap):
+        aryRecords.append({"index": intIndex, "offset": intOffset, "text": strChunk})
+        intIndex += 1
+        intOffset += intChunkSize - intOverlap
+        if len(aryRecords) >= INGEST_FLUSH_ROWS:
+            yield aryRecords
+            aryRecords = []
+
+    if aryRecords:
+        yield aryRecords
+
+def getIngestStreamingResponse(objStream, strEncoding: str="utf-8", intChunkSize: int=2000, intOverlap: int=0, intMaxOverlap: int=0, blnClean: bool=True):
+    """
+    取込み結果をNDJSONで返すレスポンス作成(Create a response streaming ingested chunks as NDJSON)
+
+    Returns:
+
+        object:StreamingResponse
+    """
+
+    aryRecords = getIngestRecords(objStream, strEncoding, intChunkSize, intOverlap, intMaxOverlap, blnClean)
+
+    return RequestStreamingResponse(stream_fnc.getNdjsonStream(aryRecords), media_type="application/x-ndjson")
@@ -1,52 +1,176 @@
 import json
 import os
+import time
+import queue
+import atexit
 import logging
+import threading
 from logging import getLogger, config
-from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener, TimedRotatingFileHandler
+
+# 共通ファンクションの読込(Reading common functions)
+from functions import context_fnc
 
 class CustomFormatter(logging.Formatter):
     def format(self, record):
-        # clientipがrecordにない場合は、デフォルト値'unknown'を使用
-        record.clientip = getattr(record, 'clientip', 'unknown')
+        # clientipがrecordにない場合は、リクエストのコンテキストから取得
+        # (If clientip is not in the record, take it from the request context)
+        if getattr(record, 'clientip', None) is None:
+            record.clientip = context_fnc.getClientIp()
         return super(CustomFormatter, self).format(record)
 
-async def setOutputLog():
+class ClientIpFilter(logging.Filter):
     """
-    ログオブジェクト作成(log-object creation)
+    ログ出力元のスレッドでクライアントIPをrecordに設定するフィルタ(Filter that stamps the client IP on the record in the logging thread)
 
-    指定のフォーマットでログオブジェクト作成(Log object creation in specified format)
+    QueueListenerのスレッドからはリクエストのコンテキストが見えないため(The request context is not visible from the QueueListener thread)
+    """
+
+    def filter(self, record):
+        if getattr(record, 'clientip', None) is None:
+            record.clientip = context_fnc.getClientIp()
+        return True
+
+class DailyFileHandler(TimedRotatingFileHandler):
+    """
+    日付ごとのログファイルへ日付が変わった時点で切り替えるハンドラ(Handler that switches to a per-date log file at midnight)
+
+    filenameの{}に日付[YYYYMMDD]が入る(The date [YYYYMMDD] is placed in the {} of filename)
+    """
+
+    def __init__(self, filename, **kwargs):
+        self.strFilenameFormat = filename
+        super(DailyFileHandler, self).__init__(self.getDailyFilename(time.time()), **kwargs)
+
+    def getDailyFilename(self, fltTime: float):
+        return self.strFilenameFormat.format(time.strftime("%Y%m%d", time.localtime(fltTime)))
+
+    def doRollover(self):
+        # リネームせずに新しい日付のファイルを開く(Open the new date file instead of renaming)
+        if self.stream:
+            self.stream.close()
+            self.stream = None
+
+        fltNow = time.time()
+        self.baseFilename = os.path.abspath(self.getDailyFilename(fltNow))
+        self.rolloverAt = self.computeRollover(fltNow)
+
+        if not self.delay:
+            self.stream = self._open()
+
+_objSetupLock = threading.Lock()
+_objListener = None
+
+def setupLogging():
+    """
+    ログ設定処理(logging setup)
+
+    起動時に一度だけ設定し、ファイル出力はQueueListenerの別スレッドで行う(Configured once at startup, file output runs on the QueueListener thread)
 
     Returns:
 
-        bool:成功:検索結果 失敗:Fals](Success:search results Failure:False)
+        bool:成功:True(Success:True)
+    """
+
+    global _objListener
+
+    with _objSetupLock:
+        if _objListener is not None:
+            return True
+
+        with open(os.getcwd() + '/log_config.json', 'r') as f:
+            objLogConf = json.load(f)
+
+        # ディレクトリが存在しなければ作成[LOG_DIRで変更可](If the directory does not exist, create it [LOG_DIR overrides it])
+        # logs/python-20231104.logs
+        strLogDir = os.getenv("LOG_DIR", os.getcwd() + '/logs') + '/'
+        if not os.path.isdir(strLogDir):
+            os.makedirs(strLogDir)
+            os.chmod(strLogDir, 0o777)
+
+        # ファイル名は日付が変わるたびに切り替える(The file name switches each time the date changes)
+        objFileHandlerConf = objLogConf["handlers"]["fileHandler"]
+        objFileHandlerConf.pop("class")
+        objFileHandlerConf["()"] = DailyFileHandler
+        objFileHandlerConf["filename"] = strLogDir + 'python-{}.logs'
+
+        # カスタムフォーマッタの設定
+        for handler in objLogConf["handlers"].values():
+            handler["formatter"] = "custom"
+
+        objLogConf["formatters"]["custom"] = {
+            "()": CustomFormatter,
+            "format": "[%(asctime)s][%(clientip)s][%(name)s:%(lineno)s][%(funcName)s][%(levelname)s]: %(message)s"
+        }
+
+        config.dictConfig(objLogConf)
+
+        # 出力ハンドラをキュー経由に差し替え(Route output handlers through the queue)
+        objQueue = queue.SimpleQueue()
+        objQueueHandler = QueueHandler(objQueue)
+        objQueueHandler.addFilter(ClientIpFilter())
+        aryHandlers = []
+        for strLoggerName in [None] + list(objLogConf.get("loggers", {})):
+            objLogger = getLogger(strLoggerName)
+            for objHandler in objLogger.handlers:
+                if objHandler not in aryHandlers:
+                    aryHandlers.append(objHandler)
+            objLogger.handlers = [objQueueHandler]
+
+        _objListener = QueueListener(objQueue, *aryHandlers, respect_handler_level=True)
+        _objListener.start()
+
+        atexit.register(shutdownLogging)
+
+    return True
+
+def shutdownLogging():
     """
+    ログ出力の終了処理(logging shutdown)
 
-    with open(os.getcwd() + '/log_config.json', 'r') as f:
-        objLogConf = json.load(f)
+    キューに残ったログを書き出してから停止する(Flush the queued logs and then stop)
+    """
+
+    global _objListener
 
-    # ディレクトリが存在しなければ作成(If the directory does not exist, create it)
-    # logs/{client_id}/20231104.logs
-    strLogDir = os.getcwd() + '/logs/' + '/'
-    if not os.path.isdir(strLogDir):
-        os.makedirs(strLogDir)
-        os.chmod(strLogDir, 0o777)
+    with _objSetupLock:
+        if _objListener is None:
+            return
 
-    # ファイル名をタイムスタンプで作成(Create file names with timestamps)
-    strDatetimeDat = datetime.now()
-    objLogConf["handlers"]["fileHandler"]["filename"] = \
-        strLogDir + 'python-{}.logs'.format(strDatetimeDat.strftime("%Y%m%d"))
+        _objListener.stop()
+        for objHandler in _objListener.handlers:
+            objHandler.close()
+        _objListener = None
+
+def getOutputLog(strName: str=None):
+    """
+    ログオブジェクト取得(log-object acquisition)
 
+    未設定の場合のみ設定を行い、キャッシュ済みのロガーを返す(Configures only when not yet set up and returns the cached logger)
 
-    # カスタムフォーマッタの設定
-    for handler in objLogConf["handlers"].values():
-        handler["formatter"] = "custom"
+    Args:
 
-    objLogConf["formatters"]["custom"] = {
-        "()": CustomFormatter,
-        "format": "[%(asctime)s][%(clientip)s][%(name)s:%(lineno)s][%(funcName)s][%(levelname)s]: %(message)s"
-    }
+        strName (str): ロガー名[省略時はroot](logger name [root if omitted])
 
-    config.dictConfig(objLogConf)
+    Returns:
+
+        object:ロガー(logger)
+    """
+
+    if _objListener is None:
+        setupLogging()
+
+    return getLogger(strName)
+
+async def setOutputLog():
+    """
+    ログオブジェクト作成(log-object creation)
+
+    指定のフォーマットでログオブジェクト作成(Log object creation in specified format)
+
+    Returns:
+
+        bool:成功:検索結果 失敗:Fals](Success:search results Failure:False)
+    """
 
-    objLogger = getLogger()
-    return objLogger
\ No newline at end of file
+    return getOutputLog()
@@ -1,6 +1,7 @@
-import ssl
-import smtplib
-from smtplib import SMTP_SSL
+import html
+import asyncio
+import functools
+from string import Template
 
 from email.mime.multipart import MIMEMultipart
 from email.mime.text import MIMEText
@@ -8,11 +9,13 @@ from email.mime.text import MIMEText
 # 共通ファンクションの読込(Reading common functions)
 from functions import mysqlaio_fnc
 from functions import log_fnc
+from functions import smtp_fnc
+from functions import timing_fnc
 
 # 共通ユーティリティの読込(Reading common utilities)
 from util import util_cmn
 
-async def execSendEmail(objDbPool, strSubject: str, strMessage: str, strSendMail: str=""):
+async def execSendEmail(objDbPool, strSubject: str, strMessage: str, strSendMail: str="", blnWait: bool=True):
     """
     メール送信処理(mail service)
 
@@ -26,153 +29,256 @@ async def execSendEmail(objDbPool, strSubject: str, strMessage: str, strSendMail
 
         strSendMail (int): メール宛先(Mailing address)
 
+        blnWait (bool): 送信結果を待つ[Falseの場合はキュー登録のみ](wait for the send result [enqueue only if False])
+
     Returns:
 
         bool:成功:メール送信 失敗:Fals](Success:send mail Failure:False)
     """
 
-    objLogger = await log_fnc.setOutputLog()
-    aryLogExtra = await util_cmn.getIpAddress()
+    return await execSendMime(MIMEMultipart(), MIMEText(strMessage, 'plain', 'utf-8'), strSubject, strSendMail, blnWait)
 
-    # メール情報取得(Obtaining email information)
-    strMailDealerSendMail = getenv("mail_system_send_mail")
-    strMailDealerInfoMail =  getenv("mail_system_info_mail")
-    strMailHost = getenv("mail_host")
-    strMailPort = getenv("mail_port")
-    strMailUsername = getenv("mail_username")
-    strMailPassword = getenv("mail_password")
-    intMailTimeout = getenv("mail_timeout")
-    strMailLocalDomain = getenv("mail_local_domain")
-    strMailEncryption = getenv("mail_encryption")
+async def execSendEmailHtml(objDbPool, strSubject: str, strMessage: str, strSendMail: str="", blnWait: bool=True):
+    """
+    HTMLメール送信処理(html mail service)
 
-    # 宛先の指定があれば書き換える(Rewrite the destination designation, if any)
-    if strSendMail != "":
-        strMailDealerSendMail = strSendMail
+    strSendMailを指定することで指定のアドレスにメール送信することが可能(Email can be sent to a specified address by specifying strSendMail)
 
-    # 設定がない場合はメール送信無(No email sent if no settings)
-    if strMailHost == None or strMailPort == None or strMailDealerSendMail == None or strMailDealerInfoMail ==None:
-        objLogger.info(f"メール送信無(mail send notthing)", extra=aryLogExtra)
-        return False
+    Args:
 
-    try:
-        # MIMETextを作成(Create MIMEText)
-        objMIMEMultipart = MIMEMultipart()
-        objMIMEMultipart['Subject'] = strSubject
-        objMIMEMultipart['From'] = strMailDealerInfoMail
-        objMIMEMultipart['To'] = strMailDealerSendMail
-        objMIMEMultipart.attach(MIMEText(strMessage, 'plain', 'utf-8'))
-
-        # サーバを指定(Specify server)
-        if strMailEncryption == "tls":
-            objContext = ssl.create_default_context()
-            server = SMTP_SSL(strMailHost, strMailPort, context=objContext)
-            if intMailTimeout != None:
-                server.timeout = int(intMailTimeout)
-        elif strMailHost == "mailhog":
-            if intMailTimeout != None:
-                server = smtplib.SMTP(strMailHost, strMailPort, timeout=int(intMailTimeout))
-            else:
-                server = smtplib.SMTP(strMailHost, strMailPort)
-        else:
-            if intMailTimeout != None:
-                server = smtplib.SMTP(strMailHost, strMailPort, timeout=int(intMailTimeout))
-            else:
-                server = smtplib.SMTP(strMailHost, strMailPort)
-            server.starttls()
+        strSubject (int): メールタイトル(Mail Title)
 
-        # ログイン処理(login process)
-        if strMailUsername != None and strMailPassword != None:
-            server.login(strMailUsername, strMailPassword)
+        strMessage (int): メールメッセージ(email message)
 
-        # メールを送信(Send email to)
-        server.send_message(objMIMEMultipart)
-        
-        # 閉じる(close)
-        server.quit()
+        strSendMail (int): メール宛先(Mailing address)
 
-    except Exception as e:
-        objLogger.critical(f"メール送信失敗(Exception Error mail send) Exception:{e}", extra=aryLogExtra)
-        return False
-    
-async def execSendEmailHtml(objDbPool, strSubject: str, strMessage: str, strSendMail: str=""):
+        blnWait (bool): 送信結果を待つ[Falseの場合はキュー登録のみ](wait for the send result [enqueue only if False])
+
+    Returns:
+
+        bool:成功:メール送信 失敗:Fals](Success:send mail Failure:False)
     """
-    HTMLメール送信処理(html mail service)
 
-    strSendMailを指定することで指定のアドレスにメール送信することが可能(Email can be sent to a specified address by specifying strSendMail)
+    return await execSendMime(MIMEMultipart('alternative'), MIMEText(strMessage, 'html', 'utf-8'), strSubject, strSendMail, blnWait)
+
+async def execSendMime(objMIMEMultipart, objMIMEText, strSubject: str, strSendMail: str="", blnWait: bool=True):
+    """
+    MIMEメッセージ送信処理(MIME message send)
+
+    送信はメールディスパッチャのプール済み接続で行う(Sent over the pooled connections of the mail dispatcher)
 
     Args:
 
-        strSubject (int): メールタイトル(Mail Title)
+        objMIMEMultipart (object): MIMEMultipart
 
-        strMessage (int): メールメッセージ(email message)
+        objMIMEText (object): 本文のMIMEText(MIMEText body)
 
-        strSendMail (int): メール宛先(Mailing address)
+        strSubject (str): メールタイトル(Mail Title)
+
+        strSendMail (str): メール宛先(Mailing address)
+
+        blnWait (bool): 送信結果を待つ[Falseの場合はキュー登録のみ](wait for the send result [enqueue only if False])
 
     Returns:
 
         bool:成功:メール送信 失敗:Fals](Success:send mail Failure:False)
     """
 
-    objLogger = await log_fnc.setOutputLog()
+    objLogger = log_fnc.getOutputLog()
     aryLogExtra = await util_cmn.getIpAddress()
 
     # メール情報取得(Obtaining email information)
-    strMailDealerSendMail = getenv("mail_system_send_mail")
-    strMailDealerInfoMail =  getenv("mail_system_info_mail")
-    strMailHost = getenv("mail_host")
-    strMailPort = getenv("mail_port")
-    strMailUsername = getenv("mail_username")
-    strMailPassword = getenv("mail_password")
-    intMailTimeout = getenv("mail_timeout")
-    strMailLocalDomain = getenv("mail_local_domain")
-    strMailEncryption = getenv("mail_encryption")
-    strMailSendType = getenv("mail_send_type")
+    objSetting = smtp_fnc.getMailSetting()
+    strMailDealerSendMail = objSetting["send_mail"]
+    strMailDealerInfoMail = objSetting["info_mail"]
 
     # 宛先の指定があれば書き換える(Rewrite the destination designation, if any)
     if strSendMail != "":
         strMailDealerSendMail = strSendMail
 
     # 設定がない場合はメール送信無(No email sent if no settings)
-    if strMailHost == None or strMailPort == None or strMailDealerSendMail == None or strMailDealerInfoMail ==None:
+    if objSetting["host"] == None or objSetting["port"] == None or strMailDealerSendMail == None or strMailDealerInfoMail ==None:
         objLogger.info(f"メール送信無(mail send notthing)", extra=aryLogExtra)
         return False
 
-    try:
-        # MIMETextを作成(Create MIMEText)
-        objMIMEMultipart = MIMEMultipart('alternative')
-        objMIMEMultipart['Subject'] = strSubject
-        objMIMEMultipart['From'] = strMailDealerInfoMail
-        objMIMEMultipart['To'] = strMailDealerSendMail
-        objMIMEMultipart.attach(MIMEText(strMessage, 'html', 'utf-8'))
-
-        # サーバを指定(Specify server)
-        if strMailEncryption == "tls":
-            objContext = ssl.create_default_context()
-            server = SMTP_SSL(strMailHost, strMailPort, context=objContext)
-            if intMailTimeout != None:
-                server.timeout = int(intMailTimeout)
-        elif strMailHost == "mailhog":
-            if intMailTimeout != None:
-                server = smtplib.SMTP(strMailHost, strMailPort, timeout=int(intMailTimeout))
-            else:
-                server = smtplib.SMTP(strMailHost, strMailPort)
-        else:
-            if intMailTimeout != None:
-                server = smtplib.SMTP(strMailHost, strMailPort, timeout=int(intMailTimeout))
+    # MIMETextを作成(Create MIMEText)
+    objMIMEMultipart['Subject'] = strSubject
+    objMIMEMultipart['From'] = strMailDealerInfoMail
+    objMIMEMultipart['To'] = strMailDealerSendMail
+    objMIMEMultipart.attach(objMIMEText)
+
+    objDispatcher = smtp_fnc.getMailDispatcher()
+    if not blnWait:
+        if not objDispatcher.enqueue(objMIMEMultipart):
+            objLogger.critical(f"メール送信キュー満杯(mail send queue full) to:{strMailDealerSendMail}", extra=aryLogExtra)
+            return False
+        return True
+
+    with timing_fnc.getSpan("smtp"):
+        return await objDispatcher.send(objMIMEMultipart)
+
+@functools.lru_cache(maxsize=128)
+def getCompiledTemplate(strTemplate: str):
+    """
+    テンプレートのコンパイル(Compile a template)
+
+    $name / ${name} の置換箇所を事前に分解してキャッシュする($name / ${name} placeholders are split once and cached)
+
+    Args:
+
+        strTemplate (str): テンプレート(template)
+
+    Returns:
+
+        tuple:(固定文字列, 置換キー)のタプル[置換キーがない場合はNone](tuple of (literal, key) [key is None if absent])
+    """
+
+    aryParts = []
+    intPos = 0
+    for objMatch in Template.pattern.finditer(strTemplate):
+        strLiteral = strTemplate[intPos:objMatch.start()]
+        strKey = objMatch.group('named') or objMatch.group('braced')
+        if strKey is None:
+            # $$ と不正な$はそのまま出力($$ and invalid $ are output as is)
+            strLiteral += "$" if objMatch.group('escaped') is not None else objMatch.group()
+        aryParts.append((strLiteral, strKey))
+        intPos = objMatch.end()
+    aryParts.append((strTemplate[intPos:], None))
+
+    return tuple(aryParts)
+
+def getRenderTemplate(aryCompiled: tuple, aryContext: dict, blnEscape: bool=False):
+    """
+    コンパイル済みテンプレートの描画(Render a compiled template)
+
+    Args:
+
+        aryCompiled (tuple): getCompiledTemplateの結果(result of getCompiledTemplate)
+
+        aryContext (dict): 置換する値(values to substitute)
+
+        blnEscape (bool): 値をHTMLエスケープする(HTML escape the values)
+
+    Returns:
+
+        str:描画結果(rendered text)
+    """
+
+    aryText = []
+    for strLiteral, strKey in aryCompiled:
+        aryText.append(strLiteral)
+        if strKey is not None:
+            strValue = str(aryContext[strKey])
+            aryText.append(html.escape(strValue) if blnEscape else strValue)
+
+    return "".join(aryText)
+
+def getBulkMessages(objSetting: dict, strSubject: str, strTemplate: str, aryRecipients: list, blnHtml: bool):
+    """
+    一括送信用のMIMEメッセージ作成(Build MIME messages for bulk send)
+
+    Args:
+
+        objSetting (dict): メール設定(mail settings)
+
+        strSubject (str): メールタイトルのテンプレート(Mail Title template)
+
+        strTemplate (str): メールメッセージのテンプレート(email message template)
+
+        aryRecipients (list): (メール宛先, 置換する値)のリスト(list of (Mailing address, values to substitute))
+
+        blnHtml (bool): HTMLメール(html mail)
+
+    Returns:
+
+        list:(MIMEメッセージ, エラー内容)のリスト[作成失敗時はMIMEメッセージがNone](list of (MIME message, error) [message is None on failure])
+    """
+
+    arySubject = getCompiledTemplate(strSubject)
+    aryTemplate = getCompiledTemplate(strTemplate)
+
+    aryMessages = []
+    for strSendMail, aryContext in aryRecipients:
+        try:
+            if blnHtml:
+                objMIMEMultipart = MIMEMultipart('alternative')
+                objMIMEText = MIMEText(getRenderTemplate(aryTemplate, aryContext, True), 'html', 'utf-8')
             else:
-                server = smtplib.SMTP(strMailHost, strMailPort)
-            server.starttls()
-
-        # ログイン処理(login process)
-        if strMailUsername != None and strMailPassword != None:
-            server.login(strMailUsername, strMailPassword)
-
-        # メールを送信(Send email to)
-        server.send_message(objMIMEMultipart)
-        
-        # 閉じる(close)
-        server.quit()
-
-    except Exception as e:
-        objLogger.critical(f"メール送信失敗(Exception Error mail send) Exception:{e}", extra=aryLogExtra)
-        return False
\ No newline at end of file
+                objMIMEMultipart = MIMEMultipart()
+                objMIMEText = MIMEText(getRenderTemplate(aryTemplate, aryContext), 'plain', 'utf-8')
+            objMIMEMultipart['Subject'] = getRenderTemplate(arySubject, aryContext)
+            objMIMEMultipart['From'] = objSetting["info_mail"]
+            objMIMEMultipart['To'] = strSendMail
+            objMIMEMultipart.attach(objMIMEText)
+            aryMessages.append((objMIMEMultipart, ""))
+        except KeyError as e:
+            aryMessages.append((None, f"template key not found:{e}"))
+
+    return aryMessages
+
+def execSendEmailBulkSync(objSetting: dict, strSubject: str, strTemplate: str, aryRecipients: list, blnHtml: bool, intReconnectEvery: int):
+    """
+    テンプレートメール一括送信処理[ブロッキング](Blocking templated bulk mail send)
+
+    Returns:
+
+        list:宛先ごとの送信結果(per recipient send result)
+    """
+
+    aryMessages = getBulkMessages(objSetting, strSubject, strTemplate, aryRecipients, blnHtml)
+    arySendResult = iter(smtp_fnc.execSendBulk(
+        objSetting, [objMessage for objMessage, _ in aryMessages if objMessage is not None], intReconnectEvery
+    ))
+
+    aryResult = []
+    for (strSendMail, _), (objMessage, strError) in zip(aryRecipients, aryMessages):
+        blnResult = False
+        if objMessage is not None:
+            blnResult, strError = next(arySendResult)
+        aryResult.append({"mail": strSendMail, "result": blnResult, "error": strError})
+
+    return aryResult
+
+async def execSendEmailBulk(objDbPool, strSubject: str, strTemplate: str, aryRecipients: list, blnHtml: bool=False, intReconnectEvery: int=100):
+    """
+    テンプレートメール一括送信処理(templated bulk mail service)
+
+    宛先ごとに$name形式のテンプレートを描画し、1つのSMTPセッションで順に送信する
+    (Renders a $name style template per recipient and sends them over one SMTP session)
+
+    Args:
+
+        strSubject (str): メールタイトルのテンプレート(Mail Title template)
+
+        strTemplate (str): メールメッセージのテンプレート(email message template)
+
+        aryRecipients (list): (メール宛先, 置換する値)のリスト(list of (Mailing address, values to substitute))
+
+        blnHtml (bool): HTMLメール[値はHTMLエスケープする](html mail [values are HTML escaped])
+
+        intReconnectEvery (int): 再接続する送信数(messages per connection)
+
+    Returns:
+
+        list:宛先ごとの{"mail", "result", "error"}(per recipient {"mail", "result", "error"})
+    """
+
+    objLogger = log_fnc.getOutputLog()
+    aryLogExtra = await util_cmn.getIpAddress()
+
+    # 設定がない場合はメール送信無(No email sent if no settings)
+    objSetting = smtp_fnc.getMailSetting()
+    if objSetting["host"] == None or objSetting["port"] == None or objSetting["info_mail"] == None:
+        objLogger.info(f"メール送信無(mail send notthing)", extra=aryLogExtra)
+        return [{"mail": strSendMail, "result": False, "error": "mail not configured"} for strSendMail, _ in aryRecipients]
+
+    with timing_fnc.getSpan("smtp"):
+        aryResult = await asyncio.get_running_loop().run_in_executor(
+            None, execSendEmailBulkSync, objSetting, strSubject, strTemplate, list(aryRecipients), blnHtml, intReconnectEvery
+        )
+
+    intFailed = sum(1 for aryRow in aryResult if not aryRow["result"])
+    if intFailed:
+        objLogger.critical(f"メール一括送信失敗(Exception Error bulk mail send) failed:{intFailed}/{len(aryResult)}", extra=aryLogExtra)
+
+    return aryResult
@@ -0,0 +1,215 @@
+import os
+import time
+from bisect import bisect_left
+
+# 共通ファンクションの読込(Reading common functions)
+from functions import log_fnc
+from functions import querycache_fnc
+from functions import timing_fnc
+
+# 時間のバケット[秒](time buckets in seconds)
+TIME_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# 行数のバケット(row count buckets)
+ROW_BUCKETS = (0, 1, 10, 100, 1000, 10000, 100000)
+
+# スロークエリとしてログ出力する秒数[0以下は出力しない](seconds to log as a slow query [0 or less disables])
+SLOW_QUERY_SECONDS = float(os.getenv("SLOW_QUERY_SECONDS", "1.0"))
+
+class Histogram:
+    """
+    累積バケットのヒストグラム(Histogram with cumulative buckets)
+    """
+
+    __slots__ = ("aryBuckets", "aryCounts", "fltSum", "intCount")
+
+    def __init__(self, aryBuckets: tuple):
+        self.aryBuckets = aryBuckets
+        self.aryCounts = [0] * (len(aryBuckets) + 1)
+        self.fltSum = 0.0
+        self.intCount = 0
+
+    def observe(self, fltValue: float):
+        self.aryCounts[bisect_left(self.aryBuckets, fltValue)] += 1
+        self.fltSum += fltValue
+        self.intCount += 1
+
+# メトリクス名ごとの(説明, バケット, ラベル名, {ラベル値: ヒストグラム})(per metric name (help, buckets, label names, {label values: histogram}))
+_aryHistograms = {
+    "mysql_pool_acquire_seconds": ("Time waiting on objDbPool.acquire()", TIME_BUCKETS, ("method",), {}),
+    "mysql_execute_seconds": ("Time in cursor.execute()", TIME_BUCKETS, ("method",), {}),
+    "mysql_fetch_seconds": ("Time in cursor.fetch*()", TIME_BUCKETS, ("method",), {}),
+    "mysql_rows": ("Rows returned or affected", ROW_BUCKETS, ("method",), {}),
+    "http_request_duration_seconds": ("HTTP request latency", TIME_BUCKETS, ("method", "route", "status"), {}),
+}
+
+# 追加のゲージを返す関数[名前: (説明, 関数)](additional gauge callbacks [name: (help, function)])
+_aryGauges = {}
+
+def setObserve(strName: str, aryLabels: tuple, fltValue: float):
+    """
+    ヒストグラムへの記録(Record into a histogram)
+
+    Args:
+
+        strName (str): メトリクス名(metric name)
+
+        aryLabels (tuple): ラベル値(label values)
+
+        fltValue (float): 値(value)
+    """
+
+    _, aryBuckets, _, aryChildren = _aryHistograms[strName]
+    objHistogram = aryChildren.get(aryLabels)
+    if objHistogram is None:
+        objHistogram = aryChildren[aryLabels] = Histogram(aryBuckets)
+    objHistogram.observe(fltValue)
+
+def setQueryTiming(strMethod, strSql: str, fltStart: float, fltAcquired: float, fltExecuted: float, fltFetched: float, intRows: int):
+    """
+    クエリ時間の記録(Record query timings)
+
+    Args:
+
+        strMethod (str): 呼び出しメソッド名(Calling method name)
+
+        strSql (str): sql
+
+        fltStart (float): acquire開始時刻(acquire start time)
+
+        fltAcquired (float): acquire完了時刻(acquire end time)
+
+        fltExecuted (float): execute完了時刻(execute end time)
+
+        fltFetched (float): fetch完了時刻(fetch end time)
+
+        intRows (int): 行数(row count)
+    """
+
+    aryLabels = (str(strMethod),)
+    setObserve("mysql_pool_acquire_seconds", aryLabels, fltAcquired - fltStart)
+    setObserve("mysql_execute_seconds", aryLabels, fltExecuted - fltAcquired)
+    setObserve("mysql_fetch_seconds", aryLabels, fltFetched - fltExecuted)
+    setObserve("mysql_rows", aryLabels, intRows or 0)
+
+    # Server-Timingの区間(Server-Timing spans)
+    timing_fnc.setTiming("db-acquire", fltAcquired - fltStart)
+    timing_fnc.setTiming("db-execute", fltExecuted - fltAcquired)
+    if fltFetched > fltExecuted:
+        timing_fnc.setTiming("db-fetch", fltFetched - fltExecuted)
+
+    fltTotal = fltFetched - fltStart
+    if SLOW_QUERY_SECONDS > 0 and fltTotal >= SLOW_QUERY_SECONDS:
+        log_fnc.getOutputLog().warning(
+            f"スロークエリ(slow query) [method:{strMethod}] total:{fltTotal:.3f}s acquire:{fltAcquired - fltStart:.3f}s "
+            f"execute:{fltExecuted - fltAcquired:.3f}s fetch:{fltFetched - fltExecuted:.3f}s rows:{intRows} sql:{strSql}"
+        )
+
+def setGauge(strName: str, strHelp: str, objFunc):
+    """
+    ゲージの登録(Register a gauge)
+
+    Args:
+
+        strName (str): メトリクス名(metric name)
+
+        strHelp (str): 説明(help text)
+
+        objFunc (object): {(ラベル名, ラベル値)のタプル: 値}を返す関数(function returning {tuple of (label name, label value): value})
+    """
+
+    _aryGauges[strName] = (strHelp, objFunc)
+
+def getLabelText(aryNames: tuple, aryValues: tuple):
+    """
+    ラベルのテキスト化(Format labels)
+
+    Args:
+
+        aryNames (tuple): ラベル名(label names)
+
+        aryValues (tuple): ラベル値(label values)
+
+    Returns:
+
+        str:name="value"をカンマ区切りにしたテキスト(comma separated name="value" text)
+    """
+
+    return ",".join(
+        f'{strName}="' + str(strValue).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n") + '"'
+        for strName, strValue in zip(aryNames, aryValues)
+    )
+
+def getPrometheusText():
+    """
+    Prometheusテキスト形式の出力(Prometheus text format output)
+
+    Returns:
+
+        str:メトリクス(metrics)
+    """
+
+    aryLines = []
+
+    for strName, (strHelp, aryBuckets, aryLabelNames, aryChildren) in _aryHistograms.items():
+        aryLines.append(f"# HELP {strName} {strHelp}")
+        aryLines.append(f"# TYPE {strName} histogram")
+        for aryLabels, objHistogram in list(aryChildren.items()):
+            strLabels = getLabelText(aryLabelNames, aryLabels)
+            intCumulative = 0
+            for fltBucket, intCount in zip(aryBuckets, objHistogram.aryCounts):
+                intCumulative += intCount
+                aryLines.append(f'{strName}_bucket{{{strLabels},le="{fltBucket}"}} {intCumulative}')
+            aryLines.append(f'{strName}_bucket{{{strLabels},le="+Inf"}} {objHistogram.intCount}')
+            aryLines.append(f"{strName}_sum{{{strLabels}}} {objHistogram.fltSum}")
+            aryLines.append(f"{strName}_count{{{strLabels}}} {objHistogram.intCount}")
+
+    aryLines.append("# HELP query_cache_events_total Query cache events")
+    aryLines.append("# TYPE query_cache_events_total counter")
+    aryStats = querycache_fnc.getQueryCacheStats()
+    for strEvent in ("hits", "misses", "coalesced", "evictions", "invalidations"):
+        aryLines.append(f'query_cache_events_total{{event="{strEvent}"}} {aryStats[strEvent]}')
+    aryLines.append("# TYPE query_cache_entries gauge")
+    aryLines.append(f"query_cache_entries {aryStats['entries']}")
+    aryLines.append("# TYPE query_cache_bytes gauge")
+    aryLines.append(f"query_cache_bytes {aryStats['bytes']}")
+
+    for strName, (strHelp, objFunc) in _aryGauges.items():
+        aryLines.append(f"# HELP {strName} {strHelp}")
+        aryLines.append(f"# TYPE {strName} gauge")
+        for aryLabels, fltValue in objFunc().items():
+            strLabels = getLabelText(tuple(strKey for strKey, _ in aryLabels), tuple(strValue for _, strValue in aryLabels))
+            aryLines.append(f"{strName}{{{strLabels}}} {fltValue}" if strLabels else f"{strName} {fltValue}")
+
+    return "\n".join(aryLines) + "\n"
+
+class RequestMetricsMiddleware:
+    """
+    ルートごとのリクエスト時間を記録するASGIミドルウェア(ASGI middleware recording request latency per route)
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        aryStatus = [500]
+
+        async def sendWrapper(message):
+            if message["type"] == "http.response.start":
+                aryStatus[0] = message["status"]
+            await send(message)
+
+        fltStart = time.perf_counter()
+        try:
+            await self.app(scope, receive, sendWrapper)
+        finally:
+            # 未定義のパスはラベルを増やさないようにまとめる(Unmatched paths share one label to bound cardinality)
+            objRoute = scope.get("route")
+            strRoute = getattr(objRoute, "path", None) or "unmatched"
+            setObserve(
+                "http_request_duration_seconds", (scope["method"], strRoute, str(aryStatus[0])), time.perf_counter() - fltStart
+            )
@@ -1,4 +1,5 @@
 import os
+import time
 import aiomysql
 import math
 import json
@@ -11,10 +12,14 @@ from typing import Optional, Any
 # 共通ファンクションの読込(Reading common functions)
 from functions import secure_fnc
 from functions import log_fnc
+from functions import querycache_fnc
+from functions import metrics_fnc
+from functions import dbpool_fnc
+from functions import unitofwork_fnc
 
 from util import util_cmn
 
-async def getQuery(objDbPool, strMethod, strSql: str="", aryParam: list=()):
+async def getQuery(objDbPool, strMethod, strSql: str="", aryParam: list=(), fltCacheTtl: float=0, blnPrimary: bool=False):
     """
     SELECTベース処理(SELECT-based processing)
 
@@ -30,30 +35,47 @@ async def getQuery(objDbPool, strMethod, strSql: str="", aryParam: list=()):
 
         aryParam (list): params
 
+        fltCacheTtl (float): 結果をキャッシュする秒数[0はキャッシュしない](seconds to cache the result [0 disables caching])
+
+        blnPrimary (bool): レプリカではなくプライマリから読む[書込み直後の読込等](read from the primary instead of the replica [e.g. read-your-writes])
+
     Returns:
 
         bool:成功:結果 失敗:Fals](Success:results Failure:False)
     """
 
-    objLogger = await log_fnc.setOutputLog()
+    objLogger = log_fnc.getOutputLog()
     aryLogExtra = await util_cmn.getIpAddress()
 
     # SQLが存在しなければfalseを返却(Return false if SQL does not exist)
     if strSql == "":
         return False
 
+    # キャッシュ指定時はキャッシュ経由で取得[トランザクション中は未確定の変更を読むため使わない]
+    # (Read through the cache when requested [not inside a transaction, which must see its own uncommitted changes])
+    if fltCacheTtl > 0 and not unitofwork_fnc.isInTransaction(objDbPool):
+        return await querycache_fnc.getCachedQuery(
+            "all", strSql, aryParam, fltCacheTtl, lambda: getQuery(objDbPool, strMethod, strSql, aryParam, blnPrimary=blnPrimary)
+        )
+
+    fltStart = time.perf_counter()
     try:
-        async with objDbPool.acquire() as conn:
+        async with dbpool_fnc.getReadPool(objDbPool, blnPrimary).acquire() as conn:
+            fltAcquired = time.perf_counter()
             async with conn.cursor(aiomysql.DictCursor) as cur:
                 await cur.execute(strSql, aryParam)
+                fltExecuted = time.perf_counter()
                 aryData = await cur.fetchall()
+                fltFetched = time.perf_counter()
     except aiomysql.Error as e:
         objLogger.critical(f"MySQL error [method:{strMethod}: sql:{strSql}] args:{e.args[0]} {e.args[1]}", extra=aryLogExtra)
         return False    
 
+    metrics_fnc.setQueryTiming(strMethod, strSql, fltStart, fltAcquired, fltExecuted, fltFetched, len(aryData))
+
     return aryData
 
-async def getFetchOneQuery(objDbPool, strMethod, strSql: str="", aryParam: list=()):
+async def getFetchOneQuery(objDbPool, strMethod, strSql: str="", aryParam: list=(), fltCacheTtl: float=0, blnPrimary: bool=False):
     """
     SELECTベース処理「fetchone」(SELECT-based processing)
 
@@ -69,27 +91,44 @@ async def getFetchOneQuery(objDbPool, strMethod, strSql: str="", aryParam: list=
 
         aryParam (list): params
 
+        fltCacheTtl (float): 結果をキャッシュする秒数[0はキャッシュしない](seconds to cache the result [0 disables caching])
+
+        blnPrimary (bool): レプリカではなくプライマリから読む[書込み直後の読込等](read from the primary instead of the replica [e.g. read-your-writes])
+
     Returns:
 
         bool:成功:結果 失敗:Fals](Success:results Failure:False)
     """
 
-    objLogger = await log_fnc.setOutputLog()
+    objLogger = log_fnc.getOutputLog()
     aryLogExtra = await util_cmn.getIpAddress()
 
     # SQLが存在しなければfalseを返却(Return false if SQL does not exist)
     if strSql == "":
         return False
 
+    # キャッシュ指定時はキャッシュ経由で取得[トランザクション中は未確定の変更を読むため使わない]
+    # (Read through the cache when requested [not inside a transaction, which must see its own uncommitted changes])
+    if fltCacheTtl > 0 and not unitofwork_fnc.isInTransaction(objDbPool):
+        return await querycache_fnc.getCachedQuery(
+            "one", strSql, aryParam, fltCacheTtl, lambda: getFetchOneQuery(objDbPool, strMethod, strSql, aryParam, blnPrimary=blnPrimary)
+        )
+
+    fltStart = time.perf_counter()
     try:
-        async with objDbPool.acquire() as conn:
+        async with dbpool_fnc.getReadPool(objDbPool, blnPrimary).acquire() as conn:
+            fltAcquired = time.perf_counter()
             async with conn.cursor(aiomysql.DictCursor) as cur:
                 await cur.execute(strSql, aryParam)
+                fltExecuted = time.perf_counter()
                 aryData = await cur.fetchone()
+                fltFetched = time.perf_counter()
     except aiomysql.Error as e:
         objLogger.critical(f"MySQL error [method:{strMethod}: sql:{strSql}] args:{e.args[0]} {e.args[1]}", extra=aryLogExtra)
         return False    
 
+    metrics_fnc.setQueryTiming(strMethod, strSql, fltStart, fltAcquired, fltExecuted, fltFetched, 0 if aryData is None else 1)
+
     return aryData
 
 async def execQuery(objDbPool, strMethod, strSql: str="", aryParam: list=()):
@@ -113,22 +152,30 @@ async def execQuery(objDbPool, strMethod, strSql: str="", aryParam: list=()):
         bool:成功:結果 失敗:Fals](Success:results Failure:False)
     """
 
-    objLogger = await log_fnc.setOutputLog()
+    objLogger = log_fnc.getOutputLog()
     aryLogExtra = await util_cmn.getIpAddress()
 
     # SQLが存在しなければfalseを返却(Return false if SQL does not exist)
     if strSql == "":
         return False
 
+    fltStart = time.perf_counter()
     try:
         async with objDbPool.acquire() as conn:
+            fltAcquired = time.perf_counter()
             async with conn.cursor(aiomysql.DictCursor) as cur:
-                await cur.execute(strSql, aryParam)
+                intRowCount = await cur.execute(strSql, aryParam)
                 await conn.commit()
+                fltExecuted = time.perf_counter()
     except aiomysql.Error as e:
         objLogger.critical(f"ERROR [Method-{strMethod}] {e.args[0]}: {e.args[1]}", extra=aryLogExtra)
         return False    
 
+    # 更新したテーブルのキャッシュを無効化[トランザクション中は確定後](Invalidate the cache of the updated tables [after the commit inside a transaction])
+    unitofwork_fnc.setInvalidateSql(objDbPool, strSql)
+
+    metrics_fnc.setQueryTiming(strMethod, strSql, fltStart, fltAcquired, fltExecuted, fltExecuted, intRowCount)
+
     return True
 
 async def execQueryAndGetLastId(objDbPool, strMethod, strSql: str="", aryParam: list=()):
@@ -152,31 +199,289 @@ async def execQueryAndGetLastId(objDbPool, strMethod, strSql: str="", aryParam:
         bool:成功:結果 失敗:Fals](Success:results Failure:False)
     """
 
-    objLogger = await log_fnc.setOutputLog()
+    objLogger = log_fnc.getOutputLog()
     aryLogExtra = await util_cmn.getIpAddress()
 
     # SQLが存在しなければfalseを返却(Return false if SQL does not exist)
     if strSql == "":
         return False
 
+    fltStart = time.perf_counter()
     try:
         async with objDbPool.acquire() as conn:
+            fltAcquired = time.perf_counter()
             async with conn.cursor(aiomysql.DictCursor) as cur:
-                await cur.execute(strSql, aryParam)
+                intRowCount = await cur.execute(strSql, aryParam)
                 await conn.commit()
+                fltExecuted = time.perf_counter()
 
-                # Get last inserted id
-                strSql = "SELECT LAST_INSERT_ID() as last_insert_id"
-                aryParam = ()
-                await cur.execute(strSql, aryParam)
-                aryData = await cur.fetchone()
-                if aryData == False:
-                    return False
-
-                intLastId = aryData["last_insert_id"]
+                # INSERTしたIDはOKパケットから取得[追加の問い合わせ無](Inserted id comes from the OK packet [no extra round trip])
+                intLastId = cur.lastrowid
     except aiomysql.Error as e:
         objLogger.critical(f"ERROR [Method-{strMethod}] {e.args[0]}: {e.args[1]}", extra=aryLogExtra)
         return False    
 
+    # 更新したテーブルのキャッシュを無効化[トランザクション中は確定後](Invalidate the cache of the updated tables [after the commit inside a transaction])
+    unitofwork_fnc.setInvalidateSql(objDbPool, strSql)
+
+    metrics_fnc.setQueryTiming(strMethod, strSql, fltStart, fltAcquired, fltExecuted, fltExecuted, intRowCount)
+
     return intLastId
 
+
+async def getPythonAuthorizationKey(objDbPool):
+    """
+    REST API用の認証キー取得(Get authentication keys for the REST API)
+
+    テーブル・カラムは環境変数APIKEY_TABLE・APIKEY_COLUMNで指定(Table and column come from the APIKEY_TABLE and APIKEY_COLUMN environment variables)
+
+    Args:
+
+        objDbPool (object): コネクションプーリング
+
+    Returns:
+
+        list:成功:認証キーのリスト 失敗:False(Success:list of authentication keys Failure:False)
+    """
+
+    strTable = getQuoteIdentifier(os.getenv("APIKEY_TABLE", "python_authorization_key"))
+    strColumn = getQuoteIdentifier(os.getenv("APIKEY_COLUMN", "authorization_key"))
+
+    strSql = f"SELECT {strColumn} AS authorization_key FROM {strTable}"
+
+    # 常にプライマリから読み、失効を即時反映する(Always read from the primary so revocations apply immediately)
+    aryData = await getQuery(objDbPool, "getPythonAuthorizationKey", strSql, blnPrimary=True)
+    if aryData is False:
+        return False
+
+    return [aryRow["authorization_key"] for aryRow in aryData if aryRow["authorization_key"]]
+
+def getQuoteIdentifier(strName: str):
+    """
+    テーブル名・カラム名のクォート(Quote a table or column name)
+
+    Args:
+
+        strName (str): テーブル名・カラム名["db.table"形式可](table or column name ["db.table" allowed])
+
+    Returns:
+
+        str:クォートした名前(quoted name)
+    """
+
+    if strName == "" or "`" in strName:
+        raise ValueError(f"invalid identifier:{strName}")
+
+    return ".".join(f"`{strPart}`" for strPart in strName.split("."))
+
+async def execBulkInsert(objDbPool, strMethod, strTable: str, aryColumns: list, aryRows: list, intChunkSize: int=1000):
+    """
+    一括INSERT処理(bulk INSERT processing)
+
+    intChunkSize件ずつ複数行INSERTにまとめ、1つのトランザクションで実行する(Groups rows into multi-row INSERTs of intChunkSize and runs them in one transaction)
+
+    Args:
+
+        objDbPool (object): コネクションプーリング
+
+        strMethod (str): 呼び出しメソッド名(Calling method name)
+
+        strTable (str): テーブル名(table name)
+
+        aryColumns (list): カラム名のリスト(list of column names)
+
+        aryRows (list): 値のリストのリスト(list of value lists)
+
+        intChunkSize (int): 1文あたりの行数(rows per statement)
+
+    Returns:
+
+        list:成功:INSERTしたIDの範囲[(最初のID, 最後のID)]のリスト 失敗:False(Success:list of inserted id ranges [(first id, last id)] Failure:False)
+
+    Note:
+
+        IDの範囲は文ごとにAUTO_INCREMENTが連続採番される前提[innodb_autoinc_lock_mode 0/1、または2で同時挿入なし]
+        (Id ranges assume AUTO_INCREMENT is consecutive per statement [innodb_autoinc_lock_mode 0/1, or 2 without concurrent inserts])
+    """
+
+    objLogger = log_fnc.getOutputLog()
+    aryLogExtra = await util_cmn.getIpAddress()
+
+    # 行が存在しなければ空を返却(Return empty if there are no rows)
+    if not aryRows:
+        return []
+
+    strInsert = f"INSERT INTO {getQuoteIdentifier(strTable)} ({', '.join(getQuoteIdentifier(strColumn) for strColumn in aryColumns)}) VALUES "
+    strValues = "(" + ", ".join(["%s"] * len(aryColumns)) + ")"
+
+    aryIdRange = []
+    fltStart = time.perf_counter()
+    try:
+        async with objDbPool.acquire() as conn:
+            fltAcquired = time.perf_counter()
+            await conn.begin()
+            try:
+                async with conn.cursor() as cur:
+                    for intStart in range(0, len(aryRows), intChunkSize):
+                        aryChunk = aryRows[intStart:intStart + intChunkSize]
+                        aryParam = [objValue for aryRow in aryChunk for objValue in aryRow]
+                        await cur.execute(strInsert + ", ".join([strValues] * len(aryChunk)), aryParam)
+
+                        # 複数行INSERTのlastrowidは最初の行のID(lastrowid of a multi-row INSERT is the id of the first row)
+                        aryIdRange.append((cur.lastrowid, cur.lastrowid + len(aryChunk) - 1))
+                await conn.commit()
+                fltExecuted = time.perf_counter()
+            except BaseException:
+                await conn.rollback()
+                raise
+    except aiomysql.Error as e:
+        objLogger.critical(f"ERROR [Method-{strMethod}] {e.args[0]}: {e.args[1]}", extra=aryLogExtra)
+        return False
+
+    # 更新したテーブルのキャッシュを無効化[トランザクション中は確定後](Invalidate the cache of the updated tables [after the commit inside a transaction])
+    unitofwork_fnc.setInvalidateTables(objDbPool, [strTable])
+
+    metrics_fnc.setQueryTiming(strMethod, strInsert, fltStart, fltAcquired, fltExecuted, fltExecuted, len(aryRows))
+
+    return aryIdRange
+
+async def execManyQuery(objDbPool, strMethod, strSql: str="", aryParams: list=()):
+    """
+    実行ベース処理「executemany」(run-based processing [executemany])
+
+    同じSQLを複数のパラメータで1つのトランザクションとして実行する(Runs the same SQL for many params in one transaction)
+
+    Args:
+
+        objDbPool (object): コネクションプーリング
+
+        strMethod (str): 呼び出しメソッド名(Calling method name)
+
+        strSql (str): sql
+
+        aryParams (list): paramsのリスト(list of params)
+
+    Returns:
+
+        int:成功:影響行数 失敗:False(Success:affected rows Failure:False)
+    """
+
+    objLogger = log_fnc.getOutputLog()
+    aryLogExtra = await util_cmn.getIpAddress()
+
+    # SQLが存在しなければfalseを返却(Return false if SQL does not exist)
+    if strSql == "":
+        return False
+
+    fltStart = time.perf_counter()
+    try:
+        async with objDbPool.acquire() as conn:
+            fltAcquired = time.perf_counter()
+            await conn.begin()
+            try:
+                async with conn.cursor() as cur:
+                    intRowCount = await cur.executemany(strSql, aryParams)
+                await conn.commit()
+                fltExecuted = time.perf_counter()
+            except BaseException:
+                await conn.rollback()
+                raise
+    except aiomysql.Error as e:
+        objLogger.critical(f"ERROR [Method-{strMethod}] {e.args[0]}: {e.args[1]}", extra=aryLogExtra)
+        return False
+
+    # 更新したテーブルのキャッシュを無効化[トランザクション中は確定後](Invalidate the cache of the updated tables [after the commit inside a transaction])
+    unitofwork_fnc.setInvalidateSql(objDbPool, strSql)
+
+    metrics_fnc.setQueryTiming(strMethod, strSql, fltStart, fltAcquired, fltExecuted, fltExecuted, intRowCount)
+
+    return intRowCount
+
+async def getStreamQuery(objDbPool, strMethod, strSql: str="", aryParam: list=(), intChunkSize: int=1000, blnChunk: bool=False, blnPrimary: bool=False):
+    """
+    SELECTベース処理「ストリーミング」(SELECT-based processing [streaming])
+
+    サーバサイドカーソル[SSDictCursor]で結果を全件メモリに載せずに順に返す(Returns results one by one through a server-side cursor [SSDictCursor] without loading them all into memory)
+
+    Args:
+
+        objDbPool (object): コネクションプーリング
+
+        strMethod (str): 呼び出しメソッド名(Calling method name)
+
+        strSql (str): sql
+
+        aryParam (list): params
+
+        intChunkSize (int): fetchmanyの件数(rows per fetchmany)
+
+        blnChunk (bool): True:intChunkSize件ずつのリストを返す False:1行ずつ返す(True:yield lists of intChunkSize rows False:yield rows one by one)
+
+        blnPrimary (bool): レプリカではなくプライマリから読む(read from the primary instead of the replica)
+
+    Yields:
+
+        dict|list:行または行のリスト(row or list of rows)
+
+    Raises:
+
+        UnitOfWorkError: ユニットオブワーク内で呼ばれた(called inside a unit of work)
+
+    Note:
+
+        途中で中断[キャンセル・切断]された場合は読み残しがあるため接続を破棄してプールへ戻す
+        (If interrupted [cancelled, disconnected] the partially read connection is discarded when released to the pool)
+
+        ユニットオブワークの共有接続は、中断で閉じるとトランザクションが失われ、読込中は他のクエリが待ち続けるため使わない
+        (The shared connection of a unit of work is not used: closing it on an interrupt loses the transaction, and other queries wait forever while it is streaming)
+    """
+
+    objLogger = log_fnc.getOutputLog()
+    aryLogExtra = await util_cmn.getIpAddress()
+
+    # SQLが存在しなければ何も返さない(Yield nothing if SQL does not exist)
+    if strSql == "":
+        return
+
+    if unitofwork_fnc.getUnitOfWork(objDbPool) is not None:
+        raise unitofwork_fnc.UnitOfWorkError("getStreamQuery cannot run inside a unit of work, use getQuery")
+
+    objReadPool = dbpool_fnc.getReadPool(objDbPool, blnPrimary)
+    fltStart = time.perf_counter()
+    conn = await objReadPool.acquire()
+    fltAcquired = time.perf_counter()
+    blnComplete = False
+    try:
+        cur = await conn.cursor(aiomysql.SSDictCursor)
+        try:
+            await cur.execute(strSql, aryParam)
+            fltExecuted = time.perf_counter()
+
+            # 読込時間は呼び出し側の処理時間を含めずfetchmanyの時間のみ合計する
+            # (Fetch time sums fetchmany calls only, excluding time spent by the caller between rows)
+            fltFetch = 0.0
+            intRows = 0
+            while True:
+                fltFetchStart = time.perf_counter()
+                aryData = await cur.fetchmany(intChunkSize)
+                fltFetch += time.perf_counter() - fltFetchStart
+                if not aryData:
+                    break
+                intRows += len(aryData)
+                if blnChunk:
+                    yield aryData
+                else:
+                    for aryRow in aryData:
+                        yield aryRow
+        except aiomysql.Error as e:
+            objLogger.critical(f"MySQL error [method:{strMethod}: sql:{strSql}] args:{e.args[0]} {e.args[1]}", extra=aryLogExtra)
+            raise
+
+        await cur.close()
+        blnComplete = True
+        metrics_fnc.setQueryTiming(strMethod, strSql, fltStart, fltAcquired, fltExecuted, fltExecuted + fltFetch, intRows)
+    finally:
+        # 読み残しのある接続は再利用しない(Do not reuse a connection with unread results)
+        if not blnComplete:
+            conn.close()
+        objReadPool.release(conn)
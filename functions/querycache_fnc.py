@@ -0,0 +1,390 @@
+import os
+import re
+import sys
+import time
+import asyncio
+from functools import lru_cache
+from collections import OrderedDict
+
+# SQLの連続した空白(consecutive whitespace in SQL)
+_objSpacePattern = re.compile(r'\s+')
+
+# SQLの字句[識別子・文字列・語・記号](SQL tokens [identifiers, strings, words, symbols])
+_objTokenPattern = re.compile(r"`(?:[^`]|``)*`|'(?:[^'\\]|\\.|'')*'|\"(?:[^\"\\]|\\.|\"\")*\"|\w+|\S")
+
+# テーブル一覧[FROM・UPDATE・USINGの後のカンマ区切り]を終える語(words ending a table list [comma-separated after FROM, UPDATE and USING])
+_aryListEnd = frozenset(["WHERE", "SET", "GROUP", "ORDER", "HAVING", "LIMIT", "UNION", "WINDOW", "FOR", "LOCK", "VALUES", "VALUE", "SELECT"])
+
+# 読込中に更新があった場合の再実行指示(Tells waiters to load again when the leader failed)
+_objRetry = object()
+
+def getNormalizeSql(strSql: str):
+    """
+    キャッシュキー用にSQLを正規化(Normalize SQL for the cache key)
+
+    Args:
+
+        strSql (str): sql
+
+    Returns:
+
+        str:空白を詰めたSQL(SQL with whitespace collapsed)
+    """
+
+    return _objSpacePattern.sub(' ', strSql).strip()
+
+def getSqlTables(strSql: str):
+    """
+    SQLが参照・更新するテーブル名の取得(Get the table names an SQL statement touches)
+
+    Args:
+
+        strSql (str): sql
+
+    Returns:
+
+        frozenset:小文字のテーブル名[DB名は除く、取得できない場合は空](lower-case table names [without db name, empty if they cannot be parsed])
+    """
+
+    return getParseTables(strSql)
+
+@lru_cache(maxsize=1024)
+def getParseTables(strSql: str):
+    # FROM・UPDATE・USINGの後は括弧の深さごとにカンマ区切りの一覧として読み、JOIN・INTOの後は1つ読む
+    # (After FROM, UPDATE and USING read a comma-separated list per parenthesis depth, after JOIN and INTO read one table)
+    aryTokens = _objTokenPattern.findall(strSql)
+    aryTables = set()
+    aryListDepths = set()
+    intDepth = 0
+    blnExpect = False
+    intIndex = 0
+    while intIndex < len(aryTokens):
+        strToken = aryTokens[intIndex]
+        strWord = strToken.upper()
+        intIndex += 1
+
+        if blnExpect:
+            blnExpect = False
+            if strToken == "(":
+                # 派生テーブル・副問合せ[中のFROMは続けて読む](derived table or subquery [its FROM is read as we go])
+                intDepth += 1
+                continue
+            if not (strToken[0] == "`" or strToken[0].isalnum() or strToken[0] == "_"):
+                # テーブル名の位置に読めない字句があれば取得できないとする(an unreadable token where a table belongs means the tables cannot be parsed)
+                return frozenset()
+            strName = strToken
+            while intIndex + 1 < len(aryTokens) and aryTokens[intIndex] == ".":
+                strName = aryTokens[intIndex + 1]
+                intIndex += 2
+            aryTables.add(strName.strip("`").replace("``", "`").lower())
+            continue
+
+        if strToken == "(":
+            intDepth += 1
+        elif strToken == ")":
+            aryListDepths.discard(intDepth)
+            intDepth -= 1
+        elif strToken == ",":
+            blnExpect = intDepth in aryListDepths
+        elif strWord in ("FROM", "UPDATE") and aryTokens[intIndex - 2].upper() != "KEY":
+            blnExpect = True
+            aryListDepths.add(intDepth)
+        elif strWord == "USING" and intIndex < len(aryTokens) and aryTokens[intIndex] != "(":
+            # DELETE ... USING のテーブル一覧(table list of DELETE ... USING)
+            blnExpect = True
+            aryListDepths.add(intDepth)
+        elif strWord in ("JOIN", "STRAIGHT_JOIN", "INTO"):
+            blnExpect = True
+        elif strWord in _aryListEnd or strWord == "UPDATE":
+            # ON DUPLICATE KEY UPDATE 等(ON DUPLICATE KEY UPDATE etc.)
+            aryListDepths.discard(intDepth)
+
+    return frozenset(aryTables)
+
+def getValueSize(objValue):
+    """
+    キャッシュする値のおおよそのバイト数(Approximate byte size of a cached value)
+
+    Args:
+
+        objValue (mix): 値(value)
+
+    Returns:
+
+        int:バイト数(bytes)
+    """
+
+    if isinstance(objValue, dict):
+        return sys.getsizeof(objValue) + sum(sys.getsizeof(v) for v in objValue.values())
+    if isinstance(objValue, (list, tuple)):
+        return sys.getsizeof(objValue) + sum(getValueSize(v) for v in objValue)
+
+    return sys.getsizeof(objValue)
+
+def getCopyValue(objValue):
+    """
+    キャッシュした値の複製[呼び出し元での変更がキャッシュへ波及しないように](Copy a cached value [so callers cannot modify the cache])
+
+    Args:
+
+        objValue (mix): 値(value)
+
+    Returns:
+
+        mix:行単位で複製した値(value copied per row)
+    """
+
+    if isinstance(objValue, dict):
+        return dict(objValue)
+    if isinstance(objValue, (list, tuple)):
+        return [dict(v) if isinstance(v, dict) else v for v in objValue]
+
+    return objValue
+
+class QueryCache:
+    """
+    クエリ結果の読込キャッシュ(Read-through cache of query results)
+
+    件数・バイト数上限のLRU、エントリごとのTTL、テーブル名による無効化、同一キーの同時ミスの集約を行う
+    (LRU bounded by entries and bytes, per entry TTL, invalidation by table name and coalescing of concurrent misses per key)
+    """
+
+    def __init__(self, intMaxEntries: int=1000, intMaxBytes: int=64 * 1024 * 1024):
+        self.intMaxEntries = intMaxEntries
+        self.intMaxBytes = intMaxBytes
+        self.intBytes = 0
+        self.aryEntries = OrderedDict()
+        self.aryTagKeys = {}
+        self.aryTagGeneration = {}
+        # clearの世代[エントリのないテーブルの読込中の結果も破棄する](clear generation [also discards loads in flight for tables without entries])
+        self.intGeneration = 0
+        self.aryInflight = {}
+        self.aryStats = {"hits": 0, "misses": 0, "coalesced": 0, "evictions": 0, "invalidations": 0}
+
+    def get(self, strKey):
+        """
+        キャッシュの取得(Get from the cache)
+
+        Returns:
+
+            tuple:(ヒット有無, 値)((hit, value))
+        """
+
+        objEntry = self.aryEntries.get(strKey)
+        if objEntry is None:
+            return False, None
+
+        fltExpire, objValue, _, _ = objEntry
+        if fltExpire < time.monotonic():
+            self._delete(strKey)
+            return False, None
+
+        self.aryEntries.move_to_end(strKey)
+        return True, objValue
+
+    def set(self, strKey, objValue, aryTags: frozenset, fltTtl: float):
+        """
+        キャッシュへの登録(Store in the cache)
+        """
+
+        intSize = getValueSize(objValue)
+        if intSize > self.intMaxBytes:
+            return
+
+        if strKey in self.aryEntries:
+            self._delete(strKey)
+
+        self.aryEntries[strKey] = (time.monotonic() + fltTtl, objValue, intSize, aryTags)
+        self.intBytes += intSize
+        for strTag in aryTags:
+            self.aryTagKeys.setdefault(strTag, set()).add(strKey)
+
+        # 上限を超えた分を古い順に削除(Evict least recently used entries over the limits)
+        while len(self.aryEntries) > self.intMaxEntries or self.intBytes > self.intMaxBytes:
+            self._delete(next(iter(self.aryEntries)))
+            self.aryStats["evictions"] += 1
+
+    def invalidate(self, aryTags):
+        """
+        テーブル名によるキャッシュの無効化(Invalidate cache entries by table name)
+
+        Args:
+
+            aryTags (iterable): テーブル名(table names)
+        """
+
+        for strTag in aryTags:
+            self.aryTagGeneration[strTag] = self.aryTagGeneration.get(strTag, 0) + 1
+            for strKey in self.aryTagKeys.pop(strTag, ()):
+                if strKey in self.aryEntries:
+                    self._delete(strKey)
+                    self.aryStats["invalidations"] += 1
+
+    def clear(self):
+        """
+        全キャッシュの削除(Clear the whole cache)
+        """
+
+        self.intGeneration += 1
+        self.invalidate(list(self.aryTagKeys))
+        self.aryEntries.clear()
+        self.intBytes = 0
+
+    async def getOrLoad(self, strKey, aryTags: frozenset, fltTtl: float, objLoader):
+        """
+        キャッシュの取得、ミスの場合は読込んで登録(Get from the cache, loading and storing on a miss)
+
+        同一キーの同時ミスは1回の読込にまとめる(Concurrent misses for one key share a single load)
+
+        Args:
+
+            strKey (str): キャッシュキー(cache key)
+
+            aryTags (frozenset): テーブル名(table names)
+
+            fltTtl (float): 有効期間[秒](time to live in seconds)
+
+            objLoader (object): 読込処理のコルーチン関数[Falseは失敗としてキャッシュしない](loader coroutine function [False is a failure and is not cached])
+
+        Returns:
+
+            mix:値(value)
+        """
+
+        while True:
+            blnHit, objValue = self.get(strKey)
+            if blnHit:
+                self.aryStats["hits"] += 1
+                return getCopyValue(objValue)
+
+            objFuture = self.aryInflight.get(strKey)
+            if objFuture is None:
+                break
+
+            self.aryStats["coalesced"] += 1
+            objValue = await asyncio.shield(objFuture)
+            if objValue is not _objRetry:
+                return getCopyValue(objValue)
+
+        self.aryStats["misses"] += 1
+        objFuture = asyncio.get_running_loop().create_future()
+        self.aryInflight[strKey] = objFuture
+
+        # 読込中に更新された場合は登録しない(Do not store if a table was written during the load)
+        intGeneration = self.intGeneration
+        aryGeneration = [self.aryTagGeneration.get(strTag, 0) for strTag in aryTags]
+        objValue = _objRetry
+        try:
+            objValue = await objLoader()
+            if (
+                objValue is not False and intGeneration == self.intGeneration
+                and aryGeneration == [self.aryTagGeneration.get(strTag, 0) for strTag in aryTags]
+            ):
+                self.set(strKey, objValue, aryTags, fltTtl)
+        finally:
+            del self.aryInflight[strKey]
+            objFuture.set_result(objValue)
+
+        return getCopyValue(objValue)
+
+    def getStats(self):
+        """
+        ヒット・ミス等の件数取得(Get hit/miss counters)
+
+        Returns:
+
+            dict:件数(counters)
+        """
+
+        return dict(self.aryStats, entries=len(self.aryEntries), bytes=self.intBytes)
+
+    def _delete(self, strKey):
+        _, _, intSize, aryTags = self.aryEntries.pop(strKey)
+        self.intBytes -= intSize
+        for strTag in aryTags:
+            arySet = self.aryTagKeys.get(strTag)
+            if arySet is not None:
+                arySet.discard(strKey)
+                if not arySet:
+                    del self.aryTagKeys[strTag]
+
+objQueryCache = QueryCache(
+    int(os.getenv("QUERY_CACHE_MAX_ENTRIES", "1000")),
+    int(os.getenv("QUERY_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+)
+
+async def getCachedQuery(strFetch: str, strSql: str, aryParam, fltTtl: float, objLoader):
+    """
+    クエリ結果のキャッシュ取得(Get a cached query result)
+
+    Args:
+
+        strFetch (str): 取得種別["all"/"one"](fetch type ["all"/"one"])
+
+        strSql (str): sql
+
+        aryParam (list): params
+
+        fltTtl (float): 有効期間[秒](time to live in seconds)
+
+        objLoader (object): 読込処理のコルーチン関数(loader coroutine function)
+
+    Returns:
+
+        mix:結果(result)
+    """
+
+    # テーブル名が取れないSQLは無効化できないためキャッシュしない(SQL whose tables cannot be parsed cannot be invalidated and is not cached)
+    aryTables = getSqlTables(strSql)
+    if not aryTables:
+        return await objLoader()
+
+    strKey = (strFetch, getNormalizeSql(strSql), repr(aryParam))
+
+    return await objQueryCache.getOrLoad(strKey, aryTables, fltTtl, objLoader)
+
+def setInvalidateSql(strSql: str):
+    """
+    更新SQLが触れるテーブルのキャッシュを無効化(Invalidate cache entries of the tables an update SQL touches)
+
+    Args:
+
+        strSql (str): sql
+    """
+
+    if objQueryCache.aryEntries or objQueryCache.aryInflight:
+        aryTables = getSqlTables(strSql)
+        if aryTables:
+            objQueryCache.invalidate(aryTables)
+        else:
+            # テーブル名が取れない更新[CALL等]は全件を無効化(updates whose tables cannot be parsed [CALL etc.] invalidate everything)
+            objQueryCache.clear()
+
+def setInvalidateTables(aryTables):
+    """
+    テーブル名によるキャッシュの無効化(Invalidate cache entries by table name)
+
+    Args:
+
+        aryTables (iterable): テーブル名["db.table"形式可](table names ["db.table" allowed])
+    """
+
+    objQueryCache.invalidate(strTable.replace('`', '').split('.')[-1].lower() for strTable in aryTables)
+
+def setClearQueryCache():
+    """
+    全キャッシュの無効化(Invalidate the whole cache)
+    """
+
+    objQueryCache.clear()
+
+def getQueryCacheStats():
+    """
+    クエリキャッシュの件数取得(Get query cache counters)
+
+    Returns:
+
+        dict:hits/misses/coalesced/evictions/invalidations/entries/bytes
+    """
+
+    return objQueryCache.getStats()
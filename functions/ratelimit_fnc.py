@@ -0,0 +1,189 @@
+import os
+import json
+import math
+import mmap
+import time
+import fcntl
+import struct
+import hashlib
+import tempfile
+
+from fastapi import HTTPException
+
+# 1スロット[キーのハッシュ, トークン数, 最終補充時刻](one slot [key hash, tokens, last refill time])
+_objSlot = struct.Struct("<Qdd")
+
+# 衝突時に探索するスロット数(slots probed on collision)
+RATELIMIT_PROBE = 8
+
+def getRateLimitFile():
+    """
+    共有ファイルのパス取得(Get the shared file path)
+
+    未指定の場合は/dev/shm[なければ一時ディレクトリ]に作成(Defaults to /dev/shm [or the temp directory])
+
+    Returns:
+
+        str:ファイルパス(file path)
+    """
+
+    strPath = os.getenv("RATELIMIT_FILE")
+    if strPath:
+        return strPath
+
+    strDir = "/dev/shm" if os.path.isdir("/dev/shm") else tempfile.gettempdir()
+    return os.path.join(strDir, "python_fastapi_ratelimit.bin")
+
+def getLimitSetting(strName: str):
+    """
+    環境変数のJSON[{名前: [毎秒のトークン数, バースト]}]の読込(Read a JSON environment variable [{name: [tokens per second, burst]}])
+
+    Args:
+
+        strName (str): 環境変数名(environment variable name)
+
+    Returns:
+
+        dict:{名前: (毎秒のトークン数, バースト)}({name: (tokens per second, burst)})
+    """
+
+    return {strKey: (float(aryLimit[0]), float(aryLimit[1])) for strKey, aryLimit in json.loads(os.getenv(strName, "{}")).items()}
+
+class RateLimiter:
+    """
+    ワーカープロセス間で共有するトークンバケット(Token buckets shared between worker processes)
+
+    共有メモリ上のファイルをmmapし、スロット範囲をfcntlでロックして更新する(mmaps a file in shared memory and updates slot ranges under fcntl locks)
+    """
+
+    def __init__(self, strPath: str, intSlots: int=65536):
+        self.intSlots = intSlots
+        intSize = intSlots * _objSlot.size
+
+        self.intFd = os.open(strPath, os.O_RDWR | os.O_CREAT, 0o600)
+        # 先に作成したプロセスの内容を壊さないよう不足分のみ拡張(Only grow the file so another process's data is kept)
+        if os.fstat(self.intFd).st_size < intSize:
+            os.ftruncate(self.intFd, intSize)
+        self.objMap = mmap.mmap(self.intFd, intSize)
+
+    def take(self, strBucket: str, fltRate: float, fltBurst: float):
+        """
+        トークンの取得(Take a token)
+
+        Args:
+
+            strBucket (str): バケットのキー(bucket key)
+
+            fltRate (float): 毎秒補充するトークン数(tokens refilled per second)
+
+            fltBurst (float): 最大トークン数(maximum tokens)
+
+        Returns:
+
+            tuple:(許可:True 拒否:False, 再試行までの秒数)((allowed:True denied:False, seconds until retry))
+        """
+
+        intHash = int.from_bytes(hashlib.blake2b(strBucket.encode('utf-8'), digest_size=8).digest(), "little") or 1
+        intFirst = intHash % (self.intSlots - RATELIMIT_PROBE + 1)
+        intOffset = intFirst * _objSlot.size
+        intLength = RATELIMIT_PROBE * _objSlot.size
+
+        fcntl.lockf(self.intFd, fcntl.LOCK_EX, intLength, intOffset)
+        try:
+            fltNow = time.monotonic()
+
+            # 同じキー、空き、満杯まで補充済み[再利用可]の順で探す(Look for the same key, then an empty or fully refilled [reusable] slot)
+            intSlot = None
+            intReuse = None
+            intOldest = 0
+            fltOldest = fltNow
+            for i in range(RATELIMIT_PROBE):
+                intSlotHash, fltTokens, fltLast = _objSlot.unpack_from(self.objMap, intOffset + i * _objSlot.size)
+                if intSlotHash == intHash:
+                    intSlot = i
+                    break
+                if intReuse is None and (intSlotHash == 0 or fltLast > fltNow or (fltNow - fltLast) * fltRate >= fltBurst):
+                    intReuse = i
+                if fltLast < fltOldest:
+                    intOldest = i
+                    fltOldest = fltLast
+
+            if intSlot is None:
+                # 全スロット使用中の場合は最も古いスロットを上書き(When all slots are busy, overwrite the oldest)
+                intSlot = intOldest if intReuse is None else intReuse
+                fltTokens = fltBurst
+            else:
+                fltTokens = min(fltBurst, fltTokens + (fltNow - fltLast) * fltRate)
+
+            if fltTokens >= 1:
+                blnAllowed = True
+                fltTokens -= 1
+                fltRetryAfter = 0.0
+            else:
+                blnAllowed = False
+                fltRetryAfter = (1 - fltTokens) / fltRate
+
+            _objSlot.pack_into(self.objMap, intOffset + intSlot * _objSlot.size, intHash, fltTokens, fltNow)
+        finally:
+            fcntl.lockf(self.intFd, fcntl.LOCK_UN, intLength, intOffset)
+
+        return blnAllowed, fltRetryAfter
+
+    def close(self):
+        self.objMap.close()
+        os.close(self.intFd)
+
+_objRateLimiter = None
+_aryDefaultLimit = None
+_aryRouteLimits = None
+_aryKeyLimits = None
+
+def getRateLimiter():
+    """
+    レート制限の取得[プロセスごとに1つ](Get the rate limiter [one per process])
+
+    Returns:
+
+        object:RateLimiter
+    """
+
+    global _objRateLimiter, _aryDefaultLimit, _aryRouteLimits, _aryKeyLimits
+
+    if _objRateLimiter is None:
+        _aryDefaultLimit = (float(os.getenv("RATELIMIT_RATE", "10")), float(os.getenv("RATELIMIT_BURST", "20")))
+        _aryRouteLimits = getLimitSetting("RATELIMIT_ROUTES")
+        _aryKeyLimits = getLimitSetting("RATELIMIT_KEYS")
+        _objRateLimiter = RateLimiter(getRateLimitFile(), int(os.getenv("RATELIMIT_SLOTS", "65536")))
+
+    return _objRateLimiter
+
+def setCheckRateLimit(strApiKey: str, strRoute: str):
+    """
+    APIキー・ルートごとのレート制限の判定(Check the rate limit per API key and route)
+
+    キーの指定[RATELIMIT_KEYS]、ルートの指定[RATELIMIT_ROUTES]、既定値[RATELIMIT_RATE/RATELIMIT_BURST]の順で適用
+    (Applies the key setting [RATELIMIT_KEYS], then the route setting [RATELIMIT_ROUTES], then the defaults [RATELIMIT_RATE/RATELIMIT_BURST])
+
+    Args:
+
+        strApiKey (str): APIキー(API key)
+
+        strRoute (str): ルートのパス(route path)
+
+    Raises:
+
+        HTTPException: 制限超過時は429とRetry-After(429 with Retry-After when over the limit)
+    """
+
+    objRateLimiter = getRateLimiter()
+
+    fltRate, fltBurst = _aryKeyLimits.get(strApiKey) or _aryRouteLimits.get(strRoute) or _aryDefaultLimit
+    if fltRate <= 0:
+        return
+
+    strBucket = hashlib.sha256(strApiKey.encode('utf-8')).hexdigest() + "|" + strRoute
+    blnAllowed, fltRetryAfter = objRateLimiter.take(strBucket, fltRate, fltBurst)
+    if not blnAllowed:
+        raise HTTPException(
+            status_code=429, detail="Too Many Requests", headers={"Retry-After": str(max(1, math.ceil(fltRetryAfter)))}
+        )
@@ -0,0 +1,133 @@
+import enum
+import base64
+import inspect
+import datetime
+import functools
+from decimal import Decimal
+
+import orjson
+
+from fastapi.routing import APIRoute
+from fastapi.responses import JSONResponse, Response
+from fastapi.encoders import jsonable_encoder
+from fastapi.datastructures import DefaultPlaceholder
+
+# 共通ファンクションの読込(Reading common functions)
+from functions import timing_fnc
+
+# orjsonのオプション[数値キー等の辞書・NumPy配列を許可](orjson options [dicts with non-str keys and NumPy arrays allowed])
+ORJSON_OPTION = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+
+def getJsonDefault(objValue):
+    """
+    JSONに変換できない値の変換[orjson・json.dumps共通](Conversion of values JSON cannot encode [shared by orjson and json.dumps])
+
+    バイト列はBase64、それ以外はjsonable_encoderと同じ結果。datetime・date・timeはorjsonが直接変換する
+    (Bytes become Base64, everything else matches jsonable_encoder. datetime, date and time are encoded by orjson itself)
+
+    Args:
+
+        objValue (mix): 値(value)
+
+    Returns:
+
+        mix:JSONに変換可能な値(JSON encodable value)
+    """
+
+    if isinstance(objValue, Decimal):
+        # 整数値はint、それ以外はfloat(Integral values become int, others float)
+        return int(objValue) if objValue.as_tuple().exponent >= 0 else float(objValue)
+    if isinstance(objValue, (bytes, bytearray)):
+        # バイナリのBLOBも変換できるようにBase64(Base64 so binary BLOBs encode too)
+        return base64.b64encode(objValue).decode('ascii')
+    if isinstance(objValue, (datetime.datetime, datetime.date, datetime.time)):
+        return objValue.isoformat()
+    if isinstance(objValue, datetime.timedelta):
+        return objValue.total_seconds()
+    if isinstance(objValue, (set, frozenset)):
+        return list(objValue)
+    if isinstance(objValue, enum.Enum):
+        return objValue.value
+
+    # 上記以外[pydanticモデル等]はFastAPIの変換に任せる(Anything else [pydantic models etc.] goes through FastAPI's encoder)
+    return jsonable_encoder(objValue)
+
+def getJsonBytes(objContent):
+    """
+    JSONのバイト列への変換(Encode to JSON bytes)
+
+    Args:
+
+        objContent (mix): 値[DB行のDecimal・日時・バイト列を含めてよい](value [may contain Decimal, date/time and bytes from DB rows])
+
+    Returns:
+
+        bytes:JSON
+    """
+
+    return orjson.dumps(objContent, default=getJsonDefault, option=ORJSON_OPTION)
+
+class OrjsonResponse(JSONResponse):
+    """
+    orjsonによるJSONレスポンス(JSON response rendered with orjson)
+
+    main.appの既定のレスポンスクラス。再帰的な文字コード変換やjson.dumpsを通さない
+    (Default response class of main.app. Skips recursive re-encoding and json.dumps)
+    """
+
+    def render(self, content) -> bytes:
+        with timing_fnc.getSpan("render"):
+            return getJsonBytes(content)
+
+class OrjsonRoute(APIRoute):
+    """
+    エンドポイントの戻り値をjsonable_encoderを通さずにOrjsonResponseで返すルート
+    (Route returning endpoint results as OrjsonResponse without going through jsonable_encoder)
+
+    response_model・戻り値の型・Responseの引数がある場合はFastAPIの通常の処理を行う
+    (Endpoints with a response_model, a return annotation or a Response parameter keep FastAPI's normal handling)
+
+    使い方(usage): router = APIRouter(route_class=response_fnc.OrjsonRoute)
+    """
+
+    def __init__(self, path: str, endpoint, **aryArgs):
+        super().__init__(path, getDirectEndpoint(endpoint, aryArgs), **aryArgs)
+
+def getDirectEndpoint(objEndpoint, aryArgs: dict):
+    """
+    戻り値をOrjsonResponseにするエンドポイントの作成[対象外の場合はそのまま](Wrap an endpoint so it returns OrjsonResponse [unchanged when not applicable])
+    """
+
+    objResponseModel = aryArgs.get("response_model")
+    objResponseClass = aryArgs.get("response_class")
+    intStatus = aryArgs.get("status_code") or 200
+
+    if isinstance(objResponseModel, DefaultPlaceholder):
+        objResponseModel = objResponseModel.value if inspect.signature(objEndpoint).return_annotation is inspect.Signature.empty else True
+    if isinstance(objResponseClass, DefaultPlaceholder) or objResponseClass is None:
+        objResponseClass = OrjsonResponse
+
+    if (
+        objResponseModel is not None
+        or not (isinstance(objResponseClass, type) and issubclass(objResponseClass, OrjsonResponse))
+        or intStatus < 200 or intStatus in (204, 304)
+        or inspect.isasyncgenfunction(objEndpoint) or inspect.isgeneratorfunction(objEndpoint)
+        or any(
+            isinstance(objParam.annotation, type) and issubclass(objParam.annotation, Response)
+            for objParam in inspect.signature(objEndpoint).parameters.values()
+        )
+    ):
+        return objEndpoint
+
+    if inspect.iscoroutinefunction(objEndpoint):
+        @functools.wraps(objEndpoint)
+        async def execEndpoint(*aryArgs, **aryKwargs):
+            objResult = await objEndpoint(*aryArgs, **aryKwargs)
+            return objResult if isinstance(objResult, Response) else objResponseClass(objResult, status_code=intStatus)
+    else:
+        @functools.wraps(objEndpoint)
+        def execEndpoint(*aryArgs, **aryKwargs):
+            objResult = objEndpoint(*aryArgs, **aryKwargs)
+            return objResult if isinstance(objResult, Response) else objResponseClass(objResult, status_code=intStatus)
+
+    return execEndpoint
@@ -1,16 +1,190 @@
-from fastapi import HTTPException
-
 from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
-from cryptography.hazmat.backends import default_backend
 from cryptography.hazmat.primitives import padding
+from concurrent.futures import ThreadPoolExecutor
+from functools import lru_cache
+import binascii
+import asyncio
 import base64
 import os
 
 # 共通ファンクションの読込(Reading common functions)
 from functions import log_fnc
+from functions import timing_fnc
+
+# この件数を超える一括復号はスレッドプールで実行(Batches larger than this run on the thread pool)
+SECURE_OFFLOAD_ROWS = int(os.getenv("SECURE_OFFLOAD_ROWS", "256"))
+
+# スレッドプールで1回に処理する件数(rows per thread pool task)
+SECURE_CHUNK_ROWS = int(os.getenv("SECURE_CHUNK_ROWS", "1024"))
+
+# AESのブロック長[バイト](AES block size in bytes)
+AES_BLOCK_BYTES = algorithms.AES.block_size // 8
+
+_objExecutor = None
+
+class SecureError(Exception):
+    """
+    暗号化・復号化のエラー(Encryption/decryption error)
+
+    Attributes:
+
+        strCode (str): エラー種別["key"/"empty"/"format"/"decrypt"](error kind ["key"/"empty"/"format"/"decrypt"])
+
+        strMessage (str): エラー内容(error message)
+    """
+
+    def __init__(self, strCode: str, strMessage: str):
+        super().__init__(f"{strCode}: {strMessage}")
+        self.strCode = strCode
+        self.strMessage = strMessage
+
+    def getDict(self):
+        return {"code": self.strCode, "message": self.strMessage}
+
+@lru_cache(maxsize=1)
+def getCipherAlgorithm():
+    """
+    APP_ENCRYPT_KEYの検証とAES鍵の作成[初回のみ](Validate APP_ENCRYPT_KEY and build the AES key [first call only])
+
+    Returns:
+
+        object:algorithms.AES
+
+    Raises:
+
+        SecureError: 鍵が未設定・32バイト以外(key missing or not 32 bytes)
+    """
+
+    strKey = os.getenv("APP_ENCRYPT_KEY")
+    if not strKey:
+        raise SecureError("key", "APP_ENCRYPT_KEY is not set")
+
+    bytKey = strKey.encode()
+    if len(bytKey) != 32:
+        raise SecureError("key", f"APP_ENCRYPT_KEY must be 32 bytes (got {len(bytKey)})")
+
+    return algorithms.AES(bytKey)
+
+def getDecrypt(strText: str):
+    """
+    復号化[同期処理](Decrypt [synchronous])
+
+    Args:
+
+        strText (str): base64(IV + 暗号文)(base64(IV + cipher text))
+
+    Returns:
+
+        str:復号結果(decoding result)
+
+    Raises:
+
+        SecureError: 復号化失敗(decryption failure)
+    """
+
+    if not strText:
+        raise SecureError("empty", "text is empty")
+
+    objAlgorithm = getCipherAlgorithm()
+
+    try:
+        bytData = base64.b64decode(strText)
+    except (binascii.Error, ValueError) as e:
+        raise SecureError("format", f"invalid base64: {e}")
+
+    if len(bytData) < AES_BLOCK_BYTES * 2 or len(bytData) % AES_BLOCK_BYTES:
+        raise SecureError("format", f"invalid length {len(bytData)}")
+
+    try:
+        # 先頭が初期化ベクトル(IV)、OpenSSLによる復号化（CBCモード）(The IV comes first, OpenSSL decryption [CBC mode])
+        objDecryptor = Cipher(objAlgorithm, modes.CBC(bytData[:AES_BLOCK_BYTES])).decryptor()
+        bytDecrypted = objDecryptor.update(bytData[AES_BLOCK_BYTES:]) + objDecryptor.finalize()
+
+        # PKCS7パディングの除去(Remove PKCS7 padding)
+        objUnpadder = padding.PKCS7(algorithms.AES.block_size).unpadder()
+        bytDecrypted = objUnpadder.update(bytDecrypted) + objUnpadder.finalize()
+
+        # 暗号化前に付与された文字数分のパディングを除去(Remove the character padding added before encryption)
+        strDecrypted = bytDecrypted.decode('utf-8')
+        return strDecrypted[:-ord(strDecrypted[-1])]
+
+    except (ValueError, IndexError) as e:
+        raise SecureError("decrypt", str(e) or e.__class__.__name__)
+
+def getEncrypt(strText: str, bytIv: bytes=None):
+    """
+    暗号化[同期処理、getDecryptの逆変換](Encrypt [synchronous, inverse of getDecrypt])
+
+    Args:
+
+        strText (str): 暗号化するテキスト(Text to be encrypted)
+
+        bytIv (bytes): 初期化ベクトル[省略時は乱数](initialization vector [random if omitted])
+
+    Returns:
+
+        str:base64(IV + 暗号文)(base64(IV + cipher text))
+
+    Raises:
+
+        SecureError: 鍵の不備(key problem)
+    """
+
+    objAlgorithm = getCipherAlgorithm()
+    if bytIv is None:
+        bytIv = os.urandom(AES_BLOCK_BYTES)
+
+    # 復号側で末尾の文字数分を除去するため、1～16文字のパディングを付与(Append 1-16 padding characters that decryption strips)
+    bytText = strText.encode('utf-8')
+    intPadding = AES_BLOCK_BYTES - len(bytText) % AES_BLOCK_BYTES
+    bytText += bytes([intPadding]) * intPadding
+
+    objPadder = padding.PKCS7(algorithms.AES.block_size).padder()
+    bytText = objPadder.update(bytText) + objPadder.finalize()
+
+    objEncryptor = Cipher(objAlgorithm, modes.CBC(bytIv)).encryptor()
 
-# 共通ユーティリティの読込(Reading common utilities)
-from util import util_cmn
+    return base64.b64encode(bytIv + objEncryptor.update(bytText) + objEncryptor.finalize()).decode('ascii')
+
+def getDecryptList(aryTexts: list):
+    """
+    複数件の復号化[同期処理](Decrypt many rows [synchronous])
+
+    Args:
+
+        aryTexts (list): 暗号化されたテキスト(encrypted texts)
+
+    Returns:
+
+        list:復号結果または SecureError(decoding result or SecureError per row)
+    """
+
+    aryResult = []
+    for strText in aryTexts:
+        try:
+            aryResult.append(getDecrypt(strText))
+        except SecureError as e:
+            aryResult.append(e)
+
+    return aryResult
+
+def getExecutor():
+    """
+    復号化用スレッドプールの取得(Get the decryption thread pool)
+
+    Returns:
+
+        object:ThreadPoolExecutor
+    """
+
+    global _objExecutor
+
+    if _objExecutor is None:
+        _objExecutor = ThreadPoolExecutor(
+            max_workers=int(os.getenv("SECURE_THREADS", str(os.cpu_count() or 1))), thread_name_prefix="secure"
+        )
+
+    return _objExecutor
 
 async def getOpensslDecrypt(strText: str=""):
     """
@@ -24,50 +198,109 @@ async def getOpensslDecrypt(strText: str=""):
 
     Returns:
 
-        bool:成功:復号結果 失敗:Fals](Success:decoding result Failure:False)
-    
+        bool:成功:復号結果 失敗:False(Success:decoding result Failure:False)
+
+    Raises:
+
+        SecureError: テキストが空・鍵の不備(text empty or key problem)
+
     Note
 
         復号化用のキーは、暁プロジェクト利用のものと同一にする(The key for decryption should be the same as the one used by the Dawn Project)
     """
 
-    objLogger = await log_fnc.setOutputLog()
-    aryLogExtra = await util_cmn.getIpAddress()
+    try:
+        with timing_fnc.getSpan("aes"):
+            return getDecrypt(strText)
+    except SecureError as e:
+        if e.strCode in ("empty", "key"):
+            raise
+        log_fnc.getOutputLog().critical(f"復号化処理エラー(Error to decrypted process) key:{strText} Exception:{e}")
+        return False
 
-    if strText:
-        # 鍵情報の取得(Obtaining key information)
+async def getOpensslEncrypt(strText: str):
+    """
+    暗号化処理(encoding process)
 
-        strKey = os.getenv("APP_ENCRYPT_KEY")
-        if len(strKey) != 32:
-            raise False
-        
-        try:
-            # base64デコード
-            strData = base64.b64decode(strText)
-
-            # 初期化ベクトル（IV）を抽出
-            intIvLength = algorithms.AES(strKey.encode()).block_size // 8
-            strIv = strData[:intIvLength]
-            strEncryptedText = strData[intIvLength:]
-
-            # OpenSSLによる復号化（CBCモード）
-            objCipher = Cipher(algorithms.AES(strKey.encode()), modes.CBC(strIv), backend=default_backend())
-            strDecryptor = objCipher.decryptor()
-            strDecrypted = strDecryptor.update(strEncryptedText) + strDecryptor.finalize()
-
-            # PKCS7パディングの除去
-            objPadder = padding.PKCS7(128).unpadder()
-            strDecrypted = objPadder.update(strDecrypted) + objPadder.finalize()
-
-            strDecrypted = strDecrypted.decode('utf-8')  # バイト列を文字列に変換
-            intPadding = ord(strDecrypted[-1])
-            strDecrypted = strDecrypted[:-intPadding]
-
-            return strDecrypted
-        
-        except Exception as e:
-            objLogger.critical(f"復号化処理エラー(Error to decrypted process) key:{strText} Exception:{e}", extra=aryLogExtra)
-            return False
-
-    else:
-        raise False
\ No newline at end of file
+    Args:
+
+        strText (str): 暗号化するテキスト(Text to be encrypted)
+
+    Returns:
+
+        str:base64(IV + 暗号文)(base64(IV + cipher text))
+
+    Raises:
+
+        SecureError: 鍵の不備(key problem)
+    """
+
+    with timing_fnc.getSpan("aes"):
+        return getEncrypt(strText)
+
+async def getOpensslDecryptBatch(aryTexts, intOffloadRows: int=None):
+    """
+    一括復号化処理(batch decoding process)
+
+    件数が多い場合はスレッドプールで分割実行する[cryptographyはGILを解放する]
+    (Large batches are split across the thread pool [cryptography releases the GIL])
+
+    Args:
+
+        aryTexts (iterable): 暗号化されたテキスト(encrypted texts)
+
+        intOffloadRows (int): スレッドプールで実行する件数の閾値[省略時はSECURE_OFFLOAD_ROWS](row threshold for the thread pool [SECURE_OFFLOAD_ROWS if omitted])
+
+    Returns:
+
+        dict:result:復号結果[失敗はNone] error:[{index, code, message}](result:decoding results [None on failure] error:[{index, code, message}])
+
+    Raises:
+
+        SecureError: 鍵の不備(key problem)
+    """
+
+    aryTexts = list(aryTexts)
+    if intOffloadRows is None:
+        intOffloadRows = SECURE_OFFLOAD_ROWS
+
+    # 鍵の不備は行ごとのエラーにせず呼び出し元へ(A key problem goes to the caller instead of every row)
+    getCipherAlgorithm()
+
+    with timing_fnc.getSpan("aes"):
+        if len(aryTexts) <= intOffloadRows:
+            aryDecrypted = getDecryptList(aryTexts)
+        else:
+            objLoop = asyncio.get_running_loop()
+            aryChunks = await asyncio.gather(*[
+                objLoop.run_in_executor(getExecutor(), getDecryptList, aryTexts[i:i + SECURE_CHUNK_ROWS])
+                for i in range(0, len(aryTexts), SECURE_CHUNK_ROWS)
+            ])
+            aryDecrypted = [objValue for aryChunk in aryChunks for objValue in aryChunk]
+
+    aryResult = []
+    aryError = []
+    for i, objValue in enumerate(aryDecrypted):
+        if isinstance(objValue, SecureError):
+            aryResult.append(None)
+            aryError.append(dict(objValue.getDict(), index=i))
+        else:
+            aryResult.append(objValue)
+
+    if aryError:
+        log_fnc.getOutputLog().critical(
+            f"一括復号化処理エラー(Error to batch decrypted process) {len(aryError)}/{len(aryTexts)} rows first:{aryError[0]}"
+        )
+
+    return {"result": aryResult, "error": aryError}
+
+def shutdownSecureExecutor():
+    """
+    復号化用スレッドプールの停止(Stop the decryption thread pool)
+    """
+
+    global _objExecutor
+
+    if _objExecutor is not None:
+        _objExecutor.shutdown(wait=True)
+        _objExecutor = None
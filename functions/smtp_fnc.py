@@ -0,0 +1,355 @@
+import os
+import ssl
+import time
+import asyncio
+import smtplib
+import contextvars
+from smtplib import SMTP_SSL
+from concurrent.futures import ThreadPoolExecutor
+
+# 共通ファンクションの読込(Reading common functions)
+from functions import log_fnc
+from functions import context_fnc
+
+_objMailSetting = None
+_objDispatcher = None
+
+def getMailSetting(blnReload: bool=False):
+    """
+    メール設定の取得(Get mail settings)
+
+    環境変数は初回のみ読み込む(Environment variables are read only on the first call)
+
+    Args:
+
+        blnReload (bool): 環境変数を再読込する(reload the environment variables)
+
+    Returns:
+
+        dict:メール設定(mail settings)
+    """
+
+    global _objMailSetting
+
+    if _objMailSetting is None or blnReload:
+        _objMailSetting = {
+            "send_mail": os.getenv("mail_system_send_mail"),
+            "info_mail": os.getenv("mail_system_info_mail"),
+            "host": os.getenv("mail_host"),
+            "port": os.getenv("mail_port"),
+            "username": os.getenv("mail_username"),
+            "password": os.getenv("mail_password"),
+            "timeout": os.getenv("mail_timeout"),
+            "local_domain": os.getenv("mail_local_domain"),
+            "encryption": os.getenv("mail_encryption"),
+            "send_type": os.getenv("mail_send_type"),
+            "pool_size": int(os.getenv("mail_pool_size", "2")),
+            "queue_size": int(os.getenv("mail_queue_size", "1000")),
+            "retry": int(os.getenv("mail_retry", "3")),
+            "retry_backoff": float(os.getenv("mail_retry_backoff", "0.5")),
+            "idle_timeout": float(os.getenv("mail_idle_timeout", "60")),
+        }
+
+    return _objMailSetting
+
+def getSmtpConnection(objSetting: dict):
+    """
+    SMTPサーバへの接続とログイン(Connect and log in to the SMTP server)
+
+    tls:SMTP_SSL mailhog:平文 それ以外:STARTTLS(tls:SMTP_SSL mailhog:plain otherwise:STARTTLS)
+
+    Args:
+
+        objSetting (dict): メール設定(mail settings)
+
+    Returns:
+
+        object:SMTP接続(SMTP connection)
+    """
+
+    strMailHost = objSetting["host"]
+    intMailPort = int(objSetting["port"])
+    strMailLocalDomain = objSetting["local_domain"]
+    aryTimeout = {}
+    if objSetting["timeout"] != None:
+        aryTimeout["timeout"] = int(objSetting["timeout"])
+
+    # サーバを指定(Specify server)
+    if objSetting["encryption"] == "tls":
+        objContext = ssl.create_default_context()
+        server = SMTP_SSL(strMailHost, intMailPort, local_hostname=strMailLocalDomain, context=objContext, **aryTimeout)
+    elif strMailHost == "mailhog":
+        server = smtplib.SMTP(strMailHost, intMailPort, local_hostname=strMailLocalDomain, **aryTimeout)
+    else:
+        server = smtplib.SMTP(strMailHost, intMailPort, local_hostname=strMailLocalDomain, **aryTimeout)
+        server.starttls()
+
+    # ログイン処理(login process)
+    if objSetting["username"] != None and objSetting["password"] != None:
+        server.login(objSetting["username"], objSetting["password"])
+
+    return server
+
+def isRetryableError(e: Exception):
+    """
+    再送可能なエラーか判定(Check whether the error is worth retrying)
+
+    Args:
+
+        e (Exception): 例外(exception)
+
+    Returns:
+
+        bool:再送可能:True 再送不可:False(retryable:True not retryable:False)
+    """
+
+    # 5xxは恒久エラーのため再送しない(5xx is a permanent error and is not retried)
+    if isinstance(e, smtplib.SMTPRecipientsRefused):
+        return False
+    if isinstance(e, smtplib.SMTPResponseException):
+        return e.smtp_code < 500
+
+    return isinstance(e, (smtplib.SMTPException, OSError))
+
+class SmtpConnection:
+    """
+    再利用するSMTP接続(Reused SMTP connection)
+
+    アイドル時間を超えた接続は送信前に張り直す(Connections idle past the timeout are reopened before sending)
+    """
+
+    def __init__(self, objSetting: dict, objConnect=getSmtpConnection):
+        self.objSetting = objSetting
+        self.objConnect = objConnect
+        self.objServer = None
+        self.fltLastUsed = 0.0
+
+    def close(self):
+        if self.objServer is not None:
+            try:
+                self.objServer.quit()
+            except Exception:
+                try:
+                    self.objServer.close()
+                except Exception:
+                    pass
+            self.objServer = None
+
+    def send(self, objMessage):
+        if self.objServer is not None and time.monotonic() - self.fltLastUsed > self.objSetting["idle_timeout"]:
+            self.close()
+
+        if self.objServer is None:
+            self.objServer = self.objConnect(self.objSetting)
+
+        try:
+            self.objServer.send_message(objMessage)
+        except smtplib.SMTPServerDisconnected:
+            self.objServer = None
+            raise
+        finally:
+            self.fltLastUsed = time.monotonic()
+
+        return True
+
+class MailDispatcher:
+    """
+    非同期メール送信ディスパッチャ(Asynchronous mail dispatcher)
+
+    上限付きキューから接続ごとのワーカーが送信し、SMTP処理は専用スレッドで行う(Per-connection workers send from a bounded queue, SMTP runs on dedicated threads)
+    """
+
+    def __init__(self, objSetting: dict, objConnect=getSmtpConnection):
+        self.objSetting = objSetting
+        self.objConnect = objConnect
+        self.objQueue = asyncio.Queue(maxsize=objSetting["queue_size"])
+        self.objExecutor = ThreadPoolExecutor(max_workers=objSetting["pool_size"], thread_name_prefix="smtp")
+        self.aryWorkers = []
+
+    def start(self):
+        """
+        ワーカー起動(Start workers)
+
+        ワーカーはリクエストのコンテキストを引き継がない(Workers do not inherit the request context)
+        """
+
+        if self.aryWorkers:
+            return
+
+        for _ in range(self.objSetting["pool_size"]):
+            self.aryWorkers.append(
+                asyncio.get_running_loop().create_task(self._execWorker(), context=contextvars.Context())
+            )
+
+    async def stop(self, blnDrain: bool=True):
+        """
+        ワーカー停止(Stop workers)
+
+        Args:
+
+            blnDrain (bool): キューに残ったメールを送信してから停止する(send queued mails before stopping)
+        """
+
+        if blnDrain and self.aryWorkers:
+            await self.objQueue.join()
+
+        for objWorker in self.aryWorkers:
+            objWorker.cancel()
+        await asyncio.gather(*self.aryWorkers, return_exceptions=True)
+        self.aryWorkers = []
+        self.objExecutor.shutdown(wait=True)
+
+    def enqueue(self, objMessage):
+        """
+        メールをキューへ登録し結果を待たない(Enqueue a mail without waiting for the result)
+
+        Args:
+
+            objMessage (object): MIMEメッセージ(MIME message)
+
+        Returns:
+
+            bool:成功:True 失敗[キュー満杯]:False(Success:True Failure [queue full]:False)
+        """
+
+        self.start()
+
+        try:
+            self.objQueue.put_nowait((objMessage, None, context_fnc.getClientIp()))
+        except asyncio.QueueFull:
+            return False
+
+        return True
+
+    async def send(self, objMessage):
+        """
+        メールをキューへ登録し送信結果を待つ(Enqueue a mail and wait for the send result)
+
+        Args:
+
+            objMessage (object): MIMEメッセージ(MIME message)
+
+        Returns:
+
+            bool:成功:True 失敗:False(Success:True Failure:False)
+        """
+
+        self.start()
+
+        objFuture = asyncio.get_running_loop().create_future()
+        await self.objQueue.put((objMessage, objFuture, context_fnc.getClientIp()))
+
+        return await objFuture
+
+    async def _execWorker(self):
+        objLoop = asyncio.get_running_loop()
+        objConnection = SmtpConnection(self.objSetting, self.objConnect)
+
+        try:
+            while True:
+                objMessage, objFuture, strClientIp = await self.objQueue.get()
+                try:
+                    blnResult = await self._execSend(objLoop, objConnection, objMessage, strClientIp)
+                    if objFuture is not None and not objFuture.done():
+                        objFuture.set_result(blnResult)
+                finally:
+                    self.objQueue.task_done()
+        finally:
+            await objLoop.run_in_executor(self.objExecutor, objConnection.close)
+
+    async def _execSend(self, objLoop, objConnection, objMessage, strClientIp: str):
+        objLogger = log_fnc.getOutputLog()
+        aryLogExtra = { 'clientip' : strClientIp }
+
+        intRetry = self.objSetting["retry"]
+        for intAttempt in range(intRetry + 1):
+            try:
+                return await objLoop.run_in_executor(self.objExecutor, objConnection.send, objMessage)
+            except Exception as e:
+                await objLoop.run_in_executor(self.objExecutor, objConnection.close)
+                if intAttempt >= intRetry or not isRetryableError(e):
+                    objLogger.critical(f"メール送信失敗(Exception Error mail send) Exception:{e}", extra=aryLogExtra)
+                    return False
+                await asyncio.sleep(self.objSetting["retry_backoff"] * (2 ** intAttempt))
+
+        return False
+
+def execSendBulk(objSetting: dict, aryMessages: list, intReconnectEvery: int=100, objConnect=getSmtpConnection):
+    """
+    一括メール送信処理(bulk mail send)
+
+    1つのセッションで順に送信し、intReconnectEvery通ごとに接続を張り直す[ブロッキング処理のためスレッドで実行する]
+    (Sends over one session, reconnecting every intReconnectEvery messages [blocking, run it on a thread])
+
+    Args:
+
+        objSetting (dict): メール設定(mail settings)
+
+        aryMessages (list): MIMEメッセージのリスト(list of MIME messages)
+
+        intReconnectEvery (int): 再接続する送信数(messages per connection)
+
+        objConnect (object): 接続関数(connect function)
+
+    Returns:
+
+        list:メッセージごとの(成功可否, エラー内容)(per message (success, error))
+    """
+
+    objConnection = SmtpConnection(objSetting, objConnect)
+    aryResult = []
+    intSent = 0
+
+    try:
+        for objMessage in aryMessages:
+            if intSent >= intReconnectEvery:
+                objConnection.close()
+                intSent = 0
+
+            for intAttempt in range(objSetting["retry"] + 1):
+                try:
+                    objConnection.send(objMessage)
+                    aryResult.append((True, ""))
+                    break
+                except Exception as e:
+                    # 宛先拒否は接続を維持したまま次の宛先へ(Refused recipients keep the session and move on)
+                    if not isinstance(e, smtplib.SMTPRecipientsRefused):
+                        objConnection.close()
+                    if intAttempt >= objSetting["retry"] or not isRetryableError(e):
+                        aryResult.append((False, str(e)))
+                        break
+                    time.sleep(objSetting["retry_backoff"] * (2 ** intAttempt))
+            intSent += 1
+    finally:
+        objConnection.close()
+
+    return aryResult
+
+def getMailDispatcher():
+    """
+    メールディスパッチャの取得(Get the mail dispatcher)
+
+    Returns:
+
+        object:メールディスパッチャ(mail dispatcher)
+    """
+
+    global _objDispatcher
+
+    if _objDispatcher is None:
+        _objDispatcher = MailDispatcher(getMailSetting())
+
+    return _objDispatcher
+
+async def shutdownMailDispatcher():
+    """
+    メールディスパッチャの終了処理(Mail dispatcher shutdown)
+
+    キューに残ったメールを送信してから停止する(Send queued mails and then stop)
+    """
+
+    global _objDispatcher
+
+    if _objDispatcher is not None:
+        await _objDispatcher.stop()
+        _objDispatcher = None
@@ -0,0 +1,93 @@
+import io
+import csv
+import json
+
+from fastapi.responses import StreamingResponse
+
+# 共通ファンクションの読込(Reading common functions)
+from functions import mysqlaio_fnc
+from functions import response_fnc
+
+async def getNdjsonStream(aryChunks):
+    """
+    行のリストをNDJSONのバイト列に変換(Convert lists of rows to NDJSON bytes)
+
+    Args:
+
+        aryChunks (object): 行のリストを返す非同期イテレータ(async iterator of row lists)
+
+    Yields:
+
+        bytes:NDJSON
+    """
+
+    async for aryRows in aryChunks:
+        yield "".join(
+            json.dumps(aryRow, ensure_ascii=False, default=response_fnc.getJsonDefault) + "\n" for aryRow in aryRows
+        ).encode('utf-8')
+
+async def getCsvStream(aryChunks):
+    """
+    行のリストをCSVのバイト列に変換[先頭行のキーをヘッダとする](Convert lists of rows to CSV bytes [keys of the first row become the header])
+
+    Args:
+
+        aryChunks (object): 行のリストを返す非同期イテレータ(async iterator of row lists)
+
+    Yields:
+
+        bytes:CSV
+    """
+
+    objBuffer = io.StringIO()
+    objWriter = None
+
+    async for aryRows in aryChunks:
+        if objWriter is None:
+            objWriter = csv.DictWriter(objBuffer, fieldnames=list(aryRows[0].keys()), extrasaction='ignore')
+            objWriter.writeheader()
+        objWriter.writerows(aryRows)
+
+        yield objBuffer.getvalue().encode('utf-8')
+        objBuffer.seek(0)
+        objBuffer.truncate(0)
+
+def getQueryStreamingResponse(objDbPool, strMethod, strSql: str="", aryParam: list=(), strFormat: str="ndjson", intChunkSize: int=1000, strFilename: str=""):
+    """
+    SELECT結果をストリーミングで返すレスポンス作成(Create a response that streams SELECT results)
+
+    Args:
+
+        objDbPool (object): コネクションプーリング
+
+        strMethod (str): 呼び出しメソッド名(Calling method name)
+
+        strSql (str): sql
+
+        aryParam (list): params
+
+        strFormat (str): "ndjson" または "csv"("ndjson" or "csv")
+
+        intChunkSize (int): fetchmanyの件数(rows per fetchmany)
+
+        strFilename (str): ダウンロードファイル名[空の場合は指定しない](download file name [none if empty])
+
+    Returns:
+
+        object:StreamingResponse
+    """
+
+    aryChunks = mysqlaio_fnc.getStreamQuery(objDbPool, strMethod, strSql, aryParam, intChunkSize, blnChunk=True)
+
+    if strFormat == "csv":
+        objStream = getCsvStream(aryChunks)
+        strMediaType = "text/csv; charset=utf-8"
+    else:
+        objStream = getNdjsonStream(aryChunks)
+        strMediaType = "application/x-ndjson"
+
+    aryHeaders = {}
+    if strFilename != "":
+        aryHeaders["Content-Disposition"] = f'attachment; filename="{strFilename}"'
+
+    return StreamingResponse(objStream, media_type=strMediaType, headers=aryHeaders)
@@ -0,0 +1,217 @@
+import os
+import hmac
+import time
+import random
+import asyncio
+import cProfile
+import datetime
+import itertools
+from contextvars import ContextVar
+
+# 共通ファンクションの読込(Reading common functions)
+from functions import log_fnc
+
+# 全リクエストにServer-Timingヘッダーを付ける(add the Server-Timing header to every request)
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+
+# X-Server-Timing-Tokenヘッダーがこの値のリクエストはServer-Timingとプロファイルを取る[空は無効]
+# (requests whose X-Server-Timing-Token header has this value get Server-Timing and a profile [empty disables])
+SERVER_TIMING_TOKEN = os.getenv("SERVER_TIMING_TOKEN", "")
+
+# プロファイルを取るリクエストの割合[0.001は1000件に1件](fraction of requests profiled [0.001 is one in a thousand])
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+
+# プロファイルの出力先(profile output directory)
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(os.getcwd(), "logs", "profile"))
+
+# リクエスト単位の{区間名: [秒数, 回数]}[計測しない場合はNone](request-scoped {span name: [seconds, count]} [None when not measured])
+_objTimings = ContextVar("timings", default=None)
+
+# プロファイラは同時に1つだけ(only one profiler at a time)
+_blnProfiling = False
+_objProfileSeq = itertools.count(1)
+
+class Span:
+    """
+    区間の計測[with文](Measure a span [with statement])
+    """
+
+    __slots__ = ("aryTimings", "strName", "fltStart")
+
+    def __init__(self, aryTimings: dict, strName: str):
+        self.aryTimings = aryTimings
+        self.strName = strName
+
+    def __enter__(self):
+        self.fltStart = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        setAddTiming(self.aryTimings, self.strName, time.perf_counter() - self.fltStart)
+
+class NoSpan:
+    """
+    計測しない場合の区間[何もしない](Span used when not measuring [does nothing])
+    """
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return None
+
+_objNoSpan = NoSpan()
+
+def setAddTiming(aryTimings: dict, strName: str, fltSeconds: float):
+    aryTiming = aryTimings.get(strName)
+    if aryTiming is None:
+        aryTimings[strName] = [fltSeconds, 1]
+    else:
+        aryTiming[0] += fltSeconds
+        aryTiming[1] += 1
+
+def getSpan(strName: str):
+    """
+    区間の計測[計測しないリクエストでは何もしない](Measure a span [does nothing for requests not being measured])
+
+    使い方(usage):
+        with timing_fnc.getSpan("aes"):
+            ...
+
+    Args:
+
+        strName (str): 区間名[Server-Timingのメトリクス名](span name [Server-Timing metric name])
+
+    Returns:
+
+        object:with文で使う区間(span for a with statement)
+    """
+
+    aryTimings = _objTimings.get()
+    if aryTimings is None:
+        return _objNoSpan
+
+    return Span(aryTimings, strName)
+
+def setTiming(strName: str, fltSeconds: float):
+    """
+    計測済みの時間の記録(Record an already measured duration)
+
+    Args:
+
+        strName (str): 区間名(span name)
+
+        fltSeconds (float): 秒数(seconds)
+    """
+
+    aryTimings = _objTimings.get()
+    if aryTimings is not None:
+        setAddTiming(aryTimings, strName, fltSeconds)
+
+def getServerTimingHeader(aryTimings: dict, fltTotal: float):
+    """
+    Server-Timingヘッダーの値(Server-Timing header value)
+
+    Returns:
+
+        str:例(e.g.) db-execute;dur=1.20;desc="2x", total;dur=3.05
+    """
+
+    aryParts = []
+    for strName, (fltSeconds, intCount) in aryTimings.items():
+        strPart = f"{strName};dur={fltSeconds * 1000:.2f}"
+        if intCount > 1:
+            strPart += f';desc="{intCount}x"'
+        aryParts.append(strPart)
+    aryParts.append(f"total;dur={fltTotal * 1000:.2f}")
+
+    return ", ".join(aryParts)
+
+def getProfilePath(strMethod: str, strPath: str):
+    """
+    プロファイルの出力ファイル名(Profile output file name)
+
+    Returns:
+
+        str:logs/profile/日時-プロセスID-連番-メソッド-パス.prof(logs/profile/time-pid-seq-method-path.prof)
+    """
+
+    strRoute = "".join(c if c.isalnum() else "_" for c in strPath.strip("/"))[:80] or "root"
+    strTime = datetime.datetime.now().strftime("%Y%m%d-%H%M%S")
+
+    return os.path.join(PROFILE_DIR, f"{strTime}-{os.getpid()}-{next(_objProfileSeq)}-{strMethod}-{strRoute}.prof")
+
+def setDumpProfile(objProfile, strFile: str):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    objProfile.dump_stats(strFile)
+
+class ServerTimingMiddleware:
+    """
+    区間ごとの時間をServer-Timingヘッダーで返し、対象のリクエストはプロファイルを取るASGIミドルウェア
+    (ASGI middleware returning span timings as a Server-Timing header and profiling selected requests)
+
+    プロファイルはcProfileの.prof[snakeviz・flameprof等で表示]。プロファイル中に同じイベントループで動いた他のリクエストも含む
+    (Profiles are cProfile .prof files [view with snakeviz, flameprof etc.]. They include other requests running on the same event loop meanwhile)
+
+    無効のリクエストは判定のみで何もしない(Requests not selected only pay for the check)
+    """
+
+    def __init__(self, app):
+        self.app = app
+        self.bytToken = SERVER_TIMING_TOKEN.encode("latin-1")
+
+    def isPrivileged(self, scope):
+        if not self.bytToken:
+            return False
+        for key, value in scope["headers"]:
+            if key == b"x-server-timing-token":
+                return hmac.compare_digest(value, self.bytToken)
+        return False
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        blnPrivileged = self.isPrivileged(scope)
+        blnHeader = SERVER_TIMING or blnPrivileged
+        blnProfile = blnPrivileged or (PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE)
+        if not blnHeader and not blnProfile:
+            await self.app(scope, receive, send)
+            return
+
+        global _blnProfiling
+
+        aryTimings = {}
+        objToken = _objTimings.set(aryTimings)
+        fltStart = time.perf_counter()
+
+        async def sendWrapper(message):
+            if message["type"] == "http.response.start" and blnHeader:
+                strHeader = getServerTimingHeader(aryTimings, time.perf_counter() - fltStart)
+                message["headers"] = list(message.get("headers", [])) + [(b"server-timing", strHeader.encode("latin-1"))]
+            await send(message)
+
+        objProfile = None
+        if blnProfile and not _blnProfiling:
+            _blnProfiling = True
+            objProfile = cProfile.Profile()
+            objProfile.enable()
+
+        try:
+            await self.app(scope, receive, sendWrapper)
+        finally:
+            _objTimings.reset(objToken)
+            if objProfile is not None:
+                objProfile.disable()
+                _blnProfiling = False
+                strFile = getProfilePath(scope["method"], scope["path"])
+                try:
+                    await asyncio.get_running_loop().run_in_executor(None, setDumpProfile, objProfile, strFile)
+                    log_fnc.getOutputLog().info(
+                        f"プロファイル出力(profile written) {strFile} {getServerTimingHeader(aryTimings, time.perf_counter() - fltStart)}"
+                    )
+                except OSError as e:
+                    log_fnc.getOutputLog().critical(f"プロファイル出力失敗(failed to write profile) {strFile} Exception:{e}")
@@ -0,0 +1,298 @@
+import os
+import asyncio
+from itertools import accumulate
+from functools import lru_cache
+from concurrent.futures import ProcessPoolExecutor
+
+# 既定のモデル名[またはエンコーディング名](default model name [or encoding name])
+TOKEN_DEFAULT_MODEL = os.getenv("TOKEN_DEFAULT_MODEL", "gpt-3.5-turbo")
+
+# この件数を超える一括処理はプロセスプールで実行(Batches larger than this run on the process pool)
+TOKEN_PROCESS_ROWS = int(os.getenv("TOKEN_PROCESS_ROWS", "2000"))
+
+# プロセスプールで1回に処理する件数(documents per process pool task)
+TOKEN_CHUNK_ROWS = int(os.getenv("TOKEN_CHUNK_ROWS", "500"))
+
+# プロセス数[1以下はプロセスプールを使わない](process count [1 or less disables the process pool])
+TOKEN_PROCESSES = int(os.getenv("TOKEN_PROCESSES", str(min(4, os.cpu_count() or 1))))
+
+_objProcessPool = None
+
+@lru_cache(maxsize=256)
+def getEncodingName(strModel: str):
+    """
+    モデル名からエンコーディング名の取得(Resolve a model name to its encoding name)
+
+    モデル名が不明な場合はエンコーディング名として扱い、それも不明ならcl100k_baseを使う。
+    モデル名はクライアントが指定するため件数を制限してキャッシュする
+    (Unknown model names are tried as encoding names, falling back to cl100k_base.
+    Model names come from clients, so the cache is bounded)
+
+    Args:
+
+        strModel (str): モデル名またはエンコーディング名(model or encoding name)
+
+    Returns:
+
+        str:エンコーディング名(encoding name)
+    """
+
+    # 初回の使用時に読込む(Imported on first use)
+    import tiktoken
+    import tiktoken.model
+
+    try:
+        return tiktoken.model.encoding_name_for_model(strModel)
+    except KeyError:
+        pass
+
+    if strModel in tiktoken.list_encoding_names():
+        return strModel
+
+    return "cl100k_base"
+
+@lru_cache(maxsize=None)
+def getEncoding(strEncoding: str):
+    """
+    エンコーディング名ごとのエンコーダー取得[プロセスごとに1回だけ作成](Get the encoder per encoding name [built once per process])
+    """
+
+    import tiktoken
+
+    return tiktoken.get_encoding(strEncoding)
+
+def getEncoder(strModel: str=None):
+    """
+    モデルごとのエンコーダー取得[エンコーディングごとに1つ](Get the encoder per model [one per encoding])
+
+    Args:
+
+        strModel (str): モデル名またはエンコーディング名(model or encoding name)
+
+    Returns:
+
+        object:tiktoken.Encoding
+    """
+
+    return getEncoding(getEncodingName(strModel or TOKEN_DEFAULT_MODEL))
+
+def getTokenCount(strText: str, strModel: str=None):
+    """
+    トークン数の取得(Count tokens)
+
+    特殊トークンの文字列も通常のテキストとして数える(Special token strings are counted as plain text)
+
+    Args:
+
+        strText (str): テキスト(text)
+
+        strModel (str): モデル名(model name)
+
+    Returns:
+
+        int:トークン数(token count)
+    """
+
+    return len(getEncoder(strModel).encode_ordinary(strText))
+
+def getTokenCountList(aryTexts: list, strModel: str=None):
+    """
+    複数件のトークン数の取得[同期処理](Count tokens of many texts [synchronous])
+
+    Args:
+
+        aryTexts (list): テキスト(texts)
+
+        strModel (str): モデル名(model name)
+
+    Returns:
+
+        list:トークン数(token counts)
+    """
+
+    objEncode = getEncoder(strModel).encode_ordinary
+
+    return [len(objEncode(strText)) for strText in aryTexts]
+
+def getTokenChunks(strText: str, intMaxTokens: int, intOverlap: int=0, strModel: str=None):
+    """
+    トークン数で区切ったチャンクへの分割(Split text into token-bounded chunks)
+
+    区切りはトークン境界の文字位置で行い、元のテキストを切り出すため文字化けしない
+    (Chunks are cut from the original text at the character position of token boundaries, so multi-byte characters stay intact)
+
+    tokensは切り出したテキストを数え直した値で、intMaxTokens以下になる
+    (tokens is the count of the cut text encoded again, and never exceeds intMaxTokens)
+
+    Args:
+
+        strText (str): テキスト(text)
+
+        intMaxTokens (int): チャンクの最大トークン数(maximum tokens per chunk)
+
+        intOverlap (int): 前のチャンクと重ねるトークン数(tokens shared with the previous chunk)
+
+        strModel (str): モデル名(model name)
+
+    Returns:
+
+        list:[{text, tokens}]
+    """
+
+    if intMaxTokens <= 0 or not 0 <= intOverlap < intMaxTokens:
+        raise ValueError(f"invalid chunk size max_tokens:{intMaxTokens} overlap:{intOverlap}")
+
+    objEncoder = getEncoder(strModel)
+    aryTokens = objEncoder.encode_ordinary(strText)
+    intTokens = len(aryTokens)
+    if intTokens <= intMaxTokens:
+        return [{"text": strText, "tokens": intTokens}] if strText else []
+
+    # トークンの開始バイト位置を文字位置へ変換[文字の途中は文字の先頭へ]
+    # (Convert the start byte offset of each token to a character offset [mid-character offsets move to the character start])
+    bytText = strText.encode('utf-8')
+    aryOffsets = []
+    intBytePos = 0
+    intCharPos = 0
+    for intByte in accumulate(map(len, objEncoder.decode_tokens_bytes(aryTokens)), initial=0):
+        while 0 < intByte < len(bytText) and 0x80 <= bytText[intByte] < 0xC0:
+            intByte -= 1
+        intCharPos += len(bytText[intBytePos:intByte].decode('utf-8'))
+        intBytePos = intByte
+        aryOffsets.append(intCharPos)
+
+    # 切り出したテキストを数え直し、境界のトークンが変わって上限を超える場合は短くする
+    # (Re-count each cut text and shorten it when tokens merging differently at the edges push it over the limit)
+    aryChunks = []
+    intStart = 0
+    while True:
+        intEnd = min(intStart + intMaxTokens, intTokens)
+        while True:
+            strChunk = strText[aryOffsets[intStart]:aryOffsets[intEnd]]
+            intChunkTokens = len(objEncoder.encode_ordinary(strChunk))
+            if intChunkTokens <= intMaxTokens or intEnd - intStart <= 1:
+                break
+            intEnd -= 1
+        aryChunks.append({"text": strChunk, "tokens": intChunkTokens})
+        if intEnd == intTokens:
+            break
+        intStart = max(intStart + 1, intEnd - intOverlap)
+
+    return aryChunks
+
+def getTokenChunksList(aryTexts: list, intMaxTokens: int, intOverlap: int=0, strModel: str=None):
+    """
+    複数件のチャンク分割[同期処理](Split many texts into chunks [synchronous])
+
+    Returns:
+
+        list:テキストごとの[{text, tokens}]([{text, tokens}] per text)
+    """
+
+    return [getTokenChunks(strText, intMaxTokens, intOverlap, strModel) for strText in aryTexts]
+
+def getProcessPool():
+    """
+    トークン処理用プロセスプールの取得(Get the process pool for token work)
+
+    Returns:
+
+        object:ProcessPoolExecutor[無効の場合はNone](ProcessPoolExecutor [None when disabled])
+    """
+
+    global _objProcessPool
+
+    if TOKEN_PROCESSES <= 1:
+        return None
+
+    if _objProcessPool is None:
+        _objProcessPool = ProcessPoolExecutor(max_workers=TOKEN_PROCESSES)
+
+    return _objProcessPool
+
+async def execBatch(objFunc, aryTexts: list, *aryArgs):
+    """
+    一括処理の実行[件数が多い場合はプロセスプールへ分割](Run a batch function [split across the process pool when large])
+
+    少量はスレッドで実行する[tiktokenはGILを解放する](Small batches run on a thread [tiktoken releases the GIL])
+
+    Args:
+
+        objFunc (object): 一括処理の関数(batch function)
+
+        aryTexts (list): テキスト(texts)
+
+    Returns:
+
+        list:結果(results)
+    """
+
+    objLoop = asyncio.get_running_loop()
+
+    objProcessPool = getProcessPool() if len(aryTexts) > TOKEN_PROCESS_ROWS else None
+    if objProcessPool is None:
+        return await objLoop.run_in_executor(None, objFunc, aryTexts, *aryArgs)
+
+    aryParts = await asyncio.gather(*[
+        objLoop.run_in_executor(objProcessPool, objFunc, aryTexts[i:i + TOKEN_CHUNK_ROWS], *aryArgs)
+        for i in range(0, len(aryTexts), TOKEN_CHUNK_ROWS)
+    ])
+
+    return [objValue for aryPart in aryParts for objValue in aryPart]
+
+async def getTokenCounts(aryTexts, strModel: str=None):
+    """
+    複数件のトークン数の取得(Count tokens of many texts)
+
+    Args:
+
+        aryTexts (iterable): テキスト(texts)
+
+        strModel (str): モデル名(model name)
+
+    Returns:
+
+        list:トークン数(token counts)
+    """
+
+    # エンコーダーの読込エラーは呼び出し元で受ける(Encoder load errors surface in the caller)
+    getEncoder(strModel)
+
+    return await execBatch(getTokenCountList, list(aryTexts), strModel)
+
+async def getTokenChunkBatch(aryTexts, intMaxTokens: int, intOverlap: int=0, strModel: str=None):
+    """
+    複数件のチャンク分割(Split many texts into chunks)
+
+    Args:
+
+        aryTexts (iterable): テキスト(texts)
+
+        intMaxTokens (int): チャンクの最大トークン数(maximum tokens per chunk)
+
+        intOverlap (int): 前のチャンクと重ねるトークン数(tokens shared with the previous chunk)
+
+        strModel (str): モデル名(model name)
+
+    Returns:
+
+        list:テキストごとの[{text, tokens}]([{text, tokens}] per text)
+    """
+
+    if intMaxTokens <= 0 or not 0 <= intOverlap < intMaxTokens:
+        raise ValueError(f"invalid chunk size max_tokens:{intMaxTokens} overlap:{intOverlap}")
+
+    getEncoder(strModel)
+
+    return await execBatch(getTokenChunksList, list(aryTexts), intMaxTokens, intOverlap, strModel)
+
+def shutdownTokenPool():
+    """
+    トークン処理用プロセスプールの停止(Stop the token process pool)
+    """
+
+    global _objProcessPool
+
+    if _objProcessPool is not None:
+        _objProcessPool.shutdown(wait=True)
+        _objProcessPool = None
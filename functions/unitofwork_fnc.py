@@ -0,0 +1,413 @@
+import asyncio
+import itertools
+from contextvars import ContextVar
+
+from fastapi import Request
+
+# 共通ファンクションの読込(Reading common functions)
+from functions import querycache_fnc
+
+# 実行中のユニットオブワーク(unit of work in progress)
+_objUnitOfWork = ContextVar("unitofwork", default=None)
+
+class UnitOfWorkError(Exception):
+    """
+    ユニットオブワークの使い方の誤り(Misuse of a unit of work)
+    """
+
+class UnitOfWorkConnection:
+    """
+    ユニットオブワーク内でmysqlaio_fncの処理に渡す共有接続(Shared connection handed to mysqlaio_fnc helpers inside a unit of work)
+
+    処理側のbegin/commit/rollbackは、ユニットオブワークのトランザクション中はセーブポイントになり、
+    処理側がbeginしていないcommitは何もしない[トランザクションの確定はユニットオブワークが行う]
+    (A helper's begin/commit/rollback become savepoints while the unit of work has a transaction open,
+    and a commit without the helper's own begin does nothing [the unit of work commits])
+    """
+
+    def __init__(self, objUnitOfWork, conn):
+        self.objUnitOfWork = objUnitOfWork
+        self.conn = conn
+        self.aryLevels = []
+
+    def __getattr__(self, strName: str):
+        return getattr(self.conn, strName)
+
+    def cursor(self, *aryArgs, **aryKwargs):
+        return self.conn.cursor(*aryArgs, **aryKwargs)
+
+    async def begin(self):
+        if self.objUnitOfWork.blnTransaction:
+            strSavepoint = await self.objUnitOfWork.execSavepoint()
+            self.aryLevels.append(strSavepoint)
+        else:
+            await self.conn.begin()
+            self.aryLevels.append(None)
+
+    async def commit(self):
+        if not self.aryLevels:
+            if not self.objUnitOfWork.blnTransaction:
+                await self.conn.commit()
+            return
+
+        strSavepoint = self.aryLevels.pop()
+        if strSavepoint is None:
+            await self.conn.commit()
+        else:
+            await self.objUnitOfWork.execSql(f"RELEASE SAVEPOINT {strSavepoint}")
+
+    async def rollback(self):
+        if not self.aryLevels:
+            self.objUnitOfWork.blnTransaction = False
+            await self.objUnitOfWork.execRollback(self.conn)
+            return
+
+        strSavepoint = self.aryLevels.pop()
+        if strSavepoint is None:
+            await self.conn.rollback()
+        else:
+            await self.objUnitOfWork.execSql(f"ROLLBACK TO SAVEPOINT {strSavepoint}")
+            await self.objUnitOfWork.execSql(f"RELEASE SAVEPOINT {strSavepoint}")
+
+    def close(self):
+        # 読み残し等で閉じた接続は以降使わない(A connection closed e.g. with unread results is not used again)
+        self.conn.close()
+
+class UnitOfWork:
+    """
+    1つの接続を共有する処理のまとまり(Unit of work sharing one connection)
+
+    async with の中では、同じプールを渡したmysqlaio_fncのgetQuery・execQuery等が同じ接続を使う。
+    接続は最初のクエリで取得し、終了時にプールへ戻す。読込もレプリカではなくこの接続で行う
+    (Inside async with, mysqlaio_fnc getQuery, execQuery etc. given the same pool use the same connection.
+    It is acquired on the first query and returned to the pool at the end. Reads use it too instead of the replica)
+
+    使い方(usage):
+        async with unitofwork_fnc.UnitOfWork(db_pool) as objUnitOfWork:
+            await objUnitOfWork.begin()
+            await mysqlaio_fnc.execQuery(db_pool, ...)
+            async with objUnitOfWork.getSavepoint():
+                await mysqlaio_fnc.execQuery(db_pool, ...)
+            await objUnitOfWork.commit()
+
+    終了時にトランザクションが残っていれば、例外の場合はrollback、それ以外はcommitする。
+    トランザクション中に更新したテーブルのクエリキャッシュは確定後に無効化し、取消した場合は無効化しない。
+    トランザクション中に接続が閉じられた場合はUnitOfWorkErrorとなる。mysqlaio_fnc.getStreamQueryはブロック内では使えない。
+    同時に実行したクエリは順に実行される。ブロック内で db_pool.acquire() を直接使う場合、その接続を持ったままmysqlaio_fncを呼ぶと待ち続ける
+    (A transaction still open at the end is rolled back on an exception and committed otherwise.
+    Query cache entries of tables written in a transaction are invalidated after the commit, and not at all on a rollback.
+    A connection closed during the transaction raises UnitOfWorkError. mysqlaio_fnc.getStreamQuery cannot be used inside the block.
+    Concurrent queries run one after another. Calling mysqlaio_fnc while holding a connection from db_pool.acquire() inside the block waits forever)
+    """
+
+    def __init__(self, objDbPool):
+        self.objDbPool = objDbPool
+        self.conn = None
+        self.objLock = asyncio.Lock()
+        self.blnTransaction = False
+        self.blnClosed = False
+        self.objParent = None
+        self.objToken = None
+        self.objSavepointSeq = itertools.count(1)
+        self.aryInvalidateTables = set()
+        self.blnInvalidateAll = False
+
+    async def getConnection(self):
+        """
+        共有接続の取得[最初の呼出しでプールから取得](Get the shared connection [acquired from the pool on first call])
+
+        Returns:
+
+            object:UnitOfWorkConnection
+        """
+
+        if self.blnClosed:
+            raise UnitOfWorkError("unit of work is already finished")
+
+        # 閉じられた接続はトランザクション外なら取り直す(A closed connection is replaced when no transaction is open)
+        if self.conn is not None and self.conn.conn.closed and not self.blnTransaction:
+            conn = self.conn.conn
+            self.conn = None
+            await self.objDbPool.release(conn)
+
+        if self.conn is None:
+            self.conn = UnitOfWorkConnection(self, await self.objDbPool.getConnection())
+
+        return self.conn
+
+    async def getLockedConnection(self):
+        """
+        共有接続の取得と排他[setUnlockで解除](Get the shared connection exclusively [released by setUnlock])
+        """
+
+        await self.objLock.acquire()
+        try:
+            return await self.getConnection()
+        except BaseException:
+            self.objLock.release()
+            raise
+
+    def setUnlock(self):
+        self.objLock.release()
+
+    async def execSql(self, strSql: str):
+        async with self.conn.cursor() as cur:
+            await cur.execute(strSql)
+
+    async def execSavepoint(self):
+        strSavepoint = f"uow_{next(self.objSavepointSeq)}"
+        await self.execSql(f"SAVEPOINT {strSavepoint}")
+
+        return strSavepoint
+
+    def setInvalidateTables(self, aryTables):
+        """
+        確定後にキャッシュを無効化するテーブルの記録(Record tables whose cache is invalidated after the commit)
+
+        Args:
+
+            aryTables (iterable): テーブル名(table names)
+        """
+
+        self.aryInvalidateTables.update(aryTables)
+
+    def setInvalidateSql(self, strSql: str):
+        """
+        確定後にキャッシュを無効化する更新SQLの記録[テーブル名が取れない場合は全件](Record an update SQL whose cache is invalidated after the commit [everything if its tables cannot be parsed])
+
+        Args:
+
+            strSql (str): sql
+        """
+
+        aryTables = querycache_fnc.getSqlTables(strSql)
+        if aryTables:
+            self.aryInvalidateTables.update(aryTables)
+        else:
+            self.blnInvalidateAll = True
+
+    def setDiscardInvalidate(self):
+        self.aryInvalidateTables = set()
+        self.blnInvalidateAll = False
+
+    async def execCommit(self, conn):
+        # 確定に失敗した場合も結果が不明なため無効化する(Invalidate even when the commit fails, its outcome is unknown)
+        try:
+            await conn.commit()
+        finally:
+            aryTables = self.aryInvalidateTables
+            blnInvalidateAll = self.blnInvalidateAll
+            self.setDiscardInvalidate()
+            if blnInvalidateAll:
+                querycache_fnc.setClearQueryCache()
+            elif aryTables:
+                querycache_fnc.setInvalidateTables(aryTables)
+
+    async def execRollback(self, conn):
+        # 取消した変更のキャッシュは無効化しない(Cache is not invalidated for rolled back changes)
+        self.setDiscardInvalidate()
+        await conn.rollback()
+
+    async def begin(self):
+        """
+        トランザクションの開始(Begin a transaction)
+
+        Raises:
+
+            UnitOfWorkError: トランザクション中[入れ子はgetSavepointを使う](a transaction is already open [use getSavepoint to nest])
+        """
+
+        if self.blnTransaction:
+            raise UnitOfWorkError("transaction already open, use getSavepoint() to nest")
+
+        async with self.objLock:
+            conn = await self.getConnection()
+            await conn.conn.begin()
+            self.blnTransaction = True
+
+    async def commit(self):
+        """
+        トランザクションの確定(Commit the transaction)
+
+        Raises:
+
+            UnitOfWorkError: トランザクション中に接続が閉じられた(the connection was closed during the transaction)
+        """
+
+        if not self.blnTransaction:
+            raise UnitOfWorkError("no transaction open")
+
+        async with self.objLock:
+            self.blnTransaction = False
+            if self.conn.conn.closed:
+                self.setDiscardInvalidate()
+                raise UnitOfWorkError("connection was closed during the transaction, changes were not committed")
+            await self.execCommit(self.conn.conn)
+
+    async def rollback(self):
+        """
+        トランザクションの取消(Roll back the transaction)
+        """
+
+        if not self.blnTransaction:
+            raise UnitOfWorkError("no transaction open")
+
+        async with self.objLock:
+            self.blnTransaction = False
+            await self.execRollback(self.conn.conn)
+
+    def getSavepoint(self):
+        """
+        セーブポイント[例外の場合はそこまで取消](Savepoint [rolled back to on an exception])
+
+        使い方(usage): async with objUnitOfWork.getSavepoint(): ...
+
+        Returns:
+
+            object:async with で使うセーブポイント(savepoint for async with)
+        """
+
+        return Savepoint(self)
+
+    async def __aenter__(self):
+        objCurrent = _objUnitOfWork.get()
+        if objCurrent is not None and not objCurrent.blnClosed and objCurrent.objDbPool is self.objDbPool:
+            # 同じプールの入れ子は外側の接続を使う(Nested on the same pool uses the outer connection)
+            self.objParent = objCurrent
+            return objCurrent
+
+        self.objToken = _objUnitOfWork.set(self)
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        if self.objParent is not None:
+            return
+
+        _objUnitOfWork.reset(self.objToken)
+        self.blnClosed = True
+        if self.conn is None:
+            return
+
+        conn = self.conn.conn
+        try:
+            if self.blnTransaction:
+                self.blnTransaction = False
+                if conn.closed:
+                    # 切断された接続の変更はサーバ側で取消済み(changes on a dropped connection were rolled back by the server)
+                    self.setDiscardInvalidate()
+                    if exc_type is None:
+                        raise UnitOfWorkError("connection was closed during the transaction, changes were not committed")
+                elif exc_type is None:
+                    await self.execCommit(conn)
+                else:
+                    await self.execRollback(conn)
+        finally:
+            self.conn = None
+            await self.objDbPool.release(conn)
+
+class Savepoint:
+    """
+    UnitOfWork.getSavepoint()の戻り値(Return value of UnitOfWork.getSavepoint())
+    """
+
+    def __init__(self, objUnitOfWork):
+        self.objUnitOfWork = objUnitOfWork
+        self.strName = None
+
+    async def __aenter__(self):
+        if not self.objUnitOfWork.blnTransaction:
+            raise UnitOfWorkError("savepoints need an open transaction, call begin() first")
+
+        async with self.objUnitOfWork.objLock:
+            await self.objUnitOfWork.getConnection()
+            self.strName = await self.objUnitOfWork.execSavepoint()
+
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        async with self.objUnitOfWork.objLock:
+            if exc_type is not None:
+                await self.objUnitOfWork.execSql(f"ROLLBACK TO SAVEPOINT {self.strName}")
+            await self.objUnitOfWork.execSql(f"RELEASE SAVEPOINT {self.strName}")
+
+def getUnitOfWork(objDbPool):
+    """
+    プールに対して実行中のユニットオブワークの取得(Get the unit of work in progress for a pool)
+
+    Args:
+
+        objDbPool (object): コネクションプーリング
+
+    Returns:
+
+        object:UnitOfWork[無い場合はNone](UnitOfWork [None if there is none])
+    """
+
+    objUnitOfWork = _objUnitOfWork.get()
+    if objUnitOfWork is None or objUnitOfWork.blnClosed or objUnitOfWork.objDbPool is not objDbPool:
+        return None
+
+    return objUnitOfWork
+
+def isInTransaction(objDbPool):
+    """
+    ユニットオブワークのトランザクション中か判定(Check whether a unit of work transaction is open)
+    """
+
+    objUnitOfWork = getUnitOfWork(objDbPool)
+
+    return objUnitOfWork is not None and objUnitOfWork.blnTransaction
+
+def setInvalidateSql(objDbPool, strSql: str):
+    """
+    更新SQLが触れるテーブルのキャッシュを無効化[トランザクション中は確定後](Invalidate the cache of the tables an update SQL touches [after the commit inside a transaction])
+
+    Args:
+
+        objDbPool (object): コネクションプーリング
+
+        strSql (str): sql
+    """
+
+    objUnitOfWork = getUnitOfWork(objDbPool)
+    if objUnitOfWork is not None and objUnitOfWork.blnTransaction:
+        objUnitOfWork.setInvalidateSql(strSql)
+    else:
+        querycache_fnc.setInvalidateSql(strSql)
+
+def setInvalidateTables(objDbPool, aryTables):
+    """
+    テーブル名によるキャッシュの無効化[トランザクション中は確定後](Invalidate cache entries by table name [after the commit inside a transaction])
+
+    Args:
+
+        objDbPool (object): コネクションプーリング
+
+        aryTables (iterable): テーブル名["db.table"形式可](table names ["db.table" allowed])
+    """
+
+    objUnitOfWork = getUnitOfWork(objDbPool)
+    if objUnitOfWork is not None and objUnitOfWork.blnTransaction:
+        objUnitOfWork.setInvalidateTables(aryTables)
+    else:
+        querycache_fnc.setInvalidateTables(aryTables)
+
+async def getRequestUnitOfWork(request: Request):
+    """
+    リクエスト単位のユニットオブワーク[FastAPIの依存関数](Request-scoped unit of work [FastAPI dependency])
+
+    scope="function"を指定し、レスポンス送信前に確定させる。既定のscope="request"ではレスポンス送信後にcommitされ、
+    失敗してもクライアントには成功が返る[指定しない場合はreturn前にobjUnitOfWork.commit()を呼ぶ]
+    (Declare it with scope="function" so it commits before the response is sent. With the default scope="request" the commit
+    runs after the response and a failed commit still reaches the client as a success [otherwise call objUnitOfWork.commit() before returning])
+
+    使い方(usage):
+        async def post_order(objUnitOfWork=Depends(unitofwork_fnc.getRequestUnitOfWork, scope="function"), db_pool=Depends(getDbPool)):
+
+    Yields:
+
+        object:UnitOfWork
+    """
+
+    async with UnitOfWork(request.app.state.db_pool) as objUnitOfWork:
+        yield objUnitOfWork
@@ -0,0 +1,723 @@
+import os
+import re
+import json
+import fcntl
+import asyncio
+import threading
+
+import numpy as np
+
+# 共通ファンクションの読込(Reading common functions)
+from functions import log_fnc
+
+# ベクトルストアの保存先(vector store directory)
+VECTOR_DIR = os.getenv("VECTOR_DIR", os.path.join(os.getcwd(), "files", "vector"))
+
+# 検索時に一度に読むベクトル数(vectors read per block when searching)
+VECTOR_BLOCK_ROWS = int(os.getenv("VECTOR_BLOCK_ROWS", "65536"))
+
+# 削除済みの割合がこれを超えると圧縮(compact when the deleted ratio exceeds this)
+VECTOR_COMPACT_RATIO = float(os.getenv("VECTOR_COMPACT_RATIO", "0.25"))
+
+# 圧縮を行う最小の削除件数(minimum deleted rows before compacting)
+VECTOR_COMPACT_MIN_ROWS = int(os.getenv("VECTOR_COMPACT_MIN_ROWS", "1000"))
+
+# IVFで探索するリスト数の既定値(default number of IVF lists probed)
+VECTOR_IVF_PROBE = int(os.getenv("VECTOR_IVF_PROBE", "16"))
+
+# 作成できるストアの最大数[プロセスが開くストア数の上限にもなる](maximum number of stores [also bounds the stores a process keeps open])
+VECTOR_MAX_STORES = int(os.getenv("VECTOR_MAX_STORES", "64"))
+
+# ストア名に使える文字(characters allowed in a store name)
+_objNamePattern = re.compile(r'^[A-Za-z0-9_\-]{1,64}$')
+
+# ストア名ごとのインスタンス(instances per store name)
+_aryStores = {}
+_objStoresLock = threading.Lock()
+
+class VectorError(Exception):
+    """
+    ベクトルストアのエラー(Vector store error)
+    """
+
+class VectorNotFoundError(VectorError):
+    """
+    存在しないストア(Store does not exist)
+    """
+
+class VectorLimitError(VectorError):
+    """
+    ストア数の上限超過(Too many stores)
+    """
+
+class VectorStore:
+    """
+    メモリマップしたfloat32ファイルによるベクトルストア(Vector store on a memory-mapped float32 file)
+
+    ファイル構成(files):
+
+        header.json: 次元数・距離・世代・IVF情報(dimension, metric, generation, IVF info)
+
+        vectors.<世代>.f32: 行×次元のfloat32(rows x dim float32)
+
+        rows.<世代>.jsonl: 追加{"r","id","m"}・削除{"d"}のログ(log of adds {"r","id","m"} and deletes {"d"})
+
+        ivf.<世代>.npz: 重心・リスト順の行番号(centroids and row numbers in list order)
+
+    行列はメモリマップで参照しRAMへは読込まない。更新はファイルロックで直列化し、他プロセスの更新はログの差分で反映する
+    (The matrix is memory-mapped, never loaded into RAM. Writes are serialized by a file lock and other processes' writes are replayed from the log)
+    """
+
+    def __init__(self, strPath: str, intDim: int=None, strMetric: str="cosine"):
+        if strMetric not in ("cosine", "dot"):
+            raise VectorError(f"unknown metric {strMetric}")
+
+        self.strPath = strPath
+        self.objLock = threading.RLock()
+        os.makedirs(strPath, exist_ok=True)
+        self.intLockFd = os.open(os.path.join(strPath, ".lock"), os.O_RDWR | os.O_CREAT, 0o600)
+
+        with self.getFileLock():
+            objHeader = self.getHeader()
+            if objHeader is None:
+                objHeader = {"dim": intDim, "metric": strMetric, "generation": 0, "ivf": None}
+                self.setHeader(objHeader)
+
+        self.setReset(objHeader)
+        self.refresh()
+
+    def getFileLock(self):
+        return _FileLock(self.intLockFd)
+
+    def getHeader(self):
+        try:
+            with open(os.path.join(self.strPath, "header.json"), "r") as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def setHeader(self, objHeader: dict):
+        strTemp = os.path.join(self.strPath, "header.json.tmp")
+        with open(strTemp, "w") as f:
+            json.dump(objHeader, f)
+        os.replace(strTemp, os.path.join(self.strPath, "header.json"))
+
+    def getFileName(self, strKind: str, intGeneration: int=None):
+        intGeneration = self.intGeneration if intGeneration is None else intGeneration
+        return os.path.join(self.strPath, {"vectors": f"vectors.{intGeneration}.f32", "rows": f"rows.{intGeneration}.jsonl", "ivf": f"ivf.{intGeneration}.npz"}[strKind])
+
+    def setReset(self, objHeader: dict):
+        """
+        ヘッダーの世代で状態を初期化(Reset the in-memory state to the header's generation)
+        """
+
+        self.intDim = objHeader["dim"]
+        self.strMetric = objHeader["metric"]
+        self.intGeneration = objHeader["generation"]
+        self.objIvfInfo = objHeader.get("ivf")
+        self.objIvf = None
+        self.intRows = 0
+        self.intDeleted = 0
+        self.intLogOffset = 0
+        self.aryIds = []
+        self.aryMetadata = []
+        self.aryRowById = {}
+        self.aryAlive = np.zeros(1024, dtype=bool)
+        self.objMatrix = None
+
+    def refresh(self):
+        """
+        他プロセスの更新の反映[ログの差分のみ読込む](Apply updates from other processes [only new log lines are read])
+        """
+
+        with self.objLock:
+            objHeader = self.getHeader()
+            if objHeader["generation"] != self.intGeneration or objHeader["dim"] != self.intDim:
+                self.setReset(objHeader)
+            elif objHeader.get("ivf") != self.objIvfInfo:
+                self.objIvfInfo = objHeader.get("ivf")
+                self.objIvf = None
+
+            try:
+                with open(self.getFileName("rows"), "rb") as f:
+                    f.seek(self.intLogOffset)
+                    bytLog = f.read()
+            except FileNotFoundError:
+                bytLog = b""
+
+            # 書込み途中の最終行は次回に読む(A partially written last line is read next time)
+            intEnd = bytLog.rfind(b"\n") + 1
+            if intEnd == 0:
+                return
+            self.intLogOffset += intEnd
+
+            # 1回のjson.loadsで読込む(Parsed with a single json.loads)
+            for objOp in json.loads(b"[" + bytLog[:intEnd - 1].replace(b"\n", b",") + b"]"):
+                if "d" in objOp:
+                    intRow = objOp["d"]
+                    if self.aryAlive[intRow]:
+                        self.aryAlive[intRow] = False
+                        del self.aryRowById[self.aryIds[intRow]]
+                        self.aryMetadata[intRow] = None
+                        self.intDeleted += 1
+                else:
+                    intRow = objOp["r"]
+                    if intRow >= len(self.aryAlive):
+                        self.aryAlive = np.concatenate([self.aryAlive, np.zeros(max(intRow + 1, len(self.aryAlive)), dtype=bool)])
+                    self.aryIds.append(objOp["id"])
+                    self.aryMetadata.append(objOp.get("m"))
+                    self.aryRowById[objOp["id"]] = intRow
+                    self.aryAlive[intRow] = True
+                    self.intRows = intRow + 1
+
+            if self.intRows and (self.objMatrix is None or self.objMatrix.shape[0] != self.intRows):
+                self.objMatrix = np.memmap(self.getFileName("vectors"), dtype=np.float32, mode="r", shape=(self.intRows, self.intDim))
+
+    def getNormalized(self, aryVectors):
+        """
+        float32の2次元配列への変換[cosineの場合は正規化](Convert to a 2-D float32 array [normalized for cosine])
+        """
+
+        aryVectors = np.asarray(aryVectors, dtype=np.float32)
+        if aryVectors.ndim == 1:
+            aryVectors = aryVectors[None, :]
+        if aryVectors.ndim != 2 or (self.intDim is not None and aryVectors.shape[1] != self.intDim):
+            raise VectorError(f"vectors must have dimension {self.intDim} (got shape {aryVectors.shape})")
+
+        if self.strMetric == "cosine":
+            aryNorms = np.linalg.norm(aryVectors, axis=1, keepdims=True)
+            aryVectors = aryVectors / np.where(aryNorms == 0, 1, aryNorms)
+
+        return np.ascontiguousarray(aryVectors, dtype=np.float32)
+
+    def upsert(self, aryIds: list, aryVectors, aryMetadata: list=None):
+        """
+        ベクトルの追加・置換[既存のIDは削除して追加](Add or replace vectors [existing ids are deleted then added])
+
+        Args:
+
+            aryIds (list): ID(ids)
+
+            aryVectors (array): ベクトル[件数×次元](vectors [count x dim])
+
+            aryMetadata (list): メタデータ[省略可](metadata [optional])
+
+        Returns:
+
+            int:追加した件数(rows added)
+        """
+
+        aryIds = [str(strId) for strId in aryIds]
+        if aryMetadata is None:
+            aryMetadata = [None] * len(aryIds)
+
+        # 次元数を決める前に確認する(Checked before the dimension is fixed)
+        aryVectors = getCheckedVectors(aryIds, aryVectors, aryMetadata)
+        if not aryIds:
+            return 0
+
+        with self.objLock, self.getFileLock():
+            self.refresh()
+
+            if self.intDim is None:
+                objHeader = self.getHeader()
+                objHeader["dim"] = int(aryVectors.shape[1])
+                self.setHeader(objHeader)
+                self.refresh()
+
+            aryVectors = self.getNormalized(aryVectors)
+
+            # 同じIDが複数ある場合は最後を使う(The last one wins for duplicated ids)
+            aryLast = {strId: i for i, strId in enumerate(aryIds)}
+            aryIndex = sorted(aryLast.values())
+
+            aryLines = [json.dumps({"d": self.aryRowById[strId]}) for strId in aryLast if strId in self.aryRowById]
+            for j, i in enumerate(aryIndex):
+                aryLines.append(json.dumps({"r": self.intRows + j, "id": aryIds[i], "m": aryMetadata[i]}, ensure_ascii=False))
+
+            # ベクトルを書いてからログを追記[ログにない行は次の書込みで上書き](Write vectors before the log [rows not in the log are overwritten next time])
+            with open(self.getFileName("vectors"), "ab") as f:
+                f.truncate(self.intRows * self.intDim * 4)
+                f.write(aryVectors[aryIndex].tobytes())
+            with open(self.getFileName("rows"), "a", encoding="utf-8") as f:
+                f.write("\n".join(aryLines) + "\n")
+
+            self.refresh()
+
+        self.setCompactIfNeeded()
+
+        return len(aryIndex)
+
+    def delete(self, aryIds: list):
+        """
+        ベクトルの削除[削除済みの印を付ける](Delete vectors [marked as tombstones])
+
+        Args:
+
+            aryIds (list): ID(ids)
+
+        Returns:
+
+            int:削除した件数(rows deleted)
+        """
+
+        with self.objLock, self.getFileLock():
+            self.refresh()
+            aryRows = {self.aryRowById[str(strId)] for strId in aryIds if str(strId) in self.aryRowById}
+            if aryRows:
+                with open(self.getFileName("rows"), "a", encoding="utf-8") as f:
+                    f.write("".join(json.dumps({"d": intRow}) + "\n" for intRow in sorted(aryRows)))
+                self.refresh()
+
+        self.setCompactIfNeeded()
+
+        return len(aryRows)
+
+    def setCompactIfNeeded(self):
+        if self.intDeleted >= VECTOR_COMPACT_MIN_ROWS and self.intDeleted > self.intRows * VECTOR_COMPACT_RATIO:
+            self.compact()
+
+    def compact(self):
+        """
+        削除済みの行を除いて次の世代のファイルへ書き直す(Rewrite live rows into next-generation files)
+
+        IVFは行番号が変わるため破棄する(The IVF index is dropped since row numbers change)
+        """
+
+        with self.objLock, self.getFileLock():
+            self.refresh()
+            intGeneration = self.intGeneration + 1
+            aryLive = np.flatnonzero(self.aryAlive[:self.intRows])
+
+            with open(self.getFileName("vectors", intGeneration), "wb") as f:
+                for intStart in range(0, len(aryLive), VECTOR_BLOCK_ROWS):
+                    f.write(np.ascontiguousarray(self.objMatrix[aryLive[intStart:intStart + VECTOR_BLOCK_ROWS]]).tobytes())
+            with open(self.getFileName("rows", intGeneration), "w", encoding="utf-8") as f:
+                for j, intRow in enumerate(aryLive):
+                    f.write(json.dumps({"r": j, "id": self.aryIds[intRow], "m": self.aryMetadata[intRow]}, ensure_ascii=False) + "\n")
+
+            # ヘッダーの置換で新しい世代に切り替わる(Replacing the header switches to the new generation)
+            objHeader = self.getHeader()
+            objHeader["generation"] = intGeneration
+            objHeader["ivf"] = None
+            self.setHeader(objHeader)
+
+            intOldGeneration = self.intGeneration
+            self.refresh()
+            for strKind in ("vectors", "rows", "ivf"):
+                try:
+                    os.remove(self.getFileName(strKind, intOldGeneration))
+                except FileNotFoundError:
+                    pass
+
+            log_fnc.getOutputLog().info(f"ベクトルストア圧縮(vector store compacted) path:{self.strPath} rows:{len(aryLive)} generation:{intGeneration}")
+
+    def buildIvf(self, intLists: int=None, intIterations: int=10, intSample: int=100000, intSeed: int=0):
+        """
+        IVF[k-meansによる粗い分割]インデックスの作成(Build an IVF [coarse k-means partition] index)
+
+        作成後に追加された行は検索時に全件比較する(Rows added after the build are scanned exhaustively)
+
+        Args:
+
+            intLists (int): リスト数[省略時は4×√件数](number of lists [4 x sqrt(rows) if omitted])
+
+            intIterations (int): k-meansの繰り返し回数(k-means iterations)
+
+            intSample (int): 学習に使う件数(rows sampled for training)
+
+            intSeed (int): 乱数の種(random seed)
+
+        Returns:
+
+            dict:IVF情報(IVF info)
+        """
+
+        self.refresh()
+        with self.objLock:
+            intGeneration = self.intGeneration
+            intRows = self.intRows
+            objMatrix = self.objMatrix
+            aryLive = np.flatnonzero(self.aryAlive[:intRows])
+
+        if len(aryLive) == 0:
+            raise VectorError("vector store is empty")
+
+        intLists = max(1, min(intLists or int(4 * np.sqrt(len(aryLive))), len(aryLive)))
+        objRandom = np.random.default_rng(intSeed)
+
+        # 標本でk-means[内積で最も近い重心へ割当て](k-means on a sample [assigned to the centroid with the highest dot product])
+        arySample = np.sort(objRandom.choice(aryLive, size=min(len(aryLive), max(intSample, intLists)), replace=False))
+        aryTrain = np.ascontiguousarray(objMatrix[arySample])
+        aryCentroids = aryTrain[objRandom.choice(len(aryTrain), size=intLists, replace=False)].copy()
+        for _ in range(intIterations):
+            aryLabels = getNearestCentroid(aryTrain, aryCentroids)
+            aryCounts = np.bincount(aryLabels, minlength=intLists)
+            # ラベル順に並べて区間ごとに合計[np.add.atより速い](Sum per label over sorted rows [faster than np.add.at])
+            aryOrder = np.argsort(aryLabels, kind="stable")
+            aryUsed = np.flatnonzero(aryCounts)
+            arySums = np.zeros_like(aryCentroids)
+            arySums[aryUsed] = np.add.reduceat(aryTrain[aryOrder], np.searchsorted(aryLabels[aryOrder], aryUsed), axis=0)
+            aryEmpty = aryCounts == 0
+            aryCentroids = arySums / np.maximum(aryCounts, 1)[:, None]
+            aryCentroids[aryEmpty] = aryTrain[objRandom.choice(len(aryTrain), size=int(aryEmpty.sum()))]
+            if self.strMetric == "cosine":
+                aryNorms = np.linalg.norm(aryCentroids, axis=1, keepdims=True)
+                aryCentroids /= np.where(aryNorms == 0, 1, aryNorms)
+
+        # 全行の割当て[ブロック単位](Assign every row [block by block])
+        aryLabels = np.empty(intRows, dtype=np.int32)
+        for intStart in range(0, intRows, VECTOR_BLOCK_ROWS):
+            aryLabels[intStart:intStart + VECTOR_BLOCK_ROWS] = getNearestCentroid(objMatrix[intStart:intStart + VECTOR_BLOCK_ROWS], aryCentroids)
+        aryOrder = np.argsort(aryLabels, kind="stable").astype(np.int64)
+        aryOffsets = np.searchsorted(aryLabels[aryOrder], np.arange(intLists + 1)).astype(np.int64)
+
+        with self.objLock, self.getFileLock():
+            self.refresh()
+            if self.intGeneration != intGeneration:
+                raise VectorError("vector store was compacted while building the index")
+
+            np.savez(self.getFileName("ivf") + ".tmp.npz", centroids=aryCentroids.astype(np.float32), order=aryOrder, offsets=aryOffsets)
+            os.replace(self.getFileName("ivf") + ".tmp.npz", self.getFileName("ivf"))
+            objHeader = self.getHeader()
+            objHeader["ivf"] = {"lists": intLists, "rows": intRows}
+            self.setHeader(objHeader)
+            self.refresh()
+
+        return self.objIvfInfo
+
+    def getIvf(self):
+        if self.objIvfInfo is None:
+            return None
+        if self.objIvf is None:
+            with np.load(self.getFileName("ivf")) as objFile:
+                self.objIvf = (objFile["centroids"], objFile["order"], objFile["offsets"])
+        return self.objIvf
+
+    def search(self, aryQueries, intTopK: int=10, intProbe: int=None, blnExact: bool=False):
+        """
+        上位k件の検索(Top-k search)
+
+        IVFがある場合は近い重心のリストのみ、ない場合・blnExactの場合は全件をブロック単位の行列積で比較する
+        (Uses the closest IVF lists when an index exists, otherwise [or with blnExact] all rows via block-wise matrix products)
+
+        Args:
+
+            aryQueries (array): 検索ベクトル[件数×次元](query vectors [count x dim])
+
+            intTopK (int): 件数(k)
+
+            intProbe (int): 探索するIVFリスト数[省略時はVECTOR_IVF_PROBE](IVF lists probed [VECTOR_IVF_PROBE if omitted])
+
+            blnExact (bool): IVFを使わない(do not use IVF)
+
+        Returns:
+
+            list:検索ベクトルごとの[{id, score, metadata}]([{id, score, metadata}] per query)
+        """
+
+        self.refresh()
+        with self.objLock:
+            intRows = self.intRows
+            objMatrix = self.objMatrix
+            aryAlive = self.aryAlive[:intRows].copy()
+            objIvf = None if blnExact else self.getIvf()
+            objIvfInfo = self.objIvfInfo
+            aryIds = self.aryIds
+            aryMetadata = self.aryMetadata
+
+        if self.intDim is None:
+            return [[] for _ in range(len(np.atleast_2d(aryQueries)))]
+
+        aryQueries = self.getNormalized(aryQueries)
+        if intRows == 0 or intTopK <= 0:
+            return [[] for _ in range(len(aryQueries))]
+
+        if objIvf is None:
+            aryRows, aryScores = getExactTopK(objMatrix, aryAlive, aryQueries, intTopK, 0, intRows)
+        else:
+            aryRows, aryScores = getIvfTopK(objMatrix, aryAlive, aryQueries, intTopK, objIvf, objIvfInfo["rows"], intRows, intProbe or VECTOR_IVF_PROBE)
+
+        aryResult = []
+        for aryRow, aryScore in zip(aryRows, aryScores):
+            aryResult.append([
+                {"id": aryIds[intRow], "score": float(fltScore), "metadata": aryMetadata[intRow]}
+                for intRow, fltScore in zip(aryRow.tolist(), aryScore.tolist()) if intRow >= 0
+            ])
+
+        return aryResult
+
+    def getStats(self):
+        """
+        件数等の取得(Get counts)
+
+        Returns:
+
+            dict:dim/metric/rows/live/deleted/generation/ivf
+        """
+
+        self.refresh()
+
+        return {
+            "dim": self.intDim, "metric": self.strMetric, "rows": self.intRows, "live": self.intRows - self.intDeleted,
+            "deleted": self.intDeleted, "generation": self.intGeneration, "ivf": self.objIvfInfo,
+        }
+
+    def close(self):
+        self.objMatrix = None
+        os.close(self.intLockFd)
+
+class _FileLock:
+    """
+    プロセス間の排他ロック(Exclusive lock between processes)
+    """
+
+    def __init__(self, intFd: int):
+        self.intFd = intFd
+
+    def __enter__(self):
+        fcntl.flock(self.intFd, fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        fcntl.flock(self.intFd, fcntl.LOCK_UN)
+
+def getCheckedVectors(aryIds: list, aryVectors, aryMetadata: list=None):
+    """
+    追加するベクトルの確認(Check vectors to add)
+
+    Args:
+
+        aryIds (list): ID(ids)
+
+        aryVectors (array): ベクトル[件数×次元、1件の場合は1次元も可](vectors [count x dim, 1-D for a single vector])
+
+        aryMetadata (list): メタデータ[省略可](metadata [optional])
+
+    Returns:
+
+        array:float32の2次元配列(2-D float32 array)
+
+    Raises:
+
+        VectorError: 件数の不一致・2次元でない・次元数0・有限でない値(mismatched lengths, not 2-D, zero dimension or non-finite values)
+    """
+
+    try:
+        aryVectors = np.asarray(aryVectors, dtype=np.float32)
+    except (TypeError, ValueError) as e:
+        raise VectorError(f"vectors must be a 2-D array of numbers ({e})")
+
+    if aryVectors.ndim == 1 and aryVectors.size and len(aryIds) == 1:
+        aryVectors = aryVectors[None, :]
+    if not aryIds and aryVectors.size == 0:
+        return aryVectors.reshape(0, 0)
+
+    if aryVectors.ndim != 2 or aryVectors.shape[1] == 0:
+        raise VectorError(f"vectors must be a 2-D array with dimension above 0 (got shape {aryVectors.shape})")
+    if len(aryVectors) != len(aryIds) or (aryMetadata is not None and len(aryMetadata) != len(aryIds)):
+        raise VectorError("ids, vectors and metadata must have the same length")
+    if not np.isfinite(aryVectors).all():
+        raise VectorError("vectors must be finite")
+
+    return aryVectors
+
+def getNearestCentroid(aryVectors, aryCentroids):
+    """
+    内積が最大の重心の番号(Index of the centroid with the highest dot product)
+    """
+
+    return np.argmax(np.asarray(aryVectors, dtype=np.float32) @ aryCentroids.T, axis=1).astype(np.int32)
+
+def getMergeTopK(aryRows, aryScores, intTopK: int):
+    """
+    候補から上位k件を選ぶ[argpartition](Pick the top k from candidates [argpartition])
+
+    Args:
+
+        aryRows (array): 候補の行番号[検索ベクトル×候補](candidate rows [queries x candidates])
+
+        aryScores (array): 候補のスコア[検索ベクトル×候補](candidate scores [queries x candidates])
+
+        intTopK (int): 件数(k)
+
+    Returns:
+
+        tuple:(行番号, スコア)[未整列](rows, scores [unsorted])
+    """
+
+    if aryScores.shape[1] <= intTopK:
+        return aryRows, aryScores
+
+    aryIndex = np.argpartition(-aryScores, intTopK - 1, axis=1)[:, :intTopK]
+
+    return np.take_along_axis(aryRows, aryIndex, axis=1), np.take_along_axis(aryScores, aryIndex, axis=1)
+
+def getSortedTopK(aryRows, aryScores, intTopK: int):
+    """
+    スコア順に並べて上位k件にする[不足分は行番号-1](Sort by score and keep k [missing entries get row -1])
+    """
+
+    aryIndex = np.argsort(-aryScores, axis=1, kind="stable")[:, :intTopK]
+    aryRows = np.take_along_axis(aryRows, aryIndex, axis=1)
+    aryScores = np.take_along_axis(aryScores, aryIndex, axis=1)
+    aryRows[~np.isfinite(aryScores)] = -1
+
+    return aryRows, aryScores
+
+def getExactTopK(objMatrix, aryAlive, aryQueries, intTopK: int, intStart: int, intEnd: int):
+    """
+    全件比較による上位k件[ブロック単位の行列積](Exact top k [block-wise matrix products])
+
+    Returns:
+
+        tuple:(行番号, スコア)[検索ベクトル×k](rows, scores [queries x k])
+    """
+
+    intQueries = len(aryQueries)
+    aryBestRows = np.full((intQueries, 0), -1, dtype=np.int64)
+    aryBestScores = np.full((intQueries, 0), -np.inf, dtype=np.float32)
+
+    for intBlock in range(intStart, intEnd, VECTOR_BLOCK_ROWS):
+        intBlockEnd = min(intBlock + VECTOR_BLOCK_ROWS, intEnd)
+        aryScores = aryQueries @ np.asarray(objMatrix[intBlock:intBlockEnd]).T
+        aryScores[:, ~aryAlive[intBlock:intBlockEnd]] = -np.inf
+        aryRows = np.broadcast_to(np.arange(intBlock, intBlockEnd, dtype=np.int64), aryScores.shape)
+        aryRows, aryScores = getMergeTopK(aryRows, aryScores, intTopK)
+        aryBestRows, aryBestScores = getMergeTopK(
+            np.concatenate([aryBestRows, aryRows], axis=1), np.concatenate([aryBestScores, aryScores], axis=1), intTopK
+        )
+
+    return getSortedTopK(aryBestRows, aryBestScores, intTopK)
+
+def getIvfTopK(objMatrix, aryAlive, aryQueries, intTopK: int, objIvf, intIvfRows: int, intRows: int, intProbe: int):
+    """
+    IVFによる上位k件[近い重心のリストとIVF作成後の追加行を比較](IVF top k [closest lists plus rows added after the build])
+
+    Returns:
+
+        tuple:(行番号, スコア)[検索ベクトル×k](rows, scores [queries x k])
+    """
+
+    aryCentroids, aryOrder, aryOffsets = objIvf
+    intProbe = max(1, min(intProbe, len(aryCentroids)))
+    aryProbes = np.argpartition(-(aryQueries @ aryCentroids.T), intProbe - 1, axis=1)[:, :intProbe]
+
+    aryRowList = []
+    aryScoreList = []
+    for aryQuery, aryProbe in zip(aryQueries, aryProbes):
+        aryRows = np.sort(np.concatenate([aryOrder[aryOffsets[p]:aryOffsets[p + 1]] for p in aryProbe]))
+        aryRows = aryRows[aryAlive[aryRows]]
+        aryScores = np.asarray(objMatrix[aryRows]) @ aryQuery if len(aryRows) else np.empty(0, dtype=np.float32)
+        aryRows, aryScores = getMergeTopK(aryRows[None, :], aryScores[None, :], intTopK)
+        aryRowList.append(aryRows[0])
+        aryScoreList.append(aryScores[0])
+
+    # 各検索ベクトルの候補をk件にそろえる(Pad each query's candidates to k)
+    aryBestRows = np.full((len(aryQueries), intTopK), -1, dtype=np.int64)
+    aryBestScores = np.full((len(aryQueries), intTopK), -np.inf, dtype=np.float32)
+    for i, (aryRows, aryScores) in enumerate(zip(aryRowList, aryScoreList)):
+        aryBestRows[i, :len(aryRows)] = aryRows
+        aryBestScores[i, :len(aryScores)] = aryScores
+
+    if intIvfRows < intRows:
+        aryTailRows, aryTailScores = getExactTopK(objMatrix, aryAlive, aryQueries, intTopK, intIvfRows, intRows)
+        aryBestRows, aryBestScores = getMergeTopK(
+            np.concatenate([aryBestRows, aryTailRows], axis=1), np.concatenate([aryBestScores, aryTailScores], axis=1), intTopK
+        )
+
+    return getSortedTopK(aryBestRows, aryBestScores, intTopK)
+
+def getStoreCount():
+    """
+    保存先にあるストア数(Number of stores in the store directory)
+    """
+
+    try:
+        return sum(1 for objEntry in os.scandir(VECTOR_DIR) if os.path.exists(os.path.join(objEntry.path, "header.json")))
+    except FileNotFoundError:
+        return 0
+
+def getVectorStore(strName: str="default", intDim: int=None, strMetric: str="cosine", blnCreate: bool=False):
+    """
+    ストア名ごとのベクトルストア取得[プロセスごとに1つ](Get the vector store per name [one per process])
+
+    Args:
+
+        strName (str): ストア名(store name)
+
+        intDim (int): 次元数[新規作成時、省略時は最初の追加で決まる](dimension [on creation, taken from the first upsert if omitted])
+
+        strMetric (str): "cosine" または "dot"("cosine" or "dot")
+
+        blnCreate (bool): 存在しない場合は作成する(create the store if it does not exist)
+
+    Returns:
+
+        object:VectorStore
+
+    Raises:
+
+        VectorNotFoundError: 存在しないストア[blnCreate:False](the store does not exist [blnCreate:False])
+
+        VectorLimitError: ストア数がVECTOR_MAX_STORESに達した(the number of stores reached VECTOR_MAX_STORES)
+    """
+
+    if not _objNamePattern.match(strName):
+        raise VectorError(f"invalid store name {strName}")
+
+    with _objStoresLock:
+        objStore = _aryStores.get(strName)
+        if objStore is None:
+            strPath = os.path.join(VECTOR_DIR, strName)
+            if not os.path.exists(os.path.join(strPath, "header.json")):
+                if not blnCreate:
+                    raise VectorNotFoundError(f"vector store {strName} not found")
+                if getStoreCount() >= VECTOR_MAX_STORES:
+                    raise VectorLimitError(f"too many vector stores (max {VECTOR_MAX_STORES})")
+            elif len(_aryStores) >= VECTOR_MAX_STORES:
+                raise VectorLimitError(f"too many vector stores open (max {VECTOR_MAX_STORES})")
+            objStore = _aryStores[strName] = VectorStore(strPath, intDim, strMetric)
+
+    return objStore
+
+async def execUpsert(strName: str, aryIds: list, aryVectors, aryMetadata: list=None):
+    """
+    ベクトルの追加・置換[スレッドで実行、ストアが無ければ作成](Add or replace vectors [runs on a thread, creates the store if missing])
+    """
+
+    # 不正な入力ではストアを作らない(No store is created for invalid input)
+    aryVectors = getCheckedVectors(aryIds, aryVectors, aryMetadata)
+    if not aryIds:
+        return 0
+
+    objStore = getVectorStore(strName, blnCreate=True)
+
+    return await asyncio.get_running_loop().run_in_executor(None, objStore.upsert, aryIds, aryVectors, aryMetadata)
+
+async def execDelete(strName: str, aryIds: list):
+    """
+    ベクトルの削除[スレッドで実行](Delete vectors [runs on a thread])
+    """
+
+    objStore = getVectorStore(strName)
+
+    return await asyncio.get_running_loop().run_in_executor(None, objStore.delete, aryIds)
+
+async def getSearch(strName: str, aryQueries, intTopK: int=10, intProbe: int=None, blnExact: bool=False):
+    """
+    上位k件の検索[スレッドで実行、NumPyの行列積はGILを解放する](Top-k search [runs on a thread, NumPy matrix products release the GIL])
+    """
+
+    objStore = getVectorStore(strName)
+
+    return await asyncio.get_running_loop().run_in_executor(None, objStore.search, aryQueries, intTopK, intProbe, blnExact)
+
+async def execBuildIvf(strName: str, intLists: int=None):
+    """
+    IVFインデックスの作成[スレッドで実行](Build the IVF index [runs on a thread])
+    """
+
+    objStore = getVectorStore(strName)
+
+    return await asyncio.get_running_loop().run_in_executor(None, objStore.buildIvf, intLists)
@@ -0,0 +1,154 @@
+import asyncio
+import contextvars
+
+# 共通ファンクションの読込(Reading common functions)
+from functions import mysqlaio_fnc
+from functions import log_fnc
+
+# テーブルごとのバッファ(buffers per table)
+_aryBuffers = {}
+
+class WriteBehindBuffer:
+    """
+    追記専用テーブル向けの遅延書込みバッファ(Write-behind buffer for append-only tables)
+
+    個別の書込みをまとめ、件数または時間で一括INSERTする(Coalesces individual writes and bulk INSERTs them by size or time)
+    """
+
+    def __init__(self, objDbPool, strTable: str, aryColumns: list, intMaxRows: int=500, fltFlushInterval: float=1.0, intMaxPending: int=50000):
+        self.objDbPool = objDbPool
+        self.strTable = strTable
+        self.aryColumns = list(aryColumns)
+        self.intMaxRows = intMaxRows
+        self.fltFlushInterval = fltFlushInterval
+        self.intMaxPending = intMaxPending
+        self.aryRows = []
+        self.objFlushLock = asyncio.Lock()
+        self.objTask = None
+
+    def start(self):
+        """
+        定期書込みタスクの起動(Start the periodic flush task)
+
+        タスクはリクエストのコンテキストを引き継がない(The task does not inherit the request context)
+        """
+
+        if self.objTask is None:
+            self.objTask = asyncio.get_running_loop().create_task(self._execFlushLoop(), context=contextvars.Context())
+
+    async def add(self, aryRow):
+        """
+        書込み行の追加(Add a row to write)
+
+        intMaxRowsに達した場合のみ書込みを待つ。書込みは呼び出し元のコンテキストを引き継がないため、
+        ユニットオブワーク中でもその共有接続を使わず、ロールバックされても他のリクエストの行は失われない
+        (Waits for a write only when intMaxRows is reached. The write does not inherit the caller's context,
+        so inside a unit of work it does not use the shared connection, and a rollback cannot discard rows buffered by other requests)
+
+        Args:
+
+            aryRow (list|dict): カラム順の値のリストまたはカラム名をキーとする辞書(list of values in column order or dict keyed by column name)
+        """
+
+        self.start()
+
+        if isinstance(aryRow, dict):
+            aryRow = [aryRow.get(strColumn) for strColumn in self.aryColumns]
+        self.aryRows.append(aryRow)
+
+        if len(self.aryRows) >= self.intMaxRows:
+            # 呼び出し元が取消されても書込みは続ける(The write goes on even if the caller is cancelled)
+            objTask = asyncio.get_running_loop().create_task(self.flush(), context=contextvars.Context())
+            await asyncio.shield(objTask)
+
+    async def flush(self):
+        """
+        バッファの書込み(Flush the buffer)
+
+        Returns:
+
+            bool:成功:True 失敗:False(Success:True Failure:False)
+        """
+
+        async with self.objFlushLock:
+            if not self.aryRows:
+                return True
+
+            aryRows = self.aryRows
+            self.aryRows = []
+
+            aryIdRange = await mysqlaio_fnc.execBulkInsert(
+                self.objDbPool, f"WriteBehindBuffer:{self.strTable}", self.strTable, self.aryColumns, aryRows, self.intMaxRows
+            )
+            if aryIdRange is not False:
+                return True
+
+            # 失敗した行は上限までバッファへ戻す(Failed rows are put back into the buffer up to the limit)
+            self.aryRows = aryRows + self.aryRows
+            intDrop = len(self.aryRows) - self.intMaxPending
+            if intDrop > 0:
+                self.aryRows = self.aryRows[intDrop:]
+                log_fnc.getOutputLog().critical(f"遅延書込み破棄(write-behind rows dropped) table:{self.strTable} rows:{intDrop}")
+
+            return False
+
+    async def close(self):
+        """
+        定期書込みを停止し残りを書き込む(Stop the periodic flush and write the rest)
+        """
+
+        if self.objTask is not None:
+            self.objTask.cancel()
+            await asyncio.gather(self.objTask, return_exceptions=True)
+            self.objTask = None
+
+        await self.flush()
+
+    async def _execFlushLoop(self):
+        while True:
+            await asyncio.sleep(self.fltFlushInterval)
+            try:
+                await self.flush()
+            except Exception as e:
+                log_fnc.getOutputLog().critical(f"遅延書込み失敗(write-behind flush error) table:{self.strTable} Exception:{e}")
+
+def getWriteBehindBuffer(objDbPool, strTable: str, aryColumns: list, intMaxRows: int=500, fltFlushInterval: float=1.0):
+    """
+    テーブルの遅延書込みバッファ取得(Get the write-behind buffer of a table)
+
+    Args:
+
+        objDbPool (object): コネクションプーリング
+
+        strTable (str): テーブル名(table name)
+
+        aryColumns (list): カラム名のリスト(list of column names)
+
+        intMaxRows (int): 書込みを行う件数(rows that trigger a write)
+
+        fltFlushInterval (float): 書込み間隔[秒](write interval in seconds)
+
+    Returns:
+
+        object:WriteBehindBuffer
+    """
+
+    objBuffer = _aryBuffers.get(strTable)
+    if objBuffer is None:
+        objBuffer = WriteBehindBuffer(objDbPool, strTable, aryColumns, intMaxRows, fltFlushInterval)
+        _aryBuffers[strTable] = objBuffer
+
+    return objBuffer
+
+async def shutdownWriteBehindBuffers():
+    """
+    全バッファの終了処理(Shutdown of all buffers)
+
+    プールを閉じる前に呼び出す(Call before closing the pool)
+    """
+
+    aryBuffers = list(_aryBuffers.values())
+    _aryBuffers.clear()
+
+    for objBuffer in aryBuffers:
+        await objBuffer.close()
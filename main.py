@@ -3,17 +3,33 @@
 # docker exec -it python gunicorn -k uvicorn.workers.UvicornWorker --bind "0.0.0.0:8000" --reload main:app
 # appはFastAPI()を読み込んでる変数となる
 # --reloadはソースを変更した場合即時反映される
-# 本番orテスト起動方法
-# nohup uvicorn main:app --host 0.0.0.0
+# 本番orテスト起動方法[CPU数からワーカー数、DB接続数の上限からワーカーごとの接続数を決める。詳細はserve.py]
+# (production or test [workers from the CPU count, per-worker connections from the DB connection budget. See serve.py])
+# nohup python -m serve &
+# python -m serve restart
 import os
+import asyncio
+import importlib
 
 from fastapi import Depends, FastAPI, status, HTTPException, Security, Request
-from aiomysql import create_pool
+from fastapi.responses import PlainTextResponse
 from fastapi.security.api_key import APIKeyHeader, APIKey
 from starlette.status import HTTP_403_FORBIDDEN
 
-# エンドポイント管理(endpoint management)
-from routers import test
+# 共通ファンクションの読込(Reading common functions)
+from functions import gmo_fnc
+from functions import log_fnc
+from functions import context_fnc
+from functions import smtp_fnc
+from functions import writebehind_fnc
+from functions import metrics_fnc
+from functions import dbpool_fnc
+from functions import apikey_fnc
+from functions import ratelimit_fnc
+from functions import secure_fnc
+from functions import token_fnc
+from functions import response_fnc
+from functions import timing_fnc
 
 # 共通ユーティリティの読込(Reading common utilities)
 from util import util_cmn
@@ -22,6 +38,11 @@ from util import util_cmn
 from dotenv import load_dotenv
 load_dotenv()
 
+# 登録する機能ごとのルーター[カンマ区切り、既定はtestのみ。token,ingest,vector,embed,chatは指定した場合のみ読込む]
+# (Feature routers to register [comma separated, test only by default. token, ingest, vector, embed and chat are loaded only when listed])
+# 例(e.g.) APP_ROUTERS=test,token,ingest,vector,embed,chat
+APP_ROUTERS = [strName.strip() for strName in os.getenv("APP_ROUTERS", "test").split(",") if strName.strip()]
+
 # APIリクエストのヘッダーに認証情報Authorizationという名前のフィールドを追加し、
 # そのフィールドにAPIキーまたはトークンを設定
 # Falseに設定されている場合、認証情報がなくてもエラーは発生しません
@@ -43,48 +64,109 @@ async def get_api_key(
     db_pool=Depends(get_db_pool)
     ):
 
-    correct_key: str = getenv("getApikey")
-
-    if api_key_header in correct_key:
+    # メモリ上の認証キー一覧で判定(Verify against the in-memory key registry)
+    if await apikey_fnc.objApiKeyRegistry.verify(api_key_header):
         return api_key_header
     else:
         raise HTTPException(
-            status_code=HTTP_403_FORBIDDEN, detail=f"Could not validate credentials 1:{api_key_header} 2:{correct_key}"
+            status_code=HTTP_403_FORBIDDEN, detail="Could not validate credentials"
         )
 
+# APIキー・ルートごとのレート制限[ワーカー間で共有](Rate limit per API key and route [shared between workers])
+# 超過時は429とRetry-Afterを返す(Returns 429 with Retry-After when over the limit)
+async def check_rate_limit(
+    request: Request,
+    api_key: str = Depends(get_api_key)
+    ):
+
+    strRoute = getattr(request.scope.get("route"), "path", request.url.path)
+    ratelimit_fnc.setCheckRateLimit(api_key, strRoute)
+
+    return api_key
+
 # FastAPIアプリケーションのインスタンスを作成
 # Instantiate a FastAPI application
-app = FastAPI()
+# 既定のレスポンスはorjsonで変換[DB行のDecimal・日時・バイト列もそのまま返せる]
+# (Responses are rendered with orjson by default [Decimal, date/time and bytes in DB rows are handled])
+app = FastAPI(default_response_class=response_fnc.OrjsonResponse)
+
+# リクエストごとにクライアントIPをコンテキストへ設定(Store the client IP in the context per request)
+app.add_middleware(context_fnc.ClientIpMiddleware)
+
+# ルートごとのリクエスト時間を記録(Record request latency per route)
+app.add_middleware(metrics_fnc.RequestMetricsMiddleware)
+
+# 区間ごとの時間をServer-Timingで返し、対象のリクエストはlogs/profileへプロファイルを出力[SERVER_TIMING・SERVER_TIMING_TOKEN・PROFILE_SAMPLE_RATE]
+# (Return span timings as Server-Timing and write profiles of selected requests to logs/profile [SERVER_TIMING, SERVER_TIMING_TOKEN, PROFILE_SAMPLE_RATE])
+app.add_middleware(timing_fnc.ServerTimingMiddleware)
 
 # アプリケーションの起動時にデータベース接続プールを作成
 # Create database connection pool at application startup
 @app.on_event("startup")
 async def startup():
-    app.state.db_pool = await create_pool(
-        host=os.getenv("MYSQL_LOCALHOST"),
-        port=3306,
-        user=os.getenv("MYSQL_USER"),
-        password=os.getenv("MYSQL_PASSWORD"),
-        db=os.getenv("MYSQL_DB"),
-        autocommit=True,
-        minsize=1,
-        maxsize=10
-    )
+    # ログ設定は起動時に一度だけ行う(Logging is configured only once at startup)
+    log_fnc.setupLogging()
+
+    # 設定値でプールを作成しminsizeまで事前接続、レプリカがあれば読込用に作成
+    # (Create pools from settings, warmed up to minsize, plus a read replica if configured)
+    app.state.db_pool = await dbpool_fnc.createDbPool()
+
+    # 認証キーを読込み、定期的に再読込する(Load authentication keys and refresh them periodically)
+    await apikey_fnc.objApiKeyRegistry.start(app.state.db_pool)
+
+    # GMOエラーコードインデックスを事前構築(Prebuild the GMO error code index)
+    await asyncio.get_running_loop().run_in_executor(None, gmo_fnc.getGmoErrorIndex)
+
+    # チャット補完用の共有クライアントを作成[接続プールを再利用](Create the shared chat client [its connection pool is reused])
+    if "chat" in APP_ROUTERS:
+        from functions import chat_fnc
+        chat_fnc.setupChatClient()
 
 # アプリケーションの終了時にデータベース接続プールを閉じる
 # Close the database connection pool when closing the application
 @app.on_event("shutdown")
 async def shutdown():
+    # キューに残ったメールを送信してから停止(Send queued mails and then stop)
+    await smtp_fnc.shutdownMailDispatcher()
+
+    # 遅延書込みバッファはプールを閉じる前に書き出す(Flush write-behind buffers before closing the pool)
+    await writebehind_fnc.shutdownWriteBehindBuffers()
+
+    await apikey_fnc.objApiKeyRegistry.stop()
+
+    if "chat" in APP_ROUTERS:
+        from functions import chat_fnc
+        await chat_fnc.shutdownChatClient()
+
+    # 実行中の埋め込み取得を待ってキャッシュを閉じる(Wait for running embedding calls and close the cache)
+    if "embed" in APP_ROUTERS:
+        from functions import embed_fnc
+        await embed_fnc.shutdownEmbeddingService()
+
+    secure_fnc.shutdownSecureExecutor()
+    token_fnc.shutdownTokenPool()
+    util_cmn.shutdownCleanPool()
+
     app.state.db_pool.close()
     await app.state.db_pool.wait_closed()
 
+    # キューに残ったログを書き出して停止(Flush queued logs and stop)
+    log_fnc.shutdownLogging()
+
 # データベース接続プールを取得するための依存関数
 def get_db_pool(request: Request):
     return request.app.state.db_pool
 
 # Noneをわたすことで無効化できる(It can be disabled by handing over None)
 # app = FastAPI(docs_url=None, redoc_url=None, openapi_url=None)
-app.include_router(test.router, dependencies=[Depends(get_api_key)])
+# エンドポイント管理[有効なルーターのみ読込む](endpoint management [only enabled routers are imported])
+for strRouter in APP_ROUTERS:
+    app.include_router(importlib.import_module(f"routers.{strRouter}").router, dependencies=[Depends(check_rate_limit)])
+
+# Prometheusテキスト形式のメトリクス(Metrics in Prometheus text format)
+@app.get("/metrics", include_in_schema=False)
+async def metrics():
+    return PlainTextResponse(metrics_fnc.getPrometheusText(), media_type="text/plain; version=0.0.4; charset=utf-8")
 
 # @app.get('/')から始まる関数をPath operation 関数(Path operation function for functions starting with @app.get('/'))
 # GETで引数を指定する場合は{}で指定する(When specifying arguments in GET, use {})
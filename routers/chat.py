@@ -0,0 +1,53 @@
+from typing import List, Optional
+from pydantic import BaseModel
+from fastapi import APIRouter, status, HTTPException
+from fastapi.responses import StreamingResponse
+
+# 機能の切り出しはfunctionディレクトリに作成
+from functions import chat_fnc
+from functions import response_fnc
+
+# エンドポイント管理
+router = APIRouter(route_class=response_fnc.OrjsonRoute)
+
+class ChatMessage(BaseModel):
+    role: str
+    content: str
+
+class ChatRequest(BaseModel):
+    messages: List[ChatMessage]
+    model: Optional[str] = None
+    temperature: Optional[float] = None
+    max_tokens: Optional[int] = None
+    stream: bool = True
+
+@router.post("/v1/chat/completions", status_code=status.HTTP_200_OK, tags=['chat REST API'])
+async def post_v1_chat_completions(objRequest: ChatRequest):
+    """
+    チャット補完[stream:trueの場合はServer-Sent Eventsでトークンごとに返す](Chat completion [streamed token by token as Server-Sent Events when stream is true])
+
+    同じ内容の同時リクエストは上流の呼び出しを共有し、全員が切断すると上流を取り消す
+    (Concurrent identical requests share one upstream call, which is cancelled once every caller has disconnected)
+    """
+
+    if not objRequest.messages:
+        raise HTTPException(status_code=422, detail="messages must not be empty")
+
+    try:
+        aryEvents = chat_fnc.getChatEvents(
+            [objMessage.model_dump() for objMessage in objRequest.messages], objRequest.model,
+            {"temperature": objRequest.temperature, "max_tokens": objRequest.max_tokens}
+        )
+    except chat_fnc.ChatError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+
+    if not objRequest.stream:
+        try:
+            return await chat_fnc.getChatText(aryEvents)
+        except chat_fnc.ChatError as e:
+            raise HTTPException(status_code=502, detail=str(e))
+
+    return StreamingResponse(
+        chat_fnc.getSseStream(aryEvents), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
@@ -0,0 +1,39 @@
+import os
+
+from typing import List, Optional
+from pydantic import BaseModel
+from fastapi import APIRouter, status, HTTPException
+
+# 機能の切り出しはfunctionディレクトリに作成
+from functions import embed_fnc
+from functions import response_fnc
+
+# 1リクエストで受け付ける最大件数(maximum texts per request)
+EMBED_MAX_DOCUMENTS = int(os.getenv("EMBED_MAX_DOCUMENTS", "10000"))
+
+# エンドポイント管理
+router = APIRouter(route_class=response_fnc.OrjsonRoute)
+
+class EmbeddingRequest(BaseModel):
+    documents: List[str]
+    model: Optional[str] = None
+
+@router.post("/v1/embeddings", status_code=status.HTTP_200_OK, tags=['embedding REST API'])
+async def post_v1_embeddings(objRequest: EmbeddingRequest):
+    """
+    文書ごとの埋め込み[キャッシュ済みは提供元を呼ばない](Embedding per document [cached ones skip the provider])
+    """
+
+    if len(objRequest.documents) > EMBED_MAX_DOCUMENTS:
+        raise HTTPException(
+            status_code=413, detail=f"too many documents (max {EMBED_MAX_DOCUMENTS})"
+        )
+
+    try:
+        aryVectors = await embed_fnc.getEmbeddings(objRequest.documents, objRequest.model)
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+    except Exception as e:
+        raise HTTPException(status_code=502, detail=f"embedding provider error: {e}")
+
+    return {"model": objRequest.model or embed_fnc.EMBED_DEFAULT_MODEL, "embeddings": aryVectors.tolist()}
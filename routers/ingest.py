@@ -0,0 +1,40 @@
+import codecs
+
+from fastapi import APIRouter, status, HTTPException, Request
+
+# 機能の切り出しはfunctionディレクトリに作成
+from functions import ingest_fnc
+from functions import response_fnc
+
+# エンドポイント管理
+router = APIRouter(route_class=response_fnc.OrjsonRoute)
+
+@router.post("/v1/ingest", status_code=status.HTTP_200_OK, tags=['ingest REST API'])
+async def post_v1_ingest(
+    request: Request,
+    encoding: str = "utf-8",
+    chunk_size: int = 2000,
+    overlap: int = 0,
+    stitch: bool = False,
+    clean: bool = True
+    ):
+    """
+    アップロードされたテキストをチャンクに分割してNDJSONで返す(Split uploaded text into chunks returned as NDJSON)
+
+    リクエストボディをそのまま読込むため、一時ファイルへの保存は行わない
+    (The request body is read as it arrives, nothing is spooled to a temporary file)
+
+    stitch:Trueの場合、前の行の末尾と重複する行の先頭を除去して結合する(When stitch is true, the start of a line that repeats the end of the previous one is dropped)
+    """
+
+    try:
+        codecs.lookup(encoding)
+    except LookupError:
+        raise HTTPException(status_code=422, detail=f"unknown encoding {encoding}")
+
+    if chunk_size <= 0 or not 0 <= overlap < chunk_size:
+        raise HTTPException(status_code=422, detail=f"invalid chunk size chunk_size:{chunk_size} overlap:{overlap}")
+
+    return ingest_fnc.getIngestStreamingResponse(
+        request.stream(), encoding, chunk_size, overlap, ingest_fnc.INGEST_MAX_OVERLAP if stitch else 0, clean
+    )
@@ -1,26 +1,25 @@
 import os
 import json
-import openai
 
 from typing import Dict, List, TypedDict
 from fastapi import APIRouter, Depends, status, HTTPException, Response, File, UploadFile, Form, Request
 #from sentence_transformers import SentenceTransformer
-from langchain.text_splitter import CharacterTextSplitter
+# 重いライブラリ[openai・langchain等]は使う処理の中で読込む(Heavy libraries [openai, langchain etc.] are imported inside the code that uses them)
 
 import shutil
 
 # 機能の切り出しはfunctionディレクトリに作成
-from functions import vector_fnc
 from functions import secure_fnc
 from functions import mysqlaio_fnc
 from functions import log_fnc
 from functions import mail_fnc
+from functions import response_fnc
 
 # 共通ユーティリティの読込(Reading common utilities)
 from util import util_cmn
 
 # エンドポイント管理
-router = APIRouter()
+router = APIRouter(route_class=response_fnc.OrjsonRoute)
 
 def getDbPool(request: Request):
     return request.app.state.db_pool
@@ -0,0 +1,51 @@
+import os
+
+from typing import List, Optional
+from pydantic import BaseModel
+from fastapi import APIRouter, status, HTTPException
+
+# 機能の切り出しはfunctionディレクトリに作成
+from functions import token_fnc
+from functions import response_fnc
+
+# 1リクエストで受け付ける最大文書数(maximum documents per request)
+TOKEN_MAX_DOCUMENTS = int(os.getenv("TOKEN_MAX_DOCUMENTS", "10000"))
+
+# エンドポイント管理
+router = APIRouter(route_class=response_fnc.OrjsonRoute)
+
+class TokenRequest(BaseModel):
+    documents: List[str]
+    model: Optional[str] = None
+    mode: str = "count"
+    max_tokens: int = 512
+    overlap: int = 0
+
+@router.post("/v1/tokens", status_code=status.HTTP_200_OK, tags=['token REST API'])
+async def post_v1_tokens(objRequest: TokenRequest):
+    """
+    文書ごとのトークン数またはチャンク(Token counts or chunks per document)
+
+    mode:"count" はトークン数、"chunk" はmax_tokens以内でoverlapずつ重ねたチャンクを返す
+    (mode "count" returns token counts, "chunk" returns chunks of at most max_tokens overlapping by overlap tokens)
+    """
+
+    if len(objRequest.documents) > TOKEN_MAX_DOCUMENTS:
+        raise HTTPException(
+            status_code=413, detail=f"too many documents (max {TOKEN_MAX_DOCUMENTS})"
+        )
+
+    if objRequest.mode == "count":
+        aryCounts = await token_fnc.getTokenCounts(objRequest.documents, objRequest.model)
+        return {"model": objRequest.model or token_fnc.TOKEN_DEFAULT_MODEL, "counts": aryCounts, "total": sum(aryCounts)}
+
+    if objRequest.mode == "chunk":
+        try:
+            aryChunks = await token_fnc.getTokenChunkBatch(
+                objRequest.documents, objRequest.max_tokens, objRequest.overlap, objRequest.model
+            )
+        except ValueError as e:
+            raise HTTPException(status_code=422, detail=str(e))
+        return {"model": objRequest.model or token_fnc.TOKEN_DEFAULT_MODEL, "chunks": aryChunks}
+
+    raise HTTPException(status_code=422, detail="mode must be 'count' or 'chunk'")
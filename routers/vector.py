@@ -0,0 +1,103 @@
+import os
+
+from typing import List, Optional, Any
+from pydantic import BaseModel
+from fastapi import APIRouter, status, HTTPException
+
+# 機能の切り出しはfunctionディレクトリに作成
+from functions import vector_fnc
+from functions import response_fnc
+
+# 1リクエストで受け付ける最大件数(maximum vectors or queries per request)
+VECTOR_MAX_ROWS = int(os.getenv("VECTOR_MAX_ROWS", "10000"))
+
+# エンドポイント管理
+router = APIRouter(route_class=response_fnc.OrjsonRoute)
+
+class VectorUpsertRequest(BaseModel):
+    ids: List[str]
+    vectors: List[List[float]]
+    metadata: Optional[List[Any]] = None
+
+class VectorQueryRequest(BaseModel):
+    vectors: List[List[float]]
+    top_k: int = 10
+    probe: Optional[int] = None
+    exact: bool = False
+
+class VectorDeleteRequest(BaseModel):
+    ids: List[str]
+
+class VectorIndexRequest(BaseModel):
+    lists: Optional[int] = None
+
+def getCheckedRows(intRows: int):
+    if intRows > VECTOR_MAX_ROWS:
+        raise HTTPException(status_code=413, detail=f"too many rows (max {VECTOR_MAX_ROWS})")
+
+def getHttpException(e: Exception):
+    # 存在しないストアは404、ストア数の上限は503、それ以外は422(Unknown store 404, store limit 503, anything else 422)
+    if isinstance(e, vector_fnc.VectorNotFoundError):
+        return HTTPException(status_code=404, detail=str(e))
+    if isinstance(e, vector_fnc.VectorLimitError):
+        return HTTPException(status_code=503, detail=str(e))
+
+    return HTTPException(status_code=422, detail=str(e))
+
+@router.post("/v1/vectors/{name}/upsert", status_code=status.HTTP_200_OK, tags=['vector REST API'])
+async def post_v1_vectors_upsert(name: str, objRequest: VectorUpsertRequest):
+    """
+    ベクトルの追加・置換[同じIDは置換、ストアが無ければ作成](Add or replace vectors [the same id is replaced, creates the store if missing])
+    """
+
+    getCheckedRows(len(objRequest.ids))
+    try:
+        intRows = await vector_fnc.execUpsert(name, objRequest.ids, objRequest.vectors, objRequest.metadata)
+    except vector_fnc.VectorError as e:
+        raise getHttpException(e)
+
+    return {"upserted": intRows}
+
+@router.post("/v1/vectors/{name}/query", status_code=status.HTTP_200_OK, tags=['vector REST API'])
+async def post_v1_vectors_query(name: str, objRequest: VectorQueryRequest):
+    """
+    上位k件の検索[IVFインデックスがあれば使用、exact:trueで全件比較](Top-k search [uses the IVF index if built, exact:true scans every row])
+    """
+
+    getCheckedRows(len(objRequest.vectors))
+    if not 0 < objRequest.top_k <= 1000:
+        raise HTTPException(status_code=422, detail="top_k must be between 1 and 1000")
+
+    try:
+        aryResults = await vector_fnc.getSearch(name, objRequest.vectors, objRequest.top_k, objRequest.probe, objRequest.exact)
+    except vector_fnc.VectorError as e:
+        raise getHttpException(e)
+
+    return {"results": aryResults}
+
+@router.post("/v1/vectors/{name}/delete", status_code=status.HTTP_200_OK, tags=['vector REST API'])
+async def post_v1_vectors_delete(name: str, objRequest: VectorDeleteRequest):
+    """
+    ベクトルの削除(Delete vectors)
+    """
+
+    getCheckedRows(len(objRequest.ids))
+    try:
+        intRows = await vector_fnc.execDelete(name, objRequest.ids)
+    except vector_fnc.VectorError as e:
+        raise getHttpException(e)
+
+    return {"deleted": intRows}
+
+@router.post("/v1/vectors/{name}/index", status_code=status.HTTP_200_OK, tags=['vector REST API'])
+async def post_v1_vectors_index(name: str, objRequest: VectorIndexRequest):
+    """
+    IVFインデックスの作成(Build the IVF index)
+    """
+
+    try:
+        objIvf = await vector_fnc.execBuildIvf(name, objRequest.lists)
+    except vector_fnc.VectorError as e:
+        raise getHttpException(e)
+
+    return {"ivf": objIvf, "stats": vector_fnc.getVectorStore(name).getStats()}
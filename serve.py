@@ -0,0 +1,303 @@
+# 本番用の起動(Production launcher)
+# 起動方法(usage):
+#   python -m serve                 gunicorn + UvicornWorker[CPU数に応じたワーカー数、アプリを事前読込]
+#                                   (gunicorn + UvicornWorker [workers sized from CPUs, app preloaded])
+#   python -m serve --reload        開発用の1プロセス[ソース変更を即時反映](single development process [reloads on change])
+#   python -m serve plan            ワーカー数・接続数の確認(show worker and connection sizing)
+#   python -m serve restart         ワーカーを1つずつ再起動(restart workers one at a time)
+import os
+import sys
+import gc
+import math
+import time
+import signal
+import argparse
+import importlib.util
+
+# 環境変数へ登録[ワーカー数・接続数の計算前に読込む](Register to environment variables [before sizing workers and connections])
+from dotenv import load_dotenv
+load_dotenv()
+
+# 読込むアプリ(application to serve)
+SERVE_APP = os.getenv("SERVE_APP", "main:app")
+SERVE_BIND = os.getenv("SERVE_BIND", "0.0.0.0:8000")
+
+# ワーカー数[未指定の場合はCPU数×SERVE_WORKERS_PER_CORE](workers [CPUs x SERVE_WORKERS_PER_CORE if not set])
+SERVE_WORKERS = os.getenv("SERVE_WORKERS", "")
+SERVE_WORKERS_PER_CORE = float(os.getenv("SERVE_WORKERS_PER_CORE", "1"))
+SERVE_MAX_WORKERS = int(os.getenv("SERVE_MAX_WORKERS", "16"))
+
+# 全ワーカー合計のDB接続数の上限[MySQLのmax_connections以下にする](total DB connections for all workers [keep below MySQL's max_connections])
+MYSQL_CONNECTION_BUDGET = int(os.getenv("MYSQL_CONNECTION_BUDGET", "100"))
+
+# アプリの事前読込[fork後もメモリを共有](preload the app [memory stays shared after fork])
+SERVE_PRELOAD = os.getenv("SERVE_PRELOAD", "1") == "1"
+
+# タイムアウト秒数・ワーカーの定期再起動(timeouts in seconds and periodic worker recycling)
+SERVE_TIMEOUT = int(os.getenv("SERVE_TIMEOUT", "60"))
+SERVE_GRACEFUL_TIMEOUT = int(os.getenv("SERVE_GRACEFUL_TIMEOUT", "30"))
+SERVE_KEEPALIVE = int(os.getenv("SERVE_KEEPALIVE", "5"))
+SERVE_MAX_REQUESTS = int(os.getenv("SERVE_MAX_REQUESTS", "0"))
+SERVE_MAX_REQUESTS_JITTER = int(os.getenv("SERVE_MAX_REQUESTS_JITTER", "0"))
+
+SERVE_PIDFILE = os.getenv("SERVE_PIDFILE", "/tmp/python_fastapi_serve.pid")
+
+def getCpuCount():
+    """
+    使用できるCPU数[CPUアフィニティとcgroupのCPU制限を考慮](Usable CPUs [honours CPU affinity and cgroup CPU quota])
+
+    Returns:
+
+        int:CPU数(CPU count)
+    """
+
+    try:
+        intCpus = len(os.sched_getaffinity(0))
+    except AttributeError:
+        intCpus = os.cpu_count() or 1
+
+    # コンテナのCPU制限[cgroup v2 / v1](container CPU quota [cgroup v2 / v1])
+    fltQuota = None
+    try:
+        with open("/sys/fs/cgroup/cpu.max") as f:
+            strQuota, strPeriod = f.read().split()
+            if strQuota != "max":
+                fltQuota = int(strQuota) / int(strPeriod)
+    except (OSError, ValueError):
+        try:
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_quota_us") as f:
+                intQuota = int(f.read())
+            with open("/sys/fs/cgroup/cpu/cpu.cfs_period_us") as f:
+                intPeriod = int(f.read())
+            if intQuota > 0:
+                fltQuota = intQuota / intPeriod
+        except (OSError, ValueError):
+            pass
+
+    if fltQuota is not None:
+        intCpus = min(intCpus, max(1, math.ceil(fltQuota)))
+
+    return max(1, intCpus)
+
+def getServePlan():
+    """
+    ワーカー数とワーカーごとの接続数・プロセス数の計算(Work out workers and per-worker connections and processes)
+
+    DB接続はMYSQL_CONNECTION_BUDGETをワーカー数で分ける。MYSQL_POOL_MAXSIZEの指定がより小さい場合はそちらを使う
+    (DB connections split MYSQL_CONNECTION_BUDGET across workers. A smaller explicit MYSQL_POOL_MAXSIZE wins)
+
+    Returns:
+
+        dict:起動設定と各ワーカーへ渡す環境変数(launch settings and environment passed to every worker)
+    """
+
+    intCpus = getCpuCount()
+    if SERVE_WORKERS:
+        intWorkers = int(SERVE_WORKERS)
+    else:
+        intWorkers = min(SERVE_MAX_WORKERS, max(1, round(intCpus * SERVE_WORKERS_PER_CORE)))
+
+    # 1ワーカー最低1接続(at least one connection per worker)
+    intWorkers = max(1, min(intWorkers, MYSQL_CONNECTION_BUDGET))
+    intPoolMax = MYSQL_CONNECTION_BUDGET // intWorkers
+    if os.getenv("MYSQL_POOL_MAXSIZE"):
+        intPoolMax = min(intPoolMax, int(os.getenv("MYSQL_POOL_MAXSIZE")))
+    intPoolMin = min(int(os.getenv("MYSQL_POOL_MINSIZE", "1")), intPoolMax)
+
+    aryEnv = {"MYSQL_POOL_MAXSIZE": str(intPoolMax), "MYSQL_POOL_MINSIZE": str(intPoolMin)}
+
+    # レプリカは別サーバーのため同じ方法で別に分ける(The replica is another server, so it is split the same way separately)
+    if os.getenv("MYSQL_REPLICA_HOST"):
+        intReplicaMax = int(os.getenv("MYSQL_REPLICA_CONNECTION_BUDGET", str(MYSQL_CONNECTION_BUDGET))) // intWorkers
+        if os.getenv("MYSQL_REPLICA_POOL_MAXSIZE"):
+            intReplicaMax = min(intReplicaMax, int(os.getenv("MYSQL_REPLICA_POOL_MAXSIZE")))
+        aryEnv["MYSQL_REPLICA_POOL_MAXSIZE"] = str(max(1, intReplicaMax))
+        aryEnv["MYSQL_REPLICA_POOL_MINSIZE"] = str(min(int(os.getenv("MYSQL_REPLICA_POOL_MINSIZE", os.getenv("MYSQL_POOL_MINSIZE", "1"))), max(1, intReplicaMax)))
+
+    # ワーカー内のプロセスプールもCPUを取り合わないよう分ける(Process pools inside workers share the CPUs too)
+    intProcesses = max(1, intCpus // intWorkers)
+    for strName in ("TOKEN_PROCESSES", "CLEAN_PROCESSES"):
+        if not os.getenv(strName):
+            aryEnv[strName] = str(min(4, intProcesses))
+    if not os.getenv("SECURE_THREADS"):
+        aryEnv["SECURE_THREADS"] = str(intProcesses)
+
+    return {
+        "cpus": intCpus,
+        "workers": intWorkers,
+        "loop": "uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+        "http": "httptools" if importlib.util.find_spec("httptools") else "h11",
+        "env": aryEnv,
+    }
+
+def getWorkerClass():
+    """
+    uvloop・httptoolsを使えれば使うUvicornWorker(UvicornWorker using uvloop and httptools when installed)
+    """
+
+    from uvicorn.workers import UvicornWorker
+
+    class ServeWorker(UvicornWorker):
+        CONFIG_KWARGS = {
+            "loop": "uvloop" if importlib.util.find_spec("uvloop") else "asyncio",
+            "http": "httptools" if importlib.util.find_spec("httptools") else "h11",
+            "lifespan": "on",
+        }
+
+    return ServeWorker
+
+# gunicornのworker_classは文字列で指定するためモジュール変数にする(gunicorn's worker_class is given as a dotted path)
+def __getattr__(strName: str):
+    if strName == "ServeWorker":
+        return getWorkerClass()
+    raise AttributeError(strName)
+
+def setWhenReady(objServer):
+    # 事前読込したオブジェクトをGCの対象外にしてfork後のコピーを防ぐ(Keep preloaded objects out of GC so forks do not copy them)
+    gc.freeze()
+    objServer.log.info(f"serve: {SERVE_APP} workers:{objServer.num_workers} preload:{SERVE_PRELOAD} pid:{os.getpid()}")
+
+def setPostFork(objServer, objWorker):
+    gc.enable()
+
+def execGunicorn(objPlan: dict):
+    """
+    gunicornの起動(Run gunicorn)
+    """
+
+    from gunicorn.app.base import BaseApplication
+
+    class ServeApplication(BaseApplication):
+        def load_config(self):
+            aryOptions = {
+                "bind": SERVE_BIND,
+                "workers": objPlan["workers"],
+                "worker_class": "serve.ServeWorker",
+                "preload_app": SERVE_PRELOAD,
+                "timeout": SERVE_TIMEOUT,
+                "graceful_timeout": SERVE_GRACEFUL_TIMEOUT,
+                "keepalive": SERVE_KEEPALIVE,
+                "max_requests": SERVE_MAX_REQUESTS,
+                "max_requests_jitter": SERVE_MAX_REQUESTS_JITTER,
+                "pidfile": SERVE_PIDFILE,
+                "when_ready": setWhenReady,
+                "post_fork": setPostFork,
+            }
+            for strName, objValue in aryOptions.items():
+                self.cfg.set(strName, objValue)
+
+        def load(self):
+            strModule, strApp = SERVE_APP.split(":")
+            return getattr(importlib.import_module(strModule), strApp)
+
+    # 事前読込の間はGCを止め、世代を動かさない(No GC while preloading so objects are not moved between generations)
+    if SERVE_PRELOAD:
+        gc.disable()
+
+    ServeApplication().run()
+
+def getWorkerPids(intMaster: int):
+    """
+    マスタープロセスの子プロセス[ワーカー]の取得(Get the master's child processes [workers])
+
+    Returns:
+
+        set:プロセスID(process ids)
+    """
+
+    aryPids = set()
+    for strPid in os.listdir("/proc"):
+        if not strPid.isdigit():
+            continue
+        try:
+            with open(f"/proc/{strPid}/stat") as f:
+                # 実行ファイル名に空白を含む場合があるため最後の")"以降を読む(The command name may contain spaces, read after the last ")")
+                aryFields = f.read().rsplit(")", 1)[1].split()
+        except OSError:
+            continue
+        if int(aryFields[1]) == intMaster:
+            aryPids.add(int(strPid))
+
+    return aryPids
+
+def execRollingRestart(fltWait: float=2.0, fltTimeout: float=None):
+    """
+    ワーカーを1つずつ再起動[処理中のリクエストは終わるまで待つ](Restart workers one at a time [in-flight requests are finished first])
+
+    ワーカーへTERMを送り、gunicornが補充したワーカーが起動してから次へ進むため、同時に止まるのは1つだけ。
+    事前読込しない場合[SERVE_PRELOAD=0]は新しいワーカーが新しいコードを読込む
+    (Each worker gets TERM and the next one waits until gunicorn has replaced it, so only one is ever down.
+    Without preloading [SERVE_PRELOAD=0] the new workers load the new code)
+
+    Args:
+
+        fltWait (float): 補充後に待つ秒数(seconds to wait after each replacement)
+
+        fltTimeout (float): 1ワーカーあたりの待ち時間の上限(maximum wait per worker)
+
+    Returns:
+
+        int:再起動したワーカー数(workers restarted)
+    """
+
+    fltTimeout = fltTimeout or SERVE_GRACEFUL_TIMEOUT + SERVE_TIMEOUT
+    with open(SERVE_PIDFILE) as f:
+        intMaster = int(f.read().strip())
+
+    aryOld = getWorkerPids(intMaster)
+    intWorkers = len(aryOld)
+    intRestarted = 0
+    for intPid in sorted(aryOld):
+        if intPid not in getWorkerPids(intMaster):
+            continue
+        os.kill(intPid, signal.SIGTERM)
+
+        fltDeadline = time.monotonic() + fltTimeout
+        while time.monotonic() < fltDeadline:
+            aryNow = getWorkerPids(intMaster)
+            if intPid not in aryNow and len(aryNow) >= intWorkers:
+                break
+            time.sleep(0.1)
+        else:
+            raise TimeoutError(f"worker {intPid} was not replaced within {fltTimeout:.0f} s")
+
+        time.sleep(fltWait)
+        intRestarted += 1
+        print(f"restarted worker {intPid} ({intRestarted}/{intWorkers})", flush=True)
+
+    return intRestarted
+
+def main():
+    objParser = argparse.ArgumentParser(prog="python -m serve", description="Run main:app in production or development")
+    objParser.add_argument("command", nargs="?", default="run", choices=["run", "plan", "restart"])
+    objParser.add_argument("--reload", action="store_true", help="single process that reloads on source changes (development)")
+    objParser.add_argument("--wait", type=float, default=2.0, help="seconds between workers for restart")
+    objArgs = objParser.parse_args()
+
+    objPlan = getServePlan()
+
+    if objArgs.command == "plan":
+        for strName in ("cpus", "workers", "loop", "http"):
+            print(f"{strName}: {objPlan[strName]}")
+        for strName, strValue in objPlan["env"].items():
+            print(f"{strName}={strValue}")
+        return
+
+    if objArgs.command == "restart":
+        execRollingRestart(objArgs.wait)
+        return
+
+    # 各ワーカーはこの環境変数を引き継ぐ(Every worker inherits this environment)
+    os.environ.update(objPlan["env"])
+
+    if objArgs.reload:
+        import uvicorn
+
+        strHost, _, strPort = SERVE_BIND.rpartition(":")
+        uvicorn.run(SERVE_APP, host=strHost or "0.0.0.0", port=int(strPort), reload=True, loop=objPlan["loop"], http=objPlan["http"])
+        return
+
+    execGunicorn(objPlan)
+
+if __name__ == "__main__":
+    main()
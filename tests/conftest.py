@@ -0,0 +1,13 @@
+import os
+import sys
+import tempfile
+
+# リポジトリ直下をパスに追加し、作業ディレクトリにする[log_config.json・files等を相対で読むため]
+# (Put the repository root on the path and make it the working directory [log_config.json, files etc. are read relatively])
+strRoot = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, strRoot)
+os.chdir(strRoot)
+
+# テストのログはリポジトリに残さない(test logs are kept out of the repository)
+os.environ.setdefault("LOG_DIR", tempfile.mkdtemp(prefix="pytest_logs_"))
+os.environ.setdefault("PROFILE_DIR", os.path.join(os.environ["LOG_DIR"], "profile"))
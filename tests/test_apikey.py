@@ -0,0 +1,86 @@
+# 認証キーの判定[疑似MySQLプール使用](Authentication key verification [fake MySQL pool])
+import asyncio
+
+import aiomysql
+
+from functions import apikey_fnc
+from functions import dbpool_fnc
+
+from benchmarks import fakedb
+
+async def getRegistry(aryKeys: list, monkeypatch):
+    """
+    aryKeysをDBの認証キーとして返す疑似プールで読込んだ一覧(Registry loaded from a fake pool returning aryKeys as the DB keys)
+    """
+
+    def getRows(strSql: str, aryParam):
+        return [{"authorization_key": strKey} for strKey in aryKeys]
+
+    monkeypatch.setenv("getApikey", "env-key")
+    objPool = await fakedb.getCreatePool(0, 0, getRows)(minsize=1, maxsize=2, autocommit=True)
+    objRegistry = apikey_fnc.ApiKeyRegistry()
+    await objRegistry.start(dbpool_fnc.DbPool(objPool, "primary"))
+
+    return objRegistry, objPool
+
+def test_verify_uses_memory_only(monkeypatch):
+    async def execTest():
+        objRegistry, objPool = await getRegistry(["db-key"], monkeypatch)
+        intQueries = objPool.intQueries
+
+        assert await objRegistry.verify("db-key")
+        assert await objRegistry.verify("env-key")
+        assert not await objRegistry.verify("")
+        # 大文字小文字・末尾の空白が違うキーは別のキー(keys differing in case or trailing spaces are different keys)
+        assert not await objRegistry.verify("DB-KEY")
+        assert not await objRegistry.verify("db-key ")
+        for i in range(100):
+            assert not await objRegistry.verify(f"random-{i}")
+
+        # 不正なキーはDBへ問い合わせない(invalid keys never reach the DB)
+        assert objPool.intQueries == intQueries
+
+    asyncio.run(execTest())
+
+def test_refresh_adds_and_revokes_keys(monkeypatch):
+    async def execTest():
+        aryKeys = ["old-key"]
+        objRegistry, _ = await getRegistry(aryKeys, monkeypatch)
+        assert not await objRegistry.verify("new-key")
+
+        aryKeys[:] = ["new-key"]
+        assert await objRegistry.refresh()
+        assert await objRegistry.verify("new-key")
+        assert not await objRegistry.verify("old-key")
+
+    asyncio.run(execTest())
+
+def test_refresh_failure_keeps_keys(monkeypatch):
+    async def execTest():
+        objRegistry, _ = await getRegistry(["db-key"], monkeypatch)
+        def getRows(strSql: str, aryParam):
+            raise aiomysql.OperationalError(2003, "Can't connect to MySQL server")
+        objRegistry.objDbPool.objPool.objRows = getRows
+
+        # DB障害時は以前のキーを維持(previous keys are kept while the DB is down)
+        assert not await objRegistry.refresh()
+        assert await objRegistry.verify("db-key")
+
+    asyncio.run(execTest())
+
+def test_startup_db_failure_keeps_env_keys(monkeypatch):
+    async def execTest():
+        def getRows(strSql: str, aryParam):
+            raise aiomysql.ProgrammingError(1146, "Table 'python_authorization_key' doesn't exist")
+
+        monkeypatch.setenv("getApikey", "env-key")
+        objPool = await fakedb.getCreatePool(0, 0, getRows)(minsize=1, maxsize=2, autocommit=True)
+        objRegistry = apikey_fnc.ApiKeyRegistry()
+        objRegistry.objDbPool = dbpool_fnc.DbPool(objPool, "primary")
+
+        # DBのキーが読めなくても環境変数のキーは使える(environment keys work even when the DB keys cannot be loaded)
+        assert not await objRegistry.refresh()
+        assert await objRegistry.verify("env-key")
+        assert not await objRegistry.verify("db-key")
+
+    asyncio.run(execTest())
@@ -0,0 +1,88 @@
+# 共有チャットストリームの購読と取消(Subscriptions and cancellation of shared chat streams)
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+from functions import chat_fnc
+
+class FakeCompletion:
+    """
+    上流ストリームの代わり[トークンごとに待つ](Stand-in for the upstream stream [waits per token])
+    """
+
+    def __init__(self, aryStats: dict, intTokens: int):
+        self.aryStats = aryStats
+        self.intTokens = intTokens
+
+    async def __aiter__(self):
+        try:
+            for i in range(self.intTokens):
+                await asyncio.sleep(0.01)
+                yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=f"t{i} "), finish_reason=None)])
+            yield SimpleNamespace(choices=[SimpleNamespace(delta=SimpleNamespace(content=None), finish_reason="stop")])
+            self.aryStats["completed"] += 1
+        except asyncio.CancelledError:
+            self.aryStats["cancelled"] += 1
+            raise
+
+    async def close(self):
+        pass
+
+@pytest.fixture
+def aryStats(monkeypatch):
+    aryStats = {"requests": 0, "completed": 0, "cancelled": 0}
+
+    async def create(**aryArgs):
+        aryStats["requests"] += 1
+        return FakeCompletion(aryStats, 10)
+
+    objClient = SimpleNamespace(chat=SimpleNamespace(completions=SimpleNamespace(create=create)))
+    monkeypatch.setattr(chat_fnc, "_objClient", objClient)
+    monkeypatch.setattr(chat_fnc, "_aryInflight", {})
+
+    return aryStats
+
+def getExpect():
+    return "".join(f"t{i} " for i in range(10))
+
+def test_subscriber_registered_before_iterating(aryStats):
+    async def execTest():
+        aryFirst = chat_fnc.getChatEvents([{"role": "user", "content": "same"}])
+        arySecond = chat_fnc.getChatEvents([{"role": "user", "content": "same"}])
+
+        # 2人目が反復を始める前に1人目が切断しても上流は続く(Upstream goes on when the first leaves before the second starts)
+        await aryFirst.__anext__()
+        await aryFirst.aclose()
+        await asyncio.sleep(0.03)
+
+        return await chat_fnc.getChatText(arySecond)
+
+    objResult = asyncio.run(execTest())
+    assert objResult["text"] == getExpect()
+    assert aryStats == {"requests": 1, "completed": 1, "cancelled": 0}
+
+def test_last_subscriber_leaving_cancels(aryStats):
+    async def execTest():
+        aryEvents = chat_fnc.getChatEvents([{"role": "user", "content": "leave"}])
+        await aryEvents.__anext__()
+        await aryEvents.aclose()
+        await asyncio.sleep(0.03)
+        assert not chat_fnc._aryInflight
+
+    asyncio.run(execTest())
+    assert aryStats["cancelled"] == 1 and aryStats["completed"] == 0
+
+def test_cancel_sends_error_to_subscribers(aryStats):
+    async def execTest():
+        aryEvents = chat_fnc.getChatEvents([{"role": "user", "content": "shutdown"}])
+        await aryEvents.__anext__()
+        for objStream in list(chat_fnc._aryInflight.values()):
+            objStream.cancel()
+
+        # 途中で終わった応答を成功として返さない(A truncated answer is not returned as a success)
+        with pytest.raises(chat_fnc.ChatError):
+            await chat_fnc.getChatText(aryEvents)
+
+    asyncio.run(execTest())
+    assert aryStats["cancelled"] == 1
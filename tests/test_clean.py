@@ -0,0 +1,93 @@
+# テキスト整形の従来処理との同等性(Equivalence of text cleaning with the previous implementation)
+import re
+import random
+import asyncio
+
+from xml.sax.saxutils import unescape
+
+import pytest
+
+from util import util_cmn
+
+def getLegacyCleanText(strText: str):
+    """
+    従来のgetCleanText(Previous getCleanText)
+    """
+
+    strText = unescape(strText)
+    strText = strText.replace('&nbsp;', ' ')
+    strText = strText.strip()
+    strText = strText.replace('　', '')
+    strText = strText.replace(' ', '')
+    strText = re.sub(r'\s+', ' ', strText)
+    strText = re.sub('<.+?>', '', strText)
+    strText = strText.replace('\n', '')
+    strText = strText.replace('\r\n', '')
+    strText = strText.replace('\r', '')
+
+    return strText
+
+def getFuzzTexts(intCount: int, objRandom):
+    """
+    特殊タグ・空白・タグの断片を組み合わせたテキスト(Texts mixing fragments of entities, whitespace and tags)
+    """
+
+    aryParts = [
+        "&", "amp;", "lt;", "gt;", "nbsp;", "&amp;", "&lt;", "&gt;", "&nbsp;", "&amp;nbsp;", "&amp;amp;", "<", ">", "<b>", "</p>",
+        " ", "　", "\n", "\r", "\r\n", "\t", "\x0b", "\x0c", "\x1c", "\xa0", " ", " ", "a", "日本", ";", "/",
+    ]
+
+    return ["".join(objRandom.choice(aryParts) for _ in range(objRandom.randrange(0, 30))) for _ in range(intCount)]
+
+def getHtmlTexts(intCount: int, objRandom):
+    """
+    商品説明のような実際に近いHTML(Realistic HTML such as product descriptions)
+    """
+
+    aryTexts = []
+    for i in range(intCount):
+        aryParagraphs = []
+        for _ in range(objRandom.randrange(3, 12)):
+            strBody = " ".join(objRandom.choice(["送料無料", "在庫あり", "Size&nbsp;M", "price &lt;1,000&gt;", "A&amp;B", "　新商品", "limited"]) for _ in range(12))
+            aryParagraphs.append(f'\n  <p class="desc">{strBody}<br />\r\n<span style="color:red">セール</span></p>')
+        aryTexts.append(f"<div id=\"item{i}\">" + "".join(aryParagraphs) + "\n</div>\n")
+
+    return aryTexts
+
+@pytest.fixture(scope="module")
+def aryFuzz():
+    return getFuzzTexts(200000, random.Random(0))
+
+@pytest.fixture(scope="module")
+def aryHtml():
+    return getHtmlTexts(2000, random.Random(1))
+
+@pytest.fixture(scope="module", autouse=True)
+def setShutdownCleanPool():
+    yield
+    util_cmn.shutdownCleanPool()
+
+def test_clean_text_fuzz(aryFuzz):
+    aryDiff = [strText for strText in aryFuzz if util_cmn.getCleanText(strText) != getLegacyCleanText(strText)]
+    assert aryDiff == []
+
+def test_clean_text_html(aryHtml):
+    assert util_cmn.getCleanTextList(aryHtml) == [getLegacyCleanText(strText) for strText in aryHtml]
+
+def test_clean_text_series(aryFuzz):
+    pd = pytest.importorskip("pandas")
+
+    objCleaned = util_cmn.getCleanTextSeries(pd.Series(aryFuzz[:20000] + [None], dtype=object))
+    assert objCleaned.iloc[:-1].tolist() == [getLegacyCleanText(strText) for strText in aryFuzz[:20000]]
+    assert pd.isna(objCleaned.iloc[-1])
+
+def test_clean_text_batch(aryHtml):
+    aryExpect = [getLegacyCleanText(strText) for strText in aryHtml]
+
+    # 閾値0でプロセスプールを通す(threshold 0 goes through the process pool)
+    assert asyncio.run(util_cmn.getCleanTextBatch(aryHtml, 0)) == aryExpect
+
+def test_clean_text_batch_series(aryHtml):
+    pd = pytest.importorskip("pandas")
+
+    assert asyncio.run(util_cmn.getCleanTextBatch(pd.Series(aryHtml), 0)).tolist() == [getLegacyCleanText(strText) for strText in aryHtml]
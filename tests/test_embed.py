@@ -0,0 +1,183 @@
+# 埋め込みのキャッシュ・一括呼び出し・再試行[LocalEmbeddingProvider使用](Embedding cache, batching and retries [LocalEmbeddingProvider])
+import os
+import asyncio
+
+import numpy as np
+import pytest
+
+from functions import embed_fnc
+
+class RecordProvider(embed_fnc.LocalEmbeddingProvider):
+    """
+    呼び出しを記録し、最初のintFailures回は失敗する提供元(Provider recording its calls that fails the first intFailures calls)
+    """
+
+    strName = "record"
+
+    def __init__(self, fltLatency: float=0, intFailures: int=0, objError: Exception=None):
+        super().__init__(intDim=32)
+        self.fltLatency = fltLatency
+        self.intFailures = intFailures
+        self.objError = objError or ConnectionError("temporary failure")
+        self.aryBatches = []
+        self.intRunning = 0
+        self.intPeak = 0
+
+    async def getEmbeddings(self, aryTexts: list, strModel: str):
+        self.intRunning += 1
+        self.intPeak = max(self.intPeak, self.intRunning)
+        try:
+            await asyncio.sleep(self.fltLatency)
+            if self.intFailures > 0:
+                self.intFailures -= 1
+                raise self.objError
+            self.aryBatches.append(list(aryTexts))
+            return await super().getEmbeddings(aryTexts, strModel)
+        finally:
+            self.intRunning -= 1
+
+@pytest.fixture(autouse=True)
+def setNoBackoff(monkeypatch):
+    monkeypatch.setattr(embed_fnc, "EMBED_BACKOFF", 0)
+
+def getExpect(aryTexts: list):
+    objProvider = embed_fnc.LocalEmbeddingProvider(intDim=32)
+
+    return np.asarray([objProvider.getEmbedding(strText) for strText in aryTexts], dtype=np.float32)
+
+def test_dedupe_within_and_across_calls():
+    objProvider = RecordProvider()
+
+    async def execTest():
+        objService = embed_fnc.EmbeddingService(objProvider, fltBatchWait=0)
+        aryFirst = await objService.getEmbeddings(["a", "b", "a", "a"], "m")
+        arySecond = await objService.getEmbeddings(["b", "c"], "m")
+        await objService.close()
+        return objService, aryFirst, arySecond
+
+    objService, aryFirst, arySecond = asyncio.run(execTest())
+    assert np.array_equal(aryFirst, getExpect(["a", "b", "a", "a"]))
+    assert np.array_equal(arySecond, getExpect(["b", "c"]))
+    # キャッシュがなくても同じ呼び出し内の重複は1回だけ送る(duplicates within a call are sent once even without a cache)
+    assert objProvider.aryBatches == [["a", "b"], ["b", "c"]]
+
+def test_cache_hits_across_calls_and_reopen(tmp_path):
+    strPath = os.path.join(tmp_path, "cache.sqlite3")
+    aryTexts = ["alpha", "beta", "gamma"]
+
+    async def execTest(objProvider: RecordProvider):
+        objService = embed_fnc.EmbeddingService(objProvider, embed_fnc.EmbeddingCache(strPath), fltBatchWait=0)
+        aryFirst = await objService.getEmbeddings(aryTexts, "m")
+        arySecond = await objService.getEmbeddings(aryTexts + ["delta"], "m")
+        objStats = objService.getStats()
+        await objService.close()
+        return aryFirst, arySecond, objStats
+
+    objProvider = RecordProvider()
+    aryFirst, arySecond, objStats = asyncio.run(execTest(objProvider))
+    assert objProvider.aryBatches == [aryTexts, ["delta"]]
+    assert np.array_equal(arySecond, getExpect(aryTexts + ["delta"]))
+    assert objStats["hits"] == 3 and objStats["misses"] == 4
+
+    # 開き直したキャッシュからも読める(readable from the reopened cache)
+    objProvider = RecordProvider()
+    aryFirst, _, objStats = asyncio.run(execTest(objProvider))
+    assert objProvider.aryBatches == []
+    assert np.array_equal(aryFirst, getExpect(aryTexts))
+    assert objStats["hits"] == 7 and objStats["misses"] == 0
+
+    # モデルが違えば別のキー(another model is another key)
+    assert embed_fnc.getCacheKey("record:m", "alpha") != embed_fnc.getCacheKey("record:n", "alpha")
+
+def test_cache_evicts_by_size(tmp_path):
+    # 1行は16+32*4+8=152バイト(one row is 16+32*4+8=152 bytes)
+    objCache = embed_fnc.EmbeddingCache(os.path.join(tmp_path, "cache.sqlite3"), intMaxBytes=152 * 10)
+    aryVectors = getExpect([f"text {i}" for i in range(30)])
+
+    for i, aryVector in enumerate(aryVectors):
+        objCache.setSync([(embed_fnc.getCacheKey("m", f"text {i}"), aryVector)])
+        objStats = objCache.getStatsSync()
+        assert objStats["bytes"] <= 152 * 10 and objStats["bytes"] == objStats["rows"] * 152
+
+    # 最近のものが残る(the most recent rows are kept)
+    aryFound = objCache.getSync([embed_fnc.getCacheKey("m", f"text {i}") for i in range(30)])
+    assert embed_fnc.getCacheKey("m", "text 29") in aryFound
+    assert embed_fnc.getCacheKey("m", "text 0") not in aryFound
+    objCache.close()
+
+def test_concurrent_misses_share_one_call():
+    objProvider = RecordProvider(fltLatency=0.01)
+
+    async def execTest():
+        objService = embed_fnc.EmbeddingService(objProvider, fltBatchWait=0.02)
+        aryResults = await asyncio.gather(*[objService.getEmbeddings([f"text {i % 5}", "shared"], "m") for i in range(20)])
+        objStats = objService.getStats()
+        await objService.close()
+        return aryResults, objStats
+
+    aryResults, objStats = asyncio.run(execTest())
+    assert len(objProvider.aryBatches) == 1
+    assert sorted(objProvider.aryBatches[0]) == sorted([f"text {i}" for i in range(5)] + ["shared"])
+    assert objStats["provider_calls"] == 1 and objStats["misses"] == 6 and objStats["coalesced"] == 34
+    for i, aryResult in enumerate(aryResults):
+        assert np.array_equal(aryResult, getExpect([f"text {i % 5}", "shared"]))
+
+def test_concurrency_is_bounded():
+    objProvider = RecordProvider(fltLatency=0.01)
+    objProvider.intMaxBatch = 2
+
+    async def execTest():
+        objService = embed_fnc.EmbeddingService(objProvider, intConcurrency=3, fltBatchWait=0)
+        aryResult = await objService.getEmbeddings([f"text {i}" for i in range(40)], "m")
+        await objService.close()
+        return aryResult
+
+    assert np.array_equal(asyncio.run(execTest()), getExpect([f"text {i}" for i in range(40)]))
+    assert len(objProvider.aryBatches) == 20
+    assert objProvider.intPeak == 3
+
+def test_retry_then_success():
+    objProvider = RecordProvider(intFailures=2)
+
+    async def execTest():
+        objService = embed_fnc.EmbeddingService(objProvider, fltBatchWait=0)
+        aryResult = await objService.getEmbeddings(["a"], "m")
+        objStats = objService.getStats()
+        await objService.close()
+        return aryResult, objStats
+
+    aryResult, objStats = asyncio.run(execTest())
+    assert np.array_equal(aryResult, getExpect(["a"]))
+    assert objStats["retries"] == 2 and objStats["provider_calls"] == 1
+
+def test_retry_gives_up(monkeypatch):
+    monkeypatch.setattr(embed_fnc, "EMBED_RETRIES", 2)
+    objProvider = RecordProvider(intFailures=10)
+
+    async def execTest():
+        objService = embed_fnc.EmbeddingService(objProvider, fltBatchWait=0)
+        with pytest.raises(ConnectionError):
+            await objService.getEmbeddings(["a"], "m")
+        # 失敗したキーは次の呼び出しで再び送る(failed keys are sent again on the next call)
+        objProvider.intFailures = 0
+        aryResult = await objService.getEmbeddings(["a"], "m")
+        objStats = objService.getStats()
+        await objService.close()
+        return aryResult, objStats
+
+    aryResult, objStats = asyncio.run(execTest())
+    assert np.array_equal(aryResult, getExpect(["a"]))
+    assert objStats["retries"] == 2 and objProvider.aryBatches == [["a"]]
+
+def test_not_retryable_error():
+    objProvider = RecordProvider(intFailures=1, objError=ValueError("bad input"))
+
+    async def execTest():
+        objService = embed_fnc.EmbeddingService(objProvider, fltBatchWait=0)
+        with pytest.raises(ValueError):
+            await objService.getEmbeddings(["a"], "m")
+        objStats = objService.getStats()
+        await objService.close()
+        return objStats
+
+    assert asyncio.run(execTest())["retries"] == 0
@@ -0,0 +1,72 @@
+# 一括実行・ストリーミングのクエリ時間の記録(Query timings of bulk and streaming queries)
+import asyncio
+
+import pytest
+
+from functions import dbpool_fnc
+from functions import metrics_fnc
+from functions import mysqlaio_fnc
+
+from benchmarks import fakedb
+
+@pytest.fixture
+def aryTimings(monkeypatch):
+    aryTimings = []
+
+    def setQueryTiming(strMethod, strSql, fltStart, fltAcquired, fltExecuted, fltFetched, intRows):
+        assert fltStart <= fltAcquired <= fltExecuted <= fltFetched
+        aryTimings.append((strMethod, strSql, intRows))
+
+    monkeypatch.setattr(metrics_fnc, "setQueryTiming", setQueryTiming)
+
+    return aryTimings
+
+async def getDbPool():
+    def getRows(strSql: str, aryParam):
+        if strSql.startswith("SELECT"):
+            return [{"id": intId} for intId in range(25)]
+        return fakedb.getDefaultRows(strSql, aryParam)
+
+    objPool = await fakedb.getCreatePool(0, 0, getRows)(minsize=1, maxsize=2, autocommit=True)
+
+    return dbpool_fnc.DbPool(objPool, "primary")
+
+def test_bulk_insert_timing(aryTimings):
+    async def execTest():
+        objDbPool = await getDbPool()
+        return await mysqlaio_fnc.execBulkInsert(objDbPool, "bulk", "t", ["a", "b"], [(i, i) for i in range(5)], intChunkSize=2)
+
+    assert len(asyncio.run(execTest())) == 3
+    assert aryTimings == [("bulk", "INSERT INTO `t` (`a`, `b`) VALUES ", 5)]
+
+def test_many_query_timing(aryTimings):
+    strSql = "UPDATE t SET a = %s WHERE id = %s"
+
+    async def execTest():
+        objDbPool = await getDbPool()
+        return await mysqlaio_fnc.execManyQuery(objDbPool, "many", strSql, [(1, 1), (2, 2), (3, 3)])
+
+    assert asyncio.run(execTest()) == 3
+    assert aryTimings == [("many", strSql, 3)]
+
+def test_stream_query_timing(aryTimings):
+    strSql = "SELECT id FROM t"
+
+    async def execTest(intLimit: int):
+        objDbPool = await getDbPool()
+        aryRows = []
+        objStream = mysqlaio_fnc.getStreamQuery(objDbPool, "stream", strSql, intChunkSize=10)
+        async for aryRow in objStream:
+            aryRows.append(aryRow)
+            if len(aryRows) == intLimit:
+                break
+        await objStream.aclose()
+        return aryRows
+
+    assert len(asyncio.run(execTest(100))) == 25
+    assert aryTimings == [("stream", strSql, 25)]
+
+    # 中断した場合は記録しない(Nothing is recorded when interrupted)
+    aryTimings.clear()
+    assert len(asyncio.run(execTest(5))) == 5
+    assert aryTimings == []
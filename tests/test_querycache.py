@@ -0,0 +1,81 @@
+# クエリキャッシュのテーブル名取得と無効化(Table parsing and invalidation of the query cache)
+import asyncio
+
+import pytest
+
+from functions import querycache_fnc
+
+@pytest.mark.parametrize("strSql, aryTables", [
+    ("SELECT * FROM a, b WHERE a.id = b.id", {"a", "b"}),
+    ("SELECT * FROM a x, `db`.`B c` AS y, c JOIN d ON 1", {"a", "b c", "c", "d"}),
+    ("select * from a\n, b\n,c", {"a", "b", "c"}),
+    ("SELECT * FROM a JOIN b ON a.id = IF(b.x, 1, 2), c WHERE x IN (1, 2) ORDER BY a, b LIMIT 1, 2", {"a", "b", "c"}),
+    ("SELECT * FROM a, (SELECT * FROM b) t, c", {"a", "b", "c"}),
+    ("SELECT * FROM t1 UNION SELECT * FROM t2, t3", {"t1", "t2", "t3"}),
+    ("SELECT 'FROM x, y' FROM t", {"t"}),
+    ("UPDATE a, b SET a.x = 1, b.y = 2", {"a", "b"}),
+    ("DELETE FROM a USING a, b WHERE a.id = b.id", {"a", "b"}),
+    ("INSERT INTO a (x) SELECT x FROM b, c ON DUPLICATE KEY UPDATE x = 1, y = 2", {"a", "b", "c"}),
+    ("INSERT INTO t (a, b) VALUES (1, 2), (3, 4)", {"t"}),
+    ("CALL p()", set()),
+    ("SELECT 1", set()),
+])
+def test_sql_tables(strSql, aryTables):
+    assert querycache_fnc.getSqlTables(strSql) == aryTables
+
+def test_unparsed_sql_not_cached():
+    aryCalls = []
+
+    async def getLoad():
+        aryCalls.append(1)
+        return [{"now": 1}]
+
+    async def execTest():
+        querycache_fnc.objQueryCache.clear()
+        for _ in range(2):
+            await querycache_fnc.getCachedQuery("all", "SELECT NOW()", (), 60, getLoad)
+
+    asyncio.run(execTest())
+    assert len(aryCalls) == 2
+    assert querycache_fnc.objQueryCache.aryEntries == {}
+
+def test_comma_join_invalidated_by_second_table():
+    async def getLoad():
+        return [{"id": 1}]
+
+    async def execTest():
+        querycache_fnc.objQueryCache.clear()
+        await querycache_fnc.getCachedQuery("all", "SELECT * FROM orders o, customers c WHERE o.cid = c.id", (), 60, getLoad)
+        assert len(querycache_fnc.objQueryCache.aryEntries) == 1
+
+        querycache_fnc.setInvalidateSql("UPDATE customers SET name = %s")
+        assert len(querycache_fnc.objQueryCache.aryEntries) == 0
+
+        # テーブル名が取れない更新は全件を無効化(updates whose tables cannot be parsed invalidate everything)
+        await querycache_fnc.getCachedQuery("all", "SELECT * FROM orders", (), 60, getLoad)
+        querycache_fnc.setInvalidateSql("CALL reset_orders()")
+        assert len(querycache_fnc.objQueryCache.aryEntries) == 0
+
+    asyncio.run(execTest())
+
+def test_clear_discards_load_in_flight():
+    async def execTest():
+        objCache = querycache_fnc.QueryCache()
+        objStarted = asyncio.Event()
+        objRelease = asyncio.Event()
+
+        async def getLoad():
+            objStarted.set()
+            await objRelease.wait()
+            return "old"
+
+        objTask = asyncio.create_task(objCache.getOrLoad("k", frozenset({"t"}), 60, getLoad))
+        await objStarted.wait()
+
+        # エントリのないテーブルの読込中もclearで破棄する(clear also discards a load for a table without entries)
+        objCache.clear()
+        objRelease.set()
+        assert await objTask == "old"
+        assert objCache.get("k") == (False, None)
+
+    asyncio.run(execTest())
@@ -0,0 +1,48 @@
+# JSON変換の共通処理(Shared JSON conversion)
+import json
+import asyncio
+import datetime
+from decimal import Decimal
+
+import orjson
+
+from functions import response_fnc
+from functions import stream_fnc
+
+# DictCursorの行と同じ型の値[バイナリのBLOBを含む](values of the same types as DictCursor rows [including a binary BLOB])
+aryRow = {
+    "id": 1,
+    "price": Decimal("12.34"),
+    "quantity": Decimal("3"),
+    "created_at": datetime.datetime(2024, 1, 1, 9, 0, 0, 123456),
+    "ship_date": datetime.date(2024, 1, 2),
+    "elapsed": datetime.timedelta(seconds=1.5),
+    "blob": b"\x00\xff\xfe binary",
+    "text": b"utf-8 \xe6\x97\xa5\xe6\x9c\xac",
+    "note": None,
+}
+
+aryExpected = {
+    "id": 1,
+    "price": 12.34,
+    "quantity": 3,
+    "created_at": "2024-01-01T09:00:00.123456",
+    "ship_date": "2024-01-02",
+    "elapsed": 1.5,
+    "blob": "AP/+IGJpbmFyeQ==",
+    "text": "dXRmLTgg5pel5pys",
+    "note": None,
+}
+
+def test_response_encodes_binary_blob():
+    assert orjson.loads(response_fnc.getJsonBytes(aryRow)) == aryExpected
+
+def test_stream_matches_response():
+    async def getAsyncChunks():
+        yield [aryRow, aryRow]
+
+    async def getBody():
+        return b"".join([bytChunk async for bytChunk in stream_fnc.getNdjsonStream(getAsyncChunks())])
+
+    aryLines = asyncio.run(getBody()).decode('utf-8').splitlines()
+    assert [json.loads(strLine) for strLine in aryLines] == [aryExpected, aryExpected]
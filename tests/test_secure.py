@@ -0,0 +1,118 @@
+# 暗号化・復号化[従来形式との互換](Encryption and decryption [compatibility with the existing format])
+import base64
+import asyncio
+
+import pytest
+from cryptography.hazmat.primitives.ciphers import Cipher, algorithms, modes
+from cryptography.hazmat.backends import default_backend
+from cryptography.hazmat.primitives import padding
+
+from functions import secure_fnc
+
+KEY = "0123456789abcdef0123456789abcdef"
+
+# 固定のIV[00..0f]で従来形式により作成した暗号文(cipher texts made in the existing format with a fixed IV [00..0f])
+BASELINE_TEXTS = {
+    "hello": "AAECAwQFBgcICQoLDA0ODzGDUpebmFelfbTh+UUl7QxUhzxFnHKbC+wvXgPSSbxd",
+    "日本語のテキスト": "AAECAwQFBgcICQoLDA0OD253heXJhyWqu9KOLiWT0njP8Cp0JGciX0SKkV3CFiBucDjwLltjjZDpqTx1+XVQEw==",
+    "x" * 16: "AAECAwQFBgcICQoLDA0OD1gC8ciuzwfoTTp69tiGUOugt6KEJJMRT1C0W/sB8W1TQbOfMJaeKo70U7xL8h0QwA==",
+}
+
+def getBaselineDecrypt(strText: str):
+    """
+    変更前のgetOpensslDecryptの復号処理(Decryption of getOpensslDecrypt before the rewrite)
+    """
+
+    strData = base64.b64decode(strText)
+    intIvLength = algorithms.AES(KEY.encode()).block_size // 8
+    objCipher = Cipher(algorithms.AES(KEY.encode()), modes.CBC(strData[:intIvLength]), backend=default_backend())
+    objDecryptor = objCipher.decryptor()
+    strDecrypted = objDecryptor.update(strData[intIvLength:]) + objDecryptor.finalize()
+    objPadder = padding.PKCS7(128).unpadder()
+    strDecrypted = (objPadder.update(strDecrypted) + objPadder.finalize()).decode('utf-8')
+
+    return strDecrypted[:-ord(strDecrypted[-1])]
+
+@pytest.fixture(autouse=True)
+def setKey(monkeypatch):
+    monkeypatch.setenv("APP_ENCRYPT_KEY", KEY)
+    secure_fnc.getCipherAlgorithm.cache_clear()
+    yield
+    secure_fnc.getCipherAlgorithm.cache_clear()
+
+@pytest.mark.parametrize("strPlain, strCipher", list(BASELINE_TEXTS.items()))
+def test_baseline_format(strPlain, strCipher):
+    assert getBaselineDecrypt(strCipher) == strPlain
+    assert secure_fnc.getDecrypt(strCipher) == strPlain
+    assert asyncio.run(secure_fnc.getOpensslDecrypt(strCipher)) == strPlain
+    # 同じIVなら同じ暗号文(the same IV gives the same cipher text)
+    assert secure_fnc.getEncrypt(strPlain, bytes(range(16))) == strCipher
+
+@pytest.mark.parametrize("strPlain", ["", "a", "x" * 15, "x" * 16, "x" * 17, "日本語" * 50, "\x01\x10"])
+def test_roundtrip(strPlain):
+    strCipher = secure_fnc.getEncrypt(strPlain)
+    assert secure_fnc.getDecrypt(strCipher) == strPlain
+    assert getBaselineDecrypt(strCipher) == strPlain
+    # IVは毎回変わる(the IV differs per call)
+    assert secure_fnc.getEncrypt(strPlain) != strCipher
+
+@pytest.mark.parametrize("strKey", [None, "short", KEY + "x"])
+def test_bad_key(monkeypatch, strKey):
+    if strKey is None:
+        monkeypatch.delenv("APP_ENCRYPT_KEY")
+    else:
+        monkeypatch.setenv("APP_ENCRYPT_KEY", strKey)
+    secure_fnc.getCipherAlgorithm.cache_clear()
+
+    with pytest.raises(secure_fnc.SecureError) as objInfo:
+        secure_fnc.getDecrypt(BASELINE_TEXTS["hello"])
+    assert objInfo.value.strCode == "key"
+    with pytest.raises(secure_fnc.SecureError):
+        secure_fnc.getEncrypt("hello")
+    with pytest.raises(secure_fnc.SecureError):
+        asyncio.run(secure_fnc.getOpensslDecryptBatch([BASELINE_TEXTS["hello"]]))
+
+def getWrongPadding():
+    # 正しい鍵で暗号化したPKCS7パディングのないブロック(a block encrypted with the right key but without PKCS7 padding)
+    objEncryptor = Cipher(algorithms.AES(KEY.encode()), modes.CBC(bytes(16))).encryptor()
+    return base64.b64encode(bytes(16) + objEncryptor.update(b"x" * 16) + objEncryptor.finalize()).decode('ascii')
+
+@pytest.mark.parametrize("strText, strCode", [
+    ("", "empty"),
+    ("not base64!", "format"),
+    (base64.b64encode(b"x" * 20).decode(), "format"),
+    (base64.b64encode(b"x" * 16).decode(), "format"),
+    (getWrongPadding(), "decrypt"),
+])
+def test_bad_text(strText, strCode):
+    with pytest.raises(secure_fnc.SecureError) as objInfo:
+        secure_fnc.getDecrypt(strText)
+    assert objInfo.value.strCode == strCode
+
+    # 空は呼び出し元へ、それ以外はFalse(empty goes to the caller, anything else is False)
+    if strCode == "empty":
+        with pytest.raises(secure_fnc.SecureError):
+            asyncio.run(secure_fnc.getOpensslDecrypt(strText))
+    else:
+        assert asyncio.run(secure_fnc.getOpensslDecrypt(strText)) is False
+
+@pytest.mark.parametrize("intOffloadRows", [1000, 0])
+def test_batch_per_row_errors(monkeypatch, intOffloadRows):
+    # 閾値以下は同期、超えるとスレッドプールで分割(at or below the threshold runs inline, above it is split across the pool)
+    monkeypatch.setattr(secure_fnc, "SECURE_CHUNK_ROWS", 3)
+    aryPlain = [f"row {i}" for i in range(10)]
+    aryTexts = [secure_fnc.getEncrypt(strPlain) for strPlain in aryPlain]
+    aryTexts[2] = ""
+    aryTexts[5] = "not base64!"
+    aryTexts[7] = getWrongPadding()
+
+    async def execTest():
+        try:
+            return await secure_fnc.getOpensslDecryptBatch(aryTexts, intOffloadRows)
+        finally:
+            secure_fnc.shutdownSecureExecutor()
+
+    objResult = asyncio.run(execTest())
+    assert objResult["result"] == [None if i in (2, 5, 7) else strPlain for i, strPlain in enumerate(aryPlain)]
+    assert [(objError["index"], objError["code"]) for objError in objResult["error"]] == [(2, "empty"), (5, "format"), (7, "decrypt")]
+    assert all(objError["message"] for objError in objResult["error"])
@@ -0,0 +1,220 @@
+# メール送信ディスパッチャ・テンプレート一括送信[ローカルのaiosmtpdに送信](Mail dispatcher and templated bulk send [sends to a local aiosmtpd])
+import time
+import email
+import socket
+import asyncio
+import smtplib
+import functools
+from string import Template
+from email.message import EmailMessage
+
+import pytest
+from aiosmtpd.controller import Controller
+
+from functions import mail_fnc
+from functions import smtp_fnc
+
+class RecordHandler:
+    """
+    受信したメールを記録し、指定した応答を順に返すハンドラ[Noneは受理](Handler recording mails and answering with the given replies in order [None accepts])
+    """
+
+    def __init__(self):
+        self.aryMessages = []
+        self.aryReplies = []
+
+    async def handle_DATA(self, server, session, envelope):
+        strReply = self.aryReplies.pop(0) if self.aryReplies else None
+        if strReply is not None:
+            return strReply
+        self.aryMessages.append(envelope.content)
+        return "250 OK"
+
+def getFreePort():
+    with socket.socket() as objSocket:
+        objSocket.bind(("127.0.0.1", 0))
+        return objSocket.getsockname()[1]
+
+@pytest.fixture
+def objHandler():
+    objHandler = RecordHandler()
+    objController = Controller(objHandler, hostname="127.0.0.1", port=getFreePort())
+    objController.start()
+    objHandler.intPort = objController.port
+    yield objHandler
+    objController.stop()
+
+def getSetting(objHandler, **aryValues):
+    objSetting = {
+        "host": "127.0.0.1",
+        "port": objHandler.intPort,
+        "timeout": "5",
+        "local_domain": "localhost",
+        "pool_size": 2,
+        "queue_size": 10,
+        "retry": 2,
+        "retry_backoff": 0.01,
+        "idle_timeout": 60,
+    }
+    objSetting.update(aryValues)
+
+    return objSetting
+
+def getConnect(aryConnects: list):
+    """
+    平文で接続し接続回数を記録する接続関数(Plain-text connect function counting connections)
+    """
+
+    def getConnection(objSetting: dict):
+        aryConnects.append(time.monotonic())
+        return smtplib.SMTP(objSetting["host"], objSetting["port"], local_hostname=objSetting["local_domain"], timeout=int(objSetting["timeout"]))
+
+    return getConnection
+
+def getMessage(intNo: int):
+    objMessage = EmailMessage()
+    objMessage["From"] = "from@example.com"
+    objMessage["To"] = "to@example.com"
+    objMessage["Subject"] = f"test {intNo}"
+    objMessage.set_content(f"body {intNo}")
+
+    return objMessage
+
+def test_enqueue_drains_on_stop(objHandler):
+    aryConnects = []
+
+    async def execTest():
+        objDispatcher = smtp_fnc.MailDispatcher(getSetting(objHandler), getConnect(aryConnects))
+        aryResults = [objDispatcher.enqueue(getMessage(i)) for i in range(6)]
+        await objDispatcher.stop()
+        return aryResults
+
+    assert asyncio.run(execTest()) == [True] * 6
+    assert len(objHandler.aryMessages) == 6
+    # 接続はワーカーごとに再利用する(connections are reused per worker)
+    assert len(aryConnects) <= 2
+
+def test_enqueue_queue_full(objHandler):
+    async def execTest():
+        objDispatcher = smtp_fnc.MailDispatcher(getSetting(objHandler, queue_size=2), getConnect([]))
+        aryResults = [objDispatcher.enqueue(getMessage(i)) for i in range(3)]
+        await objDispatcher.stop()
+        return aryResults
+
+    assert asyncio.run(execTest()) == [True, True, False]
+    assert len(objHandler.aryMessages) == 2
+
+def test_send_retries_temporary_error(objHandler):
+    aryConnects = []
+    objHandler.aryReplies = ["451 try again later"]
+
+    async def execTest():
+        objDispatcher = smtp_fnc.MailDispatcher(getSetting(objHandler, pool_size=1), getConnect(aryConnects))
+        blnResult = await objDispatcher.send(getMessage(1))
+        await objDispatcher.stop()
+        return blnResult
+
+    assert asyncio.run(execTest()) is True
+    assert len(objHandler.aryMessages) == 1
+    # 失敗した接続は閉じて張り直す(the failed connection is closed and reopened)
+    assert len(aryConnects) == 2
+
+def test_send_permanent_error_not_retried(objHandler):
+    aryConnects = []
+    objHandler.aryReplies = ["554 rejected", "554 rejected"]
+
+    async def execTest():
+        objDispatcher = smtp_fnc.MailDispatcher(getSetting(objHandler, pool_size=1), getConnect(aryConnects))
+        blnResult = await objDispatcher.send(getMessage(1))
+        await objDispatcher.stop()
+        return blnResult
+
+    assert asyncio.run(execTest()) is False
+    assert objHandler.aryMessages == []
+    assert len(aryConnects) == 1
+
+def test_send_gives_up_after_retries(objHandler):
+    objHandler.aryReplies = ["451 try again later"] * 3
+
+    async def execTest():
+        objDispatcher = smtp_fnc.MailDispatcher(getSetting(objHandler, pool_size=1), getConnect([]))
+        blnResult = await objDispatcher.send(getMessage(1))
+        await objDispatcher.stop()
+        return blnResult
+
+    assert asyncio.run(execTest()) is False
+    assert objHandler.aryMessages == []
+
+def test_idle_connection_reconnects(objHandler):
+    aryConnects = []
+
+    async def execTest():
+        objDispatcher = smtp_fnc.MailDispatcher(getSetting(objHandler, pool_size=1, idle_timeout=0.2), getConnect(aryConnects))
+        assert await objDispatcher.send(getMessage(1))
+        assert await objDispatcher.send(getMessage(2))
+        await asyncio.sleep(0.3)
+        assert await objDispatcher.send(getMessage(3))
+        await objDispatcher.stop()
+
+    asyncio.run(execTest())
+    assert len(objHandler.aryMessages) == 3
+    # アイドル時間内は同じ接続、超えた後は張り直す(same connection within the idle timeout, reopened after it)
+    assert len(aryConnects) == 2
+
+def test_send_bulk_reconnect_every(objHandler):
+    aryConnects = []
+    aryResult = smtp_fnc.execSendBulk(getSetting(objHandler), [getMessage(i) for i in range(5)], 2, getConnect(aryConnects))
+
+    assert aryResult == [(True, "")] * 5
+    assert len(objHandler.aryMessages) == 5
+    assert len(aryConnects) == 3
+
+def test_template_render_and_cache():
+    mail_fnc.getCompiledTemplate.cache_clear()
+    strTemplate = "Hello $name, ${item}s cost $$5 ($bad $)"
+
+    aryCompiled = mail_fnc.getCompiledTemplate(strTemplate)
+    assert mail_fnc.getRenderTemplate(aryCompiled, {"name": "Ann", "item": "<b>", "bad": 1}) == "Hello Ann, <b>s cost $5 (1 $)"
+    # HTMLは値のみエスケープ(HTML escapes the values only)
+    assert mail_fnc.getRenderTemplate(mail_fnc.getCompiledTemplate("<p>$name</p>"), {"name": "<Ann & Bob>"}, True) == "<p>&lt;Ann &amp; Bob&gt;</p>"
+
+    # string.Templateと同じ結果(same result as string.Template)
+    assert mail_fnc.getRenderTemplate(aryCompiled, {"name": "A", "item": "B", "bad": "C"}) == Template(strTemplate).safe_substitute(name="A", item="B", bad="C")
+
+    # 同じテンプレートは分解済みのものを使う(the same template reuses the compiled parts)
+    assert mail_fnc.getCompiledTemplate(strTemplate) is aryCompiled
+    assert mail_fnc.getCompiledTemplate.cache_info().hits >= 1
+
+def test_template_missing_key():
+    with pytest.raises(KeyError):
+        mail_fnc.getRenderTemplate(mail_fnc.getCompiledTemplate("Hello $name"), {})
+
+    aryMessages = mail_fnc.getBulkMessages({"info_mail": "from@example.com"}, "Hi $name", "$name $missing", [("a@example.com", {"name": "A"})], False)
+    assert aryMessages == [(None, "template key not found:'missing'")]
+
+def test_send_email_bulk_results(objHandler, monkeypatch):
+    aryConnects = []
+    monkeypatch.setattr(smtp_fnc, "getMailSetting", lambda: getSetting(objHandler, info_mail="from@example.com"))
+    monkeypatch.setattr(smtp_fnc, "execSendBulk", functools.partial(smtp_fnc.execSendBulk, objConnect=getConnect(aryConnects)))
+
+    # 1:受理 2:置換キーなし 3:451の後に受理 4:554 5:451が続き再試行切れ 6:受理
+    # (1:accepted 2:missing key 3:accepted after a 451 4:554 5:451 until retries run out 6:accepted)
+    objHandler.aryReplies = [None, "451 try again later", None, "554 rejected", "451 busy", "451 busy", "451 busy"]
+    aryRecipients = [(f"user{i}@example.com", {"name": f"user{i}"}) for i in range(1, 7)]
+    aryRecipients[1] = ("user2@example.com", {})
+
+    aryResult = asyncio.run(mail_fnc.execSendEmailBulk(None, "Hi $name", "<p>$name</p>", aryRecipients, blnHtml=True))
+
+    assert [(aryRow["mail"], aryRow["result"]) for aryRow in aryResult] == [
+        ("user1@example.com", True), ("user2@example.com", False), ("user3@example.com", True),
+        ("user4@example.com", False), ("user5@example.com", False), ("user6@example.com", True),
+    ]
+    assert aryResult[0]["error"] == "" and aryResult[2]["error"] == "" and aryResult[5]["error"] == ""
+    assert aryResult[1]["error"] == "template key not found:'name'"
+    assert "554" in aryResult[3]["error"]
+    assert "451" in aryResult[4]["error"]
+
+    aryMails = [email.message_from_bytes(bytMessage) for bytMessage in objHandler.aryMessages]
+    assert [objMail["To"] for objMail in aryMails] == ["user1@example.com", "user3@example.com", "user6@example.com"]
+    assert [objMail["Subject"] for objMail in aryMails] == ["Hi user1", "Hi user3", "Hi user6"]
+    assert aryMails[0].get_payload()[0].get_payload(decode=True).decode("utf-8") == "<p>user1</p>"
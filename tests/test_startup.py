@@ -0,0 +1,19 @@
+# main:appの起動時間とメモリの予算(Boot time and memory budget of main:app)
+import statistics
+
+from benchmarks import bench_startup
+
+def test_startup_within_budget():
+    aryResults = [bench_startup.getProbe("import main")[0] for _ in range(3)]
+    fltMs = statistics.median(objResult["ms"] for objResult in aryResults)
+    fltRss = statistics.median(objResult["rss"] for objResult in aryResults) / 1024 / 1024
+
+    assert fltMs <= bench_startup.STARTUP_IMPORT_BUDGET_MS, f"import {fltMs:.0f} ms > {bench_startup.STARTUP_IMPORT_BUDGET_MS:.0f} ms"
+    assert fltRss <= bench_startup.STARTUP_RSS_BUDGET_MB, f"RSS {fltRss:.1f} MB > {bench_startup.STARTUP_RSS_BUDGET_MB:.0f} MB"
+
+def test_startup_no_heavy_imports():
+    # 重いライブラリは初回使用時に読込む(heavy libraries are loaded on first use)
+    _, strOutput = bench_startup.getProbe("import main", True)
+    aryModules = {strModule for _, _, strModule in bench_startup.getImportTimes(strOutput)}
+
+    assert aryModules & {"pandas", "numpy", "tiktoken", "openai", "langchain", "bs4"} == set()
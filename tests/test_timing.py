@@ -0,0 +1,93 @@
+# Server-Timingヘッダーとプロファイル出力(Server-Timing header and profile output)
+import os
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+
+from functions import dbpool_fnc
+from functions import mysqlaio_fnc
+from functions import response_fnc
+from functions import timing_fnc
+
+from benchmarks import fakedb
+
+TOKEN = "timing-secret"
+
+@pytest.fixture
+def strProfileDir(tmp_path, monkeypatch):
+    monkeypatch.setattr(timing_fnc, "SERVER_TIMING", False)
+    monkeypatch.setattr(timing_fnc, "SERVER_TIMING_TOKEN", TOKEN)
+    monkeypatch.setattr(timing_fnc, "PROFILE_SAMPLE_RATE", 0)
+    monkeypatch.setattr(timing_fnc, "PROFILE_DIR", str(tmp_path / "profile"))
+
+    return str(tmp_path / "profile")
+
+def getResponses(aryHeaders: list):
+    """
+    DBを読んでJSONを返すエンドポイントへのリクエスト(Requests to an endpoint reading the DB and rendering JSON)
+
+    Returns:
+
+        list:[(レスポンス, エンドポイント内のContextVarの値)]([(response, ContextVar value inside the endpoint)])
+    """
+
+    objApp = FastAPI(default_response_class=response_fnc.OrjsonResponse)
+    objApp.add_middleware(timing_fnc.ServerTimingMiddleware)
+    aryContext = []
+
+    def getRows(strSql: str, aryParam):
+        return [{"id": 1}]
+
+    @objApp.get("/items")
+    async def get_items():
+        aryContext.append(timing_fnc._objTimings.get())
+        return await mysqlaio_fnc.getQuery(objApp.state.db_pool, "get_items", "SELECT id FROM items")
+
+    async def execTest():
+        objPool = await fakedb.getCreatePool(0, 0, getRows)(minsize=1, maxsize=2, autocommit=True)
+        objApp.state.db_pool = dbpool_fnc.DbPool(objPool, "primary")
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=objApp), base_url="http://test") as objClient:
+            return [await objClient.get("/items", headers=objHeaders) for objHeaders in aryHeaders]
+
+    aryResponses = asyncio.run(execTest())
+    assert all(objResponse.json() == [{"id": 1}] for objResponse in aryResponses)
+
+    return list(zip(aryResponses, aryContext))
+
+def getSpanNames(objResponse):
+    return {strPart.split(";")[0].strip() for strPart in objResponse.headers["server-timing"].split(",")}
+
+def test_disabled_adds_nothing(strProfileDir):
+    for objResponse, objTimings in getResponses([{}, {"x-server-timing-token": "wrong"}]):
+        assert "server-timing" not in objResponse.headers
+        assert objTimings is None
+
+    assert not os.path.exists(strProfileDir)
+
+def test_enabled_for_every_request(strProfileDir, monkeypatch):
+    monkeypatch.setattr(timing_fnc, "SERVER_TIMING", True)
+
+    [(objResponse, objTimings)] = getResponses([{}])
+    assert {"db-acquire", "db-execute", "db-fetch", "render", "total"} <= getSpanNames(objResponse)
+    assert objTimings is not None
+    # ヘッダーのみでプロファイルは取らない(header only, no profile)
+    assert not os.path.exists(strProfileDir)
+
+def test_token_adds_header_and_profile(strProfileDir):
+    [(objResponse, _), (objWrong, objWrongTimings)] = getResponses([{"x-server-timing-token": TOKEN}, {"x-server-timing-token": "wrong"}])
+
+    assert {"db-acquire", "db-execute", "render", "total"} <= getSpanNames(objResponse)
+    assert "server-timing" not in objWrong.headers and objWrongTimings is None
+
+    aryFiles = os.listdir(strProfileDir)
+    assert len(aryFiles) == 1 and aryFiles[0].endswith("-GET-items.prof")
+    assert os.path.getsize(os.path.join(strProfileDir, aryFiles[0])) > 0
+
+def test_empty_token_disables(strProfileDir, monkeypatch):
+    monkeypatch.setattr(timing_fnc, "SERVER_TIMING_TOKEN", "")
+
+    [(objResponse, objTimings)] = getResponses([{"x-server-timing-token": ""}])
+    assert "server-timing" not in objResponse.headers and objTimings is None
+    assert not os.path.exists(strProfileDir)
@@ -0,0 +1,50 @@
+# エンコーダーのキャッシュとチャンク分割(Encoder cache and chunking)
+import random
+
+import pytest
+import tiktoken
+
+from functions import token_fnc
+
+@pytest.fixture
+def objEncoder(monkeypatch):
+    # 取得不要なバイト単位のエンコーディング[英字2文字の組を結合](Byte-level encoding needing no download [two-letter pairs merged])
+    aryRanks = {bytes([i]): i for i in range(256)}
+    aryLetters = b"abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ "
+    for a in aryLetters:
+        for b in aryLetters:
+            aryRanks[bytes([a, b])] = len(aryRanks)
+
+    objEncoder = tiktoken.Encoding(
+        name="test_bytes",
+        pat_str=r"""'(?i:[sdmt]|ll|ve|re)|[^\r\n\p{L}\p{N}]?+\p{L}+|\p{N}{1,3}| ?[^\s\p{L}\p{N}]++[\r\n]*|\s*[\r\n]|\s+(?!\S)|\s+""",
+        mergeable_ranks=aryRanks,
+        special_tokens={},
+    )
+    monkeypatch.setattr(token_fnc, "getEncoder", lambda strModel=None: objEncoder)
+
+    return objEncoder
+
+def test_encoding_name():
+    assert token_fnc.getEncodingName("gpt-4") == "cl100k_base"
+    assert token_fnc.getEncodingName("gpt-4-0613") == "cl100k_base"
+    assert token_fnc.getEncodingName("o200k_base") == "o200k_base"
+    assert token_fnc.getEncodingName("no-such-model") == "cl100k_base"
+    assert token_fnc.getEncodingName.cache_info().maxsize is not None
+
+@pytest.mark.parametrize("intMaxTokens, intOverlap", [(16, 0), (32, 4), (128, 16)])
+def test_chunks_recounted(objEncoder, intMaxTokens, intOverlap):
+    objRandom = random.Random(0)
+    aryWords = "token budget context window 日本語 テキスト 文書 チャンク overlap embedding".split()
+    for _ in range(20):
+        strText = " ".join(objRandom.choice(aryWords) + str(objRandom.randrange(1000)) for _ in range(100))
+        aryChunks = token_fnc.getTokenChunks(strText, intMaxTokens, intOverlap)
+
+        intEnd = 0
+        for objChunk in aryChunks:
+            intTokens = len(objEncoder.encode_ordinary(objChunk["text"]))
+            assert intTokens == objChunk["tokens"] <= intMaxTokens
+            intStart = strText.find(objChunk["text"], max(0, intEnd - len(objChunk["text"])))
+            assert 0 <= intStart <= intEnd
+            intEnd = intStart + len(objChunk["text"])
+        assert intEnd == len(strText)
@@ -0,0 +1,218 @@
+# ユニットオブワーク[疑似MySQLプール使用](Unit of work [fake MySQL pool])
+import asyncio
+
+import httpx
+import aiomysql
+import pytest
+from fastapi import FastAPI, Depends
+
+from functions import dbpool_fnc
+from functions import mysqlaio_fnc
+from functions import querycache_fnc
+from functions import unitofwork_fnc
+from functions import writebehind_fnc
+
+from benchmarks import fakedb
+
+@pytest.fixture
+def aryLog(monkeypatch):
+    """
+    疑似接続で実行されたSQLとbegin/commit/rollbackの記録(Log of SQL, begin, commit and rollback run on fake connections)
+    """
+
+    aryLog = []
+
+    def getRecorder(strName: str):
+        async def execRecord(self):
+            aryLog.append(strName)
+            await self._execRoundTrip()
+        return execRecord
+
+    for strName in ("begin", "commit", "rollback"):
+        monkeypatch.setattr(fakedb.FakeConnection, strName, getRecorder(strName.upper()))
+
+    return aryLog
+
+async def getDbPool(aryLog: list):
+    def getRows(strSql: str, aryParam):
+        aryLog.append(strSql)
+        return fakedb.getDefaultRows(strSql, aryParam)
+
+    objPool = await fakedb.getCreatePool(0, 0, getRows)(minsize=1, maxsize=2, autocommit=True)
+
+    return dbpool_fnc.DbPool(objPool, "primary")
+
+def test_request_unit_of_work_failed_commit_returns_500(aryLog, monkeypatch):
+    async def execFailCommit(self):
+        raise aiomysql.OperationalError(2013, "Lost connection to MySQL server during query")
+
+    objApp = FastAPI()
+
+    @objApp.post("/order")
+    async def post_order(objUnitOfWork=Depends(unitofwork_fnc.getRequestUnitOfWork, scope="function")):
+        await objUnitOfWork.begin()
+        await mysqlaio_fnc.execQuery(objApp.state.db_pool, "post_order", "INSERT INTO orders (id) VALUES (%s)", (1,))
+        # 確定前に失敗させる(fail the commit)
+        monkeypatch.setattr(fakedb.FakeConnection, "commit", execFailCommit)
+        return {"ok": True}
+
+    async def execTest():
+        objApp.state.db_pool = await getDbPool(aryLog)
+        objTransport = httpx.ASGITransport(app=objApp, raise_app_exceptions=False)
+        async with httpx.AsyncClient(transport=objTransport, base_url="http://test") as objClient:
+            return await objClient.post("/order")
+
+    objResponse = asyncio.run(execTest())
+    assert objResponse.status_code == 500
+    assert aryLog == ["BEGIN", "INSERT INTO orders (id) VALUES (%s)"]
+
+def getCacheEntry():
+    # ordersテーブルを参照するキャッシュを登録(store a cache entry reading the orders table)
+    querycache_fnc.objQueryCache.clear()
+    strKey = ("all", "SELECT * FROM orders", "()")
+    querycache_fnc.objQueryCache.set(strKey, [], frozenset({"orders"}), 60)
+
+    return strKey
+
+def test_cache_invalidated_after_commit(aryLog):
+    async def execTest():
+        objDbPool = await getDbPool(aryLog)
+        strKey = getCacheEntry()
+        async with unitofwork_fnc.UnitOfWork(objDbPool) as objUnitOfWork:
+            await objUnitOfWork.begin()
+            await mysqlaio_fnc.execQuery(objDbPool, "test", "UPDATE orders SET note = %s", ("a",))
+            await mysqlaio_fnc.execBulkInsert(objDbPool, "test", "orders", ["id"], [(1,), (2,)])
+            # 確定前は無効化しない(not invalidated before the commit)
+            assert strKey in querycache_fnc.objQueryCache.aryEntries
+            await objUnitOfWork.commit()
+            assert strKey not in querycache_fnc.objQueryCache.aryEntries
+
+    asyncio.run(execTest())
+
+def test_cache_kept_on_rollback(aryLog):
+    async def execTest():
+        objDbPool = await getDbPool(aryLog)
+        strKey = getCacheEntry()
+        with pytest.raises(RuntimeError):
+            async with unitofwork_fnc.UnitOfWork(objDbPool) as objUnitOfWork:
+                await objUnitOfWork.begin()
+                await mysqlaio_fnc.execQuery(objDbPool, "test", "UPDATE orders SET note = %s", ("a",))
+                raise RuntimeError("abort")
+        assert strKey in querycache_fnc.objQueryCache.aryEntries
+
+        # トランザクション外の更新は即時に無効化(writes outside a transaction invalidate immediately)
+        async with unitofwork_fnc.UnitOfWork(objDbPool):
+            await mysqlaio_fnc.execQuery(objDbPool, "test", "UPDATE orders SET note = %s", ("a",))
+            assert strKey not in querycache_fnc.objQueryCache.aryEntries
+
+    asyncio.run(execTest())
+
+def test_begin_commit_shares_one_connection(aryLog):
+    async def execTest():
+        objDbPool = await getDbPool(aryLog)
+        intAcquires = objDbPool.objPool.intAcquires
+        async with unitofwork_fnc.UnitOfWork(objDbPool) as objUnitOfWork:
+            await objUnitOfWork.begin()
+            await mysqlaio_fnc.execQuery(objDbPool, "test", "UPDATE orders SET note = %s", ("a",))
+            await mysqlaio_fnc.getQuery(objDbPool, "test", "SELECT * FROM orders")
+            assert unitofwork_fnc.isInTransaction(objDbPool)
+        assert objDbPool.objPool.intAcquires - intAcquires == 1
+        assert objDbPool.objPool.freesize == 1
+
+    asyncio.run(execTest())
+    # 処理側のcommitは何もせず終了時に確定(the helper's commit does nothing, the unit of work commits at the end)
+    assert aryLog == ["BEGIN", "UPDATE orders SET note = %s", "SELECT * FROM orders", "COMMIT"]
+
+def test_begin_twice_raises(aryLog):
+    async def execTest():
+        objDbPool = await getDbPool(aryLog)
+        async with unitofwork_fnc.UnitOfWork(objDbPool) as objUnitOfWork:
+            await objUnitOfWork.begin()
+            with pytest.raises(unitofwork_fnc.UnitOfWorkError):
+                await objUnitOfWork.begin()
+
+    asyncio.run(execTest())
+
+def test_savepoint_rolls_back_inner_block(aryLog):
+    async def execTest():
+        objDbPool = await getDbPool(aryLog)
+        async with unitofwork_fnc.UnitOfWork(objDbPool) as objUnitOfWork:
+            await objUnitOfWork.begin()
+            await mysqlaio_fnc.execQuery(objDbPool, "test", "UPDATE orders SET note = %s", ("a",))
+            with pytest.raises(RuntimeError):
+                async with objUnitOfWork.getSavepoint():
+                    await mysqlaio_fnc.execQuery(objDbPool, "test", "DELETE FROM orders")
+                    raise RuntimeError("abort")
+            # 処理側のbegin/commitはセーブポイントになる(a helper's begin/commit become a savepoint)
+            await mysqlaio_fnc.execManyQuery(objDbPool, "test", "INSERT INTO orders (id) VALUES (%s)", [(1,), (2,)])
+            await objUnitOfWork.commit()
+
+    asyncio.run(execTest())
+    assert aryLog == [
+        "BEGIN", "UPDATE orders SET note = %s",
+        "SAVEPOINT uow_1", "DELETE FROM orders", "ROLLBACK TO SAVEPOINT uow_1", "RELEASE SAVEPOINT uow_1",
+        "SAVEPOINT uow_2", "RELEASE SAVEPOINT uow_2",
+        "COMMIT",
+    ]
+
+def test_rollback_on_exception(aryLog):
+    async def execTest():
+        objDbPool = await getDbPool(aryLog)
+        with pytest.raises(RuntimeError):
+            async with unitofwork_fnc.UnitOfWork(objDbPool) as objUnitOfWork:
+                await objUnitOfWork.begin()
+                await mysqlaio_fnc.execQuery(objDbPool, "test", "UPDATE orders SET note = %s", ("a",))
+                raise RuntimeError("abort")
+        assert objDbPool.objPool.freesize == 1
+
+    asyncio.run(execTest())
+    assert aryLog == ["BEGIN", "UPDATE orders SET note = %s", "ROLLBACK"]
+
+def test_closed_connection_raises(aryLog):
+    async def execTest():
+        objDbPool = await getDbPool(aryLog)
+        with pytest.raises(unitofwork_fnc.UnitOfWorkError):
+            async with unitofwork_fnc.UnitOfWork(objDbPool) as objUnitOfWork:
+                await objUnitOfWork.begin()
+                await mysqlaio_fnc.execQuery(objDbPool, "test", "UPDATE orders SET note = %s", ("a",))
+                objUnitOfWork.conn.close()
+        # 閉じた接続はプールへ戻さない(the closed connection is not returned to the pool)
+        assert objDbPool.objPool.freesize == 0
+
+    asyncio.run(execTest())
+    assert "COMMIT" not in aryLog
+
+def test_stream_refused_inside_unit_of_work(aryLog):
+    async def execTest():
+        objDbPool = await getDbPool(aryLog)
+        async with unitofwork_fnc.UnitOfWork(objDbPool):
+            with pytest.raises(unitofwork_fnc.UnitOfWorkError):
+                async for _ in mysqlaio_fnc.getStreamQuery(objDbPool, "test", "SELECT * FROM orders"):
+                    pass
+
+    asyncio.run(execTest())
+    assert aryLog == []
+
+def test_write_behind_flush_outside_unit_of_work(aryLog):
+    async def execTest():
+        objDbPool = await getDbPool(aryLog)
+        objBuffer = writebehind_fnc.WriteBehindBuffer(objDbPool, "events", ["name"], intMaxRows=2, fltFlushInterval=60)
+        await objBuffer.add(["other request"])
+
+        # 件数による書込みはリクエストのトランザクションに含めない(a size-triggered flush is not part of the request's transaction)
+        with pytest.raises(RuntimeError):
+            async with unitofwork_fnc.UnitOfWork(objDbPool) as objUnitOfWork:
+                await objUnitOfWork.begin()
+                await mysqlaio_fnc.execQuery(objDbPool, "test", "UPDATE orders SET note = %s", ("a",))
+                await objBuffer.add(["this request"])
+                raise RuntimeError("abort")
+
+        assert objBuffer.aryRows == []
+        await objBuffer.close()
+
+    asyncio.run(execTest())
+    assert aryLog == [
+        "BEGIN", "UPDATE orders SET note = %s",
+        "BEGIN", "INSERT INTO `events` (`name`) VALUES (%s), (%s)", "COMMIT",
+        "ROLLBACK",
+    ]
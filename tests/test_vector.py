@@ -0,0 +1,189 @@
+# ベクトルストアのAPIと検索結果[一時ディレクトリ使用](Vector store API and search results [temporary directory])
+import os
+import asyncio
+
+import httpx
+import numpy as np
+import pytest
+from fastapi import FastAPI
+
+from functions import vector_fnc
+from routers import vector
+
+@pytest.fixture
+def strVectorDir(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_fnc, "VECTOR_DIR", str(tmp_path))
+    monkeypatch.setattr(vector_fnc, "VECTOR_MAX_STORES", 2)
+    monkeypatch.setattr(vector_fnc, "_aryStores", {})
+    yield str(tmp_path)
+    for objStore in vector_fnc._aryStores.values():
+        objStore.close()
+
+def getResponses(aryRequests: list):
+    objApp = FastAPI()
+    objApp.include_router(vector.router)
+
+    async def execTest():
+        async with httpx.AsyncClient(transport=httpx.ASGITransport(app=objApp), base_url="http://test") as objClient:
+            return [await objClient.post(strPath, json=objBody) for strPath, objBody in aryRequests]
+
+    return [objResponse.status_code for objResponse in asyncio.run(execTest())]
+
+def test_unknown_store_returns_404(strVectorDir):
+    aryStatus = getResponses([
+        ("/v1/vectors/missing/query", {"vectors": [[1.0, 0.0]]}),
+        ("/v1/vectors/missing/delete", {"ids": ["a"]}),
+        ("/v1/vectors/missing/index", {}),
+    ])
+
+    assert aryStatus == [404, 404, 404]
+    # 存在しないストアはディレクトリもファイルも作らない(no directory or file is created for an unknown store)
+    assert os.listdir(strVectorDir) == []
+    assert vector_fnc._aryStores == {}
+
+def test_upsert_creates_store(strVectorDir):
+    aryStatus = getResponses([
+        ("/v1/vectors/items/upsert", {"ids": ["a", "b"], "vectors": [[1.0, 0.0], [0.0, 1.0]]}),
+        ("/v1/vectors/items/query", {"vectors": [[1.0, 0.0]], "top_k": 1}),
+        ("/v1/vectors/items/delete", {"ids": ["a"]}),
+    ])
+
+    assert aryStatus == [200, 200, 200]
+    assert os.listdir(strVectorDir) == ["items"]
+
+def test_store_count_is_capped(strVectorDir):
+    aryStatus = getResponses([
+        (f"/v1/vectors/store{i}/upsert", {"ids": ["a"], "vectors": [[1.0, 0.0]]}) for i in range(3)
+    ])
+
+    assert aryStatus == [200, 200, 503]
+    assert sorted(os.listdir(strVectorDir)) == ["store0", "store1"]
+
+@pytest.mark.parametrize("objBody", [
+    {"ids": ["a"], "vectors": []},
+    {"ids": ["a"], "vectors": [[]]},
+    {"ids": ["a", "b"], "vectors": [[1.0, 0.0]]},
+    {"ids": ["a"], "vectors": [[1.0, 0.0]], "metadata": [1, 2]},
+])
+def test_invalid_upsert_returns_422(strVectorDir, objBody):
+    assert getResponses([("/v1/vectors/items/upsert", objBody)]) == [422]
+    # 不正な入力ではストアを作らない(no store is created for invalid input)
+    assert os.listdir(strVectorDir) == []
+
+def test_invalid_first_upsert_keeps_dimension_open(strVectorDir):
+    aryStatus = getResponses([
+        ("/v1/vectors/items/upsert", {"ids": ["a"], "vectors": [[1.0, 0.0]]}),
+        ("/v1/vectors/items/upsert", {"ids": ["b", "c"], "vectors": [[1.0, 0.0, 0.0]]}),
+        ("/v1/vectors/items/upsert", {"ids": ["b"], "vectors": [[1.0, 0.0, 0.0]]}),
+        ("/v1/vectors/items/query", {"vectors": [[1.0, 0.0]], "top_k": 1}),
+    ])
+    assert aryStatus == [200, 422, 422, 200]
+
+    # 件数が合わない最初の追加で次元数を決めない(a first upsert with mismatched lengths does not fix the dimension)
+    objStore = vector_fnc.VectorStore(os.path.join(strVectorDir, "fresh"))
+    with pytest.raises(vector_fnc.VectorError):
+        objStore.upsert(["a", "b"], [[1.0, 0.0, 0.0]])
+    assert objStore.getStats()["dim"] is None
+    assert objStore.upsert(["a"], [[1.0, 0.0]]) == 1
+    assert objStore.getStats()["dim"] == 2
+    objStore.close()
+
+def getExpectTopK(aryVectors, aryQueries, intTopK: int, aryAlive=None):
+    """
+    NumPyの全件比較による正解[cosine](Expected results by a plain NumPy scan [cosine])
+    """
+
+    aryVectors = aryVectors / np.linalg.norm(aryVectors, axis=1, keepdims=True)
+    aryQueries = aryQueries / np.linalg.norm(aryQueries, axis=1, keepdims=True)
+    aryScores = aryQueries @ aryVectors.T
+    if aryAlive is not None:
+        aryScores[:, ~aryAlive] = -np.inf
+
+    return [list(aryRow) for aryRow in np.argsort(-aryScores, axis=1, kind="stable")[:, :intTopK]]
+
+def getResultRows(aryResults: list):
+    return [[int(objHit["id"]) for objHit in aryHits] for aryHits in aryResults]
+
+@pytest.fixture
+def objStore(strVectorDir):
+    objStore = vector_fnc.VectorStore(os.path.join(strVectorDir, "unit"))
+    yield objStore
+    objStore.close()
+
+def test_exact_top_k(objStore):
+    objRandom = np.random.default_rng(1)
+    aryVectors = objRandom.standard_normal((500, 16)).astype(np.float32)
+    aryQueries = objRandom.standard_normal((20, 16)).astype(np.float32)
+    objStore.upsert([str(i) for i in range(500)], aryVectors, [{"n": i} for i in range(500)])
+
+    aryResults = objStore.search(aryQueries, intTopK=10)
+    assert getResultRows(aryResults) == getExpectTopK(aryVectors, aryQueries, 10)
+    # スコアは降順、メタデータはIDの行のもの(scores descend and metadata belongs to the id)
+    for aryHits in aryResults:
+        assert [objHit["score"] for objHit in aryHits] == sorted((objHit["score"] for objHit in aryHits), reverse=True)
+        assert all(objHit["metadata"] == {"n": int(objHit["id"])} for objHit in aryHits)
+
+def test_delete_and_replace_are_filtered(objStore):
+    objRandom = np.random.default_rng(2)
+    aryVectors = objRandom.standard_normal((200, 8)).astype(np.float32)
+    aryQueries = objRandom.standard_normal((10, 8)).astype(np.float32)
+    objStore.upsert([str(i) for i in range(200)], aryVectors)
+
+    aryAlive = np.ones(200, dtype=bool)
+    aryAlive[::3] = False
+    assert objStore.delete([str(i) for i in range(0, 200, 3)] + ["missing"]) == int((~aryAlive).sum())
+    assert getResultRows(objStore.search(aryQueries, intTopK=10)) == getExpectTopK(aryVectors, aryQueries, 10, aryAlive)
+
+    # 置換は古い行を削除済みにする(a replace tombstones the old row)
+    objStore.upsert(["1"], -aryQueries[:1])
+    aryHits = objStore.search(-aryQueries[:1], intTopK=200)[0]
+    assert aryHits[0]["id"] == "1" and [objHit["id"] for objHit in aryHits].count("1") == 1
+    assert objStore.getStats()["live"] == int(aryAlive.sum())
+
+def test_compaction_keeps_results(objStore, monkeypatch):
+    monkeypatch.setattr(vector_fnc, "VECTOR_COMPACT_MIN_ROWS", 10)
+    objRandom = np.random.default_rng(3)
+    aryVectors = objRandom.standard_normal((100, 8)).astype(np.float32)
+    aryQueries = objRandom.standard_normal((10, 8)).astype(np.float32)
+    objStore.upsert([str(i) for i in range(100)], aryVectors, [{"n": i} for i in range(100)])
+
+    aryAlive = np.ones(100, dtype=bool)
+    aryAlive[:40] = False
+    objStore.delete([str(i) for i in range(40)])
+
+    objStats = objStore.getStats()
+    assert objStats["generation"] == 1
+    assert objStats["rows"] == objStats["live"] == 60 and objStats["deleted"] == 0
+    assert sorted(os.listdir(objStore.strPath)) == [".lock", "header.json", "rows.1.jsonl", "vectors.1.f32"]
+
+    aryResults = objStore.search(aryQueries, intTopK=10)
+    assert getResultRows(aryResults) == getExpectTopK(aryVectors, aryQueries, 10, aryAlive)
+    assert all(objHit["metadata"] == {"n": int(objHit["id"])} for aryHits in aryResults for objHit in aryHits)
+
+    # 別のインスタンス[別プロセス相当]も新しい世代を読む(another instance [like another process] reads the new generation)
+    objOther = vector_fnc.VectorStore(objStore.strPath)
+    assert getResultRows(objOther.search(aryQueries, intTopK=10)) == getResultRows(aryResults)
+    objOther.close()
+
+def test_ivf_recall(objStore):
+    # クラスタのあるデータ(clustered data)
+    objRandom = np.random.default_rng(4)
+    aryCenters = objRandom.standard_normal((32, 32)).astype(np.float32)
+    aryVectors = (aryCenters[objRandom.integers(0, 32, 4000)] + 0.3 * objRandom.standard_normal((4000, 32))).astype(np.float32)
+    aryQueries = (aryCenters[objRandom.integers(0, 32, 50)] + 0.3 * objRandom.standard_normal((50, 32))).astype(np.float32)
+    objStore.upsert([str(i) for i in range(4000)], aryVectors)
+    objStore.buildIvf(intLists=64)
+
+    # IVF作成後の追加・削除も反映(upserts and deletes after the build are seen)
+    aryExtra = objRandom.standard_normal((100, 32)).astype(np.float32)
+    objStore.upsert([str(i) for i in range(4000, 4100)], aryExtra)
+    objStore.delete([str(i) for i in range(0, 4000, 10)])
+
+    aryExact = getResultRows(objStore.search(aryQueries, intTopK=10, blnExact=True))
+    aryIvf = getResultRows(objStore.search(aryQueries, intTopK=10, intProbe=16))
+    fltRecall = np.mean([len(set(aryA) & set(aryB)) / 10 for aryA, aryB in zip(aryExact, aryIvf)])
+    assert fltRecall >= 0.9, fltRecall
+    assert all(intRow % 10 != 0 or intRow >= 4000 for aryRow in aryIvf for intRow in aryRow)
+
+    # 全リストを探索すれば全件比較と一致(probing every list matches the exact search)
+    assert getResultRows(objStore.search(aryQueries, intTopK=10, intProbe=64)) == aryExact
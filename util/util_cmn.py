@@ -1,18 +1,32 @@
+import os
 import re
-import tiktoken
 import math
 import json
 import sys
-import socket
-import pandas as pd
+import asyncio
 
-from xml.sax.saxutils import unescape
-from bs4 import BeautifulSoup
+from concurrent.futures import ProcessPoolExecutor
 
 # 共通ファンクションの読込(Reading common functions)
 from functions import mysqlaio_fnc
 from functions import log_fnc
 from functions import secure_fnc
+from functions import gmo_fnc
+from functions import context_fnc
+
+# getOverlapLengthでstr.findを試す最大回数[超えた場合はKMP](maximum str.find steps in getOverlapLength [KMP after that])
+OVERLAP_FIND_STEPS = 32
+
+# HTMLタグ(HTML tags)
+_objTagPattern = re.compile(r'<.+?>')
+
+# この件数を超える一括整形はプロセスプールで実行(Batches larger than this run on the process pool)
+CLEAN_PROCESS_ROWS = int(os.getenv("CLEAN_PROCESS_ROWS", "50000"))
+
+# プロセス数[1以下はプロセスプールを使わない](process count [1 or less disables the process pool])
+CLEAN_PROCESSES = int(os.getenv("CLEAN_PROCESSES", str(min(4, os.cpu_count() or 1))))
+
+_objCleanPool = None
 
 async def getApikey(objDbPool):
     """
@@ -46,30 +60,123 @@ def getCleanText(strText: str):
     Returns:
 
         str:除去されたテキスト(Text with unnecessary material removed)
+
+    Note:
+
+        &lt; &gt; &amp; &nbsp; のデコード後に前後の空白を削除し、半角・全角スペースを削除、残りの連続した空白を1つの半角スペースにしてからHTMLタグを削除する
+        (After decoding &lt; &gt; &amp; &nbsp;, the ends are stripped, half/full-width spaces removed and remaining whitespace runs collapsed to one space before HTML tags are removed)
     """
 
-    # 特殊タグのデコード(Decoding of special tags)
-    strText = unescape(strText)
-    strText = strText.replace('&nbsp;', ' ')
+    # 特殊タグのデコード[unescapeと同じ順序、&amp;nbsp;は&nbsp;を経て空白になる](Decoding of special tags [same order as unescape, &amp;nbsp; becomes a space via &nbsp;])
+    if '&' in strText:
+        strText = strText.replace('&lt;', '<').replace('&gt;', '>').replace('&amp;', '&').replace('&nbsp;', ' ')
 
-    # 前後の空白の削除(Deletion of preceding and following spaces)
-    strText = strText.strip()
+    # 前後の空白・半角全角スペースの削除(Deletion of surrounding whitespace and half/full-width spaces)
+    strText = strText.strip().replace(' ', '').replace('　', '')
 
-    # 連続した空白の削除(Deletion of consecutive spaces)
-    strText = strText.replace('　', '')
-    strText = strText.replace(' ', '')
-    strText = re.sub('\s+', ' ', strText)
+    # 連続した空白を1つに[前後は削除済みのためsplitと同じ、改行もここで半角スペースになる]
+    # (Collapse whitespace runs [same as split since the ends are stripped, line breaks become a space too])
+    strText = ' '.join(strText.split())
 
     # HTMLタグの削除(Delete HTML tags)
-    strText = re.sub('<.+?>', '', strText)
+    if '<' in strText:
+        strText = _objTagPattern.sub('', strText)
 
-    # 改行を削除(Remove line breaks)
-    strText = strText.replace('\n', '')
-    strText = strText.replace('\r\n', '')
-    strText = strText.replace('\r', '')
-    
     return strText
 
+def getCleanTextList(aryTexts: list):
+    """
+    複数件のHTMLタグ・改行・空白の削除[同期処理](Clean many texts [synchronous])
+
+    Args:
+
+        aryTexts (list): テキスト(texts)
+
+    Returns:
+
+        list:除去されたテキスト(cleaned texts)
+    """
+
+    return [getCleanText(strText) for strText in aryTexts]
+
+def getCleanTextSeries(objSeries):
+    """
+    pandas.SeriesのHTMLタグ・改行・空白の削除[.str演算](Clean a pandas Series [.str operations])
+
+    getCleanTextと同じ順序の処理を列ごとにまとめて行い、欠損値はそのまま残す
+    (Runs the same steps as getCleanText column-wise, missing values are kept)
+
+    Args:
+
+        objSeries (pandas.Series): テキストの列(text column)
+
+    Returns:
+
+        pandas.Series:除去されたテキスト(cleaned texts)
+    """
+
+    objStr = objSeries.str
+    for strEntity, strChar in (('&lt;', '<'), ('&gt;', '>'), ('&amp;', '&'), ('&nbsp;', ' ')):
+        objStr = objStr.replace(strEntity, strChar, regex=False).str
+
+    objStr = objStr.strip().str.replace(' ', '', regex=False).str.replace('　', '', regex=False).str
+    objStr = objStr.split().str.join(' ').str
+
+    return objStr.replace(_objTagPattern, '', regex=True)
+
+async def getCleanTextBatch(aryTexts, intProcessRows: int=None):
+    """
+    複数件のHTMLタグ・改行・空白の削除(Clean many texts)
+
+    pandas.Seriesは.str演算で処理し、件数が多い場合はプロセスプールへ分割する
+    (A pandas Series uses .str operations, large batches are split across a process pool)
+
+    Args:
+
+        aryTexts (list|pandas.Series): テキスト(texts)
+
+        intProcessRows (int): プロセスプールで実行する件数の閾値[省略時はCLEAN_PROCESS_ROWS](row threshold for the process pool [CLEAN_PROCESS_ROWS if omitted])
+
+    Returns:
+
+        list|pandas.Series:除去されたテキスト[入力と同じ型](cleaned texts [same type as the input])
+    """
+
+    if intProcessRows is None:
+        intProcessRows = CLEAN_PROCESS_ROWS
+
+    # pandasは呼び出し元が読込んでいる場合のみ参照する(pandas is only looked at when the caller has already imported it)
+    objPandas = sys.modules.get("pandas")
+    blnSeries = objPandas is not None and isinstance(aryTexts, objPandas.Series)
+    if len(aryTexts) <= intProcessRows or CLEAN_PROCESSES <= 1:
+        return getCleanTextSeries(aryTexts) if blnSeries else getCleanTextList(aryTexts)
+
+    global _objCleanPool
+    if _objCleanPool is None:
+        _objCleanPool = ProcessPoolExecutor(max_workers=CLEAN_PROCESSES)
+
+    aryValues = aryTexts.tolist() if blnSeries else list(aryTexts)
+    intChunk = -(-len(aryValues) // (CLEAN_PROCESSES * 4))
+    objLoop = asyncio.get_running_loop()
+    aryParts = await asyncio.gather(*[
+        objLoop.run_in_executor(_objCleanPool, getCleanTextList, aryValues[i:i + intChunk])
+        for i in range(0, len(aryValues), intChunk)
+    ])
+    aryResult = [strText for aryPart in aryParts for strText in aryPart]
+
+    return objPandas.Series(aryResult, index=aryTexts.index, name=aryTexts.name) if blnSeries else aryResult
+
+def shutdownCleanPool():
+    """
+    テキスト整形用プロセスプールの停止(Stop the text cleaning process pool)
+    """
+
+    global _objCleanPool
+
+    if _objCleanPool is not None:
+        _objCleanPool.shutdown(wait=True)
+        _objCleanPool = None
+
 def getOrthopedicsTime(intTime: int):
     """
     timeのフォーマット(Format of time)
@@ -165,25 +272,100 @@ async def getJoinStrings(strS1, strS2):
         str:結合文字列(combined character string)
     """
 
-    for i in range(min(len(strS1), len(strS2)), -1, -1):
-        if strS1.endswith(strS2[:i]):
-            return strS1 + strS2[i:]
-        
-    return strS1 + strS2
+    return strS1 + strS2[getOverlapLength(strS1, strS2):]
+
+def getOverlapLength(strS1: str, strS2: str):
+    """
+    strS1の末尾とstrS2の先頭が一致する最大の長さ(Longest length where the end of strS1 matches the start of strS2)
+
+    まずstr.findで候補を絞り、決まらない場合はKMPの接頭辞関数で求めるため、長さに比例した時間で終わる
+    (Candidates are narrowed with str.find first, falling back to the KMP prefix function, so it runs in linear time)
+
+    Args:
+
+        strS1 (str): ベース文字列(base string)
+
+        strS2 (str): 結合する文字列(String to be combined)
+
+    Returns:
+
+        int:重複している文字数(number of overlapping characters)
+    """
+
+    intLength = min(len(strS1), len(strS2))
+    if intLength == 0:
+        return 0
+
+    strTail = strS1[-intLength:]
+    strPattern = strS2[:intLength]
+    if strTail == strPattern:
+        return intLength
+
+    # 末尾k文字がstrS2に現れる位置から次の候補長へ進む[回数を制限](Jump to the next candidate length from where the last k characters occur in strS2 [bounded])
+    intBest = 0
+    k = 1
+    for _ in range(OVERLAP_FIND_STEPS):
+        intFound = strPattern.find(strTail[-k:])
+        if intFound == -1:
+            return intBest
+        k += intFound
+        if intFound == 0 or strTail[-k:] == strPattern[:k]:
+            intBest = k
+            k += 1
+            if k >= intLength:
+                return intBest
+
+    return getOverlapLengthKmp(strTail, strPattern)
+
+def getOverlapLengthKmp(strTail: str, strPattern: str):
+    """
+    KMPの接頭辞関数による重複長[同じ長さの文字列](Overlap length by the KMP prefix function [strings of equal length])
+
+    Args:
+
+        strTail (str): ベース文字列の末尾(end of the base string)
+
+        strPattern (str): 結合する文字列の先頭(start of the string to be combined)
+
+    Returns:
+
+        int:重複している文字数(number of overlapping characters)
+    """
+
+    intLength = len(strPattern)
+
+    # パターンの接頭辞関数(prefix function of the pattern)
+    aryPrefix = [0] * intLength
+    k = 0
+    for i in range(1, intLength):
+        while k and strPattern[i] != strPattern[k]:
+            k = aryPrefix[k - 1]
+        if strPattern[i] == strPattern[k]:
+            k += 1
+        aryPrefix[i] = k
+
+    # 末尾をパターンで走査し、終了時の一致長が重複長(Scan the tail, the final match length is the overlap)
+    k = 0
+    for strChar in strTail:
+        while k and (k == intLength or strChar != strPattern[k]):
+            k = aryPrefix[k - 1]
+        if strChar == strPattern[k]:
+            k += 1
+
+    return k
 
 async def getIpAddress():
     """
     アクセスしている人のIPアドレスの取得(Obtaining the IP address of the person accessing the site)
 
+    ミドルウェアが設定したリクエストのコンテキストから取得し、名前解決は行わない(Read from the request context set by the middleware, no name resolution)
+
     Returns:
 
         str:IPアドレス(IP address
     """
 
-    # ホスト名を取得、表示
-    strHost = socket.gethostname()
-    strIp = socket.gethostbyname(strHost)
-    aryLogExtra = { 'clientip' : strIp }
+    aryLogExtra = { 'clientip' : context_fnc.getClientIp() }
 
     return aryLogExtra
 
@@ -191,6 +373,8 @@ async def getGmoErrorMsg(strErrorCode :str, strErrorInfo :str):
     """
     GMOペイメントのエラーコードからメッセージを取得(Get message from GMO Payments error code)
 
+    HTMLは初回のみ解析し、以降はインデックスから取得する(HTML is parsed only once, later lookups use the index)
+
     Args:
 
         strErrorCode (str): エラーコード(error code)
@@ -202,58 +386,19 @@ async def getGmoErrorMsg(strErrorCode :str, strErrorInfo :str):
         str:GMOエラーメッセージ[取得できない場合は空](GMO error message [empty if not obtained])
     """
 
-    aryGmoErrorFile = []
-
-    if strErrorCode.upper()[0] == "E":
-        aryGmoErrorFile.append("gmo_e")
-        aryGmoErrorFile.append("gmo_e_m")
-    elif strErrorCode.upper()[0] == "C":
-        aryGmoErrorFile.append("gmo_c")
-    elif strErrorCode.upper()[0] == "G":
-        aryGmoErrorFile.append("gmo_g")
-    elif strErrorCode.upper()[0] == "M":
-        aryGmoErrorFile.append("gmo_m")
-        aryGmoErrorFile.append("gmo_e_m")
-        aryGmoErrorFile.append("gmo_carrier")
-        aryGmoErrorFile.append("gom_linepay")
-    else:
-        return ""
-
-    strGmoErrorMsg = ""
-    for strFileName in aryGmoErrorFile:
-        # HTMLファイルを開く
-        with open(f'./files/gmo/{strFileName}.html', 'r') as file:
-            html = file.read()
-
-        # BeautifulSoupオブジェクトを作成
-        soup = BeautifulSoup(html, 'html.parser')
-
-        # テーブルを見つける
-        table = soup.find('table')
-
-        # 全てのテーブルを見つける
-        tables = soup.find_all('table')
-
-        # 二番目のテーブルを選択
-        table = tables[1]
-
-        # 各行をループし、検索条件に一致するものを探す
-        for row in table.find_all('tr'):
-            cells = row.find_all('td')
-            if cells:
-                # 例: エラーコード 'G02' に一致する行を探す
-                if strErrorInfo in cells[1].text:
-                    # 条件に一致した行のデータを出力（または他の処理）
-                    if strFileName == "gmo_m" or strFileName == "gmo_carrier" or strFileName == "gom_linepay" or strFileName == "gmo_paysle":
-                        strGmoErrorMsg = cells[2].text
-                    else:
-                        strGmoErrorMsg = cells[3].text
-                    break
-        
-        if strGmoErrorMsg != "":
-            break
-    
-    if strGmoErrorMsg == "－":
-        return ""
-
-    return strGmoErrorMsg
\ No newline at end of file
+    return gmo_fnc.getGmoErrorMsg(strErrorCode, strErrorInfo)
+
+async def getGmoErrorMsgList(aryErrors: list):
+    """
+    GMOペイメントのエラーコードからメッセージを一括取得(Batch get messages from GMO Payments error codes)
+
+    Args:
+
+        aryErrors (list): (エラーコード, 詳細コード)のリスト(list of (error code, detail code))
+
+    Returns:
+
+        list:GMOエラーメッセージのリスト[取得できない場合は空](list of GMO error messages [empty if not obtained])
+    """
+
+    return gmo_fnc.getGmoErrorMsgList(aryErrors)